@@ -7,20 +7,43 @@ Includes portable Node.js, pnpm, and MariaDB management.
 """
 
 import os
+import re
 import sys
 import json
 import shutil
 import zipfile
+import hashlib
+import threading
 import subprocess
 import requests
 from pathlib import Path
 from typing import Optional, Dict, List
 import logging
-from datetime import datetime
-from dotenv import load_dotenv
+from datetime import datetime, timedelta
+from dotenv import load_dotenv, dotenv_values
 
 # Import core modules
 from core import Config, setup_logging, get_log_manager_handler
+from core.log_rotation import open_append_handle, get_log_rotator
+from core.log_reader import tail_lines
+from core.tracing import get_tracer, traced, trace_span, annotate
+from core.trace_export import get_trace_recorder
+from core.install_journal import get_install_journal, file_digest, write_json_atomic, STATUS_RUNNING
+from core.task_graph import TaskGraph, RESOURCE_NET, RESOURCE_DISK, RESOURCE_CPU, PENDING, RUNNING, DONE, FAILED, report_progress
+from core.eta import EtaEstimator
+from core.proxy import get_service_proxy, proxy_enabled, lazy_start_enabled, free_port, wait_healthy
+from core.cluster import WorkerCluster, cluster_enabled, configured_workers
+from core.tuning import get_tuning, diff_settings
+from core.mariadb import request_shutdown, parse_startup, STARTUP_LOG_LINES, MariaDBClient, MariaDBError
+from core.backup import get_backups
+from core.binlog import BinlogArchiver, get_binlog_archiver, binlog_enabled
+from core.snapshot import get_snapshots, snapshot_before_update
+from core.slow_log import get_slow_query_log
+from core.index_advisor import get_index_advisor
+from core.db_metrics import get_db_metrics
+from core.maintenance import get_maintenance
+from core.rehearsal import get_migration_rehearsal, extract_prisma_dir, scratch_database_url
+from service_output import get_output_mode, get_output_ingestor, OUTPUT_MODE_PIPE
 
 # Load environment variables from .env file
 load_dotenv(Config.BASE_DIR / '.env')
@@ -29,6 +52,32 @@ load_dotenv(Config.BASE_DIR / '.env')
 log_file = Config.WRITABLE_DIR / 'agent.log'
 logger, log_manager_handler = setup_logging(log_file)
 
+# Bytes of a download covered by one 'download chunk' trace span
+DOWNLOAD_CHUNK_SPAN_BYTES = 4 * 1024 * 1024
+
+# Written into an app directory after its release is fully extracted
+RELEASE_MANIFEST = ".4paws-release.json"
+
+# pnpm install output: live "Progress: resolved N, reused R, downloaded D, added A"
+# and the final "Packages: +N" summary (packages installed, for throughput)
+PNPM_PROGRESS_RE = re.compile(r"Progress: resolved (\d+), reused (\d+), downloaded (\d+), added (\d+)")
+PNPM_PACKAGES_RE = re.compile(r"Packages: \+(\d+)")
+
+# Attempts to move a just-stopped app directory aside during a staged update
+SWAP_RETRIES = 10
+
+# How long starting services may take to answer on their ports after an update
+SERVICE_READY_TIMEOUT = 60
+
+# Progress page headings for the steps of the install task graph
+INSTALL_STEP_TITLES = {
+    'tools': 'Setting Up Tools',
+    'download': 'Downloading Applications',
+    'install': 'Installing Dependencies',
+    'database': 'Setting Up Database',
+    'start': 'Starting Services'
+}
+
 
 class GitHubClient:
     """Handle GitHub API interactions"""
@@ -112,8 +161,13 @@ class GitHubClient:
         
         return None
     
-    def download_asset(self, url: str, output_path: Path, max_retries: int = 3) -> bool:
-        """Download release asset with retry logic"""
+    def download_asset(self, url: str, output_path: Path, max_retries: int = 3, progress_callback=None) -> bool:
+        """
+        Download release asset with retry logic
+        
+        Args:
+            progress_callback: Optional function(downloaded_bytes, total_bytes)
+        """
         import time
         
         for attempt in range(1, max_retries + 1):
@@ -131,17 +185,33 @@ class GitHubClient:
                 
                 output_path.parent.mkdir(parents=True, exist_ok=True)
                 
-                # Download with progress
-                with open(output_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            downloaded += len(chunk)
-                            
-                            # Progress
-                            if total_size > 0:
-                                progress = (downloaded / total_size) * 100
-                                print(f"\r  Progress: {progress:.1f}% ({downloaded}/{total_size} bytes)", end='')
+                # Download with progress; each DOWNLOAD_CHUNK_SPAN_BYTES window is
+                # a span so throughput stalls show up in the trace
+                tracer = get_tracer()
+                chunk_span = None
+                try:
+                    with open(output_path, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=8192):
+                            if chunk:
+                                if chunk_span is None:
+                                    chunk_span = tracer.start_span('download chunk', {'offset': downloaded, 'attempt': attempt}, activate=False)
+                                f.write(chunk)
+                                downloaded += len(chunk)
+                                if downloaded - chunk_span.attributes['offset'] >= DOWNLOAD_CHUNK_SPAN_BYTES:
+                                    chunk_span.set_attribute('bytes', downloaded - chunk_span.attributes['offset'])
+                                    tracer.end_span(chunk_span)
+                                    chunk_span = None
+                                
+                                # Progress
+                                if total_size > 0:
+                                    progress = (downloaded / total_size) * 100
+                                    print(f"\r  Progress: {progress:.1f}% ({downloaded}/{total_size} bytes)", end='')
+                                    if progress_callback:
+                                        progress_callback(downloaded, total_size)
+                finally:
+                    if chunk_span is not None:
+                        chunk_span.set_attribute('bytes', downloaded - chunk_span.attributes['offset'])
+                        tracer.end_span(chunk_span, total_size <= 0 or downloaded >= total_size)
                 
                 print()  # New line after progress
                 
@@ -200,6 +270,9 @@ class GitHubClient:
 class VersionManager:
     """Track installed versions"""
     
+    # Components may be installed concurrently (install/update task graph)
+    _lock = threading.Lock()
+    
     @staticmethod
     def load_versions() -> Dict:
         """Load version tracking file"""
@@ -217,15 +290,25 @@ class VersionManager:
         with open(Config.VERSION_FILE, 'w') as f:
             json.dump(versions, f, indent=2)
     
+    @staticmethod
+    def release_label() -> str:
+        """Installed versions as one label, e.g. 'backend v1.2.0 / frontend v1.3.1'"""
+        versions = VersionManager.load_versions()
+        return ' / '.join(
+            f"{component} {versions.get(component, {}).get('version') or '-'}"
+            for component in ('backend', 'frontend')
+        )
+    
     @staticmethod
     def update_version(component: str, version: str):
         """Update component version"""
-        versions = VersionManager.load_versions()
-        versions[component] = {
-            'version': version,
-            'updated_at': datetime.now().isoformat()
-        }
-        VersionManager.save_versions(versions)
+        with VersionManager._lock:
+            versions = VersionManager.load_versions()
+            versions[component] = {
+                'version': version,
+                'updated_at': datetime.now().isoformat()
+            }
+            VersionManager.save_versions(versions)
 
 
 class NetworkUtils:
@@ -240,6 +323,21 @@ class NetworkUtils:
         except:
             return False
     
+    @staticmethod
+    def wait_for_port(port: int, timeout: float = SERVICE_READY_TIMEOUT, interval: float = 0.2) -> bool:
+        """Wait until something accepts connections on localhost:port"""
+        import socket
+        import time
+        deadline = time.time() + timeout
+        while True:
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=1):
+                    return True
+            except OSError:
+                if time.time() >= deadline:
+                    return False
+                time.sleep(interval)
+    
     @staticmethod
     def get_best_registry() -> str:
         """Test and return the fastest npm registry"""
@@ -649,10 +747,232 @@ class AppManager:
     """Manage frontend and backend apps"""
     
     @staticmethod
-    def extract_release(zip_path: Path, extract_to: Path) -> bool:
+    def manifest_path(app_dir: Path) -> Path:
+        """Release manifest written once an extraction has fully completed"""
+        return app_dir / RELEASE_MANIFEST
+    
+    @staticmethod
+    def write_manifest(app_dir: Path, zip_ref: zipfile.ZipFile, tag: Optional[str]):
+        """Record the extracted release: tag plus every file's size and CRC"""
+        files = {
+            info.filename: [info.file_size, info.CRC]
+            for info in zip_ref.infolist() if not info.is_dir()
+        }
+        digest = hashlib.sha256(json.dumps(sorted(files.items())).encode()).hexdigest()
+        write_json_atomic(AppManager.manifest_path(app_dir), {
+            'tag': tag,
+            'digest': digest,
+            'extracted_at': datetime.now().isoformat(),
+            'files': files
+        })
+    
+    @staticmethod
+    def read_manifest(app_dir: Path) -> Optional[Dict]:
+        try:
+            with open(AppManager.manifest_path(app_dir), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def verify_install(app_dir: Path, tag: Optional[str] = None) -> bool:
+        """
+        Check an extracted release is complete (and is the given tag)
+        
+        Every file listed in the manifest must exist with its recorded size -
+        a stat per file, no reads, so it stays cheap for large apps. A
+        half-extracted app has no manifest (it is written last).
+        """
+        manifest = AppManager.read_manifest(app_dir)
+        if not manifest or (tag is not None and manifest.get('tag') != tag):
+            return False
+        for name, (size, _) in manifest.get('files', {}).items():
+            if name == '.env':
+                continue  # Rewritten by setup_env
+            try:
+                if (app_dir / name).stat().st_size != size:
+                    return False
+            except OSError:
+                return False
+        return True
+    
+    @staticmethod
+    def is_installed(component: str) -> bool:
+        """Whether a component's release is completely extracted"""
+        app_dir = Config.FRONTEND_DIR if component == "frontend" else Config.BACKEND_DIR
+        if AppManager.manifest_path(app_dir).exists():
+            return AppManager.verify_install(app_dir)
+        # Installed before manifests existed: trust it only if a version was recorded
+        # and no install of it is unfinished
+        if get_install_journal().unfinished() and component in get_install_journal().components:
+            return False
+        version = VersionManager.load_versions().get(component, {}).get('version')
+        return bool(version) and (app_dir / "package.json").exists()
+    
+    @staticmethod
+    def app_dir(component: str) -> Path:
+        return Config.FRONTEND_DIR if component == "frontend" else Config.BACKEND_DIR
+    
+    @staticmethod
+    def staging_dir(component: str) -> Path:
+        return Config.STAGING_DIR / component
+    
+    @staticmethod
+    def previous_dir(component: str) -> Path:
+        return Config.PREVIOUS_DIR / component
+    
+    @staticmethod
+    def carry_over_env(component: str, staging_dir: Path):
+        """Copy the running app's env files into a staged release (they may have been edited)"""
+        for name in (".env", ".env.production", ".env.local"):
+            source = AppManager.app_dir(component) / name
+            if source.exists():
+                shutil.copy2(source, staging_dir / name)
+    
+    @staticmethod
+    def swap_release(component: str) -> bool:
+        """
+        Replace the app directory with its staged release (services must be stopped)
+        
+        Both moves are renames on the same volume, so the swap takes
+        milliseconds regardless of the app's size. The replaced release is
+        kept in Config.PREVIOUS_DIR.
+        """
+        import time
+        live = AppManager.app_dir(component)
+        staged = AppManager.staging_dir(component)
+        previous = AppManager.previous_dir(component)
+        if not staged.exists():
+            logger.error(f"❌ No staged {component} release to swap in")
+            return False
+        
+        if previous.exists():
+            shutil.rmtree(previous)
+        previous.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Windows may hold handles of just-stopped node processes for a moment
+        for attempt in range(1, SWAP_RETRIES + 1):
+            try:
+                if live.exists():
+                    live.rename(previous)
+                break
+            except OSError as e:
+                if attempt == SWAP_RETRIES:
+                    logger.error(f"❌ Could not move current {component} aside: {e}")
+                    return False
+                time.sleep(0.5)
+        
+        try:
+            staged.rename(live)
+        except OSError as e:
+            logger.error(f"❌ Could not swap in staged {component}: {e}")
+            if previous.exists() and not live.exists():
+                previous.rename(live)
+            return False
+        
+        logger.info(f"🔀 {component.capitalize()} swapped to the staged release")
+        return True
+    
+    @staticmethod
+    def restore_previous(component: str) -> bool:
+        """
+        Put the release kept by swap_release back in place (services must be stopped)
+        
+        The release being replaced is deleted. The version record is set
+        from the restored release's manifest.
+        """
+        import time
+        live = AppManager.app_dir(component)
+        previous = AppManager.previous_dir(component)
+        manifest = AppManager.read_manifest(previous)
+        if not previous.exists() or not manifest:
+            logger.error(f"❌ No previous {component} release to go back to")
+            return False
+        
+        discarded = live.with_name(f"{live.name}.discarded")
+        if discarded.exists():
+            shutil.rmtree(discarded)
+        for attempt in range(1, SWAP_RETRIES + 1):
+            try:
+                if live.exists():
+                    live.rename(discarded)
+                break
+            except OSError as e:
+                if attempt == SWAP_RETRIES:
+                    logger.error(f"❌ Could not move current {component} aside: {e}")
+                    return False
+                time.sleep(0.5)
+        
+        try:
+            previous.rename(live)
+        except OSError as e:
+            logger.error(f"❌ Could not restore previous {component}: {e}")
+            if discarded.exists() and not live.exists():
+                discarded.rename(live)
+            return False
+        shutil.rmtree(discarded, ignore_errors=True)
+        
+        if manifest.get('tag'):
+            VersionManager.update_version(component, manifest['tag'])
+        logger.info(f"↩️  {component.capitalize()} back on {manifest.get('tag') or 'the previous release'}")
+        return True
+    
+    @staticmethod
+    def dependencies_fingerprint(app_dir: Path) -> Optional[str]:
+        """Hash of the lockfile (or package.json) that pnpm install was run against"""
+        for name in ("pnpm-lock.yaml", "package.json"):
+            if (app_dir / name).exists():
+                return file_digest(app_dir / name)
+        return None
+    
+    @staticmethod
+    def dependencies_installed(app_dir: Path) -> bool:
+        """pnpm writes node_modules/.modules.yaml at the end of a successful install"""
+        return (app_dir / "node_modules" / ".modules.yaml").exists()
+    
+    @staticmethod
+    def migrations_fingerprint(backend_dir: Path) -> Optional[str]:
+        """Hash of the Prisma migration set (directory names and migration.sql contents)"""
+        migrations_dir = backend_dir / "prisma" / "migrations"
+        if not migrations_dir.exists():
+            return None
+        digest = hashlib.sha256()
+        for migration in sorted(migrations_dir.glob("*/migration.sql")):
+            digest.update(migration.parent.name.encode())
+            digest.update(file_digest(migration).encode())
+        return digest.hexdigest()
+    
+    @staticmethod
+    def pending_migrations(backend_dir: Path) -> Optional[List[str]]:
+        """
+        Prisma migrations in the release that the database has not applied yet
+        
+        Returns:
+            list: Migration names; None if the database has no migration
+            table yet (fresh install) or MariaDB can't be queried
+        """
+        migrations_dir = backend_dir / "prisma" / "migrations"
+        if not migrations_dir.exists():
+            return []
+        available = sorted(m.parent.name for m in migrations_dir.glob("*/migration.sql"))
+        try:
+            rows = MariaDBClient().query(
+                "SELECT migration_name FROM _prisma_migrations WHERE finished_at IS NOT NULL",
+                database=Config.MARIADB_DB
+            )
+        except MariaDBError:
+            return None
+        applied = {row[0] for row in rows}
+        return [name for name in available if name not in applied]
+    
+    @staticmethod
+    def extract_release(zip_path: Path, extract_to: Path, tag: Optional[str] = None) -> bool:
         """Extract release ZIP while preserving node_modules"""
         try:
             logger.info(f"📂 Extracting {zip_path.name}...")
+            # Invalidate the old manifest first: until the new one is written
+            # the app counts as not installed
+            AppManager.manifest_path(extract_to).unlink(missing_ok=True)
             
             # Preserve node_modules if exists (to avoid re-downloading dependencies)
             node_modules_backup = None
@@ -662,7 +982,8 @@ class AppManager:
                     logger.info(f"💾 Backing up node_modules...")
                     node_modules_backup = extract_to.parent / f"{extract_to.name}_node_modules_temp"
                     try:
-                        shutil.move(str(node_modules_path), str(node_modules_backup))
+                        with trace_span('backup node_modules', app=extract_to.name):
+                            shutil.move(str(node_modules_path), str(node_modules_backup))
                         logger.info(f"✅ node_modules backed up")
                     except Exception as e:
                         logger.warning(f"⚠️  Failed to backup node_modules: {e}")
@@ -671,22 +992,28 @@ class AppManager:
                 # Remove old version
                 logger.info(f"🗑️  Removing old version...")
                 try:
-                    shutil.rmtree(extract_to)
+                    with trace_span('remove old version', app=extract_to.name):
+                        shutil.rmtree(extract_to)
                     logger.info(f"✅ Old version removed")
                 except Exception as e:
                     logger.warning(f"⚠️  Failed to remove old version: {e}")
                     logger.info("💡 Trying to extract anyway...")
             
             # Extract new version
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_to)
+            with trace_span('unzip', app=extract_to.name) as span:
+                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                    members = zip_ref.infolist()
+                    span.set_attributes(files=len(members), bytes=sum(m.file_size for m in members))
+                    zip_ref.extractall(extract_to)
+                    AppManager.write_manifest(extract_to, zip_ref, tag)
             
             # Restore node_modules
             if node_modules_backup and node_modules_backup.exists():
                 logger.info(f"♻️  Restoring node_modules...")
                 try:
                     restored_path = extract_to / "node_modules"
-                    shutil.move(str(node_modules_backup), str(restored_path))
+                    with trace_span('restore node_modules', app=extract_to.name):
+                        shutil.move(str(node_modules_backup), str(restored_path))
                     logger.info(f"✅ node_modules restored (update will be faster!)")
                     logger.info(f"💡 Running 'pnpm install' to sync any new dependencies...")
                 except Exception as e:
@@ -768,7 +1095,10 @@ class ProcessManager:
     """Manage running processes"""
     
     processes: Dict[str, subprocess.Popen] = {}
+    instance_ports: Dict[str, int] = {}  # Internal port of each app instance behind the proxy
+    cluster: Optional[WorkerCluster] = None  # Backend workers (BACKEND_WORKERS > 1)
     installation_in_progress: bool = False  # Flag to prevent auto-check during installation
+    mariadb_startup: Optional[Dict] = None  # Recovery/startup figures of the last MariaDB start
     
     @staticmethod
     def kill_process_on_port(port: int) -> bool:
@@ -830,6 +1160,36 @@ class ProcessManager:
             return False
     
     @classmethod
+    def _spawn_service(cls, name: str, args: List[str], log_file: Path, **popen_kwargs) -> subprocess.Popen:
+        """
+        Start a service process with its output going to log_file
+        
+        In the default file mode the child appends to the log itself. With
+        SERVICE_OUTPUT_MODE=pipe the agent owns the pipe: output is kept in
+        memory for instant tails, written to log_file in batches and pushed
+        to subscribed GUI clients (see service_output.py).
+        """
+        if get_output_mode() == OUTPUT_MODE_PIPE:
+            process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **popen_kwargs)
+            get_output_ingestor().attach(name, process, log_file)
+            return process
+        
+        with open_append_handle(log_file) as log:
+            return subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT, **popen_kwargs)
+    
+    @classmethod
+    def recent_output(cls, name: str, log_file: Path, lines: int = 20) -> List[str]:
+        """Last lines a service printed (from memory in pipe mode, else from its log)"""
+        ingestor = get_output_ingestor()
+        if ingestor.is_attached(name):
+            ingestor.wait_for_eof(name)
+            return ingestor.tail(name, lines)
+        if log_file.exists():
+            return tail_lines(log_file, lines).splitlines()
+        return []
+    
+    @classmethod
+    @traced('start_mariadb')
     def start_mariadb(cls) -> bool:
         """Start MariaDB server"""
         # Kill any existing process on MariaDB port first
@@ -875,26 +1235,29 @@ class ProcessManager:
             log_file = Config.LOGS_DIR / "mariadb.log"
             log_file.parent.mkdir(parents=True, exist_ok=True)
             
-            # Start with output redirect to log file (prevents buffer issues)
+            # Start with output appended to log file (prevents buffer issues).
+            # Append keeps history across restarts; LogRotator bounds the size.
             # Use CREATE_NEW_PROCESS_GROUP so we can kill the entire process tree later
             creation_flags = subprocess.CREATE_NO_WINDOW
             if sys.platform == 'win32':
                 creation_flags |= subprocess.CREATE_NEW_PROCESS_GROUP
             
-            with open(log_file, 'w') as log:
-                process = subprocess.Popen(
-                    [
-                        str(mysqld_exe),
-                        f"--datadir={data_dir}",
-                        f"--port={Config.MARIADB_PORT}",
-                        "--default-storage-engine=InnoDB",
-                        "--skip-grant-tables",  # Allow passwordless access for initial setup
-                        "--console"
-                    ],
-                    stdout=log,
-                    stderr=subprocess.STDOUT,
-                    creationflags=creation_flags
-                )
+            process = cls._spawn_service(
+                "mariadb",
+                [
+                    str(mysqld_exe),
+                    *get_tuning().mariadb_args(),  # Managed my.ini (must be first)
+                    f"--datadir={data_dir}",
+                    *BinlogArchiver.mysqld_args(),  # Binary log for point-in-time restores
+                    *get_slow_query_log().mysqld_args(),  # Slow query digest
+                    f"--port={Config.MARIADB_PORT}",
+                    "--default-storage-engine=InnoDB",
+                    "--skip-grant-tables",  # Allow passwordless access for initial setup
+                    "--console"
+                ],
+                log_file,
+                creationflags=creation_flags
+            )
             
             # Wait and verify MariaDB is actually ready
             import time
@@ -903,6 +1266,7 @@ class ProcessManager:
             # Wait up to 10 seconds for MariaDB to start accepting connections
             max_wait = 10
             connected = False
+            ready_span = get_tracer().start_span('waiting for mariadb')
             for i in range(max_wait):
                 time.sleep(1)
                 
@@ -928,22 +1292,22 @@ class ProcessManager:
                 except:
                     pass  # Try again
             
+            get_tracer().end_span(ready_span, connected)
+            
             if not connected and process.poll() is None:
                 logger.warning(f"⚠️  MariaDB started but connection test timed out")
                 logger.warning(f"   Process is running, continuing anyway...")
             
             if process.poll() is not None:
                 
-                # Read and display last lines from log file for debugging
+                # Display the last lines of output for debugging
                 try:
-                    if log_file.exists() and log_file.stat().st_size > 0:
+                    lines = cls.recent_output("mariadb", log_file, 20)
+                    if lines:
                         logger.error("📋 Last 20 lines from MariaDB log:")
                         logger.error("-" * 60)
-                        with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
-                            lines = f.readlines()
-                            # Show last 20 lines or all if less than 20
-                            for line in lines[-20:]:
-                                logger.error(f"   {line.rstrip()}")
+                        for line in lines:
+                            logger.error(f"   {line.rstrip()}")
                         logger.error("-" * 60)
                     else:
                         logger.error("⚠️  Log file is empty or doesn't exist")
@@ -969,6 +1333,7 @@ class ProcessManager:
             logger.info(f"✅ MariaDB started (PID: {process.pid})")
             logger.info(f"🌐 MariaDB Port: {Config.MARIADB_PORT}")
             logger.info(f"📝 MariaDB log: {log_file}")
+            cls._record_mariadb_startup(log_file, ready_span.elapsed)
             return True
             
         except Exception as e:
@@ -978,202 +1343,536 @@ class ProcessManager:
             return False
     
     @classmethod
-    def start_backend(cls) -> bool:
-        """Start backend server (simple mode - no install)"""
-        # Kill any existing process on backend port first
-        logger.info(f"🔍 Checking port {Config.BACKEND_PORT}...")
-        cls.kill_process_on_port(Config.BACKEND_PORT)
+    def _record_mariadb_startup(cls, log_file: Path, wait_seconds: float):
+        """Record crash recovery / startup time of this start (from the MariaDB log) on the start span"""
+        try:
+            ingestor = get_output_ingestor()
+            if ingestor.is_attached("mariadb"):
+                lines = ingestor.tail("mariadb", STARTUP_LOG_LINES)
+            else:
+                lines = tail_lines(log_file, STARTUP_LOG_LINES).splitlines()
+            startup = parse_startup(lines)
+        except Exception as e:
+            logger.debug(f"Could not parse MariaDB startup log: {e}")
+            return
+        import time
+        cls.mariadb_startup = {
+            'time': time.time(),
+            'crash_recovery': startup['crash_recovery'],
+            'recovery_seconds': startup['recovery_seconds'],
+            'recovered_pages': startup['recovered_pages'],
+            'startup_seconds': startup['startup_seconds'],
+            'ready_wait': round(wait_seconds, 2)
+        }
+        annotate(**{key: value for key, value in cls.mariadb_startup.items() if key != 'time'})
+        if startup['crash_recovery']:
+            recovery = startup['recovery_seconds']
+            logger.warning(
+                f"⚠️  MariaDB ran crash recovery ({startup['recovered_pages']} pages"
+                + (f", {recovery:.0f}s" if recovery is not None else "") + ") - it was not shut down cleanly"
+            )
+    
+    @classmethod
+    @traced('mariadb shutdown')
+    def stop_mariadb(cls, timeout: Optional[float] = None) -> bool:
+        """
+        Stop MariaDB with a clean shutdown
         
-        if "backend" in cls.processes:
-            # Check if process is actually still running
+        The server is asked to shut down (mariadb-admin shutdown) so it
+        flushes dirty pages and writes a checkpoint; the process is only
+        killed if it has not exited after MARIADB_SHUTDOWN_TIMEOUT seconds.
+        A killed server needs crash recovery on its next start.
+        
+        Returns:
+            bool: True if MariaDB shut down cleanly (or was not running)
+        """
+        process = cls.processes.pop("mariadb", None)
+        if process is None or process.poll() is not None:
+            return True
+        if timeout is None:
+            timeout = float(os.getenv('MARIADB_SHUTDOWN_TIMEOUT', Config.MARIADB_SHUTDOWN_TIMEOUT))
+        
+        import time
+        logger.info("⏹️  Stopping MariaDB (clean shutdown)...")
+        started = time.time()
+        requested = request_shutdown(ToolsManager.get_mariadb_path(), Config.MARIADB_PORT, Config.MARIADB_USER,
+                                     timeout=min(timeout, 10))
+        clean = False
+        if requested:
             try:
-                proc = cls.processes["backend"]
-                if proc.poll() is None:  # Process is still running
-                    logger.info("✅ Backend already running")
-                    return True
-                else:
-                    # Process died, remove it
-                    logger.warning("⚠️  Backend process died, restarting...")
-                    del cls.processes["backend"]
-            except:
-                del cls.processes["backend"]
+                process.wait(timeout=max(timeout - (time.time() - started), 1))
+                clean = True
+            except subprocess.TimeoutExpired:
+                logger.warning(f"⚠️  MariaDB did not finish shutting down within {timeout:.0f}s")
+        else:
+            logger.warning("⚠️  MariaDB did not accept the shutdown request")
+        
+        elapsed = time.time() - started
+        annotate(clean=clean, requested=requested, seconds=round(elapsed, 2))
+        if clean:
+            logger.info(f"✅ MariaDB shut down cleanly ({elapsed:.1f}s)")
+        else:
+            logger.warning("⚠️  Killing MariaDB - the next start will run crash recovery")
+            cls._stop_process("mariadb", process)
+        return clean
+    
+    @classmethod
+    def _app_running(cls, name: str) -> bool:
+        """Whether an app process is recorded and alive (a dead one is forgotten)"""
+        if name not in cls.processes:
+            return False
+        try:
+            if cls.processes[name].poll() is None:
+                return True
+            logger.warning(f"⚠️  {name.capitalize()} process died, restarting...")
+        except Exception:
+            pass
+        del cls.processes[name]
+        return False
+    
+    @staticmethod
+    def _app_env(component: str, port: Optional[int] = None, worker_id: Optional[int] = None) -> Dict[str, str]:
+        """
+        Environment with portable Node.js and pnpm in PATH, the tuning
+        profile's heap limit / Prisma pool, and PORT for an internal instance
+        """
+        env = os.environ.copy()
+        node_dir = str(ToolsManager.get_node_path().absolute())
+        pnpm_dir = str(ToolsManager.get_pnpm_path().absolute())
         
+        # Add portable tools to PATH (only for this subprocess)
+        if 'PATH' in env:
+            env['PATH'] = f"{node_dir};{pnpm_dir};{env['PATH']}"
+        else:
+            env['PATH'] = f"{node_dir};{pnpm_dir}"
+        
+        # Behind the proxy the app listens on an internal port; PORT in the
+        # process environment takes precedence over the app's .env files
+        if port:
+            env['PORT'] = str(port)
+        # Cluster workers: same convention as PM2, 0 runs once-only jobs
+        if worker_id is not None:
+            env['NODE_APP_INSTANCE'] = str(worker_id)
+        
+        # Tuning: like PORT, variables set here win over the app's .env files
+        tuning = get_tuning()
+        node_options = tuning.node_options(component, env.get('NODE_OPTIONS'))
+        if node_options:
+            env['NODE_OPTIONS'] = node_options
+        if component == "backend":
+            database_url = env.get('DATABASE_URL') or dotenv_values(Config.BACKEND_DIR / ".env").get('DATABASE_URL')
+            if database_url:
+                env['DATABASE_URL'] = tuning.database_url(database_url)
+        return env
+    
+    @staticmethod
+    def _creation_flags() -> int:
+        # Use CREATE_NEW_PROCESS_GROUP so we can kill the entire process tree later
+        creation_flags = subprocess.CREATE_NO_WINDOW
+        if sys.platform == 'win32':
+            creation_flags |= subprocess.CREATE_NEW_PROCESS_GROUP
+        return creation_flags
+    
+    @classmethod
+    def _spawn_backend(cls, port: Optional[int] = None, worker_id: Optional[int] = None) -> Optional[subprocess.Popen]:
+        """Launch a backend process (on port, else the port from its .env; worker_id in a cluster)"""
         # Use node directly instead of start.bat
         main_js = Config.BACKEND_DIR / "dist" / "src" / "main.js"
         if not main_js.exists():
             logger.error("❌ Backend build not found! Run: python agent.py install backend")
-            return False
+            return None
         
         # Check if node_modules exists
         if not (Config.BACKEND_DIR / "node_modules").exists():
             logger.error("❌ Dependencies not installed! Run: python agent.py setup-apps")
-            return False
+            return None
         
-        try:
-            logger.info("🚀 Starting backend...")
-            
-            # Prepare environment with Node.js and pnpm in PATH
-            env = os.environ.copy()
-            node_dir = str(ToolsManager.get_node_path().absolute())
-            pnpm_dir = str(ToolsManager.get_pnpm_path().absolute())
-            
-            # Add portable tools to PATH (only for this subprocess)
-            if 'PATH' in env:
-                env['PATH'] = f"{node_dir};{pnpm_dir};{env['PATH']}"
-            else:
-                env['PATH'] = f"{node_dir};{pnpm_dir}"
-            
-            # Create log file path
-            log_file = Config.LOGS_DIR / "backend.log"
-            log_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Use CREATE_NEW_PROCESS_GROUP so we can kill the entire process tree later
-            creation_flags = subprocess.CREATE_NO_WINDOW
-            if sys.platform == 'win32':
-                creation_flags |= subprocess.CREATE_NEW_PROCESS_GROUP
-            
-            # Get full path to node.exe
-            node_exe = ToolsManager.get_node_path() / "node.exe"
-            if not node_exe.exists():
-                logger.error(f"❌ Node.js not found at: {node_exe}")
-                logger.error("💡 Run: python agent.py setup")
-                return False
-            
-            # Start with output redirect to log file
-            with open(log_file, 'w') as log:
-                process = subprocess.Popen(
-                    [str(node_exe), str(main_js)],
-                    cwd=str(Config.BACKEND_DIR),
-                    stdout=log,
-                    stderr=subprocess.STDOUT,
-                    env=env,
-                    creationflags=creation_flags
-                )
-            
-            # Wait a bit and check if process is still running
-            import time
-            time.sleep(2)
-            
-            if process.poll() is not None:
-                logger.error(f"❌ Backend failed to start (exit code: {process.returncode})")
-                logger.error(f"📝 Check log: {log_file}")
-                return False
-            
-            cls.processes["backend"] = process
-            logger.info(f"✅ Backend started (PID: {process.pid})")
-            logger.info(f"🌐 Backend API: http://localhost:{Config.BACKEND_PORT}")
-            logger.info(f"📝 Backend log: {log_file}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"❌ Failed to start backend: {e}")
-            import traceback
-            logger.error(traceback.format_exc())
-            return False
-    
-    @classmethod
-    def start_frontend(cls) -> bool:
-        """Start frontend server (simple mode - no install)"""
-        # Kill any existing process on frontend port first
-        logger.info(f"🔍 Checking port {Config.FRONTEND_PORT}...")
-        cls.kill_process_on_port(Config.FRONTEND_PORT)
+        # Get full path to node.exe
+        node_exe = ToolsManager.get_node_path() / "node.exe"
+        if not node_exe.exists():
+            logger.error(f"❌ Node.js not found at: {node_exe}")
+            logger.error("💡 Run: python agent.py setup")
+            return None
         
-        if "frontend" in cls.processes:
-            # Check if process is actually still running
-            try:
-                proc = cls.processes["frontend"]
-                if proc.poll() is None:  # Process is still running
-                    logger.info("✅ Frontend already running")
-                    return True
-                else:
-                    # Process died, remove it
-                    logger.warning("⚠️  Frontend process died, restarting...")
-                    del cls.processes["frontend"]
-            except:
-                del cls.processes["frontend"]
+        logger.info("🚀 Starting backend..." if worker_id is None else f"🚀 Starting backend worker {worker_id}...")
+        log_file = Config.LOGS_DIR / "backend.log"
+        log_file.parent.mkdir(parents=True, exist_ok=True)
         
+        # Start with output redirect to log file
+        return cls._spawn_service(
+            "backend",
+            [str(node_exe), str(main_js)],
+            log_file,
+            cwd=str(Config.BACKEND_DIR),
+            env=cls._app_env("backend", port, worker_id),
+            creationflags=cls._creation_flags()
+        )
+    
+    @classmethod
+    def _spawn_frontend(cls, port: Optional[int] = None) -> Optional[subprocess.Popen]:
+        """Launch a frontend process (on port, else the port from its .env)"""
         # Check if frontend build exists
         if not Config.FRONTEND_DIR.exists():
             logger.error("❌ Frontend not found! Run: python agent.py install frontend")
-            return False
+            return None
         
         # Check if node_modules exists
         if not (Config.FRONTEND_DIR / "node_modules").exists():
             logger.error("❌ Dependencies not installed! Run: python agent.py setup-apps")
-            return False
+            return None
         
         # Get full path to pnpm executable
         pnpm_path = ToolsManager.get_pnpm_path()
         pnpm_exe = pnpm_path / "pnpm.exe"
         if not pnpm_exe.exists():
             logger.error("❌ pnpm not found! Run: python agent.py setup")
-            return False
+            return None
+        
+        logger.info("🚀 Starting frontend...")
+        log_file = Config.LOGS_DIR / "frontend.log"
+        log_file.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Start with output redirect to log file
+        return cls._spawn_service(
+            "frontend",
+            [str(pnpm_exe), "start"],
+            log_file,
+            cwd=str(Config.FRONTEND_DIR),
+            env=cls._app_env("frontend", port),
+            shell=False,
+            creationflags=cls._creation_flags()
+        )
+    
+    @classmethod
+    def _start_direct(cls, name: str, public_port: int) -> bool:
+        """Start an app listening on its public port itself (SERVICE_PROXY=off)"""
+        # Kill any existing process on the port first
+        logger.info(f"🔍 Checking port {public_port}...")
+        cls.kill_process_on_port(public_port)
+        
+        if cls._app_running(name):
+            logger.info(f"✅ {name.capitalize()} already running")
+            return True
         
+        log_file = Config.LOGS_DIR / f"{name}.log"
         try:
-            logger.info("🚀 Starting frontend...")
-            
-            # Prepare environment with Node.js and pnpm in PATH
-            env = os.environ.copy()
-            node_dir = str(ToolsManager.get_node_path().absolute())
-            pnpm_dir = str(ToolsManager.get_pnpm_path().absolute())
-            
-            # Add portable tools to PATH (only for this subprocess)
-            if 'PATH' in env:
-                env['PATH'] = f"{node_dir};{pnpm_dir};{env['PATH']}"
-            else:
-                env['PATH'] = f"{node_dir};{pnpm_dir}"
-            
-            # Create log file path
-            log_file = Config.LOGS_DIR / "frontend.log"
-            log_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Use CREATE_NEW_PROCESS_GROUP so we can kill the entire process tree later
-            creation_flags = subprocess.CREATE_NO_WINDOW
-            if sys.platform == 'win32':
-                creation_flags |= subprocess.CREATE_NEW_PROCESS_GROUP
-            
-            # Start with output redirect to log file
-            with open(log_file, 'w') as log:
-                process = subprocess.Popen(
-                    [str(pnpm_exe), "start"],
-                    cwd=str(Config.FRONTEND_DIR),
-                    stdout=log,
-                    stderr=subprocess.STDOUT,
-                    env=env,
-                    shell=False,
-                    creationflags=creation_flags
-                )
+            process = cls._spawn_backend() if name == "backend" else cls._spawn_frontend()
+            if process is None:
+                return False
             
             # Wait a bit and check if process is still running
             import time
-            time.sleep(2)
+            with trace_span('readiness wait', service=name):
+                time.sleep(2)
             
             if process.poll() is not None:
-                logger.error(f"❌ Frontend failed to start (exit code: {process.returncode})")
+                logger.error(f"❌ {name.capitalize()} failed to start (exit code: {process.returncode})")
                 logger.error(f"📝 Check log: {log_file}")
                 return False
             
-            cls.processes["frontend"] = process
-            logger.info(f"✅ Frontend started (PID: {process.pid})")
-            logger.info(f"🌐 Frontend URL: http://localhost:{Config.FRONTEND_PORT}")
-            logger.info(f"📝 Frontend log: {log_file}")
+            cls.processes[name] = process
+            logger.info(f"✅ {name.capitalize()} started (PID: {process.pid})")
+            logger.info(f"🌐 {name.capitalize()}: http://localhost:{public_port}")
+            logger.info(f"📝 {name.capitalize()} log: {log_file}")
             return True
             
         except Exception as e:
-            logger.error(f"❌ Failed to start frontend: {e}")
+            logger.error(f"❌ Failed to start {name}: {e}")
             import traceback
             logger.error(traceback.format_exc())
             return False
     
     @classmethod
-    def stop_all(cls):
-        """Stop all running processes (including child processes)"""
-        import time
-        
-        # Check if there are any processes to stop
-        if not cls.processes:
-            logger.info("ℹ️  No services running")
-            return
+    def _ensure_proxy(cls, name: str):
+        """Start the front proxy of an app (taking its public port over from leftovers)"""
+        proxy = get_service_proxy(name)
+        if proxy.loop is None:
+            cls.kill_process_on_port(proxy.port)
+            proxy.start()
+        if lazy_start_enabled():
+            proxy.enable_activation(
+                activate=cls.start_backend if name == "backend" else cls.start_frontend,
+                deactivate=lambda: cls._idle_stop(name),
+                idle_timeout=float(os.getenv('LAZY_IDLE_MINUTES', Config.LAZY_IDLE_MINUTES)) * 60,
+                hold_timeout=float(os.getenv('LAZY_HOLD_TIMEOUT', Config.LAZY_HOLD_TIMEOUT))
+            )
+        return proxy
+    
+    @classmethod
+    def _idle_stop(cls, name: str) -> bool:
+        """Stop an idle app (lazy start); skipped while an install or update runs"""
+        if cls.installation_in_progress or get_install_journal().status == STATUS_RUNNING:
+            return False
+        cls.stop_service(name)
+        return True
+    
+    @classmethod
+    def _start_behind_proxy(cls, name: str) -> bool:
+        """
+        Blue/green start: launch a new instance on an internal port, wait for
+        its health check, switch the proxy to it, then drain and stop the
+        instance it replaced (if any) in the background
+        """
+        proxy = cls._ensure_proxy(name)
+        log_file = Config.LOGS_DIR / f"{name}.log"
+        health_path = os.getenv(f'{name.upper()}_HEALTH_PATH', getattr(Config, f'{name.upper()}_HEALTH_PATH'))
+        health_timeout = float(os.getenv('PROXY_HEALTH_TIMEOUT', Config.PROXY_HEALTH_TIMEOUT))
+        
+        try:
+            port = free_port()
+            process = cls._spawn_backend(port) if name == "backend" else cls._spawn_frontend(port)
+            if process is None:
+                return False
+            
+            with trace_span('health check', service=name, port=port) as span:
+                healthy = wait_healthy(port, health_path, health_timeout, process)
+                if not healthy:
+                    span.fail()
+            if not healthy:
+                if process.poll() is not None:
+                    logger.error(f"❌ {name.capitalize()} failed to start (exit code: {process.returncode})")
+                else:
+                    logger.error(f"❌ {name.capitalize()} not healthy after {health_timeout:.0f}s, stopping it")
+                    cls._stop_process(name, process)
+                logger.error(f"📝 Check log: {log_file}")
+                return False
+            
+            old_process = cls.processes.get(name)
+            cls.processes[name] = process
+            cls.instance_ports[name] = port
+            old_upstreams = proxy.switch(port)
+            logger.info(f"✅ {name.capitalize()} started (PID: {process.pid}, internal port {port})")
+            logger.info(f"🌐 {name.capitalize()}: http://localhost:{proxy.port}")
+            logger.info(f"📝 {name.capitalize()} log: {log_file}")
+            
+            if old_process is not None and old_process is not process:
+                def retire():
+                    proxy.drain(old_upstreams, float(os.getenv('PROXY_DRAIN_TIMEOUT', Config.PROXY_DRAIN_TIMEOUT)))
+                    cls._stop_process(f"previous {name}", old_process)
+                threading.Thread(target=retire, name=f'retire-{name}', daemon=True).start()
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to start {name}: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            return False
+    
+    @classmethod
+    def _cluster_active(cls) -> bool:
+        return cls.cluster is not None and bool(cls.cluster.workers)
+    
+    @classmethod
+    def backend_cpu(cls, interval: float = 1.0) -> Optional[float]:
+        """CPU used by the backend (all workers / child processes) as % of the machine"""
+        import time
+        import psutil
+        if cls._cluster_active():
+            roots = [w.process.pid for w in cls.cluster.workers.values() if w.alive]
+        elif "backend" in cls.processes and cls.processes["backend"].poll() is None:
+            roots = [cls.processes["backend"].pid]
+        else:
+            return None
+        processes = []
+        for pid in roots:
+            try:
+                root = psutil.Process(pid)
+                processes += [root, *root.children(recursive=True)]
+            except psutil.Error:
+                continue
+        for process in processes:
+            try:
+                process.cpu_percent(None)  # First call only sets the baseline
+            except psutil.Error:
+                pass
+        time.sleep(interval)
+        total = 0.0
+        for process in processes:
+            try:
+                total += process.cpu_percent(None)
+            except psutil.Error:
+                pass
+        return total / (psutil.cpu_count() or 1)
+    
+    @classmethod
+    def _backend_cluster(cls) -> WorkerCluster:
+        """The backend worker cluster (created on first use)"""
+        if cls.cluster is None:
+            cls.cluster = WorkerCluster(
+                "backend",
+                get_service_proxy("backend"),
+                spawn=lambda port, worker_id: cls._spawn_backend(port, worker_id),
+                stop=cls._stop_process,
+                on_change=cls._cluster_changed
+            )
+        return cls.cluster
+    
+    @classmethod
+    def _cluster_changed(cls, cluster: WorkerCluster):
+        # The primary worker stands in for "the backend process" (status, stop_all)
+        primary = cluster.primary()
+        if primary is not None:
+            cls.processes["backend"] = primary.process
+            cls.instance_ports["backend"] = primary.port
+        else:
+            cls.processes.pop("backend", None)
+            cls.instance_ports.pop("backend", None)
+    
+    @classmethod
+    @traced('start_backend')
+    def start_backend(cls) -> bool:
+        """Start backend server (simple mode - no install)"""
+        if not proxy_enabled():
+            return cls._start_direct("backend", Config.BACKEND_PORT)
+        if cluster_enabled():
+            if cls._cluster_active():
+                logger.info("✅ Backend cluster already running")
+                return True
+            cls._ensure_proxy("backend")
+            workers = configured_workers()
+            annotate(workers=workers)
+            if not cls._backend_cluster().start(workers):
+                logger.error(f"📝 Check log: {Config.LOGS_DIR / 'backend.log'}")
+                return False
+            logger.info(f"🌐 Backend: http://localhost:{Config.BACKEND_PORT}")
+            return True
+        if cls._app_running("backend"):
+            logger.info("✅ Backend already running")
+            return True
+        return cls._start_behind_proxy("backend")
+    
+    @classmethod
+    @traced('start_frontend')
+    def start_frontend(cls) -> bool:
+        """Start frontend server (simple mode - no install)"""
+        if not proxy_enabled():
+            return cls._start_direct("frontend", Config.FRONTEND_PORT)
+        if cls._app_running("frontend"):
+            logger.info("✅ Frontend already running")
+            return True
+        return cls._start_behind_proxy("frontend")
+    
+    @classmethod
+    @traced('restart_service')
+    def restart_service(cls, name: str) -> bool:
+        """
+        Restart the backend or frontend
+        
+        Behind the proxy the new instance takes over once healthy and the old
+        one stops after its running requests finish, so clients never see a
+        refused connection; backend workers are replaced one at a time.
+        Without the proxy it is a stop + start.
+        """
+        annotate(service=name)
+        if name == "backend" and cls._cluster_active():
+            return cls.cluster.rolling_restart()
+        if name == "backend" and proxy_enabled() and cluster_enabled():
+            return cls.start_backend()
+        if proxy_enabled():
+            return cls._start_behind_proxy(name)
+        cls.stop_service(name)
+        return cls.start_backend() if name == "backend" else cls.start_frontend()
+    
+    @classmethod
+    def stop_service(cls, name: str):
+        """Stop one service (behind the proxy: maintenance page first, running requests drained)"""
+        if name in ("backend", "frontend") and proxy_enabled():
+            get_service_proxy(name).parked = False  # Stopped on purpose: no start on demand
+        if name == "backend" and cls._cluster_active():
+            cls.cluster.stop()
+            return
+        process = cls.processes.pop(name, None)
+        cls.instance_ports.pop(name, None)
+        if name in ("backend", "frontend") and proxy_enabled():
+            proxy = get_service_proxy(name)
+            if proxy.upstreams:
+                proxy.drain(proxy.switch(None), float(os.getenv('PROXY_DRAIN_TIMEOUT', Config.PROXY_DRAIN_TIMEOUT)))
+        if process is not None:
+            cls._stop_process(name, process)
+    
+    @staticmethod
+    def _stop_process(name: str, process: subprocess.Popen):
+        """Stop a process including its child processes"""
+        try:
+            # Check if process is still running
+            if process.poll() is not None:
+                logger.info(f"ℹ️  {name} already stopped")
+                return
+            
+            logger.info(f"⏹️  Stopping {name}...")
+            
+            # On Windows, kill the entire process tree (parent + all children)
+            # Because we started with CREATE_NEW_PROCESS_GROUP, taskkill /T will work properly
+            if sys.platform == 'win32':
+                try:
+                    # Use taskkill with /T flag to terminate process tree
+                    result = subprocess.run(
+                        ['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                        capture_output=True,
+                        text=True,
+                        timeout=10,
+                        creationflags=subprocess.CREATE_NO_WINDOW
+                    )
+                    
+                    if result.returncode == 0:
+                        logger.info(f"✅ {name} stopped (including all child processes)")
+                    else:
+                        # taskkill failed, try process.kill() as fallback
+                        logger.warning(f"⚠️  taskkill returned {result.returncode}, using fallback...")
+                        process.kill()
+                        process.wait(timeout=5)
+                        logger.info(f"✅ {name} stopped (fallback method)")
+                        
+                except subprocess.TimeoutExpired:
+                    logger.warning(f"⚠️  taskkill timeout for {name}, force killing...")
+                    process.kill()
+                    process.wait(timeout=5)
+                    logger.info(f"✅ {name} force killed")
+                except Exception as e:
+                    logger.warning(f"⚠️  Error stopping {name}: {e}, trying fallback...")
+                    try:
+                        process.kill()
+                        process.wait(timeout=5)
+                        logger.info(f"✅ {name} stopped (fallback)")
+                    except:
+                        pass
+            else:
+                # On Linux/Mac, try graceful termination first
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                    logger.info(f"✅ {name} stopped gracefully")
+                except subprocess.TimeoutExpired:
+                    # Process didn't terminate gracefully, force kill
+                    logger.warning(f"⚠️  {name} didn't stop gracefully, forcing...")
+                    process.kill()
+                    process.wait(timeout=5)
+                    logger.info(f"✅ {name} force stopped")
+                
+        except Exception as e:
+            logger.error(f"❌ Failed to stop {name}: {e}")
+            # Final fallback attempt
+            try:
+                if sys.platform == 'win32':
+                    subprocess.run(
+                        ['taskkill', '/F', '/T', '/PID', str(process.pid)],
+                        capture_output=True,
+                        timeout=5,
+                        creationflags=subprocess.CREATE_NO_WINDOW
+                    )
+                else:
+                    process.kill()
+            except:
+                pass
+    
+    @classmethod
+    @traced('stop_services')
+    def stop_all(cls):
+        """Stop all running processes (including child processes)"""
+        # Check if there are any processes to stop
+        if not cls.processes:
+            logger.info("ℹ️  No services running")
+            return
         
         # Create a copy of items to avoid dictionary changed size during iteration
         processes_to_stop = list(cls.processes.items())
@@ -1191,81 +1890,28 @@ class ProcessManager:
         
         logger.info(f"⏹️  Stopping {running_count} running service(s)...")
         
+        # Behind the proxy, clients get the maintenance page from now on and
+        # requests already running finish before the apps are stopped
+        if proxy_enabled():
+            drain_timeout = float(os.getenv('PROXY_DRAIN_TIMEOUT', Config.PROXY_DRAIN_TIMEOUT))
+            for name in ("frontend", "backend"):
+                proxy = get_service_proxy(name)
+                proxy.parked = False
+                if proxy.upstreams and not (name == "backend" and cls._cluster_active()):
+                    proxy.drain(proxy.switch(None), drain_timeout)
+            if cls._cluster_active():
+                cls.cluster.stop()
+                processes_to_stop = [(name, process) for name, process in processes_to_stop if name != "backend"]
+        
+        # MariaDB last, once nothing uses it, with a clean shutdown
         for name, process in processes_to_stop:
-            try:
-                # Check if process is still running
-                if process.poll() is not None:
-                    logger.info(f"ℹ️  {name} already stopped")
-                    continue
-                
-                logger.info(f"⏹️  Stopping {name}...")
-                
-                # On Windows, kill the entire process tree (parent + all children)
-                # Because we started with CREATE_NEW_PROCESS_GROUP, taskkill /T will work properly
-                if sys.platform == 'win32':
-                    try:
-                        # Use taskkill with /T flag to terminate process tree
-                        result = subprocess.run(
-                            ['taskkill', '/F', '/T', '/PID', str(process.pid)],
-                            capture_output=True,
-                            text=True,
-                            timeout=10,
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        
-                        if result.returncode == 0:
-                            logger.info(f"✅ {name} stopped (including all child processes)")
-                        else:
-                            # taskkill failed, try process.kill() as fallback
-                            logger.warning(f"⚠️  taskkill returned {result.returncode}, using fallback...")
-                            process.kill()
-                            process.wait(timeout=5)
-                            logger.info(f"✅ {name} stopped (fallback method)")
-                            
-                    except subprocess.TimeoutExpired:
-                        logger.warning(f"⚠️  taskkill timeout for {name}, force killing...")
-                        process.kill()
-                        process.wait(timeout=5)
-                        logger.info(f"✅ {name} force killed")
-                    except Exception as e:
-                        logger.warning(f"⚠️  Error stopping {name}: {e}, trying fallback...")
-                        try:
-                            process.kill()
-                            process.wait(timeout=5)
-                            logger.info(f"✅ {name} stopped (fallback)")
-                        except:
-                            pass
-                else:
-                    # On Linux/Mac, try graceful termination first
-                    process.terminate()
-                    try:
-                        process.wait(timeout=10)
-                        logger.info(f"✅ {name} stopped gracefully")
-                    except subprocess.TimeoutExpired:
-                        # Process didn't terminate gracefully, force kill
-                        logger.warning(f"⚠️  {name} didn't stop gracefully, forcing...")
-                        process.kill()
-                        process.wait(timeout=5)
-                        logger.info(f"✅ {name} force stopped")
-                    
-            except Exception as e:
-                logger.error(f"❌ Failed to stop {name}: {e}")
-                # Final fallback attempt
-                try:
-                    if sys.platform == 'win32':
-                        subprocess.run(
-                            ['taskkill', '/F', '/T', '/PID', str(process.pid)],
-                            capture_output=True,
-                            timeout=5,
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                    else:
-                        process.kill()
-                except:
-                    pass
+            if name != "mariadb":
+                cls._stop_process(name, process)
+        cls.stop_mariadb()
         
         # Clear all processes
         cls.processes.clear()
+        cls.instance_ports.clear()
         logger.info("✅ All services have been stopped")
 
 
@@ -1279,11 +1925,39 @@ class Agent:
         # Create directories
         for dir_path in [Config.TOOLS_DIR, Config.APPS_DIR, Config.DATA_DIR, Config.LOGS_DIR]:
             dir_path.mkdir(parents=True, exist_ok=True)
+        
+        # Rotate/compress service and agent logs in the background
+        get_log_rotator().start()
+        
+        # Scheduled database backups and binary log archiving while MariaDB
+        # runs (not during installs/updates)
+        def database_maintenance_allowed():
+            return ("mariadb" in ProcessManager.processes
+                    and ProcessManager.processes["mariadb"].poll() is None
+                    and get_install_journal().status != STATUS_RUNNING)
+        get_backups().start(database_maintenance_allowed, full=binlog_enabled())
+        get_binlog_archiver().start(database_maintenance_allowed)
+        
+        # Slow query log → per-fingerprint digest
+        get_slow_query_log().start()
+        # Global status counters → rates (only while the agent's MariaDB runs)
+        get_db_metrics().start(lambda: "mariadb" in ProcessManager.processes
+                               and ProcessManager.processes["mariadb"].poll() is None)
+        
+        # ANALYZE / OPTIMIZE TABLE in the maintenance windows while the clinic is idle
+        get_maintenance().start(lambda: database_maintenance_allowed() and not get_backups().running,
+                                load=Agent.maintenance_load)
+        
+        # Tag recorded spans with the installed release
+        get_tracer().release_provider = VersionManager.release_label
+        # Install/update runs are written to logs/traces as Chrome trace files
+        get_trace_recorder()
     
     def are_apps_installed(self) -> bool:
-        """Check if both frontend and backend are installed"""
-        return Config.FRONTEND_DIR.exists() and Config.BACKEND_DIR.exists()
+        """Check if both frontend and backend are completely installed (not just present)"""
+        return AppManager.is_installed("frontend") and AppManager.is_installed("backend")
     
+    @traced('auto_install_and_setup')
     def auto_install_and_setup(self, progress_callback=None, log_callback=None):
         """
         Perform first-time installation and setup
@@ -1328,74 +2002,17 @@ class Agent:
         log("")
         
         try:
-            # Step 0: Setup tools first (Node.js, pnpm, MariaDB) (0-20%)
-            if progress_callback:
-                progress_callback(0, 'tools', 'active',
-                                'Setting Up Tools',
-                                'Installing Node.js, pnpm, and MariaDB...')
-            
-            log("🔧 Setting up required tools...")
-            if not self.setup_tools():
-                log("❌ Failed to setup tools", 'error')
-                log("💡 Tools include: Node.js, pnpm, MariaDB", 'warning')
-                return False
-            
-            if progress_callback:
-                progress_callback(20, 'tools', 'completed')
-            
-            # Step 1: Download applications (20-40%)
-            if progress_callback:
-                progress_callback(20, 'download', 'active', 
-                                'Downloading Applications', 
-                                'Fetching latest releases from GitHub...')
-            
-            log("📥 Downloading frontend...")
-            if not self.download_and_install("frontend"):
-                log("❌ Failed to download frontend", 'error')
-                return False
-            
-            if progress_callback:
-                progress_callback(30, 'download', 'active')
-            
-            log("📥 Downloading backend...")
-            if not self.download_and_install("backend"):
-                log("❌ Failed to download backend", 'error')
-                return False
-            
-            if progress_callback:
-                progress_callback(40, 'download', 'completed')
-            
-            # Step 2: Install dependencies (40-75%)
-            if progress_callback:
-                progress_callback(40, 'install', 'active',
-                                'Installing Dependencies',
-                                'Setting up backend dependencies...')
-            
-            log("📦 Setting up applications...")
-            
-            # Setup with granular progress updates
-            if not self._setup_apps_with_progress("all", progress_callback, log):
-                log("❌ Failed to setup applications", 'error')
-                return False
-            
-            if progress_callback:
-                progress_callback(75, 'install', 'completed')
-            
-            # Step 3: Database is already done in setup_apps (75-80%)
-            if progress_callback:
-                progress_callback(80, 'database', 'completed',
-                                'Database Ready',
-                                'MariaDB configured and migrations complete')
-            
-            # Step 4: Start services (80-95%)
+            # Tools, downloads, extraction, dependency installs and database
+            # setup run as a task graph: independent steps overlap within the
+            # network/disk/CPU budgets and progress is measured on the graph
+            self._web_log_callback = log  # Store for use in subprocess calls
+            graph = self.build_install_graph(log)
             if progress_callback:
-                progress_callback(80, 'start', 'active',
-                                'Starting Services',
-                                'Launching MariaDB, backend, and frontend...')
+                graph.add_listener(self.graph_progress_listener(progress_callback, INSTALL_STEP_TITLES))
             
-            log("🚀 Starting services...")
-            if not self.start_all(skip_setup=True):
-                log("❌ Failed to start services", 'error')
+            if not self.run_journaled(graph, 'install', ['backend', 'frontend']):
+                failed = graph.failed.title if graph.failed else 'installation'
+                log(f"❌ {failed} failed", 'error')
                 return False
             
             if progress_callback:
@@ -1415,17 +2032,524 @@ class Agent:
             except Exception as e:
                 log(f"⚠️  Could not create shortcuts: {e}", 'warning')
             
-            log("✅ First-time installation completed successfully!", 'success')
-            return True
+            log("✅ First-time installation completed successfully!", 'success')
+            return True
+            
+        except Exception as e:
+            log(f"❌ Auto-install failed: {e}", 'error')
+            import traceback
+            logger.error(traceback.format_exc())
+            return False
+        finally:
+            # Clear flag after installation completes (success or fail)
+            ProcessManager.installation_in_progress = False
+    
+    @staticmethod
+    def graph_progress_listener(progress_callback, step_titles: Dict[str, str]):
+        """
+        Adapt task graph events to
+        progress_callback(progress, step, status, title, description, eta=seconds)
+        
+        Progress and ETA come from an EtaEstimator: steps are weighted by
+        their durations in earlier runs and running steps are extrapolated
+        from their live throughput. Updates within a step (and the graph's
+        periodic ticks) are forwarded whenever the percentage or the ETA
+        changes.
+        """
+        last = {'progress': -1, 'eta': None, 'step': None}
+        estimator = {}
+        
+        def listener(graph, task):
+            if 'eta' not in estimator:
+                estimator['eta'] = EtaEstimator(graph)
+                estimator['eta'].apply_weights()
+            progress = int(estimator['eta'].progress())
+            eta = int(estimator['eta'].eta())
+            changed = progress != last['progress'] or eta != last['eta']
+            if task is None:
+                if not changed or last['step'] is None:
+                    return
+                progress_callback(progress, last['step'], 'active', step_titles.get(last['step']), None, eta=eta)
+            elif task.state == RUNNING:
+                if task.fraction and not changed:
+                    return
+                progress_callback(progress, task.step, 'active', step_titles.get(task.step), task.title, eta=eta)
+                last['step'] = task.step
+            elif task.state == DONE:
+                progress_callback(progress, task.step, graph.step_status(task.step), eta=eta)
+            last['progress'], last['eta'] = progress, eta
+        
+        return listener
+    
+    def _download_task(self, component: str, downloads: Dict):
+        """Task function: download a release, reporting bytes as task progress"""
+        def run(task):
+            result = self.download_release(
+                component,
+                progress_callback=lambda done, total: task.report(done=done, total=total, unit='bytes')
+            )
+            if not result:
+                return False
+            downloads[component] = result
+            return True
+        return run
+    
+    def _release_options(self, component: str, downloads: Dict) -> tuple:
+        """
+        Journal checkpoint/resume options for a component's download and
+        extract tasks
+        
+        A journaled download is still good if its archive is intact, or if
+        the release it fetched is already completely extracted (the archive
+        is deleted after extraction). An extraction is good if the app's
+        manifest verifies for the same release tag.
+        """
+        app_dir = Config.FRONTEND_DIR if component == "frontend" else Config.BACKEND_DIR
+        
+        def download_checkpoint(task):
+            zip_path, tag = downloads[component]
+            return {'zip': str(zip_path), 'tag': tag, 'size': zip_path.stat().st_size, 'sha256': file_digest(zip_path)}
+        
+        def download_resume(data):
+            if not data:
+                return False
+            zip_path = Path(data['zip'])
+            if zip_path.exists() and zip_path.stat().st_size == data['size'] and file_digest(zip_path) == data['sha256']:
+                downloads[component] = (zip_path, data['tag'])
+                return True
+            # Already extracted (or staged, in a staged update)
+            for extracted in (app_dir, AppManager.staging_dir(component)):
+                if AppManager.verify_install(extracted, data['tag']):
+                    downloads[component] = (None, data['tag'])
+                    return True
+            return False
+        
+        def extract_checkpoint(task):
+            manifest = AppManager.read_manifest(app_dir) or {}
+            return {'tag': manifest.get('tag'), 'digest': manifest.get('digest')}
+        
+        def extract_resume(data):
+            tag = downloads[component][1]
+            if not AppManager.verify_install(app_dir, tag):
+                return False
+            # The run may have stopped between extraction and the bookkeeping
+            self._finish_release(component, app_dir, tag)
+            zip_path = downloads[component][0]
+            if zip_path and zip_path.exists():
+                zip_path.unlink()
+            return True
+        
+        return (
+            {'checkpoint': download_checkpoint, 'resume': download_resume},
+            {'checkpoint': extract_checkpoint, 'resume': extract_resume}
+        )
+    
+    @staticmethod
+    def _dependencies_options(component: str, locate=None) -> Dict:
+        """
+        Journal options for pnpm install: skip it while the lockfile is unchanged
+        
+        Args:
+            locate: Optional function() returning the app directory the
+                install runs in (default: the live app directory)
+        """
+        locate = locate or (lambda: AppManager.app_dir(component))
+        
+        def resume(data):
+            app_dir = locate()
+            if not data or not AppManager.dependencies_installed(app_dir):
+                return False
+            if component == "backend" and not (app_dir / "node_modules" / ".prisma" / "client").exists():
+                return False
+            return data.get('lock') == AppManager.dependencies_fingerprint(app_dir)
+        
+        return {
+            'checkpoint': lambda task: {'lock': AppManager.dependencies_fingerprint(locate())},
+            'resume': resume
+        }
+    
+    @staticmethod
+    def _migrations_options() -> Dict:
+        """Journal options for migrations: skip them while the migration set is unchanged"""
+        return {
+            'checkpoint': lambda task: {'migrations': AppManager.migrations_fingerprint(Config.BACKEND_DIR)},
+            'resume': lambda data: bool(data) and data.get('migrations') == AppManager.migrations_fingerprint(Config.BACKEND_DIR)
+        }
+    
+    def _journaled_release_outdated(self, journal, components: List[str]) -> bool:
+        """
+        Whether an unfinished run downloaded a release that is no longer the
+        latest (a newer one came out before the retry)
+        
+        Unknown (GitHub unreachable) counts as current, so offline retries
+        still resume.
+        """
+        for component in components:
+            data = journal.checkpoint(f'download {component}')
+            if not data or not data.get('tag'):
+                continue
+            client = self.frontend_client if component == "frontend" else self.backend_client
+            latest = client.get_latest_release()
+            if latest and latest['tag_name'] != data['tag']:
+                logger.info(f"🆕 {component.capitalize()} {latest['tag_name']} was released after the interrupted "
+                            f"run fetched {data['tag']}: starting over")
+                return True
+        return False
+    
+    def run_journaled(self, graph: TaskGraph, kind: str, components: List[str]) -> bool:
+        """
+        Run an install/update graph under the install journal
+        
+        An unfinished run of the same kind and components is resumed: steps
+        whose journaled results still verify are skipped. It starts over
+        instead if a newer release came out since it downloaded its own.
+        """
+        journal = get_install_journal()
+        fresh = journal.unfinished(kind) and self._journaled_release_outdated(journal, components)
+        resumed = journal.begin(kind, components, fresh=fresh)
+        annotate(resumed=resumed, run_id=journal.state.get('run_id'))
+        try:
+            ok = graph.run(journal=journal)
+        except Exception as e:
+            journal.fail(str(e))
+            raise
+        if ok:
+            journal.complete()
+        else:
+            journal.fail(graph.failed.error if graph.failed else None)
+        return ok
+    
+    def build_install_graph(self, log) -> TaskGraph:
+        """
+        First-time installation as a task graph
+        
+        Both downloads run at once, MariaDB is set up and started while they
+        run, and each app's dependencies install as soon as its own archive
+        is extracted. Weights approximate each step's share of a typical
+        install and drive the progress percentage.
+        """
+        graph = TaskGraph('install')
+        downloads: Dict[str, tuple] = {}
+        
+        def setup_pnpm(task):
+            if not ToolsManager.setup_pnpm():
+                return False
+            ToolsManager.setup_pnpm_config()
+            return True
+        
+        def setup_mariadb(task):
+            return ToolsManager.setup_mariadb() and ToolsManager.init_mariadb()
+        
+        def start_services(task):
+            # Restart cleanly: stop the MariaDB instance used for setup first
+            ProcessManager.stop_all()
+            return self.start_all(skip_setup=True)
+        
+        graph.add('node', lambda task: ToolsManager.setup_nodejs(),
+                  resources={RESOURCE_DISK: 1}, weight=1, step='tools', title='Setting up Node.js')
+        graph.add('pnpm', setup_pnpm,
+                  resources={RESOURCE_NET: 1}, weight=2, step='tools', title='Setting up pnpm')
+        graph.add('mariadb', setup_mariadb,
+                  resources={RESOURCE_DISK: 1}, weight=3, step='database', title='Initializing MariaDB')
+        graph.add('start mariadb', lambda task: ProcessManager.start_mariadb(), deps=['mariadb'],
+                  weight=1, step='database', title='Starting MariaDB')
+        
+        for component in ('backend', 'frontend'):
+            name = component.capitalize()
+            download_options, extract_options = self._release_options(component, downloads)
+            graph.add(f'download {component}', self._download_task(component, downloads),
+                      resources={RESOURCE_NET: 1}, weight=6, step='download', title=f'Downloading {name}',
+                      **download_options)
+            graph.add(f'extract {component}',
+                      lambda task, c=component: self.install_release(c, *downloads[c]),
+                      deps=[f'download {component}'],
+                      resources={RESOURCE_DISK: 1}, weight=2, step='download', title=f'Extracting {name}',
+                      **extract_options)
+        
+        graph.add('backend dependencies', lambda task: self._install_backend_dependencies(log_callback=log),
+                  deps=['extract backend', 'node', 'pnpm'],
+                  resources={RESOURCE_NET: 1, RESOURCE_CPU: 1}, weight=8, step='install',
+                  title='Installing backend dependencies', **self._dependencies_options('backend'))
+        graph.add('frontend dependencies', lambda task: self._setup_frontend(log_callback=log),
+                  deps=['extract frontend', 'node', 'pnpm'],
+                  resources={RESOURCE_NET: 1, RESOURCE_CPU: 1}, weight=8, step='install',
+                  title='Installing frontend dependencies', **self._dependencies_options('frontend'))
+        graph.add('backend database', lambda task: self._setup_backend_database(),
+                  deps=['backend dependencies', 'start mariadb'],
+                  resources={RESOURCE_CPU: 1}, weight=3, step='database',
+                  title='Running database migrations', **self._migrations_options())
+        graph.add('start services', start_services,
+                  deps=['backend database', 'frontend dependencies'],
+                  weight=3, step='start', title='Starting services')
+        return graph
+    
+    def build_update_graph(self, components: List[str], setup: bool = False, restart: bool = False,
+                            on_stopped=None, before_start=None) -> TaskGraph:
+        """
+        Update of the given components as a task graph
+        
+        Releases are downloaded while the services are still running. With
+        setup and UPDATE_MODE=staged, each release is also extracted into
+        Config.STAGING_DIR and gets its dependencies and Prisma client there,
+        still with the services up; they are stopped only to swap the
+        directories and run the migrations. Otherwise (in place) services
+        stop once every download has finished and the releases are extracted
+        over the running apps, with setup afterwards. With restart the
+        services are started at the end, and the time they were down is
+        recorded as a 'downtime' span. Backend updates with setup snapshot
+        the MariaDB data directory while it is stopped (see rollback_update).
+        
+        Args:
+            on_stopped: Optional function() called once services are stopped
+            before_start: Optional function() called before services restart
+        """
+        staged = setup and os.getenv('UPDATE_MODE', Config.UPDATE_MODE) == 'staged'
+        graph = TaskGraph('update')
+        downloads: Dict[str, tuple] = {}
+        downtime = {}
+        
+        def stop_services(task):
+            logger.info("⏹️  Stopping services for update...")
+            if restart:
+                downtime['span'] = get_tracer().start_span('downtime', {
+                    'components': ','.join(components),
+                    'mode': 'staged' if staged else 'in_place'
+                }, activate=False)
+            ProcessManager.stop_all()
+            if on_stopped:
+                on_stopped()
+            return True
+        
+        # MariaDB is stopped with the services anyway: a cold snapshot of its
+        # data directory here is what rollback_update restores if the
+        # migrations or the restart fail
+        snapshot = setup and 'backend' in components and snapshot_before_update()
+        mariadb_deps = ['snapshot database'] if snapshot else ['stop services']
+        
+        def snapshot_data(task):
+            return get_snapshots().create('before update', meta={
+                'release': VersionManager.release_label(),
+                'components': components
+            })
+        
+        def add_snapshot_task(step):
+            graph.add('snapshot database', snapshot_data, deps=['stop services'],
+                      resources={RESOURCE_DISK: 1}, weight=2, step=step, title='Snapshotting the database',
+                      checkpoint=lambda task: {'snapshot': task.result['id']})
+        
+        def end_downtime(graph, task):
+            # A failed update leaves services down: close the measurement as failed
+            if task is not None and task.state == FAILED and 'span' in downtime:
+                get_tracer().end_span(downtime.pop('span'), False, f'{task.title} failed')
+        graph.add_listener(end_downtime)
+        
+        options = {component: self._release_options(component, downloads) for component in components}
+        for component in components:
+            name = component.capitalize()
+            graph.add(f'download {component}', self._download_task(component, downloads),
+                      resources={RESOURCE_NET: 1}, weight=6, step='downloading', title=f'Downloading {name} update',
+                      **options[component][0])
+        
+        if staged:
+            def release_dir(component):
+                """Where the new release is: staging until the swap, then the app directory"""
+                staging_dir = AppManager.staging_dir(component)
+                if not staging_dir.exists() and AppManager.verify_install(AppManager.app_dir(component),
+                                                                          downloads[component][1]):
+                    return AppManager.app_dir(component)
+                return staging_dir
+            
+            def stage_resume(component):
+                def resume(data):
+                    tag = downloads[component][1]
+                    return AppManager.verify_install(release_dir(component), tag)
+                return resume
+            
+            def swap(component):
+                if not AppManager.swap_release(component):
+                    return False
+                self._finish_release(component, AppManager.app_dir(component), downloads[component][1])
+                return True
+            
+            def swap_resume(component):
+                def resume(data):
+                    tag = downloads[component][1]
+                    if AppManager.staging_dir(component).exists():
+                        return False
+                    if not AppManager.verify_install(AppManager.app_dir(component), tag):
+                        return False
+                    self._finish_release(component, AppManager.app_dir(component), tag)
+                    return True
+                return resume
+            
+            prepared = []
+            for component in components:
+                name = component.capitalize()
+                graph.add(f'stage {component}',
+                          lambda task, c=component: self.stage_release(c, *downloads[c]),
+                          deps=[f'download {component}'], resources={RESOURCE_DISK: 1}, weight=2,
+                          step='staging', title=f'Staging {name}',
+                          checkpoint=lambda task, c=component: {'tag': downloads[c][1]},
+                          resume=stage_resume(component))
+                install = self._install_backend_dependencies if component == 'backend' else self._setup_frontend
+                graph.add(f'{component} dependencies',
+                          lambda task, c=component, install=install: install(app_dir=release_dir(c)),
+                          deps=[f'stage {component}'], resources={RESOURCE_NET: 1, RESOURCE_CPU: 1},
+                          weight=8, step='staging', title=f'Installing {component} dependencies',
+                          **self._dependencies_options(component, lambda c=component: release_dir(c)))
+                prepared.append(f'{component} dependencies')
+            
+            graph.add('stop services', stop_services, deps=prepared,
+                      weight=1, step='stopping_services', title='Stopping services')
+            if snapshot:
+                add_snapshot_task('swapping')
+            last = []
+            for component in components:
+                graph.add(f'swap {component}', lambda task, c=component: swap(c), deps=['stop services'],
+                          resources={RESOURCE_DISK: 1}, weight=1, step='swapping',
+                          title=f'Switching {component.capitalize()} to the new release',
+                          checkpoint=lambda task, c=component: {'tag': downloads[c][1]},
+                          resume=swap_resume(component))
+                last.append(f'swap {component}')
+            if 'backend' in components:
+                graph.add('start mariadb', lambda task: ProcessManager.start_mariadb(), deps=mariadb_deps,
+                          weight=1, step='migrating', title='Starting MariaDB')
+                graph.add('backend database', lambda task: self._setup_backend_database(),
+                          deps=['swap backend', 'start mariadb'], resources={RESOURCE_CPU: 1},
+                          weight=3, step='migrating', title='Running database migrations',
+                          **self._migrations_options())
+                last.append('backend database')
+        else:
+            graph.add('stop services', stop_services, deps=[f'download {c}' for c in components],
+                      weight=1, step='stopping_services', title='Stopping services')
+            for component in components:
+                graph.add(f'extract {component}',
+                          lambda task, c=component: self.install_release(c, *downloads[c]),
+                          deps=[f'download {component}', 'stop services'],
+                          resources={RESOURCE_DISK: 1}, weight=2, step='extracting',
+                          title=f'Extracting {component.capitalize()}', **options[component][1])
+            
+            last = [f'extract {c}' for c in components]
+            if setup:
+                last = []
+                if 'backend' in components:
+                    graph.add('backend dependencies', lambda task: self._install_backend_dependencies(),
+                              deps=['extract backend'], resources={RESOURCE_NET: 1, RESOURCE_CPU: 1},
+                              weight=8, step='setup', title='Installing backend dependencies',
+                              **self._dependencies_options('backend'))
+                    if snapshot:
+                        add_snapshot_task('setup')
+                    graph.add('start mariadb', lambda task: ProcessManager.start_mariadb(), deps=mariadb_deps,
+                              weight=1, step='setup', title='Starting MariaDB')
+                    graph.add('backend database', lambda task: self._setup_backend_database(),
+                              deps=['backend dependencies', 'start mariadb'], resources={RESOURCE_CPU: 1},
+                              weight=3, step='setup', title='Running database migrations',
+                              **self._migrations_options())
+                    last.append('backend database')
+                if 'frontend' in components:
+                    graph.add('frontend dependencies', lambda task: self._setup_frontend(),
+                              deps=['extract frontend'], resources={RESOURCE_NET: 1, RESOURCE_CPU: 1},
+                              weight=8, step='setup', title='Installing frontend dependencies',
+                              **self._dependencies_options('frontend'))
+                    last.append('frontend dependencies')
+        
+        if restart:
+            def start_services(task):
+                if before_start:
+                    before_start()
+                ProcessManager.stop_all()  # MariaDB used for migrations
+                if not self.start_all(skip_setup=True):
+                    return False
+                # Down until both apps answer again. Behind the proxy the public
+                # ports always accept: wait for a healthy instance behind each
+                for name, port in (('backend', Config.BACKEND_PORT), ('frontend', Config.FRONTEND_PORT)):
+                    if proxy_enabled():
+                        ready = self._wait_for_upstream(name)
+                    else:
+                        ready = NetworkUtils.wait_for_port(port)
+                    if not ready:
+                        logger.warning(f"⚠️  {name.capitalize()} not answering after {SERVICE_READY_TIMEOUT}s")
+                span = downtime.pop('span', None)
+                if span is not None:
+                    get_tracer().end_span(span)
+                    logger.info(f"⏱️  Services were down for {span.duration:.1f}s")
+                return True
             
-        except Exception as e:
-            log(f"❌ Auto-install failed: {e}", 'error')
-            import traceback
-            logger.error(traceback.format_exc())
+            graph.add('start services', start_services, deps=last,
+                      weight=3, step='restarting', title='Starting services')
+        return graph
+    
+    @staticmethod
+    def _wait_for_upstream(name: str, timeout: float = SERVICE_READY_TIMEOUT, interval: float = 0.2) -> bool:
+        """Wait until the proxy of an app has a healthy instance to forward to"""
+        import time
+        deadline = time.time() + timeout
+        while not any(u['healthy'] for u in get_service_proxy(name).status()['upstreams']):
+            if time.time() >= deadline:
+                return False
+            time.sleep(interval)
+        return True
+    
+    @traced('update rollback')
+    def rollback_update(self, graph: TaskGraph, components: List[str], before_start=None) -> Optional[bool]:
+        """
+        Undo what a failed staged update changed and start services again
+        
+        Each app swapped in by the graph goes back to its previous release
+        (kept in Config.PREVIOUS_DIR). If the migrations got to run, the
+        data directory snapshot taken while services were stopped is
+        restored with the backend; without one the new backend release
+        stays, as the old one may not run on the migrated schema.
+        
+        Args:
+            before_start: Optional function() called before services restart
+        
+        Returns:
+            None if there is nothing to undo (services never stopped) or no
+            way to (in-place update), else whether everything was put back
+            and services started
+        """
+        def state(name):
+            task = graph.tasks.get(name)
+            return task.state if task is not None else None
+        
+        if state('stop services') != DONE:
+            return None
+        if not any(f'swap {c}' in graph.tasks for c in components):
+            logger.warning("⚠️  In-place updates replace the running release, there is nothing to roll back to")
+            return None
+        
+        snapshot_task = graph.tasks.get('snapshot database')
+        snapshot = snapshot_task.result if snapshot_task is not None and snapshot_task.state == DONE else None
+        migrated = state('backend database') not in (None, PENDING)
+        swapped = [c for c in components
+                   if state(f'swap {c}') == DONE and AppManager.previous_dir(c).exists()]
+        annotate(components=','.join(swapped), snapshot=snapshot['id'] if snapshot else None, migrated=migrated)
+        
+        logger.info("↩️  Rolling back the update...")
+        ProcessManager.stop_all()
+        ok = True
+        if 'backend' in swapped and migrated:
+            if snapshot is None:
+                logger.error("❌ Migrations ran and there is no snapshot - keeping the new backend release")
+                logger.error("   Restore the 'before migrations' backup to go back: python agent.py backup list")
+                swapped.remove('backend')
+                ok = False
+            else:
+                if self.restore_snapshot(snapshot['id']) is None:
+                    # The data is still the migrated one: the new backend must stay
+                    swapped.remove('backend')
+                    ok = False
+        for component in swapped:
+            ok = AppManager.restore_previous(component) and ok
+        
+        if before_start:
+            before_start()
+        if not self.start_all(skip_setup=True):
             return False
-        finally:
-            # Clear flag after installation completes (success or fail)
-            ProcessManager.installation_in_progress = False
+        if ok:
+            logger.info("✅ Update rolled back, services running on the previous release")
+        return ok
     
     def check_updates(self) -> Dict[str, Optional[str]]:
         """Check for updates on GitHub"""
@@ -1435,8 +2559,8 @@ class Agent:
         updates = {}
         
         # Check if apps are installed
-        frontend_installed = Config.FRONTEND_DIR.exists()
-        backend_installed = Config.BACKEND_DIR.exists()
+        frontend_installed = AppManager.is_installed("frontend")
+        backend_installed = AppManager.is_installed("backend")
         
         # Check frontend
         frontend_release = self.frontend_client.get_latest_release()
@@ -1470,14 +2594,31 @@ class Agent:
         
         return updates
     
+    @traced('download_and_install')
     def download_and_install(self, component: str) -> bool:
         """Download and install component"""
+        annotate(component=component)
+        download = self.download_release(component)
+        if not download:
+            return False
+        return self.install_release(component, *download)
+    
+    def download_release(self, component: str, progress_callback=None):
+        """
+        Download the latest portable release of a component
+        
+        Args:
+            progress_callback: Optional function(downloaded_bytes, total_bytes)
+        
+        Returns:
+            tuple: (zip path, release tag), or None on failure
+        """
         client = self.frontend_client if component == "frontend" else self.backend_client
         release = client.get_latest_release()
         
         if not release or not release['assets']:
             logger.error(f"❌ No release found for {component}")
-            return False
+            return None
         
         # Find portable ZIP
         asset = None
@@ -1488,23 +2629,34 @@ class Agent:
         
         if not asset:
             logger.error(f"❌ No portable build found for {component}")
-            return False
+            return None
+        
+        annotate(version=release['tag_name'], asset=asset['name'])
         
         # Download
         zip_path = Config.APPS_DIR / asset['name']
-        if not client.download_asset(asset['download_url'], zip_path):
+        with trace_span('download', component=component) as span:
+            if not client.download_asset(asset['download_url'], zip_path, progress_callback=progress_callback):
+                span.fail()
+                return None
+            span.set_attribute('bytes', zip_path.stat().st_size)
+        
+        return zip_path, release['tag_name']
+    
+    def install_release(self, component: str, zip_path: Path, tag: str) -> bool:
+        """Extract a downloaded release, set up its .env and record the version"""
+        if zip_path is None or not zip_path.exists():
+            logger.error(f"❌ {component.capitalize()} archive is missing, download it again")
             return False
         
         # Extract
         extract_dir = Config.FRONTEND_DIR if component == "frontend" else Config.BACKEND_DIR
-        if not AppManager.extract_release(zip_path, extract_dir):
-            return False
-        
-        # Setup .env
-        AppManager.setup_env(extract_dir, component)
+        with trace_span('extract', component=component) as span:
+            if not AppManager.extract_release(zip_path, extract_dir, tag):
+                span.fail()
+                return False
         
-        # Update version
-        VersionManager.update_version(component, release['tag_name'])
+        self._finish_release(component, extract_dir, tag)
         
         # Cleanup ZIP
         zip_path.unlink()
@@ -1512,6 +2664,43 @@ class Agent:
         logger.info(f"✅ {component.capitalize()} installed successfully!")
         return True
     
+    def stage_release(self, component: str, zip_path: Path, tag: str) -> bool:
+        """
+        Extract a downloaded release into the staging directory, next to the
+        running version, with the running app's env files
+        """
+        if zip_path is None or not zip_path.exists():
+            logger.error(f"❌ {component.capitalize()} archive is missing, download it again")
+            return False
+        
+        staging_dir = AppManager.staging_dir(component)
+        with trace_span('stage', component=component) as span:
+            # Leftovers of an earlier staging, and the release kept from the
+            # update before last, are cleared now rather than during the swap
+            for old in (staging_dir, AppManager.previous_dir(component)):
+                if old.exists():
+                    shutil.rmtree(old)
+            if not AppManager.extract_release(zip_path, staging_dir, tag):
+                span.fail()
+                return False
+            AppManager.carry_over_env(component, staging_dir)
+            AppManager.setup_env(staging_dir, component)
+        
+        zip_path.unlink()
+        logger.info(f"✅ {component.capitalize()} {tag} staged")
+        return True
+    
+    @staticmethod
+    def _finish_release(component: str, app_dir: Path, tag: str):
+        """Set up .env and record the version of an extracted release (idempotent)"""
+        # Setup .env
+        AppManager.setup_env(app_dir, component)
+        
+        # Update version
+        if VersionManager.load_versions().get(component, {}).get('version') != tag:
+            VersionManager.update_version(component, tag)
+    
+    @traced('setup_tools')
     def setup_tools(self) -> bool:
         """Setup all required tools"""
         logger.info("🔧 Setting up tools...")
@@ -1531,10 +2720,12 @@ class Agent:
     
     def setup_apps(self, component: str = "all") -> bool:
         """Setup apps: install dependencies and run migrations"""
-        return self._setup_apps_with_progress(component, None, logger.info)
+        return self._setup_apps_with_log(component, logger.info)
     
-    def _setup_apps_with_progress(self, component: str, progress_callback, log):
-        """Setup apps with granular progress updates"""
+    @traced('setup_apps')
+    def _setup_apps_with_log(self, component: str, log):
+        """Setup apps, sending log messages through log"""
+        annotate(component=component)
         log("🔧 Setting up applications...")
         
         # Enable verbose mode for web interface (always show detailed logs during first install)
@@ -1563,27 +2754,17 @@ class Agent:
         success = True
         
         if component in ["backend", "all"]:
-            if progress_callback:
-                progress_callback(42, 'install', 'active', 'Backend Setup', 'Installing backend dependencies...')
             success &= self._setup_backend_with_heartbeat(log_callback=log)
-            if progress_callback:
-                progress_callback(55, 'install', 'active', 'Backend Setup', 'Backend dependencies installed')
         
         if component in ["frontend", "all"]:
-            if progress_callback:
-                progress_callback(60, 'install', 'active', 'Frontend Setup', 'Installing frontend dependencies...')
             success &= self._setup_frontend_with_heartbeat(log_callback=log)
-            if progress_callback:
-                progress_callback(75, 'install', 'active', 'Frontend Setup', 'Frontend dependencies installed')
         
         # Stop MariaDB if we started it
         if mariadb_started:
             log("⏹️  Stopping MariaDB...")
             if "mariadb" in ProcessManager.processes:
                 try:
-                    ProcessManager.processes["mariadb"].terminate()
-                    ProcessManager.processes["mariadb"].wait(timeout=10)
-                    del ProcessManager.processes["mariadb"]
+                    ProcessManager.stop_mariadb()
                     log("✅ MariaDB stopped")
                 except Exception as e:
                     logger.warning(f"⚠️  Failed to stop MariaDB: {e}")
@@ -1597,6 +2778,19 @@ class Agent:
     
     def _run_with_heartbeat(self, cmd, cwd, env, operation_name: str, timeout: int = 300, verbose: bool = False, log_callback=None) -> subprocess.CompletedProcess:
         """Run a subprocess with heartbeat logging every 15 seconds and optional real-time output"""
+        with trace_span(operation_name, command=' '.join(str(part) for part in cmd[1:])) as span:
+            result = self._run_with_heartbeat_untraced(cmd, cwd, env, operation_name, timeout, verbose, log_callback)
+            span.set_attribute('returncode', result.returncode)
+            packages = PNPM_PACKAGES_RE.search(result.stdout or '')
+            if packages:
+                span.set_attribute('packages', int(packages.group(1)))
+                report_progress(done=int(packages.group(1)), unit='packages')
+            if result.returncode != 0:
+                span.fail(f"exit code {result.returncode}")
+            return result
+    
+    def _run_with_heartbeat_untraced(self, cmd, cwd, env, operation_name: str, timeout: int, verbose: bool, log_callback) -> subprocess.CompletedProcess:
+        """Body of _run_with_heartbeat (without the span)"""
         import threading
         import time
         
@@ -1721,6 +2915,10 @@ class Agent:
                 # Log output lines
                 try:
                     line = output_queue.get(timeout=1)
+                    pnpm_progress = PNPM_PROGRESS_RE.search(line)
+                    if pnpm_progress:
+                        # The final count isn't known up front; the ETA takes it from history
+                        report_progress(done=int(pnpm_progress.group(4)), unit='packages')
                     # Only log important lines to avoid spam
                     line_lower = line.lower()
                     if any(keyword in line_lower for keyword in [
@@ -1790,6 +2988,7 @@ class Agent:
         """Setup frontend with heartbeat logs during long operations"""
         return self._setup_frontend(log_callback=log_callback)
     
+    @traced('setup_backend')
     def _setup_backend(self, log_callback=None) -> bool:
         """Setup backend: pnpm install + prisma generate + migrate"""
         if not Config.BACKEND_DIR.exists():
@@ -1797,22 +2996,52 @@ class Agent:
             return False
         
         logger.info("🔧 Setting up backend...")
+        if not self._install_backend_dependencies(log_callback):
+            return False
+        if not self._setup_backend_database():
+            return False
         
-        # Use web log callback if provided (for first-time install web interface)
-        use_log_callback = log_callback if log_callback else None
+        logger.info("✅ Backend setup complete!")
+        return True
+    
+    @staticmethod
+    def _backend_toolchain():
+        """
+        pnpm executable and an environment with Node.js and pnpm in PATH
         
+        Returns:
+            tuple: (pnpm.exe path, env), or None if pnpm is missing
+        """
         # Get full path to pnpm executable
         pnpm_path = ToolsManager.get_pnpm_path()
         pnpm_exe = pnpm_path / "pnpm.exe"
         if not pnpm_exe.exists():
             logger.error("❌ pnpm not found! Run: python agent.py setup")
-            return False
+            return None
         
         # Prepare environment with Node.js in PATH
         env = os.environ.copy()
         node_dir = str(ToolsManager.get_node_path().absolute())
         pnpm_dir = str(ToolsManager.get_pnpm_path().absolute())
         env['PATH'] = f"{node_dir};{pnpm_dir};{env.get('PATH', '')}"
+        return pnpm_exe, env
+    
+    @traced('backend dependencies')
+    def _install_backend_dependencies(self, log_callback=None, app_dir: Optional[Path] = None) -> bool:
+        """
+        Backend pnpm install + prisma generate (no database needed)
+        
+        Args:
+            app_dir: Backend directory (default Config.BACKEND_DIR; a staged release during updates)
+        """
+        app_dir = app_dir or Config.BACKEND_DIR
+        # Use web log callback if provided (for first-time install web interface)
+        use_log_callback = log_callback if log_callback else None
+        
+        toolchain = self._backend_toolchain()
+        if not toolchain:
+            return False
+        pnpm_exe, env = toolchain
         
         try:
             # 1. Install dependencies with retry
@@ -1835,7 +3064,7 @@ class Agent:
                     if attempt > 1:
                         logger.info(f"🔄 Retry attempt {attempt}/{max_retries}...")
                         # Cleanup partial node_modules on retry
-                        node_modules = Config.BACKEND_DIR / "node_modules"
+                        node_modules = app_dir / "node_modules"
                         if node_modules.exists():
                             logger.info("🧹 Cleaning up partial installation...")
                             try:
@@ -1846,7 +3075,7 @@ class Agent:
                     
                     result = self._run_with_heartbeat(
                         [str(pnpm_exe), "install", "--production", "--ignore-scripts"],
-                        str(Config.BACKEND_DIR),
+                        str(app_dir),
                         env,
                         "installing backend dependencies",
                         timeout=1800,  # Increased to 1800s (30 minutes) for very slow connections
@@ -1880,7 +3109,7 @@ class Agent:
                         raise
             
             # 2. Generate Prisma client
-            prisma_client = Config.BACKEND_DIR / "node_modules" / ".prisma" / "client"
+            prisma_client = app_dir / "node_modules" / ".prisma" / "client"
             if prisma_client.exists():
                 logger.info("✅ Prisma client already exists, skipping generate...")
             else:
@@ -1888,7 +3117,7 @@ class Agent:
                 logger.info("⏳ This may take 1-5 minutes on normal connections, up to 30 minutes on very slow connections...")
                 result = self._run_with_heartbeat(
                     [str(pnpm_exe), "prisma", "generate"],
-                    str(Config.BACKEND_DIR),
+                    str(app_dir),
                     env,
                     "generating Prisma client",
                     timeout=1800  # Increased to 1800s (30 minutes) for very slow connections
@@ -1900,6 +3129,48 @@ class Agent:
                 else:
                     logger.info("✅ Prisma client generated")
             
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Backend setup failed: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            return False
+    
+    def _backup_before_migrations(self) -> bool:
+        """
+        Back up the database if the release brings migrations it hasn't applied
+        
+        Returns:
+            bool: False if the backup failed and migrations must not run
+        """
+        if os.getenv('BACKUP_BEFORE_MIGRATE', Config.BACKUP_BEFORE_MIGRATE).lower() == 'off':
+            return True
+        pending = AppManager.pending_migrations(Config.BACKEND_DIR)
+        if not pending:
+            return True  # Nothing to migrate, or a fresh database without data
+        logger.info(f"💾 {len(pending)} pending migration(s) - backing up {Config.MARIADB_DB} first...")
+        try:
+            manifest = get_backups().create('before migrations', meta={
+                'release': VersionManager.release_label(),
+                'pending_migrations': pending
+            })
+        except Exception as e:
+            logger.error(f"❌ Backup before migrations failed: {e}")
+            logger.error("   Migrations were not run. Set BACKUP_BEFORE_MIGRATE=off to migrate without a backup")
+            return False
+        logger.info(f"✅ Backup {manifest['id']} saved - restore with: python agent.py backup restore {manifest['id']}")
+        return True
+    
+    @traced('backend database')
+    def _setup_backend_database(self) -> bool:
+        """Create the database, run migrations and seed a fresh install (MariaDB must be running)"""
+        toolchain = self._backend_toolchain()
+        if not toolchain:
+            return False
+        pnpm_exe, env = toolchain
+        
+        try:
             # 3. Create database if not exists
             logger.info("🗄️  Creating database if not exists...")
             mariadb_path = ToolsManager.get_mariadb_path()
@@ -1925,17 +3196,24 @@ class Agent:
                     logger.warning(f"⚠️  Could not create database: {e}")
                     logger.info("💡 Make sure MariaDB is running")
             
-            # 4. Run migrations
+            # 4. Back up the data the migrations are about to change
+            if not self._backup_before_migrations():
+                return False
+            
+            # 5. Run migrations
             logger.info("🗄️  Running database migrations...")
-            result = subprocess.run(
-                [str(pnpm_exe), "prisma", "migrate", "deploy"],
-                cwd=str(Config.BACKEND_DIR),
-                env=env,
-                capture_output=True,
-                text=True,
-                shell=False,
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
+            with trace_span('running database migrations') as span:
+                result = subprocess.run(
+                    [str(pnpm_exe), "prisma", "migrate", "deploy"],
+                    cwd=str(Config.BACKEND_DIR),
+                    env=env,
+                    capture_output=True,
+                    text=True,
+                    shell=False,
+                    creationflags=subprocess.CREATE_NO_WINDOW
+                )
+                if result.returncode != 0:
+                    span.fail(f"exit code {result.returncode}")
             if result.returncode != 0:
                 logger.error(f"❌ Migration failed:")
                 logger.error(result.stderr)
@@ -1944,7 +3222,7 @@ class Agent:
             else:
                 logger.info("✅ Migrations completed")
             
-            # 5. Check if database needs seeding (first-time install only)
+            # 6. Check if database needs seeding (first-time install only)
             logger.info("🔍 Checking if database needs seeding...")
             needs_seeding = False
             
@@ -1990,15 +3268,16 @@ class Agent:
                 logger.info("🌱 Seeding initial data (users & services)...")
                 seed_file = Config.BACKEND_DIR / "prisma" / "seed-first-install.ts"
                 if seed_file.exists():
-                    result = subprocess.run(
-                        [str(pnpm_exe), "exec", "ts-node", str(seed_file)],
-                        cwd=str(Config.BACKEND_DIR),
-                        env=env,
-                        capture_output=True,
-                        text=True,
-                        shell=False,
-                        creationflags=subprocess.CREATE_NO_WINDOW
-                    )
+                    with trace_span('seeding initial data'):
+                        result = subprocess.run(
+                            [str(pnpm_exe), "exec", "ts-node", str(seed_file)],
+                            cwd=str(Config.BACKEND_DIR),
+                            env=env,
+                            capture_output=True,
+                            text=True,
+                            shell=False,
+                            creationflags=subprocess.CREATE_NO_WINDOW
+                        )
                     if result.returncode != 0:
                         logger.warning(f"⚠️  Seeding failed (this is non-critical):")
                         logger.warning(result.stderr)
@@ -2015,7 +3294,6 @@ class Agent:
             else:
                 logger.info("✅ Database already initialized - skipping seeding")
             
-            logger.info("✅ Backend setup complete!")
             return True
             
         except Exception as e:
@@ -2024,9 +3302,16 @@ class Agent:
             logger.error(traceback.format_exc())
             return False
     
-    def _setup_frontend(self, log_callback=None) -> bool:
-        """Setup frontend: pnpm install"""
-        if not Config.FRONTEND_DIR.exists():
+    @traced('setup_frontend')
+    def _setup_frontend(self, log_callback=None, app_dir: Optional[Path] = None) -> bool:
+        """
+        Setup frontend: pnpm install
+        
+        Args:
+            app_dir: Frontend directory (default Config.FRONTEND_DIR; a staged release during updates)
+        """
+        app_dir = app_dir or Config.FRONTEND_DIR
+        if not app_dir.exists():
             logger.error("❌ Frontend not installed! Run: python agent.py install frontend")
             return False
         
@@ -2069,7 +3354,7 @@ class Agent:
                     if attempt > 1:
                         logger.info(f"🔄 Retry attempt {attempt}/{max_retries}...")
                         # Cleanup partial node_modules on retry
-                        node_modules = Config.FRONTEND_DIR / "node_modules"
+                        node_modules = app_dir / "node_modules"
                         if node_modules.exists():
                             logger.info("🧹 Cleaning up partial installation...")
                             try:
@@ -2080,7 +3365,7 @@ class Agent:
                     
                     result = self._run_with_heartbeat(
                         [str(pnpm_exe), "install", "--production", "--ignore-scripts"],
-                        str(Config.FRONTEND_DIR),
+                        str(app_dir),
                         env,
                         "installing frontend dependencies",
                         timeout=1800,  # Increased to 1800s (30 minutes) for very slow connections
@@ -2122,8 +3407,10 @@ class Agent:
             logger.error(traceback.format_exc())
             return False
     
+    @traced('start_all')
     def start_all(self, skip_setup: bool = False):
         """Start all services (with optional auto-setup)"""
+        annotate(skip_setup=skip_setup)
         logger.info("🚀 Starting all services...")
         
         # Check license before starting services
@@ -2172,7 +3459,8 @@ class Agent:
         
         # Small delay to ensure MariaDB is ready to accept connections
         import time
-        time.sleep(3)
+        with trace_span('readiness wait', service='mariadb'):
+            time.sleep(3)
         
         # Start backend (already includes 2s wait + verification)
         if not ProcessManager.start_backend():
@@ -2181,7 +3469,8 @@ class Agent:
             return False
         
         # Small delay to ensure backend is ready
-        time.sleep(2)
+        with trace_span('readiness wait', service='backend'):
+            time.sleep(2)
         
         # Start frontend (already includes 2s wait + verification)
         if not ProcessManager.start_frontend():
@@ -2199,6 +3488,198 @@ class Agent:
         ProcessManager.stop_all()
         logger.info("✅ All services stopped")
     
+    @staticmethod
+    def _ensure_mariadb() -> Optional[bool]:
+        """
+        Make sure MariaDB answers, starting it if needed
+        
+        Returns:
+            True if it was started here (stop it afterwards), False if it
+            was already running, None if it could not be started
+        """
+        if MariaDBClient().is_available():
+            return False
+        logger.info("🚀 Starting MariaDB...")
+        return True if ProcessManager.start_mariadb() else None
+    
+    def backup_database(self, reason: str = "manual") -> Optional[Dict]:
+        """Back up the database now; returns the backup manifest or None on failure"""
+        mariadb_started = self._ensure_mariadb()
+        if mariadb_started is None:
+            logger.error("❌ Failed to start MariaDB!")
+            return None
+        try:
+            # With the binary log on, one consistent dump with a log position
+            # (the apps may be writing) so later restores can replay from it
+            return get_backups().create(reason, meta={'release': VersionManager.release_label()},
+                                        full=binlog_enabled())
+        except Exception as e:
+            logger.error(f"❌ Backup failed: {e}")
+            return None
+        finally:
+            if mariadb_started:
+                ProcessManager.stop_mariadb()
+    
+    def restore_database(self, backup_id: str) -> Optional[Dict]:
+        """
+        Replace the database with a backup (the backend must be stopped)
+        
+        Returns:
+            dict: Restore result with throughput, or None on failure
+        """
+        if get_backups().load(backup_id) is None:
+            logger.error(f"❌ Backup {backup_id} not found")
+            return None
+        return self._restore_with_safety_backup(lambda: get_backups().restore(backup_id))
+    
+    def restore_database_to(self, target_time: float) -> Optional[Dict]:
+        """
+        Restore the database as it was at target_time: the newest backup
+        before it plus the archived binary logs up to it (backend stopped)
+        
+        Returns:
+            dict: Backup used, replayed logs and timings, or None on failure
+        """
+        if not binlog_enabled():
+            logger.error("❌ Point-in-time restore needs BINLOG=on")
+            return None
+        if get_binlog_archiver().base_backup(target_time) is None:
+            logger.error("❌ No backup with a binary log position before that time")
+            return None
+        return self._restore_with_safety_backup(lambda: get_binlog_archiver().restore_to(target_time))
+    
+    def _restore_with_safety_backup(self, restore) -> Optional[Dict]:
+        """
+        Run a restore with MariaDB up and the backend stopped
+        
+        The current data is backed up first ('before restore'), so a
+        restore can itself be undone.
+        """
+        if ProcessManager._cluster_active() or (
+                "backend" in ProcessManager.processes and ProcessManager.processes["backend"].poll() is None):
+            logger.error("❌ Stop the backend before restoring a backup")
+            return None
+        
+        mariadb_started = self._ensure_mariadb()
+        if mariadb_started is None:
+            logger.error("❌ Failed to start MariaDB!")
+            return None
+        backups = get_backups()
+        try:
+            if backups.has_tables():
+                safety = backups.create('before restore', meta={'release': VersionManager.release_label()},
+                                        prune=False)
+                logger.info(f"💾 Current data saved as backup {safety['id']}")
+            result = restore()
+            backups.prune()
+            return result
+        except Exception as e:
+            logger.error(f"❌ Restore failed: {e}")
+            return None
+        finally:
+            if mariadb_started:
+                ProcessManager.stop_mariadb()
+    
+    def restore_snapshot(self, snapshot_id: str) -> Optional[Dict]:
+        """
+        Replace the MariaDB data directory with a snapshot (MariaDB must be stopped)
+        
+        Returns:
+            dict: Restore result with throughput, or None on failure
+        """
+        snapshots = get_snapshots()
+        manifest = snapshots.load(snapshot_id)
+        if manifest is None:
+            logger.error(f"❌ Snapshot {snapshot_id} not found")
+            return None
+        try:
+            result = snapshots.restore(snapshot_id)
+        except Exception as e:
+            logger.error(f"❌ Restoring snapshot {snapshot_id} failed: {e}")
+            return None
+        get_backups().record_restore(f"snapshot {snapshot_id}", manifest['created'])
+        return result
+    
+    @staticmethod
+    def maintenance_load() -> Dict:
+        """Figures the maintenance load guard checks (None where unknown)"""
+        metrics = get_db_metrics().summary()
+        return {
+            'backend_cpu': ProcessManager.backend_cpu(),
+            'qps': metrics['latest']['qps'] if metrics['connected'] and metrics['latest'] else None
+        }
+
+    @traced('rehearse_migrations')
+    def rehearse_migrations(self) -> Optional[Dict]:
+        """
+        Run the latest backend release's pending migrations on a copy of the database
+
+        Only the release's prisma directory is extracted; the installed
+        backend's Prisma CLI applies it to the copy with --schema, so the
+        running services are not touched.
+
+        Returns:
+            dict: Rehearsal result (see MigrationRehearsal.run), or None if it
+            could not be started
+        """
+        if not AppManager.is_installed("backend"):
+            logger.error("❌ Backend not installed! Run: python agent.py install backend")
+            return None
+        database_url = dotenv_values(Config.BACKEND_DIR / ".env").get('DATABASE_URL')
+        if not database_url:
+            logger.error("❌ DATABASE_URL missing in the backend .env")
+            return None
+        toolchain = self._backend_toolchain()
+        if not toolchain:
+            return None
+        pnpm_exe, env = toolchain
+
+        rehearsal = get_migration_rehearsal()
+        download = self.download_release("backend")
+        if not download:
+            return None
+        zip_path, tag = download
+        try:
+            prisma_dir = extract_prisma_dir(zip_path, rehearsal.work_dir / "prisma")
+        except (OSError, ValueError, zipfile.BadZipFile) as e:
+            logger.error(f"❌ Could not read the migrations of {tag}: {e}")
+            return None
+        finally:
+            zip_path.unlink(missing_ok=True)
+
+        mariadb_started = self._ensure_mariadb()
+        if mariadb_started is None:
+            logger.error("❌ Failed to start MariaDB!")
+            return None
+        try:
+            pending = AppManager.pending_migrations(rehearsal.work_dir)
+            if pending is None:
+                logger.error("❌ Could not read the applied migrations from the database")
+                return None
+
+            def migrate(schema: Path, database: str):
+                run_env = dict(env, DATABASE_URL=scratch_database_url(database_url, database))
+                result = subprocess.run(
+                    [str(pnpm_exe), "prisma", "migrate", "deploy", "--schema", str(schema)],
+                    cwd=str(Config.BACKEND_DIR),
+                    env=run_env,
+                    capture_output=True,
+                    text=True,
+                    shell=False,
+                    creationflags=subprocess.CREATE_NO_WINDOW
+                )
+                return result.returncode == 0, result.stdout + result.stderr
+
+            return rehearsal.run(tag, prisma_dir, pending, migrate)
+        except RuntimeError as e:
+            logger.error(f"❌ {e}")
+            return None
+        finally:
+            shutil.rmtree(rehearsal.work_dir, ignore_errors=True)
+            if mariadb_started:
+                ProcessManager.stop_mariadb()
+
+    @traced('seed_database')
     def seed_database(self, seed_type: str = "all") -> bool:
         """Seed the database with initial data"""
         if not Config.BACKEND_DIR.exists():
@@ -2277,9 +3758,7 @@ class Agent:
             # Stop MariaDB if we started it
             if mariadb_started and "mariadb" in ProcessManager.processes:
                 logger.info("⏹️  Stopping MariaDB...")
-                ProcessManager.processes["mariadb"].terminate()
-                ProcessManager.processes["mariadb"].wait(timeout=10)
-                del ProcessManager.processes["mariadb"]
+                ProcessManager.stop_mariadb()
                 logger.info("✅ MariaDB stopped")
             
             return True
@@ -2304,8 +3783,10 @@ class Agent:
             logger.error(f"❌ Installation failed: {e}")
             return False
     
+    @traced('update_apps')
     def update_apps(self, component: str = "all", force: bool = False) -> bool:
         """Update applications"""
+        annotate(component=component, force=force)
         try:
             # Check for updates first
             updates = self.check_updates()
@@ -2314,28 +3795,18 @@ class Agent:
                 logger.info("✅ Everything is up to date!")
                 return True
             
-            # Stop services before updating
-            logger.info("⏹️  Stopping services for update...")
-            ProcessManager.stop_all()
-            
-            # Install updates
             if component == "all":
-                success = True
-                if 'frontend' in updates or force:
-                    logger.info("📥 Updating frontend...")
-                    success = self.download_and_install("frontend") and success
-                if 'backend' in updates or force:
-                    logger.info("📥 Updating backend...")
-                    success = self.download_and_install("backend") and success
-                return success
+                components = [c for c in ("backend", "frontend") if c in updates or force]
+            elif component in updates or force:
+                components = [component]
             else:
-                if component in updates or force:
-                    logger.info(f"📥 Updating {component}...")
-                    return self.download_and_install(component)
-                else:
-                    logger.info(f"✅ {component} is already up to date!")
-                    return True
-                    
+                logger.info(f"✅ {component} is already up to date!")
+                return True
+            
+            # Downloads run before services are stopped (see build_update_graph)
+            logger.info(f"📥 Updating {', '.join(components)}...")
+            return self.run_journaled(self.build_update_graph(components), 'update', components)
+            
         except Exception as e:
             logger.error(f"❌ Update failed: {e}")
             return False
@@ -2382,6 +3853,12 @@ def main():
         print("  python agent.py start [--skip-setup]     - Start all services")
         print("  python agent.py stop                     - Stop all services")
         print("  python agent.py update [component] [-y]  - Update frontend/backend/all (with confirmation)")
+        print("  python agent.py tune [show|apply|history|diff A B|rollback V] - Hardware-based MariaDB/Node/Prisma tuning")
+        print("  python agent.py backup [list|create|verify ID|restore ID|pitr TIME|binlog] - Database backups")
+        print("  python agent.py snapshot [list|create|verify ID|restore ID] - MariaDB data directory snapshots")
+        print("  python agent.py indexes [list|analyze|accept ID|dismiss ID|export [DIR]] - Index suggestions from slow queries")
+        print("  python agent.py maintenance [status|plan|run [MINUTES]] - ANALYZE/OPTIMIZE TABLE maintenance")
+        print("  python agent.py rehearse                 - Rehearse the next backend release's migrations on a copy")
         print("  python agent.py shortcuts create         - Create desktop and start menu shortcuts")
         print("  python agent.py shortcuts remove         - Remove shortcuts")
         print("  python agent.py shortcuts check          - Check if shortcuts exist")
@@ -2483,6 +3960,13 @@ def main():
             for comp, version in updates.items():
                 current = VersionManager.load_versions()[comp]['version']
                 print(f"  - {comp}: {current} → {version}")
+            rehearsed = get_migration_rehearsal().load()
+            if 'backend' in updates and rehearsed and rehearsed['release'] == updates['backend']:
+                if not rehearsed['success']:
+                    print(f"  ⚠️  Migration rehearsal of {rehearsed['release']} failed: {rehearsed['error']}")
+                elif rehearsed['predicted_downtime'] is not None:
+                    print(f"  ⏱️  Predicted downtime: ~{rehearsed['predicted_downtime']:.0f}s "
+                          f"({len(rehearsed['pending'])} migration(s), {rehearsed['migrate_seconds']:.1f}s rehearsed)")
             
             # Ask for confirmation (unless --yes flag is provided)
             if "--yes" not in sys.argv and "-y" not in sys.argv:
@@ -2503,6 +3987,311 @@ def main():
             print("  1. Run: python agent.py setup-apps")
             print("  2. Run: python agent.py start")
         
+        elif command == "tune":
+            tuning = get_tuning()
+            action = sys.argv[2].lower() if len(sys.argv) > 2 else "show"
+            
+            def print_changes(changes):
+                for change in changes:
+                    print(f"  {change['key']}: {change['old']} → {change['new']}")
+            
+            if action == "show":
+                current = tuning.current()
+                proposal = tuning.propose(refresh=True)
+                hw = proposal['hardware']
+                print(f"\n🖥️  {hw['memory_mb']} MB RAM, {hw['cores']} cores / {hw['threads']} threads, {hw['disk']} disk")
+                print(f"   Backend processes: {proposal['backend_processes']}")
+                if current:
+                    print(f"\n🎛️  Active: profile v{current['version']} ({current['reason']})")
+                    for section, values in current['settings'].items():
+                        for key, value in values.items():
+                            print(f"  {section}.{key} = {value}")
+                else:
+                    print("\n🎛️  No tuning profile yet (created on the next service start)")
+                if proposal['changes']:
+                    print("\n💡 Re-tuning would change:")
+                    print_changes(proposal['changes'])
+                    print("   Run: python agent.py tune apply")
+            
+            elif action == "apply":
+                result = tuning.apply("manual re-tune")
+                if result['created']:
+                    print(f"\n✅ Profile v{result['profile']['version']} active")
+                    print_changes(result['changes'])
+                    print("\n💡 Restart services to use it: python agent.py stop && python agent.py start")
+                else:
+                    print(f"\n✅ Profile v{result['profile']['version']} already matches this PC")
+            
+            elif action == "history":
+                for entry in tuning.history():
+                    created = datetime.fromtimestamp(entry['created_at']).strftime('%Y-%m-%d %H:%M')
+                    print(f"  v{entry['version']}  {created}  {entry['reason']}")
+            
+            elif action == "diff" and len(sys.argv) > 4:
+                old, new = tuning.load(int(sys.argv[3])), tuning.load(int(sys.argv[4]))
+                if not old or not new:
+                    print("❌ Profile version not found")
+                else:
+                    print_changes(diff_settings(old['settings'], new['settings']) or [])
+            
+            elif action == "rollback" and len(sys.argv) > 3:
+                result = tuning.rollback(int(sys.argv[3]))
+                print(f"\n✅ Profile v{result['profile']['version']} active ({result['profile']['reason']})")
+                print_changes(result['changes'])
+            
+            else:
+                print("Usage: python agent.py tune [show|apply|history|diff <v1> <v2>|rollback <v>]")
+        
+        elif command == "backup":
+            backups = get_backups()
+            action = sys.argv[2].lower() if len(sys.argv) > 2 else "list"
+            
+            def mb(size):
+                return f"{size / 1048576:.1f} MB"
+            
+            if action == "list":
+                entries = backups.list()
+                if not entries:
+                    print("\nℹ️  No backups yet")
+                for entry in entries:
+                    created = datetime.fromtimestamp(entry['created']).strftime('%Y-%m-%d %H:%M')
+                    print(f"  {entry['id']}  {created}  {mb(entry['raw_bytes']):>10} → {mb(entry['bytes']):>10}"
+                          f"  {len(entry['tables'])} tables  {entry['reason']}")
+            
+            elif action == "create":
+                manifest = agent.backup_database("manual")
+                if manifest:
+                    print(f"\n✅ Backup {manifest['id']}: {mb(manifest['raw_bytes'])} → {mb(manifest['bytes'])}"
+                          f" in {manifest['seconds']:.1f}s ({mb(manifest['throughput'] or 0)}/s)")
+                else:
+                    sys.exit(1)
+            
+            elif action == "restore" and len(sys.argv) > 3:
+                if "--yes" not in sys.argv and "-y" not in sys.argv:
+                    answer = input(f"⚠️  Replace {Config.MARIADB_DB} with backup {sys.argv[3]}? (y/N): ")
+                    if answer.strip().lower() != 'y':
+                        print("Cancelled")
+                        return
+                result = agent.restore_database(sys.argv[3])
+                if result:
+                    print(f"\n✅ Restored {result['backup']}: {mb(result['raw_bytes'])} in {result['seconds']:.1f}s"
+                          f" ({mb(result['throughput'] or 0)}/s)")
+                else:
+                    sys.exit(1)
+            
+            elif action == "pitr" and len(sys.argv) > 3:
+                try:
+                    target = datetime.strptime(sys.argv[3], '%Y-%m-%d %H:%M:%S' if sys.argv[3].count(':') == 2
+                                               else '%Y-%m-%d %H:%M').timestamp()
+                except ValueError:
+                    print("❌ Time must be 'YYYY-MM-DD HH:MM[:SS]'")
+                    sys.exit(1)
+                if "--yes" not in sys.argv and "-y" not in sys.argv:
+                    answer = input(f"⚠️  Replace {Config.MARIADB_DB} with its state at {sys.argv[3]}? (y/N): ")
+                    if answer.strip().lower() != 'y':
+                        print("Cancelled")
+                        return
+                result = agent.restore_database_to(target)
+                if result:
+                    print(f"\n✅ Restored to {sys.argv[3]}: backup {result['backup']} ({result['restore_seconds']:.1f}s)"
+                          f" + {len(result['binlogs'])} binary log(s) ({result['replay_seconds']:.1f}s)")
+                else:
+                    sys.exit(1)
+            
+            elif action == "binlog":
+                archiver = get_binlog_archiver()
+                if not MariaDBClient().is_available():
+                    print("❌ MariaDB must be running to archive binary logs")
+                    sys.exit(1)
+                archived = archiver.archive()
+                status = archiver.status()
+                print(f"\n📦 Archived now: {', '.join(archived) or 'nothing new'}")
+                print(f"   {status['archived']} log(s) kept, {mb(status['bytes'])} compressed")
+                window = status['window']
+                if window['earliest']:
+                    print(f"   Restorable from {datetime.fromtimestamp(window['earliest']):%Y-%m-%d %H:%M}")
+            
+            elif action == "verify" and len(sys.argv) > 3:
+                problems = backups.verify(sys.argv[3])
+                for problem in problems:
+                    print(f"❌ {problem}")
+                if not problems:
+                    print(f"✅ Backup {sys.argv[3]} is intact")
+            
+            else:
+                print("Usage: python agent.py backup [list|create|verify <id>|restore <id> [-y]|pitr 'YYYY-MM-DD HH:MM' [-y]|binlog]")
+        
+        elif command == "snapshot":
+            snapshots = get_snapshots()
+            action = sys.argv[2].lower() if len(sys.argv) > 2 else "list"
+            
+            if action == "list":
+                entries = snapshots.list()
+                if not entries:
+                    print("\nℹ️  No snapshots yet")
+                for entry in entries:
+                    created = datetime.fromtimestamp(entry['created']).strftime('%Y-%m-%d %H:%M')
+                    print(f"  {entry['id']}  {created}  {entry['bytes'] / 1048576:>10.1f} MB  {entry['method']:<7}"
+                          f"  {entry['seconds']:.1f}s  {entry['reason']}")
+            
+            elif action == "create":
+                # Data files are only consistent with MariaDB stopped
+                try:
+                    manifest = snapshots.create('manual', meta={'release': VersionManager.release_label()})
+                except Exception as e:
+                    print(f"❌ Snapshot failed: {e}")
+                    sys.exit(1)
+                print(f"\n✅ Snapshot {manifest['id']}: {manifest['bytes'] / 1048576:.1f} MB"
+                      f" in {manifest['seconds']:.1f}s ({manifest['method']})")
+            
+            elif action == "restore" and len(sys.argv) > 3:
+                if "--yes" not in sys.argv and "-y" not in sys.argv:
+                    answer = input(f"⚠️  Replace the MariaDB data directory with snapshot {sys.argv[3]}? (y/N): ")
+                    if answer.strip().lower() != 'y':
+                        print("Cancelled")
+                        return
+                result = agent.restore_snapshot(sys.argv[3])
+                if result:
+                    print(f"\n✅ Restored {result['snapshot']} in {result['seconds']:.1f}s ({result['method']})")
+                else:
+                    sys.exit(1)
+            
+            elif action == "verify" and len(sys.argv) > 3:
+                problems = snapshots.verify(sys.argv[3])
+                for problem in problems:
+                    print(f"❌ {problem}")
+                if not problems:
+                    print(f"✅ Snapshot {sys.argv[3]} is intact")
+            
+            else:
+                print("Usage: python agent.py snapshot [list|create|verify <id>|restore <id> [-y]]  (MariaDB stopped)")
+        
+        elif command == "indexes":
+            advisor = get_index_advisor()
+            action = sys.argv[2].lower() if len(sys.argv) > 2 else "list"
+            
+            if action == "analyze":
+                if not MariaDBClient().is_available():
+                    print("❌ MariaDB must be running to explain queries")
+                    sys.exit(1)
+                get_slow_query_log().poll()
+                try:
+                    state = advisor.analyze()
+                except Exception as e:
+                    print(f"❌ Analysis failed: {e}")
+                    sys.exit(1)
+                for result in state['results']:
+                    for note in result.get('notes', []):
+                        print(f"  ℹ️  {note}")
+                    if result.get('error'):
+                        print(f"  ⚠️  {result['fingerprint'][:80]}: {result['error']}")
+                action = "list"
+            
+            if action == "list":
+                suggestions = advisor.suggestions()
+                if not suggestions:
+                    print("\nℹ️  No index suggestions (run: python agent.py indexes analyze)")
+                for suggestion in suggestions:
+                    reduction = f"{suggestion['reduction']:.0%}" if suggestion['reduction'] is not None else "?"
+                    print(f"\n  [{suggestion['status']}] {suggestion['id']}  {suggestion['table']}"
+                          f"({', '.join(suggestion['columns'])})  {suggestion['reason']}")
+                    print(f"     rows examined ~{suggestion['rows_before']} → ~{suggestion['rows_after']} ({reduction} fewer),"
+                          f" {suggestion['time_saved_estimate']:.1f}s of slow time, {len(suggestion['queries'])} statement(s)")
+                    if suggestion['prisma_index']:
+                        print(f"     model {suggestion['prisma_model']}: {suggestion['prisma_index']}")
+                    if suggestion['replaces']:
+                        print(f"     replaces index {suggestion['replaces']}")
+            
+            elif action in ("accept", "dismiss") and len(sys.argv) > 3:
+                status = 'accepted' if action == "accept" else 'dismissed'
+                if advisor.review(sys.argv[3], status):
+                    print(f"✅ Suggestion {sys.argv[3]} {status}")
+                else:
+                    print(f"❌ Suggestion {sys.argv[3]} not found")
+                    sys.exit(1)
+            
+            elif action == "export":
+                migration = advisor.export_migration('all' if "--all" in sys.argv else 'accepted')
+                if migration is None:
+                    print("ℹ️  Nothing to export: accept suggestions first (or pass --all)")
+                    return
+                args = [arg for arg in sys.argv[3:] if not arg.startswith('-')]
+                target = Path(args[0]) if args else Config.WRITABLE_DIR / 'index_migrations'
+                path = target / migration['name'] / 'migration.sql'
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_text(migration['sql'], encoding='utf-8')
+                print(f"\n✅ Migration written to {path}")
+                for change in migration['schema_changes']:
+                    print(f"   model {change['model']}: {change['change']}")
+                print("   Copy it into the backend's prisma/migrations and update schema.prisma to apply")
+            
+            elif action != "list":
+                print("Usage: python agent.py indexes [list|analyze|accept <id>|dismiss <id>|export [DIR] [--all]]")
+        
+        elif command == "maintenance":
+            maintenance = get_maintenance()
+            action = sys.argv[2].lower() if len(sys.argv) > 2 else "status"
+            
+            if action == "status":
+                status = maintenance.status()
+                print(f"\n🧹 Windows: {status['windows']}" + ("" if status['enabled'] else " (MAINTENANCE=off)"))
+                if status['last_error']:
+                    print(f"   ⚠️  {status['last_error']}")
+                if status['next_window']:
+                    print(f"   Next window: {datetime.fromtimestamp(status['next_window']):%a %Y-%m-%d %H:%M}")
+                print(f"   Pending tasks: {status['pending']}")
+                for run in status['runs']:
+                    started = datetime.fromtimestamp(run['started']).strftime('%Y-%m-%d %H:%M')
+                    took = run['finished'] - run['started']
+                    print(f"  {started}  {len(run['tasks'])} task(s) in {took:.0f}s"
+                          + (f"  stopped: {run['stopped']}" if run['stopped'] else ""))
+                    for task in run['tasks']:
+                        print(f"      {'✅' if task['success'] else '❌'} {task['kind']:<8} {task['table']:<32} {task['seconds']:.1f}s")
+                    for task in run.get('skipped', []):
+                        print(f"      ⏭️  {task['kind']:<8} {task['table']:<32} ~{task['estimate']:.0f}s doesn't fit")
+            
+            elif action in ("plan", "run"):
+                if not MariaDBClient().is_available():
+                    print("❌ MariaDB must be running")
+                    sys.exit(1)
+                if action == "plan":
+                    tasks = maintenance.plan()['tasks']
+                    if not tasks:
+                        print("\n✅ Nothing to do: statistics are fresh and no table is fragmented")
+                    for task in tasks:
+                        print(f"  {task['kind']:<8} {task['table']:<32} ~{task['estimate']:.0f}s  {task['benefit']}")
+                else:
+                    minutes = int(sys.argv[3]) if len(sys.argv) > 3 else int(
+                        os.getenv('MAINTENANCE_WINDOW_MINUTES', Config.MAINTENANCE_WINDOW_MINUTES))
+                    record = maintenance.run(datetime.now() + timedelta(minutes=minutes), Agent.maintenance_load, 'manual')
+                    print(f"\n{'⏸️' if record['stopped'] else '✅'}  {len(record['tasks'])} task(s) run, "
+                          f"{record['pending']} pending" + (f" (stopped: {record['stopped']})" if record['stopped'] else ""))
+            
+            else:
+                print("Usage: python agent.py maintenance [status|plan|run [MINUTES]]")
+        
+        elif command == "rehearse":
+            result = agent.rehearse_migrations()
+            if result is None:
+                sys.exit(1)
+            print(f"\n🧪 Release {result['release']}: {len(result['pending'])} pending migration(s)")
+            for migration in result['migrations']:
+                seconds = f"{migration['seconds']:.2f}s" if migration['seconds'] is not None else "-"
+                print(f"  {'✅' if migration['success'] else '❌'} {migration['name']:<48} {seconds}")
+                if migration['error']:
+                    print(f"      {migration['error']}")
+            if result['clone']:
+                print(f"   Copy of the database from backup {result['clone']['backup']} "
+                      f"loaded in {result['clone']['seconds']:.1f}s")
+            if not result['success']:
+                print(f"\n❌ Rehearsal failed: {result['error']}")
+                sys.exit(1)
+            if result['predicted_downtime'] is not None:
+                print(f"\n⏱️  Predicted downtime: ~{result['predicted_downtime']:.0f}s "
+                      f"({result['migrate_seconds']:.1f}s migrations + {result['baseline_downtime']:.0f}s restart)")
+            else:
+                print(f"\n⏱️  Migrations take {result['migrate_seconds']:.1f}s (no measured update yet for the restart time)")
+        
         elif command == "shortcuts":
             # Shortcuts management
             from shortcut_manager import ShortcutManager
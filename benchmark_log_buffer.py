@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Log Buffer Memory Benchmark
+Compares bytes per entry of the old dict-per-entry deque against LogRingBuffer
+
+Messages are generated from a handful of real agent log templates, so the
+block compression ratio is on the optimistic side of production logs.
+
+Usage:
+    python benchmark_log_buffer.py [entries]
+"""
+
+import sys
+import time
+import random
+import tracemalloc
+from collections import deque
+from datetime import datetime
+
+from log_manager import LogRingBuffer
+
+LEVELS = ['info', 'info', 'info', 'success', 'warning', 'error']
+ACTIONS = [None, None, 'start-all', 'update-all', 'setup-backend', 'install-frontend']
+MESSAGES = [
+    "🚀 Starting backend...",
+    "✅ MariaDB is ready (took {n}s)",
+    "   ⏳ Still installing backend dependencies... ({n}s elapsed)",
+    "📥 Downloading from https://github.com/Mighty-SEA/4paws-backend/releases/download/v{n}/backend-portable.zip...",
+    "   📦 Progress: resolved {n}, reused {n}, downloaded 0, added {n}",
+    "❌ Failed to start frontend (exit code: {n})",
+]
+
+
+def make_records(count: int):
+    """Generate realistic (level, action, message) tuples"""
+    rng = random.Random(42)
+    return [
+        (rng.choice(LEVELS), rng.choice(ACTIONS), rng.choice(MESSAGES).format(n=rng.randint(1, 99999)))
+        for _ in range(count)
+    ]
+
+
+def measure(fill, records) -> int:
+    """Return bytes retained by the structure built by fill(records)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    holder = fill(records)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del holder
+    return after - before
+
+
+def fill_legacy(records):
+    """Pre-ring-buffer representation: one dict per entry in a deque"""
+    buffer = deque(maxlen=len(records))
+    for level, action, message in records:
+        timestamp = datetime.now().strftime('%H:%M:%S')
+        action_tag = f"[{action}]" if action else ""
+        buffer.append({
+            'timestamp': timestamp,
+            'level': level,
+            'action': action,
+            'message': message,
+            'full_text': f"[{timestamp}] {action_tag} {message}"
+        })
+    return buffer
+
+
+def fill_ring(records):
+    """Current representation: LogRingBuffer columns + seq indexes"""
+    buffer = LogRingBuffer(len(records))
+    now = time.time()
+    for level, action, message in records:
+        buffer.append(now, level, action, message)
+    return buffer
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    records = make_records(count)
+    
+    # Message strings are shared by both structures in this benchmark but
+    # the legacy buffer keeps them as str while the ring stores UTF-8 bytes,
+    # so count the input strings as part of the legacy cost
+    message_bytes = sum(sys.getsizeof(m) for _, _, m in records)
+    
+    legacy = measure(fill_legacy, records) + message_bytes
+    ring = measure(fill_ring, records)
+    
+    print(f"Entries:            {count}")
+    print(f"Legacy dict/deque:  {legacy / count:8.1f} bytes/entry ({legacy / 1024 / 1024:.1f} MB)")
+    print(f"LogRingBuffer:      {ring / count:8.1f} bytes/entry ({ring / 1024 / 1024:.1f} MB)")
+    print(f"Reduction:          {legacy / ring:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
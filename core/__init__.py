@@ -7,6 +7,26 @@ from .paths import get_base_dir, get_writable_dir
 from .config import Config
 from .logger import LogManagerHandler, setup_logging, get_log_manager_handler
 from .license import LicenseManager
+from .log_reader import tail_lines, read_incremental, LineIndex, get_line_index, rotated_segments
+from .log_rotation import LogRotator, get_log_rotator, open_append_handle
+from .log_timeline import merge_timeline, stream_timeline, parse_timestamp, parse_severity
+from .tracing import Tracer, Span, get_tracer, traced, trace_span, current_span, annotate
+from .trace_export import TraceRecorder, get_trace_recorder, to_chrome_trace
+from .task_graph import TaskGraph, Task, report_progress
+from .eta import EtaEstimator, RunHistory
+from .install_journal import InstallJournal, get_install_journal
+from .proxy import ServiceProxy, get_service_proxy, proxy_enabled
+from .cluster import WorkerCluster, cluster_enabled
+from .tuning import TuningProfiles, get_tuning, probe_hardware
+from .mariadb import MariaDBClient, MariaDBError, parse_startup, startup_history
+from .backup import DatabaseBackups, get_backups
+from .binlog import BinlogArchiver, get_binlog_archiver
+from .snapshot import DataSnapshots, get_snapshots
+from .slow_log import SlowQueryLog, get_slow_query_log, normalize_query
+from .index_advisor import IndexAdvisor, get_index_advisor, parse_prisma_schema
+from .db_metrics import DatabaseMetrics, get_db_metrics
+from .maintenance import MaintenanceScheduler, get_maintenance, parse_windows
+from .rehearsal import MigrationRehearsal, get_migration_rehearsal
 
 __all__ = [
     'get_base_dir',
@@ -16,4 +36,64 @@ __all__ = [
     'setup_logging',
     'get_log_manager_handler',
     'LicenseManager',
+    'tail_lines',
+    'read_incremental',
+    'LineIndex',
+    'get_line_index',
+    'rotated_segments',
+    'LogRotator',
+    'get_log_rotator',
+    'open_append_handle',
+    'merge_timeline',
+    'stream_timeline',
+    'parse_timestamp',
+    'parse_severity',
+    'Tracer',
+    'Span',
+    'get_tracer',
+    'traced',
+    'trace_span',
+    'current_span',
+    'annotate',
+    'TraceRecorder',
+    'get_trace_recorder',
+    'to_chrome_trace',
+    'TaskGraph',
+    'Task',
+    'report_progress',
+    'EtaEstimator',
+    'RunHistory',
+    'InstallJournal',
+    'get_install_journal',
+    'ServiceProxy',
+    'get_service_proxy',
+    'proxy_enabled',
+    'WorkerCluster',
+    'cluster_enabled',
+    'TuningProfiles',
+    'get_tuning',
+    'probe_hardware',
+    'MariaDBClient',
+    'MariaDBError',
+    'parse_startup',
+    'startup_history',
+    'DatabaseBackups',
+    'get_backups',
+    'BinlogArchiver',
+    'get_binlog_archiver',
+    'DataSnapshots',
+    'get_snapshots',
+    'SlowQueryLog',
+    'get_slow_query_log',
+    'normalize_query',
+    'IndexAdvisor',
+    'get_index_advisor',
+    'parse_prisma_schema',
+    'DatabaseMetrics',
+    'get_db_metrics',
+    'MaintenanceScheduler',
+    'get_maintenance',
+    'parse_windows',
+    'MigrationRehearsal',
+    'get_migration_rehearsal',
 ]
@@ -0,0 +1,586 @@
+"""
+Logical database backups for 4Paws Agent
+Per-table dumps streamed through gzip straight into the backup directory,
+several tables at a time, with a manifest per backup and a parallel restore
+"""
+
+import os
+import re
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .config import Config
+from .install_journal import write_json_atomic
+from .mariadb import MariaDBClient, MariaDBError, DUMP_CLIENTS, SQL_CLIENTS
+from .tracing import trace_span
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+RESTORES_FILE = 'restores.json'
+
+# Backup formats: one file per table (dumped in parallel) or one
+# mariadb-dump of the whole database (a single consistent snapshot)
+FORMAT_TABLES = 'tables'
+FORMAT_FULL = 'full'
+FULL_DUMP_TABLE = '*'
+
+# Bytes moved per read between the client process and gzip
+STREAM_CHUNK = 1024 * 1024
+
+# Largest tables are dumped first so the last one to finish is a small one
+TABLES_SQL = (
+    "SELECT TABLE_NAME, IFNULL(TABLE_ROWS, 0), IFNULL(DATA_LENGTH + INDEX_LENGTH, 0) "
+    "FROM information_schema.TABLES WHERE TABLE_SCHEMA = '{db}' AND TABLE_TYPE = 'BASE TABLE' "
+    "ORDER BY DATA_LENGTH + INDEX_LENGTH DESC"
+)
+SCHEMA_SQL = (
+    "SELECT DEFAULT_CHARACTER_SET_NAME, DEFAULT_COLLATION_NAME "
+    "FROM information_schema.SCHEMATA WHERE SCHEMA_NAME = '{db}'"
+)
+
+# Dump options: consistent InnoDB read without locking, one row fetch at a
+# time (no client-side buffering of whole tables), binary-safe values
+DUMP_OPTIONS = ('--single-transaction', '--quick', '--skip-lock-tables', '--hex-blob',
+                '--default-character-set=utf8mb4')
+# Full dumps also write the binary log position of their snapshot (as a comment)
+# when the server has binary logging active
+FULL_DUMP_OPTIONS = ('--master-data=2',)
+DUMP_POSITION = re.compile(rb"MASTER_LOG_FILE='([^']+)',\s*MASTER_LOG_POS=(\d+)")
+
+# One commit per table file instead of one per INSERT statement (the dump
+# header already turns off unique and foreign key checks). Restores are
+# kept out of the binary log: replaying history must not include them.
+RESTORE_PREFIX = b"SET SESSION sql_log_bin=0;\nSET autocommit=0;\n"
+RESTORE_SUFFIX = b"\nCOMMIT;\n"
+
+
+def backup_parallelism() -> int:
+    """Tables dumped/restored at once (BACKUP_PARALLEL, 'auto' = cores, at most 4)"""
+    setting = str(os.getenv('BACKUP_PARALLEL', Config.BACKUP_PARALLEL)).strip().lower()
+    if setting != 'auto':
+        try:
+            return max(1, int(setting))
+        except ValueError:
+            logger.warning(f"⚠️  Invalid BACKUP_PARALLEL={setting!r}, using auto")
+    return max(1, min(os.cpu_count() or 1, 4))
+
+
+class _HashingWriter:
+    """File wrapper that hashes what is written through it (the compressed bytes)"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.digest.update(data)
+        self.size += len(data)
+        return self.raw.write(data)
+
+    def flush(self):
+        self.raw.flush()
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(STREAM_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _rate(size: int, seconds: float) -> Optional[float]:
+    return round(size / seconds) if seconds > 0 else None
+
+
+class DatabaseBackups:
+    """
+    Backups of the agent's database, one directory per backup
+
+    Each table is dumped by its own mariadb-dump process whose output is
+    compressed on the fly into <table>.sql.gz, so nothing uncompressed
+    touches the disk. Tables are dumped in parallel, largest first.
+    manifest.json (written last, atomically) lists every file with its
+    size, SHA-256 and timing; a directory without one is an unfinished
+    backup and is ignored and removed.
+
+    Each mariadb-dump uses its own consistent snapshot, so a backup taken
+    while the apps write is consistent per table only. The backups taken
+    before migrations run while the apps are stopped.
+
+    Restores verify the checksums, recreate the database and feed each
+    table file to its own mysql client in parallel.
+    """
+
+    def __init__(self, directory: Path, client: Optional[MariaDBClient] = None,
+                 database: Optional[str] = None):
+        self.directory = Path(directory)
+        self.client = client or MariaDBClient()
+        self.database = database or Config.MARIADB_DB
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.running: Optional[Dict] = None   # {'action', 'backup', 'started', 'tables_done', 'tables'}
+        self.last_error: Optional[str] = None
+
+    # ------------------------------------------------------------------
+    # Listing
+    # ------------------------------------------------------------------
+
+    def list(self) -> List[Dict]:
+        """Manifests of finished backups, newest first"""
+        backups = []
+        if not self.directory.exists():
+            return backups
+        for manifest_file in self.directory.glob(f'*/{MANIFEST_FILE}'):
+            try:
+                backups.append(json.loads(manifest_file.read_text(encoding='utf-8')))
+            except (OSError, ValueError):
+                continue
+        return sorted(backups, key=lambda m: m.get('created', 0), reverse=True)
+
+    def load(self, backup_id: str) -> Optional[Dict]:
+        manifest_file = self.directory / backup_id / MANIFEST_FILE
+        if '/' in backup_id or '\\' in backup_id or not manifest_file.exists():
+            return None
+        try:
+            return json.loads(manifest_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def latest(self) -> Optional[Dict]:
+        backups = self.list()
+        return backups[0] if backups else None
+
+    # ------------------------------------------------------------------
+    # Backup
+    # ------------------------------------------------------------------
+
+    def _tables(self) -> List[Dict]:
+        rows = self.client.query(TABLES_SQL.format(db=self.database))
+        return [{'table': row[0], 'rows_estimate': int(row[1]), 'size_estimate': int(row[2])} for row in rows]
+
+    def has_tables(self) -> bool:
+        try:
+            return bool(self._tables())
+        except MariaDBError:
+            return False
+
+    def binlog_position(self) -> Optional[Dict]:
+        """Current binary log file and position, or None if binary logging is off"""
+        try:
+            rows = self.client.query('SHOW MASTER STATUS')
+        except MariaDBError:
+            return None
+        if not rows or len(rows[0]) < 2:
+            return None
+        return {'file': rows[0][0], 'position': int(rows[0][1])}
+
+    def _dump_table(self, table: Dict, target: Path, level: int, binlog: bool = False) -> Dict:
+        if table['table'] == FULL_DUMP_TABLE:
+            # --master-data fails while the server runs without log-bin (BINLOG=on
+            # takes effect at the next MariaDB start)
+            options = FULL_DUMP_OPTIONS if binlog else ()
+            args = self.client.command(DUMP_CLIENTS, *DUMP_OPTIONS, *options, self.database)
+        else:
+            args = self.client.command(DUMP_CLIENTS, *DUMP_OPTIONS, self.database, table['table'])
+        started = time.perf_counter()
+        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        errors: List[bytes] = []
+        reader = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+        reader.start()
+
+        raw_bytes = 0
+        position = None
+        with open(target, 'wb') as f:
+            hashing = _HashingWriter(f)
+            with gzip.GzipFile(filename=target.stem, mode='wb', fileobj=hashing,
+                               compresslevel=level, mtime=0) as gz:
+                for chunk in iter(lambda: process.stdout.read(STREAM_CHUNK), b''):
+                    if raw_bytes == 0:
+                        match = DUMP_POSITION.search(chunk)  # In the dump header
+                        if match:
+                            position = {'file': match.group(1).decode(), 'position': int(match.group(2))}
+                    gz.write(chunk)
+                    raw_bytes += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        code = process.wait()
+        reader.join(5)
+        if code != 0:
+            message = b''.join(errors).decode('utf-8', 'replace').strip()
+            raise MariaDBError(f"dump of {table['table']} failed: {message or f'exit code {code}'}")
+
+        seconds = time.perf_counter() - started
+        return {
+            'table': table['table'],
+            'file': target.name,
+            'rows_estimate': table['rows_estimate'],
+            'raw_bytes': raw_bytes,
+            'bytes': hashing.size,
+            'sha256': hashing.digest.hexdigest(),
+            'seconds': round(seconds, 3),
+            'throughput': _rate(raw_bytes, seconds),
+            **({'binlog': position} if position else {})
+        }
+
+    def create(self, reason: str = 'manual', meta: Optional[Dict] = None,
+               parallel: Optional[int] = None, prune: bool = True, full: bool = False) -> Dict:
+        """
+        Back up the database now
+
+        The manifest's 'binlog' is the binary log position the backup
+        matches, which point-in-time restores replay from: taken from the
+        snapshot of a full dump, or for per-table dumps the position
+        before and after the dump when nothing was written meanwhile
+        (apps stopped). None if there is no such position.
+
+        Args:
+            reason: Why ('before migrations', 'scheduled', 'manual', ...)
+            meta: Extra manifest fields (e.g. backend version)
+            parallel: Tables dumped at once (default BACKUP_PARALLEL)
+            prune: Delete backups beyond BACKUP_KEEP afterwards
+            full: One mariadb-dump of the whole database (one consistent
+                snapshot while the apps write) instead of parallel tables;
+                it records the binlog position only if the server has
+                binary logging active
+
+        Returns:
+            dict: The manifest
+
+        Raises:
+            RuntimeError: if a backup or restore is already running
+            MariaDBError: if a dump fails (the partial backup is removed)
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('A backup or restore is already running')
+        try:
+            manifest = self._create(reason, meta or {}, 1 if full else parallel or backup_parallelism(), full)
+        finally:
+            self.running = None
+            self._lock.release()
+        if prune:
+            self.prune()
+        return manifest
+
+    def _create(self, reason: str, meta: Dict, parallel: int, full: bool) -> Dict:
+        created = time.time()
+        backup_id = datetime.fromtimestamp(created).strftime('%Y%m%d-%H%M%S')
+        target = self.directory / backup_id
+        suffix = 1
+        while target.exists():
+            suffix += 1
+            target = self.directory / f"{backup_id}-{suffix}"
+        backup_id = target.name
+        level = int(os.getenv('BACKUP_COMPRESS_LEVEL', Config.BACKUP_COMPRESS_LEVEL))
+
+        with trace_span('database backup', reason=reason, database=self.database) as span:
+            tables = self._tables()
+            schema = self.client.query(SCHEMA_SQL.format(db=self.database))
+            if full:
+                tables = [{'table': FULL_DUMP_TABLE, 'file': 'full',
+                           'rows_estimate': sum(t['rows_estimate'] for t in tables),
+                           'size_estimate': sum(t['size_estimate'] for t in tables)}]
+            target.mkdir(parents=True)
+            self.running = {'action': 'backup', 'backup': backup_id, 'started': created,
+                            'tables': len(tables), 'tables_done': 0}
+            if full:
+                logger.info(f"💾 Backing up {self.database} (full dump)...")
+            else:
+                logger.info(f"💾 Backing up {self.database} ({len(tables)} tables, {parallel} at a time)...")
+
+            before = self.binlog_position()
+            started = time.perf_counter()
+            results: List[Dict] = []
+            try:
+                with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='backup') as pool:
+                    futures = [pool.submit(self._dump_table, table,
+                                           target / f"{table.get('file', table['table'])}.sql.gz", level,
+                                           before is not None)
+                               for table in tables]
+                    for future in futures:
+                        results.append(future.result())
+                        self.running['tables_done'] += 1
+            except Exception as e:
+                shutil.rmtree(target, ignore_errors=True)
+                self.last_error = str(e)
+                span.fail(str(e))
+                raise
+            if full:
+                position = results[0].pop('binlog', None) if results else None
+            else:
+                position = before if before is not None and self.binlog_position() == before else None
+
+            seconds = time.perf_counter() - started
+            raw_bytes = sum(r['raw_bytes'] for r in results)
+            size = sum(r['bytes'] for r in results)
+            manifest = {
+                'version': MANIFEST_VERSION,
+                'id': backup_id,
+                'database': self.database,
+                'reason': reason,
+                'created': created,
+                'format': FORMAT_FULL if full else FORMAT_TABLES,
+                'binlog': position,
+                'charset': schema[0][0] if schema else 'utf8mb4',
+                'collation': schema[0][1] if schema else None,
+                'tables': sorted(results, key=lambda r: r['table']),
+                'raw_bytes': raw_bytes,
+                'bytes': size,
+                'seconds': round(seconds, 3),
+                'throughput': _rate(raw_bytes, seconds),
+                'parallel': parallel,
+                'compress_level': level,
+                **meta
+            }
+            write_json_atomic(target / MANIFEST_FILE, manifest)
+            span.set_attributes(units=raw_bytes, unit='bytes', tables=len(results), compressed=size)
+            self.last_error = None
+
+        logger.info(f"✅ Backup {backup_id}: {raw_bytes / 1048576:.1f} MB → {size / 1048576:.1f} MB "
+                    f"in {seconds:.1f}s ({raw_bytes / 1048576 / max(seconds, 0.001):.1f} MB/s)")
+        return manifest
+
+    def prune(self, keep: Optional[int] = None):
+        """Delete the oldest backups beyond BACKUP_KEEP and leftovers of interrupted ones"""
+        keep = keep if keep is not None else int(os.getenv('BACKUP_KEEP', Config.BACKUP_KEEP))
+        for backup in self.list()[keep:]:
+            shutil.rmtree(self.directory / backup['id'], ignore_errors=True)
+            logger.info(f"🧹 Removed old backup {backup['id']}")
+        if self.directory.exists() and not self._lock.locked():
+            for leftover in self.directory.iterdir():
+                # Backup directories are named by date (others, e.g. binlog/, belong to someone else)
+                if leftover.is_dir() and leftover.name[:1].isdigit() and not (leftover / MANIFEST_FILE).exists():
+                    shutil.rmtree(leftover, ignore_errors=True)
+
+    # ------------------------------------------------------------------
+    # Restore
+    # ------------------------------------------------------------------
+
+    def verify(self, backup_id: str) -> List[str]:
+        """Problems with a backup's files (missing, size or checksum mismatch); empty if intact"""
+        manifest = self.load(backup_id)
+        if manifest is None:
+            return [f"Backup {backup_id} not found"]
+        problems = []
+
+        def check(entry: Dict) -> Optional[str]:
+            path = self.directory / backup_id / entry['file']
+            if not path.exists():
+                return f"{entry['file']} is missing"
+            if path.stat().st_size != entry['bytes'] or _file_sha256(path) != entry['sha256']:
+                return f"{entry['file']} is damaged (checksum mismatch)"
+            return None
+
+        with ThreadPoolExecutor(max_workers=backup_parallelism()) as pool:
+            for problem in pool.map(check, manifest['tables']):
+                if problem:
+                    problems.append(problem)
+        return problems
+
+    def _restore_table(self, path: Path, database: str) -> Dict:
+        args = self.client.command(SQL_CLIENTS, '--default-character-set=utf8mb4', database)
+        started = time.perf_counter()
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE,
+                                   creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        errors: List[bytes] = []
+        reader = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+        reader.start()
+
+        raw_bytes = 0
+        try:
+            process.stdin.write(RESTORE_PREFIX)
+            with gzip.open(path, 'rb') as gz:
+                for chunk in iter(lambda: gz.read(STREAM_CHUNK), b''):
+                    process.stdin.write(chunk)
+                    raw_bytes += len(chunk)
+            process.stdin.write(RESTORE_SUFFIX)
+            process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass  # mysql exited early: its exit code and stderr say why
+        code = process.wait()
+        reader.join(5)
+        if code != 0:
+            message = b''.join(errors).decode('utf-8', 'replace').strip()
+            raise MariaDBError(f"restore of {path.name} failed: {message or f'exit code {code}'}")
+
+        seconds = time.perf_counter() - started
+        return {'file': path.name, 'raw_bytes': raw_bytes, 'seconds': round(seconds, 3),
+                'throughput': _rate(raw_bytes, seconds)}
+
+    def restores(self) -> List[Dict]:
+        """Restores into the agent's database, oldest first ({'time', 'backup'})"""
+        try:
+            return json.loads((self.directory / RESTORES_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return []
+
+    def record_restore(self, source: str, created: float):
+        """
+        Note that the database was replaced by data from created (a backup
+        or a data directory snapshot): binary log history before a restore
+        no longer leads to the current data
+        """
+        restores = self.restores()[-99:]
+        restores.append({'time': time.time(), 'backup': source, 'backup_created': created})
+        write_json_atomic(self.directory / RESTORES_FILE, restores)
+
+    def restore(self, backup_id: str, database: Optional[str] = None,
+                parallel: Optional[int] = None) -> Dict:
+        """
+        Replace a database with a backup's contents
+
+        The target database (default: the one backed up) is dropped and
+        recreated with the backup's character set, then the tables are
+        loaded in parallel, largest first.
+
+        Returns:
+            dict: {'backup', 'database', 'raw_bytes', 'seconds', 'throughput', 'tables': [...]}
+
+        Raises:
+            RuntimeError: if a backup or restore is already running
+            ValueError: if the backup is missing or damaged
+            MariaDBError: if loading a table fails
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('A backup or restore is already running')
+        try:
+            return self._restore(backup_id, database, parallel or backup_parallelism())
+        finally:
+            self.running = None
+            self._lock.release()
+
+    def _restore(self, backup_id: str, database: Optional[str], parallel: int) -> Dict:
+        manifest = self.load(backup_id)
+        if manifest is None:
+            raise ValueError(f"Backup {backup_id} not found")
+        problems = self.verify(backup_id)
+        if problems:
+            raise ValueError('; '.join(problems))
+        database = database or manifest['database']
+
+        with trace_span('database restore', backup=backup_id, database=database) as span:
+            self.running = {'action': 'restore', 'backup': backup_id, 'started': time.time(),
+                            'tables': len(manifest['tables']), 'tables_done': 0}
+            collation = f" COLLATE {manifest['collation']}" if manifest.get('collation') else ''
+            self.client.query(
+                f"DROP DATABASE IF EXISTS `{database}`; "
+                f"CREATE DATABASE `{database}` CHARACTER SET {manifest['charset']}{collation};"
+            )
+            logger.info(f"♻️  Restoring backup {backup_id} into {database} "
+                        f"({len(manifest['tables'])} tables, {parallel} at a time)...")
+
+            entries = sorted(manifest['tables'], key=lambda t: t['raw_bytes'], reverse=True)
+            started = time.perf_counter()
+            results = []
+            try:
+                with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix='restore') as pool:
+                    futures = [pool.submit(self._restore_table, self.directory / backup_id / entry['file'], database)
+                               for entry in entries]
+                    for future in futures:
+                        results.append(future.result())
+                        self.running['tables_done'] += 1
+            except Exception as e:
+                self.last_error = str(e)
+                span.fail(str(e))
+                raise
+
+            seconds = time.perf_counter() - started
+            raw_bytes = sum(r['raw_bytes'] for r in results)
+            span.set_attributes(units=raw_bytes, unit='bytes', tables=len(results))
+
+        if database == self.database:
+            self.record_restore(backup_id, manifest['created'])
+        logger.info(f"✅ Restored {backup_id}: {raw_bytes / 1048576:.1f} MB in {seconds:.1f}s "
+                    f"({raw_bytes / 1048576 / max(seconds, 0.001):.1f} MB/s)")
+        return {
+            'backup': backup_id,
+            'database': database,
+            'raw_bytes': raw_bytes,
+            'seconds': round(seconds, 3),
+            'throughput': _rate(raw_bytes, seconds),
+            'tables': results
+        }
+
+    # ------------------------------------------------------------------
+    # Schedule
+    # ------------------------------------------------------------------
+
+    def due(self) -> bool:
+        """True if the newest backup is older than BACKUP_INTERVAL_HOURS (0 = no schedule)"""
+        interval = float(os.getenv('BACKUP_INTERVAL_HOURS', Config.BACKUP_INTERVAL_HOURS)) * 3600
+        if interval <= 0:
+            return False
+        latest = self.latest()
+        if latest is None or time.time() - latest['created'] >= interval:
+            return True
+        # Binary log replays can't cross a restore: start a new base soon after one
+        restores = self.restores()
+        return bool(restores) and restores[-1]['time'] > latest['created']
+
+    def start(self, can_run: Callable[[], bool], check_interval: int = 300, full: bool = False):
+        """
+        Take scheduled backups in the background (idempotent)
+
+        Args:
+            can_run: Called before each due backup; False postpones it
+                (e.g. MariaDB not running, an install or update in progress)
+            full: Scheduled backups are full dumps (with a binlog position
+                while the apps write)
+        """
+        if self._thread:
+            return
+        self._stop.clear()
+        self.prune()
+
+        def loop():
+            while not self._stop.wait(check_interval):
+                try:
+                    if self.due() and not self._lock.locked() and can_run() and self.has_tables():
+                        self.create('scheduled', full=full)
+                except Exception as e:
+                    logger.warning(f"⚠️  Scheduled backup failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name='db-backup', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def status(self) -> Dict:
+        latest = self.latest()
+        return {
+            'directory': str(self.directory),
+            'running': dict(self.running) if self.running else None,
+            'latest': latest,
+            'count': len(self.list()),
+            'due': self.due(),
+            'last_error': self.last_error
+        }
+
+
+_backups: Optional[DatabaseBackups] = None
+
+
+def get_backups() -> DatabaseBackups:
+    """Get the global DatabaseBackups (BACKUP_DIR, default backups/ in the writable dir)"""
+    global _backups
+    if _backups is None:
+        _backups = DatabaseBackups(Path(os.getenv('BACKUP_DIR', Config.BACKUP_DIR)))
+    return _backups
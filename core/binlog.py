@@ -0,0 +1,340 @@
+"""
+Binary log archiving and point-in-time restore for 4Paws Agent
+MariaDB writes binary logs in its data directory; closed ones are
+compressed into the backup directory, and a restore replays them on top
+of the latest backup up to a chosen time
+"""
+
+import os
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .config import Config
+from .install_journal import write_json_atomic
+from .mariadb import MariaDBClient, MariaDBError, SQL_CLIENTS, find_client
+from .backup import DatabaseBackups, get_backups, STREAM_CHUNK
+from .tracing import trace_span
+
+logger = logging.getLogger(__name__)
+
+# Binary log base name (relative: the files live in the MariaDB data directory)
+BINLOG_BASENAME = 'mysql-bin'
+BINLOG_CLIENTS = ('mariadb-binlog.exe', 'mysqlbinlog.exe', 'mariadb-binlog', 'mysqlbinlog')
+INDEX_FILE = 'index.json'
+
+# A binary log holding no more than its header events isn't worth rotating
+MIN_ROTATE_BYTES = 4096
+
+
+def binlog_enabled() -> bool:
+    return os.getenv('BINLOG', Config.BINLOG).lower() == 'on'
+
+
+class BinlogArchiver:
+    """
+    Keeps every binary log needed to bring the newest backup forward
+
+    Every BINLOG_ARCHIVE_MINUTES the server switches to a new binary log
+    (FLUSH BINARY LOGS) when the current one has data; each closed log
+    is gzip-compressed into the archive directory (index.json holds size
+    and SHA-256) and then purged from the data directory. Archived logs
+    older than the oldest backup with a binlog position are deleted.
+
+    A point-in-time restore loads the newest backup taken before the
+    target time (and not superseded by a later restore), then pipes the
+    archived logs from the backup's position through mariadb-binlog
+    --stop-datetime into the mysql client, without writing them to the
+    binary log again.
+    """
+
+    def __init__(self, directory: Path, backups: DatabaseBackups, client: Optional[MariaDBClient] = None):
+        self.directory = Path(directory)
+        self.backups = backups
+        self.client = client or backups.client
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_archive: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    # --- Server side -----------------------------------------------------
+
+    @staticmethod
+    def mysqld_args() -> List[str]:
+        """mysqld options for binary logging (row format, files in the data directory)"""
+        if not binlog_enabled():
+            return []
+        max_size = int(os.getenv('BINLOG_MAX_SIZE_MB', Config.BINLOG_MAX_SIZE_MB))
+        return [
+            f"--log-bin={BINLOG_BASENAME}",
+            "--server-id=1",
+            "--binlog-format=ROW",
+            f"--max-binlog-size={max_size}M"
+        ]
+
+    def _server_logs(self) -> List[Dict]:
+        rows = self.client.query('SHOW BINARY LOGS')
+        return [{'file': row[0], 'size': int(row[1])} for row in rows]
+
+    # --- Archive -----------------------------------------------------------
+
+    def index(self) -> Dict[str, Dict]:
+        try:
+            return json.loads((self.directory / INDEX_FILE).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def archive(self, datadir: Optional[Path] = None) -> List[str]:
+        """
+        Rotate the current binary log (if it has data) and archive closed ones
+
+        Returns:
+            list: Names of the logs archived now
+
+        Raises:
+            MariaDBError: if the server can't be queried (binary logging off, not running)
+        """
+        datadir = Path(datadir or Config.DATA_DIR / 'mariadb')
+        with self._lock:
+            logs = self._server_logs()
+            if logs and logs[-1]['size'] > MIN_ROTATE_BYTES:
+                self.client.query('FLUSH BINARY LOGS')
+                logs = self._server_logs()
+            closed = [entry['file'] for entry in logs[:-1]]
+            index = self.index()
+            archived = []
+            level = int(os.getenv('BACKUP_COMPRESS_LEVEL', Config.BACKUP_COMPRESS_LEVEL))
+            for name in closed:
+                if name in index:
+                    continue
+                source = datadir / name
+                if not source.exists():
+                    logger.warning(f"⚠️  Binary log {name} not found in {datadir}")
+                    continue
+                index[name] = self._compress(source, level)
+                archived.append(name)
+            if archived:
+                write_json_atomic(self.directory / INDEX_FILE, index)
+            if closed and all(name in index for name in closed):
+                # Archived copies are kept; the server only needs the current log
+                self.client.query(f"PURGE BINARY LOGS TO '{logs[-1]['file']}'")
+            self.last_archive = time.time()
+            self._expire(index)
+        if archived:
+            logger.info(f"📦 Archived binary log(s): {', '.join(archived)}")
+        return archived
+
+    def _compress(self, source: Path, level: int) -> Dict:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        target = self.directory / f"{source.name}.gz"
+        partial = target.with_name(f"{target.name}.partial")
+        digest = hashlib.sha256()
+        raw_bytes = 0
+        with open(source, 'rb') as src, gzip.open(partial, 'wb', compresslevel=level) as gz:
+            for chunk in iter(lambda: src.read(STREAM_CHUNK), b''):
+                gz.write(chunk)
+                raw_bytes += len(chunk)
+        with open(partial, 'rb') as f:
+            for chunk in iter(lambda: f.read(STREAM_CHUNK), b''):
+                digest.update(chunk)
+        os.replace(partial, target)
+        return {
+            'file': target.name,
+            'raw_bytes': raw_bytes,
+            'bytes': target.stat().st_size,
+            'sha256': digest.hexdigest(),
+            'archived': time.time(),
+            'modified': source.stat().st_mtime   # Time of the log's last event
+        }
+
+    def _expire(self, index: Dict[str, Dict]):
+        """Delete archived logs older than the oldest backup that can start a replay"""
+        positions = [b['binlog']['file'] for b in self.backups.list() if b.get('binlog')]
+        if not positions:
+            return
+        oldest = min(positions)
+        expired = [name for name in index if name < oldest]
+        for name in expired:
+            (self.directory / index.pop(name)['file']).unlink(missing_ok=True)
+        if expired:
+            write_json_atomic(self.directory / INDEX_FILE, index)
+            logger.info(f"🧹 Removed {len(expired)} archived binary log(s) older than the oldest backup")
+
+    # --- Point-in-time restore ------------------------------------------------
+
+    def base_backup(self, target_time: float) -> Optional[Dict]:
+        """Newest backup a restore to target_time can start from"""
+        restores = [r['time'] for r in self.backups.restores()]
+        for backup in self.backups.list():   # Newest first
+            if not backup.get('binlog') or backup['created'] > target_time:
+                continue
+            if backup.get('database') != self.backups.database:
+                continue
+            # A restore between backup and target replaced the data the logs continue from
+            if any(backup['created'] < restored <= target_time for restored in restores):
+                continue
+            return backup
+        return None
+
+    def window(self) -> Dict:
+        """
+        Time range point-in-time restores cover: from the oldest backup with
+        a binlog position to the last archived event (a restore archives
+        the current log first, so with the server running it reaches now)
+        """
+        bases = [b for b in self.backups.list() if b.get('binlog')]
+        if not bases:
+            return {'earliest': None, 'archived_until': None}
+        archived = [entry['modified'] for entry in self.index().values()]
+        return {
+            'earliest': min(b['created'] for b in bases),
+            'archived_until': max(archived + [b['created'] for b in bases])
+        }
+
+    def _replay_files(self, base: Dict) -> List[str]:
+        index = self.index()
+        start = base['binlog']['file']
+        names = sorted(name for name in index if name >= start)
+        if not names or names[0] != start:
+            raise ValueError(f"Binary log {start} (the start of backup {base['id']}) is not archived")
+        for previous, name in zip(names, names[1:]):
+            if int(name.rsplit('.', 1)[1]) != int(previous.rsplit('.', 1)[1]) + 1:
+                raise ValueError(f"Archived binary logs are not contiguous ({previous} → {name})")
+        return names
+
+    def restore_to(self, target_time: float, database: Optional[str] = None) -> Dict:
+        """
+        Restore the database as it was at target_time
+
+        The server must be running; closed binary logs are archived first
+        so the replay reaches up to now.
+
+        Returns:
+            dict: {'backup', 'target', 'binlogs', 'restore_seconds', 'replay_seconds', ...}
+
+        Raises:
+            ValueError: if no backup/log chain covers target_time
+            MariaDBError: if loading or replaying fails
+        """
+        if target_time > time.time():
+            raise ValueError('The restore time is in the future')
+        base = self.base_backup(target_time)
+        if base is None:
+            raise ValueError('No backup with a binary log position before that time')
+        self.archive()
+        names = self._replay_files(base)
+        database = database or base['database']
+        stop = datetime.fromtimestamp(target_time).strftime('%Y-%m-%d %H:%M:%S')
+
+        with trace_span('point-in-time restore', backup=base['id'], target=stop, database=database) as span:
+            restored = self.backups.restore(base['id'], database)
+            started = time.perf_counter()
+            with tempfile.TemporaryDirectory(prefix='binlog-replay-', dir=self.directory) as tmp:
+                files = []
+                for name in names:
+                    path = Path(tmp) / name
+                    with gzip.open(self.directory / self.index()[name]['file'], 'rb') as src, open(path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, STREAM_CHUNK)
+                    files.append(path)
+                self._replay(files, base['binlog']['position'], stop, base['database'], database)
+            replay_seconds = time.perf_counter() - started
+            span.set_attributes(binlogs=len(names), replay_seconds=round(replay_seconds, 2))
+
+        logger.info(f"✅ Restored {database} to {stop}: backup {base['id']} + {len(names)} binary log(s) "
+                    f"replayed in {replay_seconds:.1f}s")
+        return {
+            'backup': base['id'],
+            'target': target_time,
+            'database': database,
+            'binlogs': names,
+            'restore_seconds': restored['seconds'],
+            'replay_seconds': round(replay_seconds, 3)
+        }
+
+    def _replay(self, files: List[Path], position: int, stop: str, source_db: str, database: str):
+        client = self.client
+        binlog_exe = find_client(client.mariadb_dir, BINLOG_CLIENTS)
+        if binlog_exe is None:
+            raise MariaDBError(f"{BINLOG_CLIENTS[0]} not found in {client.mariadb_dir / 'bin'}")
+
+        args = [str(binlog_exe), '--disable-log-bin', f'--start-position={position}',
+                f'--stop-datetime={stop}']
+        if database != source_db:
+            args.append(f'--rewrite-db={source_db}->{database}')
+        args.append(f'--database={database}')
+        args += [str(f) for f in files]
+
+        creationflags = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+        reader = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=creationflags)
+        loader = subprocess.Popen(client.command(SQL_CLIENTS, '--default-character-set=utf8mb4'),
+                                  stdin=reader.stdout, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                  creationflags=creationflags)
+        reader.stdout.close()   # The loader owns the pipe now
+        _, load_errors = loader.communicate()
+        read_errors = reader.stderr.read()
+        reader.wait()
+        if reader.returncode != 0:
+            raise MariaDBError(f"reading binary logs failed: {read_errors.decode('utf-8', 'replace').strip()}")
+        if loader.returncode != 0:
+            raise MariaDBError(f"replaying binary logs failed: {load_errors.decode('utf-8', 'replace').strip()}")
+
+    # --- Schedule ------------------------------------------------------------
+
+    def start(self, can_run: Callable[[], bool]):
+        """Archive in the background every BINLOG_ARCHIVE_MINUTES while can_run() (idempotent)"""
+        if self._thread or not binlog_enabled():
+            return
+        interval = float(os.getenv('BINLOG_ARCHIVE_MINUTES', Config.BINLOG_ARCHIVE_MINUTES)) * 60
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    if can_run():
+                        self.archive()
+                        self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.warning(f"⚠️  Binary log archiving failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name='binlog-archive', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def status(self) -> Dict:
+        index = self.index()
+        return {
+            'enabled': binlog_enabled(),
+            'directory': str(self.directory),
+            'archived': len(index),
+            'raw_bytes': sum(entry['raw_bytes'] for entry in index.values()),
+            'bytes': sum(entry['bytes'] for entry in index.values()),
+            'last_archive': self.last_archive,
+            'last_error': self.last_error,
+            'window': self.window()
+        }
+
+
+_archiver: Optional[BinlogArchiver] = None
+
+
+def get_binlog_archiver() -> BinlogArchiver:
+    """Get the global BinlogArchiver (binlog/ in the backup directory)"""
+    global _archiver
+    if _archiver is None:
+        backups = get_backups()
+        _archiver = BinlogArchiver(backups.directory / 'binlog', backups)
+    return _archiver
@@ -0,0 +1,401 @@
+"""
+Backend worker cluster for 4Paws Agent
+Runs several backend processes on internal ports behind the backend proxy,
+keeps them healthy, restarts them one at a time and scales their number
+with sustained CPU load and queue depth
+"""
+
+import os
+import time
+import logging
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import psutil
+
+from .config import Config
+from .proxy import ServiceProxy, Upstream, free_port, wait_healthy, check_health
+from .tracing import trace_span
+
+logger = logging.getLogger(__name__)
+
+# Seconds between worker samples (process liveness, CPU, RSS, queue depth)
+MONITOR_INTERVAL = 2.0
+
+# Consecutive failed health checks before a worker is replaced
+UNHEALTHY_AFTER = 3
+
+# Memory budgeted per worker when sizing the cluster from the machine
+# (a NestJS + Prisma process), and the share of RAM workers may take
+WORKER_MEMORY_ESTIMATE = 256 * 1024 * 1024
+WORKER_MEMORY_SHARE = 0.25
+
+# No scale-up while the machine as a whole is this busy (more workers
+# would only compete for the same cores)
+SYSTEM_CPU_CEILING = 90.0
+
+Spawn = Callable[[int, int], Optional[subprocess.Popen]]
+Stop = Callable[[str, subprocess.Popen], None]
+
+
+def machine_worker_limit() -> int:
+    """Workers this machine can carry: one core left for MariaDB/frontend, bounded by RAM"""
+    cores = psutil.cpu_count(logical=False) or os.cpu_count() or 1
+    memory = psutil.virtual_memory().total
+    by_memory = int(memory * WORKER_MEMORY_SHARE / WORKER_MEMORY_ESTIMATE)
+    return max(1, min(cores - 1, by_memory))
+
+
+def _worker_setting(name: str, default) -> int:
+    """BACKEND_WORKERS-style setting: a number, or 'auto' (machine_worker_limit)"""
+    value = str(os.getenv(name, default)).strip().lower()
+    if value == 'auto':
+        return machine_worker_limit()
+    try:
+        return max(1, int(value))
+    except ValueError:
+        logger.warning(f"⚠️  Invalid {name}={value!r}, using auto")
+        return machine_worker_limit()
+
+
+def configured_workers() -> int:
+    """Workers to start with (BACKEND_WORKERS)"""
+    return _worker_setting('BACKEND_WORKERS', Config.BACKEND_WORKERS)
+
+
+def cluster_enabled() -> bool:
+    """More than one backend worker configured"""
+    return configured_workers() > 1
+
+
+def configured_max_workers() -> int:
+    """Most backend workers that may run at once (1 without a cluster)"""
+    if not cluster_enabled():
+        return 1
+    return max(configured_workers(),
+               _worker_setting('BACKEND_MIN_WORKERS', Config.BACKEND_MIN_WORKERS),
+               _worker_setting('BACKEND_MAX_WORKERS', Config.BACKEND_MAX_WORKERS))
+
+
+class Worker:
+    """One backend process of the cluster"""
+
+    def __init__(self, worker_id: int, port: int, process: subprocess.Popen):
+        self.id = worker_id
+        self.port = port
+        self.process = process
+        self.upstream: Optional[Upstream] = None
+        self.started_at = time.time()
+        self.health_failures = 0
+        self.cpu = 0.0
+        self.rss = 0
+        try:
+            self.ps: Optional[psutil.Process] = psutil.Process(process.pid)
+            self.ps.cpu_percent(None)  # First call only sets the baseline
+        except psutil.Error:
+            self.ps = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def sample(self):
+        """Refresh CPU (% of one core since the last sample) and RSS"""
+        if self.ps is None:
+            return
+        try:
+            with self.ps.oneshot():
+                self.cpu = self.ps.cpu_percent(None)
+                self.rss = self.ps.memory_info().rss
+        except psutil.Error:
+            self.cpu, self.rss = 0.0, 0
+
+    def to_dict(self) -> Dict:
+        upstream = self.upstream
+        return {
+            'id': self.id,
+            'pid': self.process.pid,
+            'port': self.port,
+            'alive': self.alive,
+            'healthy': upstream.healthy if upstream else False,
+            'cpu': round(self.cpu, 1),
+            'memory': round(self.rss / 1024 / 1024, 1),  # MB
+            'requests': upstream.requests if upstream else 0,
+            'in_flight': upstream.in_flight if upstream else 0,
+            'started_at': self.started_at
+        }
+
+
+class WorkerCluster:
+    """
+    N backend workers behind one ServiceProxy (least-connections)
+
+    Workers get their internal port and a worker id (NODE_APP_INSTANCE,
+    0 = primary, for jobs that must run once) from spawn(port, worker_id).
+    A monitor thread replaces workers whose process exits or that fail
+    UNHEALTHY_AFTER health checks in a row, samples per-worker CPU/RSS and
+    - with autoscaling on - adds a worker when CPU or queue depth (requests
+    in flight per worker) stayed high for a whole window, or removes one
+    when the cluster stayed idle for a window.
+    """
+
+    def __init__(self, name: str, proxy: ServiceProxy, spawn: Spawn, stop: Stop,
+                 on_change: Optional[Callable[['WorkerCluster'], None]] = None):
+        self.name = name
+        self.proxy = proxy
+        self.spawn = spawn
+        self.stop_process = stop
+        self.on_change = on_change
+        self.workers: Dict[int, Worker] = {}
+        self.restarts: Dict[int, int] = {}
+        self.lock = threading.RLock()
+        self.samples: Deque[Tuple[float, float, float]] = deque()
+        self.last_scale: Optional[Dict] = None
+        self.stopping = threading.Event()
+        self.monitor: Optional[threading.Thread] = None
+        self._last_health_check = 0.0
+
+    # --- Settings (re-read so .env changes apply without restarting the agent)
+
+    @property
+    def health_path(self) -> str:
+        return os.getenv('BACKEND_HEALTH_PATH', Config.BACKEND_HEALTH_PATH)
+
+    @property
+    def min_workers(self) -> int:
+        return _worker_setting('BACKEND_MIN_WORKERS', Config.BACKEND_MIN_WORKERS)
+
+    @property
+    def max_workers(self) -> int:
+        return max(self.min_workers, _worker_setting('BACKEND_MAX_WORKERS', Config.BACKEND_MAX_WORKERS))
+
+    @staticmethod
+    def _setting(name: str) -> float:
+        return float(os.getenv(name, getattr(Config, name)))
+
+    # --- Lifecycle ------------------------------------------------------------
+
+    def start(self, count: int) -> bool:
+        """Start count workers in parallel; True once at least one is serving"""
+        self.stopping.clear()
+        with self.lock:
+            ids = [worker_id for worker_id in range(count) if worker_id not in self.workers]
+            if ids:
+                logger.info(f"🚀 Starting {len(ids)} {self.name} worker(s)...")
+                with ThreadPoolExecutor(max_workers=len(ids)) as pool:
+                    for worker in pool.map(self._launch, ids):
+                        if worker is not None:
+                            self._admit(worker)
+            started = bool(self.workers)
+        if started:
+            logger.info(f"✅ {self.name.capitalize()} cluster: {len(self.workers)} worker(s) on "
+                        f":{', :'.join(str(w.port) for w in self.workers.values())}")
+            self._start_monitor()
+        return started
+
+    def stop(self):
+        """Maintenance page, drain all workers, stop them"""
+        self.stopping.set()
+        with self.lock:
+            workers = list(self.workers.values())
+            self.workers.clear()
+            drained = self.proxy.switch(None)
+            self.proxy.drain(drained, self._setting('PROXY_DRAIN_TIMEOUT'))
+            for worker in workers:
+                self.stop_process(f"{self.name} worker {worker.id}", worker.process)
+            self.samples.clear()
+        self._changed()
+
+    def rolling_restart(self) -> bool:
+        """
+        Replace workers one at a time: the new one joins the rotation once
+        healthy, then the old one is drained and stopped, so the cluster
+        never runs below its size. Stops at the first worker that fails to
+        come up (the old one keeps serving).
+        """
+        with self.lock:
+            if not self.workers:
+                return self.start(configured_workers())
+            with trace_span('rolling restart', service=self.name, workers=len(self.workers)):
+                for worker_id in sorted(self.workers):
+                    if not self._replace(self.workers[worker_id], 'rolling restart'):
+                        return False
+            logger.info(f"✅ {self.name.capitalize()} cluster restarted ({len(self.workers)} worker(s))")
+            return True
+
+    def scale_to(self, count: int, reason: str = 'manual') -> int:
+        """Add or remove workers until count are running; returns the new size"""
+        count = max(1, count)
+        with self.lock:
+            before = len(self.workers)
+            while len(self.workers) < count:
+                worker_id = min(set(range(len(self.workers) + 1)) - set(self.workers))
+                worker = self._launch(worker_id)
+                if worker is None:
+                    break
+                self._admit(worker)
+            while len(self.workers) > count:
+                self._retire(self.workers[max(self.workers)])
+            if len(self.workers) != before:
+                self.last_scale = {'time': time.time(), 'from': before, 'to': len(self.workers), 'reason': reason}
+                logger.info(f"📈 {self.name.capitalize()} workers {before} → {len(self.workers)} ({reason})")
+                self.samples.clear()  # Next decision needs a full window at the new size
+            return len(self.workers)
+
+    # --- Workers ---------------------------------------------------------------
+
+    def _launch(self, worker_id: int) -> Optional[Worker]:
+        """Spawn a worker on a free port and wait for its health check"""
+        port = free_port()
+        process = self.spawn(port, worker_id)
+        if process is None:
+            return None
+        with trace_span('health check', service=self.name, worker=worker_id, port=port) as span:
+            healthy = wait_healthy(port, self.health_path, self._setting('PROXY_HEALTH_TIMEOUT'), process)
+            if not healthy:
+                span.fail()
+        if not healthy:
+            if process.poll() is not None:
+                logger.error(f"❌ {self.name.capitalize()} worker {worker_id} exited (code {process.returncode})")
+            else:
+                logger.error(f"❌ {self.name.capitalize()} worker {worker_id} not healthy, stopping it")
+                self.stop_process(f"{self.name} worker {worker_id}", process)
+            return None
+        return Worker(worker_id, port, process)
+
+    def _admit(self, worker: Worker):
+        worker.upstream = self.proxy.add(worker.port)
+        self.workers[worker.id] = worker
+        self._changed()
+
+    def _retire(self, worker: Worker):
+        """Out of rotation, drain, stop"""
+        self.workers.pop(worker.id, None)
+        self._changed()
+        if worker.upstream is not None:
+            self.proxy.drain([self.proxy.remove(worker.upstream)], self._setting('PROXY_DRAIN_TIMEOUT'))
+        self.stop_process(f"{self.name} worker {worker.id}", worker.process)
+
+    def _replace(self, worker: Worker, reason: str) -> bool:
+        logger.info(f"🔄 Replacing {self.name} worker {worker.id} ({reason})")
+        new = self._launch(worker.id)
+        if new is None:
+            return False
+        self._retire(worker)
+        self._admit(new)
+        self.restarts[worker.id] = self.restarts.get(worker.id, 0) + 1
+        return True
+
+    def _changed(self):
+        if self.on_change:
+            try:
+                self.on_change(self)
+            except Exception as e:
+                logger.debug(f"Cluster change callback failed: {e}")
+
+    def primary(self) -> Optional[Worker]:
+        """Lowest-numbered worker (stands in for 'the backend process' in status views)"""
+        with self.lock:
+            return self.workers[min(self.workers)] if self.workers else None
+
+    # --- Monitor ---------------------------------------------------------------
+
+    def _start_monitor(self):
+        if self.monitor is None or not self.monitor.is_alive():
+            self.monitor = threading.Thread(target=self._monitor_loop, name=f'{self.name}-cluster', daemon=True)
+            self.monitor.start()
+
+    def _monitor_loop(self):
+        while not self.stopping.wait(MONITOR_INTERVAL):
+            # Skip a round while a restart/scale holds the cluster
+            if not self.lock.acquire(blocking=False):
+                continue
+            try:
+                if not self.workers:
+                    continue
+                self._check_workers()
+                self._sample()
+                if os.getenv('CLUSTER_AUTOSCALE', Config.CLUSTER_AUTOSCALE) == 'on':
+                    self._autoscale()
+            except Exception as e:
+                logger.warning(f"⚠️  {self.name} cluster monitor error: {e}")
+            finally:
+                self.lock.release()
+
+    def _check_workers(self):
+        health_due = time.time() - self._last_health_check >= self._setting('CLUSTER_HEALTH_INTERVAL')
+        if health_due:
+            self._last_health_check = time.time()
+        for worker in list(self.workers.values()):
+            if self.stopping.is_set():
+                return
+            if not worker.alive:
+                logger.warning(f"⚠️  {self.name.capitalize()} worker {worker.id} exited (code {worker.process.returncode})")
+                if worker.upstream:
+                    worker.upstream.healthy = False
+                if not self._replace(worker, 'process exited'):
+                    self._retire(worker)
+                continue
+            if not health_due:
+                continue
+            if check_health(worker.port, self.health_path):
+                worker.health_failures = 0
+                continue
+            worker.health_failures += 1
+            if worker.health_failures >= UNHEALTHY_AFTER:
+                logger.warning(f"⚠️  {self.name.capitalize()} worker {worker.id} failed "
+                               f"{worker.health_failures} health checks")
+                if worker.upstream:
+                    worker.upstream.healthy = False
+                self._replace(worker, 'health check failed')
+
+    def _sample(self):
+        workers = list(self.workers.values())
+        for worker in workers:
+            worker.sample()
+        cpu = sum(w.cpu for w in workers) / len(workers)
+        queue = sum(w.upstream.in_flight for w in workers if w.upstream) / len(workers)
+        now = time.time()
+        self.samples.append((now, cpu, queue))
+        window = self._setting('CLUSTER_SCALE_WINDOW')
+        while self.samples and now - self.samples[0][0] > window:
+            self.samples.popleft()
+
+    def _autoscale(self):
+        """One worker up or down when the whole last window agrees"""
+        window = self._setting('CLUSTER_SCALE_WINDOW')
+        if not self.samples or self.samples[-1][0] - self.samples[0][0] < window - MONITOR_INTERVAL:
+            return
+        size = len(self.workers)
+        cpus = [cpu for _, cpu, _ in self.samples]
+        queues = [queue for _, _, queue in self.samples]
+        busy_cpu = min(cpus) >= self._setting('CLUSTER_SCALE_UP_CPU')
+        busy_queue = min(queues) >= self._setting('CLUSTER_QUEUE_DEPTH')
+        if (busy_cpu or busy_queue) and size < self.max_workers:
+            if psutil.cpu_percent(None) >= SYSTEM_CPU_CEILING:
+                return
+            reason = (f"CPU ≥ {self._setting('CLUSTER_SCALE_UP_CPU'):.0f}%" if busy_cpu
+                      else f"queue ≥ {self._setting('CLUSTER_QUEUE_DEPTH'):.0f}") + f" for {window:.0f}s"
+            self.scale_to(size + 1, reason)
+        elif (max(cpus) < self._setting('CLUSTER_SCALE_DOWN_CPU') and max(queues) < 1
+              and size > self.min_workers):
+            self.scale_to(size - 1, f"idle for {window:.0f}s")
+
+    # --- Stats -----------------------------------------------------------------
+
+    def status(self) -> Dict:
+        workers = sorted(self.workers.values(), key=lambda w: w.id)
+        latest = self.samples[-1] if self.samples else None
+        return {
+            'workers': [dict(w.to_dict(), restarts=self.restarts.get(w.id, 0)) for w in workers],
+            'size': len(workers),
+            'min': self.min_workers,
+            'max': self.max_workers,
+            'autoscale': os.getenv('CLUSTER_AUTOSCALE', Config.CLUSTER_AUTOSCALE) == 'on',
+            'cpu': round(latest[1], 1) if latest else None,
+            'queue_depth': round(latest[2], 2) if latest else None,
+            'last_scale': self.last_scale
+        }
@@ -31,6 +31,8 @@ class Config:
     # App directories
     FRONTEND_DIR = APPS_DIR / "frontend"
     BACKEND_DIR = APPS_DIR / "backend"
+    STAGING_DIR = APPS_DIR / "staging"    # Next release, prepared while the current one runs
+    PREVIOUS_DIR = APPS_DIR / "previous"  # Release replaced by the last staged update
     
     # Version tracking (use writable dir)
     VERSION_FILE = WRITABLE_DIR / "versions.json"
@@ -40,7 +42,118 @@ class Config:
     MARIADB_DB = "4paws_db"
     MARIADB_USER = "root"
     MARIADB_PASSWORD = "4paws_secure_password"
+    MARIADB_SHUTDOWN_TIMEOUT = 60  # Seconds a clean shutdown may take before mysqld is killed
     
     # App ports
     FRONTEND_PORT = 3100
     BACKEND_PORT = 3200
+    
+    # Log rotation (override with LOG_ROTATE_* / LOG_RETENTION_* in .env)
+    LOG_ROTATE_MAX_MB = 20       # Rotate a log once it reaches this size
+    LOG_ROTATE_MAX_HOURS = 24    # ...or once it is this old
+    LOG_RETENTION_MB = 500       # Total budget for rotated segments
+    LOG_RETENTION_DAYS = 14      # Delete segments older than this
+    
+    # Service output (override with SERVICE_OUTPUT_* in .env)
+    SERVICE_OUTPUT_MODE = "file"          # "pipe" = agent reads service output itself
+    SERVICE_OUTPUT_BUFFER_LINES = 2000    # In-memory tail per service (pipe mode)
+    
+    # Install/update scheduler: steps running at once per resource (override with INSTALL_*_SLOTS in .env)
+    INSTALL_NET_SLOTS = 3     # Downloads / pnpm fetches
+    INSTALL_DISK_SLOTS = 2    # Extraction, MariaDB init
+    INSTALL_CPU_SLOTS = 2     # pnpm install, prisma, migrations
+    
+    # Front proxy (override with SERVICE_PROXY / PROXY_* in .env): "on" = the
+    # agent owns FRONTEND_PORT/BACKEND_PORT and forwards to app instances on
+    # internal ports, so restarts switch over without refused connections.
+    # Off by default: the apps must listen on the PORT they are given
+    SERVICE_PROXY = "off"
+    PROXY_POOL_SIZE = 32          # Idle keep-alive connections kept per app instance
+    PROXY_HEALTH_TIMEOUT = 90     # Seconds a new instance has to pass its health check
+    PROXY_DRAIN_TIMEOUT = 30      # Seconds running requests get to finish on the old instance
+    BACKEND_HEALTH_PATH = "/"     # Any non-5xx answer counts as healthy
+    FRONTEND_HEALTH_PATH = "/"
+    
+    # Backend cluster (override with BACKEND_*_WORKERS / CLUSTER_* in .env, needs
+    # SERVICE_PROXY=on): worker counts are a number or "auto" (cores - 1, bounded
+    # by RAM); 1 = single backend process. Off by default: scheduled jobs and
+    # in-process state in the backend would run once per worker
+    BACKEND_WORKERS = 1
+    BACKEND_MIN_WORKERS = 1
+    BACKEND_MAX_WORKERS = "auto"
+    CLUSTER_AUTOSCALE = "off"
+    CLUSTER_SCALE_UP_CPU = 75     # Avg % of one core per worker, sustained for a window -> +1 worker
+    CLUSTER_SCALE_DOWN_CPU = 15   # Below this (and no queue) for a window -> -1 worker
+    CLUSTER_QUEUE_DEPTH = 4       # Avg requests in flight per worker, sustained -> +1 worker
+    CLUSTER_SCALE_WINDOW = 60     # Seconds
+    CLUSTER_HEALTH_INTERVAL = 10  # Seconds between worker health checks
+    
+    # Lazy start (override with LAZY_* in .env, needs SERVICE_PROXY=on): "on" =
+    # frontend/backend are stopped after LAZY_IDLE_MINUTES without requests and
+    # started again by the next request, which is held until they answer
+    LAZY_START = "off"
+    LAZY_IDLE_MINUTES = 30
+    LAZY_HOLD_TIMEOUT = 90        # Seconds a request may wait for a cold start
+    
+    # Tuning (override with TUNING in .env): "auto" = MariaDB (managed my.ini),
+    # Node.js heap and Prisma pool sized from RAM/cores/disk, versioned in
+    # tuning/ and regenerated when the hardware changes; "off" = defaults
+    TUNING = "auto"
+    
+    # Database backups (override with BACKUP_* in .env): per-table compressed
+    # dumps in BACKUP_DIR, taken before migrations and every BACKUP_INTERVAL_HOURS
+    BACKUP_DIR = WRITABLE_DIR / "backups"
+    BACKUP_BEFORE_MIGRATE = "on"  # "on" = migrations don't run if the backup fails
+    BACKUP_INTERVAL_HOURS = 24    # 0 = no scheduled backups
+    BACKUP_KEEP = 14              # Newest backups kept
+    BACKUP_PARALLEL = "auto"      # Tables dumped/restored at once ("auto" = cores, at most 4)
+    BACKUP_COMPRESS_LEVEL = 3     # gzip level (1 fastest - 9 smallest)
+    
+    # Binary log (override with BINLOG / BINLOG_* in .env): "on" = MariaDB keeps
+    # a binary log in its data directory; closed logs are archived next to the
+    # backups every BINLOG_ARCHIVE_MINUTES for point-in-time restores
+    BINLOG = "on"
+    BINLOG_ARCHIVE_MINUTES = 15
+    BINLOG_MAX_SIZE_MB = 64       # The server starts a new log at this size
+    
+    # Slow query log (override with SLOW_QUERY_* in .env): statements slower
+    # than SLOW_QUERY_SECONDS are logged by MariaDB and aggregated per
+    # fingerprint; takes effect on the next MariaDB start
+    SLOW_QUERY_LOG = "on"
+    SLOW_QUERY_SECONDS = 1.0
+    SLOW_QUERY_LOG_MAX_MB = 50    # The digested log is emptied at this size
+    
+    # Database metrics (override with DB_METRICS / DB_METRICS_* in .env): global
+    # status counters sampled over one client session into a day of history
+    DB_METRICS = "on"
+    DB_METRICS_INTERVAL = 10        # Seconds between samples
+    DB_METRICS_TABLES_MINUTES = 5   # Per-table data/index sizes refreshed this often
+    
+    # Database maintenance (override with MAINTENANCE / MAINTENANCE_* in .env):
+    # ANALYZE and selective OPTIMIZE TABLE in idle windows ("Sun 02:00-05:00",
+    # "daily 03:00"; comma-separated), skipped while the clinic is busy
+    MAINTENANCE = "on"
+    MAINTENANCE_WINDOWS = "Sun 02:00-05:00"
+    MAINTENANCE_WINDOW_MINUTES = 180     # Length of a window given without an end
+    MAINTENANCE_MAX_BACKEND_CPU = 25     # % of the machine used by the backend
+    MAINTENANCE_MAX_QPS = 20             # Database queries per second
+    MAINTENANCE_OPTIMIZE_FREE_PCT = 20   # OPTIMIZE tables with this much free space
+    
+    # Migration rehearsal (override with MIGRATION_REHEARSAL_* in .env): the
+    # copy of the database is restored from the newest backup up to this old
+    MIGRATION_REHEARSAL_BACKUP_HOURS = 24
+    
+    # Data directory snapshots (override with SNAPSHOT_* in .env): file copies
+    # of data/mariadb taken while MariaDB is stopped for an update, restored
+    # together with the previous release if the update fails
+    SNAPSHOT_DIR = WRITABLE_DIR / "snapshots"
+    SNAPSHOT_BEFORE_UPDATE = "on"  # "off" = no snapshot (while on, a failed snapshot stops the update)
+    SNAPSHOT_KEEP = 2              # Newest snapshots kept
+    
+    # Updates (override with UPDATE_MODE in .env): "staged" prepares the new
+    # release in STAGING_DIR while services run and stops them only for the
+    # swap and migrations; "in_place" stops services before extracting.
+    # in_place by default: pnpm's isolated layout links packages with
+    # junctions holding absolute paths on Windows, which point into
+    # STAGING_DIR after the staged tree is renamed into place
+    UPDATE_MODE = "in_place"
@@ -0,0 +1,444 @@
+"""
+MariaDB performance sampler for 4Paws Agent
+Samples SHOW GLOBAL STATUS and information_schema over one long-lived
+client connection and keeps a compact time series of the derived rates
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+import subprocess
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .config import Config
+from .install_journal import write_json_atomic
+from .mariadb import MariaDBClient, MariaDBError, SQL_CLIENTS
+
+logger = logging.getLogger(__name__)
+
+# Counters and gauges read each sample
+STATUS_VARIABLES = (
+    'Uptime', 'Questions', 'Com_insert', 'Com_update', 'Com_delete', 'Com_replace',
+    'Innodb_buffer_pool_read_requests', 'Innodb_buffer_pool_reads',
+    'Innodb_buffer_pool_pages_dirty', 'Innodb_buffer_pool_pages_total',
+    'Innodb_row_lock_waits', 'Innodb_row_lock_time', 'Innodb_row_lock_current_waits',
+    'Created_tmp_tables', 'Created_tmp_disk_tables', 'Slow_queries',
+    'Threads_connected', 'Threads_running'
+)
+
+# One point of the series (rates per second, ratios in %)
+SERIES_FIELDS = ('time', 'qps', 'writes', 'hit_ratio', 'dirty_pct', 'lock_waits', 'lock_wait_ms',
+                 'tmp_disk', 'tmp_disk_pct', 'slow', 'threads_connected', 'threads_running')
+
+RECENT_SECONDS = 3600          # Full-resolution points kept
+ROLLUP_SECONDS = 300           # Older points averaged into 5 minute buckets...
+ROLLUP_KEEP = 288              # ...for a day
+RESPONSE_TIMEOUT = 15
+SIGNAL_POINTS = 6              # Latest points the DB-bound signals average over
+
+# Marker rows separating the replies of a batch
+_MARKER = '__4paws_sample_end__'
+_TABLES_MARKER = '__4paws_tables__'
+
+
+def db_metrics_enabled() -> bool:
+    return os.getenv('DB_METRICS', Config.DB_METRICS).lower() != 'off'
+
+
+def db_metrics_interval() -> float:
+    return max(float(os.getenv('DB_METRICS_INTERVAL', Config.DB_METRICS_INTERVAL)), 2.0)
+
+
+def _ratio(part: float, whole: float) -> Optional[float]:
+    return round(100.0 * part / whole, 2) if whole > 0 else None
+
+
+class ClientSession:
+    """
+    A mysql client kept running with SQL written to its stdin
+
+    Saves starting a client (and a connection) every sample. Each batch
+    ends with a SELECT of a marker row so the reply can be told apart;
+    --force keeps the session alive past a failing statement, whose error
+    is read back in place of its rows.
+    """
+
+    def __init__(self, client: MariaDBClient):
+        self.client = client
+        self.process: Optional[subprocess.Popen] = None
+        self.lines: 'queue.Queue[Optional[str]]' = queue.Queue()
+
+    def _open(self):
+        args = self.client.command(SQL_CLIENTS, '-N', '-B', '--unbuffered', '--force',
+                                   '--default-character-set=utf8mb4')
+        try:
+            self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                            stderr=subprocess.STDOUT, text=True, encoding='utf-8',
+                                            errors='replace', bufsize=1,
+                                            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        except OSError as e:
+            raise MariaDBError(str(e))
+        self.lines = queue.Queue()
+        process, lines = self.process, self.lines
+
+        def read():
+            for line in process.stdout:
+                lines.put(line.rstrip('\r\n'))
+            lines.put(None)
+
+        threading.Thread(target=read, name='db-metrics-reader', daemon=True).start()
+
+    def run(self, statements: List[str], timeout: float = RESPONSE_TIMEOUT) -> List[List[str]]:
+        """
+        Run statements in the session; rows of all their results in order
+
+        Raises:
+            MariaDBError: if the client exits (server down) or doesn't answer
+                in time; the next call starts a new session
+        """
+        if self.process is None or self.process.poll() is not None:
+            self._open()
+        batch = ''.join(f"{statement};\n" for statement in statements) + f"SELECT '{_MARKER}';\n"
+        try:
+            self.process.stdin.write(batch)
+            self.process.stdin.flush()
+        except OSError as e:
+            self.close()
+            raise MariaDBError(f"Client session closed: {e}")
+        rows, errors = [], []
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                line = self.lines.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                self.close()
+                raise MariaDBError(f"No answer within {timeout:.0f}s")
+            if line is None:
+                self.close()
+                raise MariaDBError(errors[-1] if errors else 'Client session ended')
+            if line == _MARKER:
+                break
+            if line.startswith('ERROR '):
+                errors.append(line)
+                continue
+            rows.append(line.split('\t'))
+        if errors:
+            logger.debug(f"Sample statement failed: {errors[0]}")
+        return rows
+
+    def close(self):
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+class DatabaseMetrics:
+    """
+    MariaDB internals as a time series
+
+    Every DB_METRICS_INTERVAL seconds the global status counters are read
+    over one client session (ClientSession) and turned into rates against
+    the previous sample: statements and writes per second, buffer pool hit
+    ratio, row lock waits and their average wait, temporary tables that
+    went to disk, slow queries, plus the dirty page share and connected /
+    running threads. Counters reset by a server restart (Uptime going
+    back) only restart the rates.
+
+    The last hour is kept at full resolution and older points as 5 minute
+    averages for a day, saved to disk so the day survives agent restarts.
+    Per-table data and index sizes come from information_schema every
+    DB_METRICS_TABLES_MINUTES.
+    """
+
+    def __init__(self, state_path: Path, database: Optional[str] = None,
+                 client: Optional[MariaDBClient] = None):
+        self.state_path = Path(state_path)
+        self.database = database or Config.MARIADB_DB
+        self.session = ClientSession(client or MariaDBClient())
+        self.lock = threading.Lock()
+        self.recent: Deque[Tuple] = deque()
+        self.history: Deque[Tuple] = deque(maxlen=ROLLUP_KEEP)
+        self._bucket: List[Tuple] = []
+        self._previous: Optional[Tuple[float, Dict[str, float]]] = None
+        self._statements = 0
+        self.tables: List[Dict] = []
+        self.tables_updated: Optional[float] = None
+        self.connected = False
+        self.last_error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.load()
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+
+    def load(self):
+        try:
+            state = json.loads(self.state_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return
+        if state.get('fields') == list(SERIES_FIELDS):
+            self.history.extend(tuple(point) for point in state.get('history', []))
+        self.tables = state.get('tables', [])
+        self.tables_updated = state.get('tables_updated')
+
+    def save(self):
+        with self.lock:
+            state = {
+                'fields': list(SERIES_FIELDS),
+                'history': [list(point) for point in self.history],
+                'tables': self.tables,
+                'tables_updated': self.tables_updated
+            }
+        write_json_atomic(self.state_path, state)
+
+    # ------------------------------------------------------------------
+    # Sampling
+    # ------------------------------------------------------------------
+
+    def _derive(self, now: float, status: Dict[str, float]) -> Optional[Tuple]:
+        """A series point from this sample and the previous one (None on the first)"""
+        previous, self._previous = self._previous, (now, status)
+        if previous is None or status.get('Uptime', 0) < previous[1].get('Uptime', 0):
+            return None  # First sample or the server restarted
+        then, before = previous
+        elapsed = now - then
+        if elapsed <= 0:
+            return None
+
+        def delta(name: str) -> float:
+            return max(status.get(name, 0) - before.get(name, 0), 0)
+
+        def rate(value: float) -> float:
+            return round(value / elapsed, 3)
+
+        # The previous sample's statements are counted in this interval
+        questions = max(delta('Questions') - self._statements, 0)
+        writes = sum(delta(name) for name in ('Com_insert', 'Com_update', 'Com_delete', 'Com_replace'))
+        requests = delta('Innodb_buffer_pool_read_requests')
+        misses = delta('Innodb_buffer_pool_reads')
+        lock_waits = delta('Innodb_row_lock_waits')
+        tmp_tables = delta('Created_tmp_tables')
+        tmp_disk = delta('Created_tmp_disk_tables')
+        values = {
+            'time': round(now, 3),
+            'qps': rate(questions),
+            'writes': rate(writes),
+            'hit_ratio': round(100.0 - _ratio(misses, requests), 3) if requests else None,
+            'dirty_pct': _ratio(status.get('Innodb_buffer_pool_pages_dirty', 0),
+                                status.get('Innodb_buffer_pool_pages_total', 0)),
+            'lock_waits': rate(lock_waits),
+            'lock_wait_ms': round(delta('Innodb_row_lock_time') / lock_waits, 1) if lock_waits else 0.0,
+            'tmp_disk': rate(tmp_disk),
+            'tmp_disk_pct': _ratio(tmp_disk, tmp_tables) if tmp_tables else 0.0,
+            'slow': rate(delta('Slow_queries')),
+            'threads_connected': int(status.get('Threads_connected', 0)),
+            # Without this session's own statement
+            'threads_running': max(int(status.get('Threads_running', 0)) - 1, 0)
+        }
+        return tuple(values[field] for field in SERIES_FIELDS)
+
+    def _tables_due(self, now: float) -> bool:
+        minutes = float(os.getenv('DB_METRICS_TABLES_MINUTES', Config.DB_METRICS_TABLES_MINUTES))
+        return self.tables_updated is None or now - self.tables_updated >= minutes * 60
+
+    def sample(self) -> Optional[Dict]:
+        """
+        Read the server's counters once and append the derived point
+
+        Returns:
+            dict: the new point (None on the first sample after a (re)connect)
+
+        Raises:
+            MariaDBError: if the server can't be reached
+        """
+        now = time.time()
+        names = ', '.join(f"'{name}'" for name in STATUS_VARIABLES)
+        statements = [f"SHOW GLOBAL STATUS WHERE Variable_name IN ({names})"]
+        with_tables = self._tables_due(now)
+        if with_tables:
+            db = self.database.replace("'", "''")
+            statements += [
+                f"SELECT '{_TABLES_MARKER}'",
+                "SELECT TABLE_NAME, IFNULL(DATA_LENGTH, 0), IFNULL(INDEX_LENGTH, 0), IFNULL(TABLE_ROWS, 0), "
+                f"IFNULL(DATA_FREE, 0) FROM information_schema.TABLES WHERE TABLE_SCHEMA = '{db}' "
+                "AND TABLE_TYPE = 'BASE TABLE' ORDER BY DATA_LENGTH + INDEX_LENGTH DESC"
+            ]
+        try:
+            rows = self.session.run(statements)
+        except MariaDBError:
+            self._previous = None
+            raise
+
+        status: Dict[str, float] = {}
+        tables = None
+        for row in rows:
+            if row == [_TABLES_MARKER]:
+                tables = []
+            elif tables is not None and len(row) == 5:
+                tables.append({'table': row[0], 'data_bytes': int(row[1]), 'index_bytes': int(row[2]),
+                               'rows': int(row[3]), 'free_bytes': int(row[4])})
+            elif len(row) == 2:
+                try:
+                    status[row[0]] = float(row[1])
+                except ValueError:
+                    pass
+        point = self._derive(now, status)
+        # The marker SELECTs and this batch land in the next interval's Questions
+        self._statements = len(statements) + 1
+
+        with self.lock:
+            if tables is not None:
+                self.tables = tables
+                self.tables_updated = now
+            if point is None:
+                return None
+            self.recent.append(point)
+            while self.recent and self.recent[0][0] < now - RECENT_SECONDS:
+                self.recent.popleft()
+            rolled = self._roll_up(point)
+        if rolled or tables is not None:
+            self.save()
+        return dict(zip(SERIES_FIELDS, point))
+
+    def _roll_up(self, point: Tuple) -> bool:
+        """Add a point to the open 5 minute bucket; True when a bucket was closed"""
+        if self._bucket and int(point[0] // ROLLUP_SECONDS) != int(self._bucket[0][0] // ROLLUP_SECONDS):
+            averaged = [int(self._bucket[0][0] // ROLLUP_SECONDS) * ROLLUP_SECONDS]
+            for index in range(1, len(SERIES_FIELDS)):
+                values = [p[index] for p in self._bucket if p[index] is not None]
+                averaged.append(round(sum(values) / len(values), 3) if values else None)
+            self.history.append(tuple(averaged))
+            self._bucket = [point]
+            return True
+        self._bucket.append(point)
+        return False
+
+    def start(self, active: Optional[Callable[[], bool]] = None):
+        """
+        Sample in the background (idempotent)
+
+        Args:
+            active: returns False while MariaDB isn't running (no sample is
+                attempted and the session is closed)
+        """
+        if self._thread or not db_metrics_enabled():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(db_metrics_interval()):
+                if active is not None and not active():
+                    if self.connected:
+                        self.session.close()
+                        self.connected, self._previous = False, None
+                    continue
+                try:
+                    self.sample()
+                    if not self.connected:
+                        logger.info("📈 Database metrics sampling connected")
+                    self.connected, self.last_error = True, None
+                except MariaDBError as e:
+                    if self.connected:
+                        logger.warning(f"⚠️  Database metrics sampling stopped: {e}")
+                    self.connected, self.last_error = False, str(e)
+                except Exception as e:
+                    logger.warning(f"⚠️  Database metrics sample failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name='db-metrics', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+        self.session.close()
+        self.save()
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def signals(self) -> List[Dict]:
+        """
+        Signs that the database is the bottleneck, from the latest points
+
+        Returns:
+            list: [{'metric', 'value', 'threshold', 'message'}]
+        """
+        with self.lock:
+            points = list(self.recent)[-SIGNAL_POINTS:]
+        if not points:
+            return []
+
+        def average(field: str) -> Optional[float]:
+            index = SERIES_FIELDS.index(field)
+            values = [p[index] for p in points if p[index] is not None]
+            return sum(values) / len(values) if values else None
+
+        checks = (
+            ('hit_ratio', lambda v: v < 95, 95, "Buffer pool hit ratio {:.1f}%: reads go to disk (buffer pool too small?)"),
+            ('threads_running', lambda v: v > (os.cpu_count() or 1), os.cpu_count() or 1,
+             "{:.1f} statements running at once, more than CPU cores"),
+            ('lock_waits', lambda v: v >= 1, 1, "{:.1f} row lock waits/s: transactions block each other"),
+            ('tmp_disk_pct', lambda v: v >= 25, 25, "{:.0f}% of temporary tables go to disk"),
+            ('dirty_pct', lambda v: v >= 75, 75, "{:.0f}% dirty pages: writes outpace flushing"),
+            ('slow', lambda v: v >= 0.1, 0.1, "{:.2f} slow queries/s"),
+        )
+        signals = []
+        for metric, exceeded, threshold, message in checks:
+            value = average(metric)
+            if value is not None and exceeded(value):
+                signals.append({'metric': metric, 'value': round(value, 3), 'threshold': threshold,
+                                'message': message.format(value)})
+        return signals
+
+    def summary(self) -> Dict:
+        """Latest point and DB-bound signals only"""
+        with self.lock:
+            latest = dict(zip(SERIES_FIELDS, self.recent[-1])) if self.recent else None
+        return {'connected': self.connected, 'latest': latest, 'signals': self.signals()}
+
+    def status(self) -> Dict:
+        """Latest point, series (as field lists) and table sizes"""
+        with self.lock:
+            recent = [list(point) for point in self.recent]
+            history = [list(point) for point in self.history]
+            tables = list(self.tables)
+        return {
+            'enabled': db_metrics_enabled(),
+            'connected': self.connected,
+            'interval': db_metrics_interval(),
+            'last_error': self.last_error,
+            'fields': list(SERIES_FIELDS),
+            'latest': dict(zip(SERIES_FIELDS, recent[-1])) if recent else None,
+            'recent': recent,
+            'history': history,
+            'signals': self.signals(),
+            'tables': tables,
+            'tables_updated': self.tables_updated
+        }
+
+
+_metrics: Optional[DatabaseMetrics] = None
+
+
+def get_db_metrics() -> DatabaseMetrics:
+    """Get the global DatabaseMetrics (day history in the writable dir)"""
+    global _metrics
+    if _metrics is None:
+        _metrics = DatabaseMetrics(Config.WRITABLE_DIR / 'db_metrics.json')
+    return _metrics
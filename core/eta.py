@@ -0,0 +1,201 @@
+"""
+ETA estimation for 4Paws Agent installs and updates
+Expected step durations and throughput come from the span history of
+earlier runs; live throughput of running steps refines them
+"""
+
+import time
+import logging
+from typing import Dict, List, Optional
+
+from .task_graph import TaskGraph, Task, DONE, SKIPPED, FAILED, RUNNING
+from .tracing import Tracer, get_tracer
+
+logger = logging.getLogger(__name__)
+
+# Most recent successful runs of a step used for its estimate
+HISTORY_RUNS = 5
+
+# Seconds per unit of static task weight when a step has no history
+DEFAULT_SECONDS_PER_WEIGHT = 10.0
+
+# A step running past its expected duration is assumed to need this
+# share of the expectation again (rather than claiming 0 s left)
+OVERRUN_SHARE = 0.1
+
+
+def _median(values: List[float]) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+class RunHistory:
+    """
+    Per-step duration and throughput of earlier runs of one task graph
+
+    Built from the tracer's persisted spans: every task runs in a span
+    tagged with its graph name, and steps that processed measurable units
+    (download bytes, installed packages) carry units/unit attributes.
+    """
+
+    def __init__(self, graph_name: str, tracer: Optional[Tracer] = None, runs: int = HISTORY_RUNS):
+        self.graph_name = graph_name
+        self.durations: Dict[str, List[float]] = {}
+        self.units: Dict[str, List[float]] = {}
+        self.rates: Dict[str, List[float]] = {}
+        self.unit_names: Dict[str, str] = {}
+        try:
+            self._load(tracer or get_tracer(), runs)
+        except Exception as e:
+            logger.debug(f"Could not read step history: {e}")
+
+    def _load(self, tracer: Tracer, runs: int):
+        for span in tracer.iter_history():
+            attributes = span.get('attributes') or {}
+            if attributes.get('graph') != self.graph_name or span.get('status') != 'ok':
+                continue
+            name = span['name']
+            duration = span.get('duration') or 0.0
+            self.durations.setdefault(name, []).append(duration)
+            units = attributes.get('units')
+            if units:
+                self.units.setdefault(name, []).append(units)
+                if duration > 0:
+                    self.rates.setdefault(name, []).append(units / duration)
+                self.unit_names[name] = attributes.get('unit')
+        for series in (self.durations, self.units, self.rates):
+            for name in series:
+                series[name] = series[name][-runs:]
+
+    def expected_duration(self, name: str) -> Optional[float]:
+        return _median(self.durations.get(name, []))
+
+    def expected_units(self, name: str) -> Optional[float]:
+        return _median(self.units.get(name, []))
+
+    def throughput(self, name: str) -> Optional[float]:
+        """Typical units per second of a step (e.g. bytes/s, packages/s)"""
+        return _median(self.rates.get(name, []))
+
+    def to_dict(self) -> Dict:
+        return {
+            name: {
+                'runs': len(durations),
+                'duration': round(self.expected_duration(name), 2),
+                'units': self.expected_units(name),
+                'unit': self.unit_names.get(name),
+                'throughput': round(self.throughput(name), 2) if self.throughput(name) else None
+            }
+            for name, durations in self.durations.items()
+        }
+
+
+class EtaEstimator:
+    """
+    Remaining time and time-weighted progress of a running task graph
+
+    Each step's expected duration is the median of its last runs (steps
+    never seen before fall back to their static weight, scaled by how the
+    known steps' weights relate to their durations). A running step's
+    remaining time comes from its live throughput when it reports units
+    (bytes downloaded, packages added), measured against the expected
+    amount; otherwise from its reported fraction or the expectation.
+    The ETA is the critical path through the remaining steps.
+    """
+
+    def __init__(self, graph: TaskGraph, history: Optional[RunHistory] = None):
+        self.graph = graph
+        self.history = history or RunHistory(graph.name)
+        self.expected: Dict[str, float] = {}
+
+        known = [
+            (self.history.expected_duration(name), task.weight)
+            for name, task in graph.tasks.items()
+            if self.history.expected_duration(name) and task.weight
+        ]
+        seconds_per_weight = (
+            sum(duration for duration, _ in known) / sum(weight for _, weight in known)
+            if known else DEFAULT_SECONDS_PER_WEIGHT
+        )
+        for name, task in graph.tasks.items():
+            self.expected[name] = self.history.expected_duration(name) or task.weight * seconds_per_weight
+
+    def apply_weights(self):
+        """Weight the graph's own progress by expected seconds instead of static weights"""
+        for name, task in self.graph.tasks.items():
+            task.weight = max(self.expected[name], 0.1)
+
+    def remaining(self, task: Task) -> float:
+        """Estimated seconds left for one step"""
+        if task.state in (DONE, SKIPPED, FAILED):
+            return 0.0
+        expected = self.expected[task.name]
+        if task.state != RUNNING:
+            return expected
+
+        elapsed = task.elapsed
+        if task.done:
+            total = task.total or self.history.expected_units(task.name)
+            rate = task.done / elapsed if elapsed > 0 else None
+            if total and rate:
+                return max(total - task.done, 0.0) / rate
+        if task.fraction > 0:
+            return elapsed * (1 - task.fraction) / task.fraction
+        return max(expected - elapsed, expected * OVERRUN_SHARE)
+
+    def eta(self) -> float:
+        """Seconds until the whole graph is done (longest remaining dependency path)"""
+        finish: Dict[str, float] = {}
+
+        def finish_time(name: str) -> float:
+            if name not in finish:
+                task = self.graph.tasks[name]
+                finish[name] = self.remaining(task) + max(
+                    (finish_time(dep) for dep in task.deps), default=0.0
+                )
+            return finish[name]
+
+        return max((finish_time(name) for name in self.graph.tasks), default=0.0)
+
+    def progress(self) -> float:
+        """Percent of the expected total work done (time-weighted; skipped steps weren't done)"""
+        total = done = 0.0
+        for name, task in self.graph.tasks.items():
+            expected = self.expected[name]
+            total += expected
+            if task.state == DONE:
+                done += expected
+            elif task.state == RUNNING:
+                remaining = self.remaining(task)
+                spent = task.elapsed
+                if spent + remaining > 0:
+                    done += expected * spent / (spent + remaining)
+        return min(100.0, done / total * 100) if total else 0.0
+
+    def snapshot(self) -> Dict:
+        """Progress, ETA and per-step state for progress events / the API"""
+        steps = []
+        for task in self.graph.tasks.values():
+            entry = {
+                'name': task.name,
+                'title': task.title,
+                'state': task.state,
+                'expected': round(self.expected[task.name], 1),
+                'remaining': round(self.remaining(task), 1),
+                'elapsed': round(task.elapsed, 1)
+            }
+            if task.done and task.elapsed > 0:
+                entry['throughput'] = round(task.done / task.elapsed, 2)
+                entry['unit'] = task.unit
+            steps.append(entry)
+        return {
+            'progress': round(self.progress(), 1),
+            'eta_seconds': round(self.eta()),
+            'estimated_finish': time.time() + self.eta(),
+            'steps': steps
+        }
@@ -0,0 +1,602 @@
+"""
+Index advisor for 4Paws Agent
+Runs EXPLAIN on the samples of the slowest statement fingerprints, finds
+full scans and filesorts on large tables and proposes composite indexes,
+named and written the way the backend's Prisma schema would declare them.
+Suggestions are only ever exported for review, never applied
+"""
+
+import re
+import json
+import math
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .config import Config
+from .install_journal import write_json_atomic
+from .mariadb import MariaDBClient, MariaDBError
+from .slow_log import SlowQueryLog, get_slow_query_log
+from .tracing import trace_span
+
+logger = logging.getLogger(__name__)
+
+# Fingerprints analysed per run (worst total time first)
+ANALYZE_FINGERPRINTS = 20
+# Plans only count as a problem on tables at least this big
+LARGE_TABLE_ROWS = 1000
+# Rows read to estimate how selective a column combination is
+SELECTIVITY_SAMPLE_ROWS = 100000
+# Longest composite index proposed, and MariaDB's identifier limit
+MAX_INDEX_COLUMNS = 4
+MAX_IDENTIFIER = 64
+EXPLAIN_TIMEOUT = 30
+
+STATUS_PROPOSED = 'proposed'
+STATUS_ACCEPTED = 'accepted'
+STATUS_DISMISSED = 'dismissed'
+
+# Only statements EXPLAIN doesn't execute
+EXPLAINABLE = re.compile(r'^\s*(select|update|delete)\b', re.IGNORECASE)
+EXPLAIN_COLUMNS = ('id', 'select_type', 'table', 'type', 'possible_keys', 'key', 'key_len', 'ref', 'rows', 'Extra')
+# Columns that can't be indexed whole
+UNINDEXABLE_TYPES = {'tinytext', 'text', 'mediumtext', 'longtext', 'tinyblob', 'blob', 'mediumblob',
+                     'longblob', 'json', 'geometry'}
+
+# SQL pieces (statements are reduced before matching, see _where_predicates)
+_IDENT = r'(?:`[^`]+`|[A-Za-z_][\w$]*)'
+_COLUMN = rf'({_IDENT}(?:\.{_IDENT}){{0,2}})'
+_TABLE_REF = re.compile(rf'\b(?:from|join)\s+({_IDENT}(?:\.{_IDENT})?)(?:\s+(?:as\s+)?({_IDENT}))?', re.I)
+_CLAUSE_END = r'(?=\b(?:group\s+by|order\s+by|having|limit|for\s+update|lock\s+in|union)\b|$)'
+_WHERE = re.compile(rf'\bwhere\b(.*?){_CLAUSE_END}', re.I | re.S)
+_ON = re.compile(rf'\bon\b(.*?)(?=\b(?:where|inner|left|right|cross|join|group\s+by|order\s+by|limit)\b|$)', re.I | re.S)
+_ORDER_BY = re.compile(r'\border\s+by\b(.*?)(?=\b(?:limit|for\s+update|lock\s+in)\b|$)', re.I | re.S)
+_LIMIT = re.compile(r'\blimit\s+(\d+)(?:\s*,\s*(\d+)|\s+offset\s+(\d+))?', re.I)
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_IN_LIST = re.compile(r'\bin\s*\([^()]*\)', re.I)
+_BETWEEN = re.compile(r'\bbetween\s+\S+\s+and\s+\S+', re.I)
+_SQL_KEYWORDS = {'where', 'inner', 'left', 'right', 'cross', 'join', 'on', 'group', 'order', 'limit',
+                 'using', 'natural', 'straight_join', 'set', 'force', 'use', 'ignore'}
+
+# Prisma schema
+_MODEL = re.compile(r'^model\s+(\w+)\s*\{(.*?)^\}', re.M | re.S)
+_FIELD = re.compile(r'^\s*(\w+)\s+(\w+)(\[\])?\??(?:\([^)]*\))?(.*)$')
+_MAP = re.compile(r'@map\(\s*(?:name:\s*)?"([^"]+)"')
+_BLOCK_MAP = re.compile(r'@@map\(\s*(?:name:\s*)?"([^"]+)"')
+_BLOCK_INDEX = re.compile(r'@@(index|unique|id)\(\s*(?:fields:\s*)?\[([^\]]*)\]')
+
+
+def _unquote(name: str) -> str:
+    return name.strip().strip('`')
+
+
+def _split_column(reference: str) -> Tuple[Optional[str], str]:
+    """`db`.`table`.`col` -> ('table', 'col'); col -> (None, 'col')"""
+    parts = [_unquote(part) for part in re.findall(_IDENT, reference)]
+    return (parts[-2] if len(parts) > 1 else None), parts[-1]
+
+
+def parse_prisma_schema(paths: List[Path]) -> Dict[str, Dict]:
+    """
+    Tables of a Prisma schema, keyed by lower-case table name
+
+    Returns:
+        dict: table -> {'model', 'table', 'fields': {column (lower): field name},
+                        'indexes': [[column, ...], ...] (@@index/@@unique/@@id, @id, @unique)}
+    """
+    text = '\n'.join(path.read_text(encoding='utf-8', errors='replace') for path in paths)
+    models = {match.group(1): match.group(2) for match in _MODEL.finditer(text)}
+    tables = {}
+    for model, body in models.items():
+        fields, field_columns, indexes = {}, {}, []
+        block_map = None
+        for line in body.splitlines():
+            line = line.split('//')[0].strip()
+            if not line:
+                continue
+            if line.startswith('@@'):
+                mapped = _BLOCK_MAP.search(line)
+                if mapped:
+                    block_map = mapped.group(1)
+                index = _BLOCK_INDEX.search(line)
+                if index:
+                    names = [name.split('(')[0].strip() for name in index.group(2).split(',') if name.strip()]
+                    indexes.append(names)
+                continue
+            match = _FIELD.match(line)
+            if not match:
+                continue
+            name, field_type, is_list, attributes = match.groups()
+            if is_list or field_type in models or '@relation' in attributes:
+                continue  # Relation fields have no column of their own
+            mapped = _MAP.search(attributes)
+            column = mapped.group(1) if mapped else name
+            fields[column.lower()] = name
+            field_columns[name] = column
+            if re.search(r'@(id|unique)\b', attributes):
+                indexes.append([name])
+        table = block_map or model
+        tables[table.lower()] = {
+            'model': model,
+            'table': table,
+            'fields': fields,
+            'indexes': [[field_columns.get(name, name) for name in names] for names in indexes]
+        }
+    return tables
+
+
+def index_name(table: str, columns: List[str]) -> str:
+    """Prisma's default index name ({Table}_{col}_{col}_idx), shortened past 64 characters"""
+    name = f"{table}_{'_'.join(columns)}_idx"
+    if len(name) <= MAX_IDENTIFIER:
+        return name
+    digest = hashlib.sha1(name.encode()).hexdigest()[:8]
+    return f"{name[:MAX_IDENTIFIER - 13]}_{digest}_idx"
+
+
+class IndexAdvisor:
+    """
+    Index suggestions from the slow query digest
+
+    For each of the worst fingerprints (by total time) with an explainable
+    sample, EXPLAIN shows which tables are read in full ('ALL'), through a
+    whole index ('index') or need a filesort. For each such table with at
+    least LARGE_TABLE_ROWS rows, the statement's own predicates give the
+    candidate: equality columns first (=, IN, IS NULL, join conditions),
+    then the ORDER BY columns if one index can deliver that order, else
+    the first range column. Candidates already served by an existing
+    index prefix are dropped; one that extends an existing index replaces
+    it.
+
+    The estimated rows examined afterwards come from a bounded sample of
+    the table (rows per distinct value of the equality columns), capped
+    by LIMIT when the index also delivers the order. Suggestions keep
+    their review status (accepted / dismissed) across runs and are only
+    exported, as a Prisma migration plus the matching schema changes.
+    """
+
+    def __init__(self, slow_log: SlowQueryLog, state_path: Path, schema_dir: Path,
+                 client: Optional[MariaDBClient] = None, database: Optional[str] = None):
+        self.slow_log = slow_log
+        self.state_path = Path(state_path)
+        self.schema_dir = Path(schema_dir)
+        self.client = client or MariaDBClient()
+        self.database = database or Config.MARIADB_DB
+        self._lock = threading.Lock()
+        self.running = False
+        self.last_error: Optional[str] = None
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+
+    def load(self) -> Dict:
+        try:
+            return json.loads(self.state_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {'analyzed_at': None, 'results': [], 'reviews': {}}
+
+    def suggestions(self) -> List[Dict]:
+        """Suggestions of the last analysis with their review status, biggest saving first"""
+        state = self.load()
+        reviews = state.get('reviews', {})
+        merged: Dict[str, Dict] = {}
+        for result in state.get('results', []):
+            for suggestion in result.get('suggestions', []):
+                entry = merged.get(suggestion['id'])
+                if entry is None:
+                    entry = merged[suggestion['id']] = {**suggestion, 'queries': [],
+                                                        'time_saved_estimate': 0.0}
+                entry['queries'].append({key: result[key] for key in
+                                         ('fingerprint_id', 'fingerprint', 'count', 'total')})
+                entry['time_saved_estimate'] += result['total'] * (suggestion.get('reduction') or 0)
+        for entry in merged.values():
+            entry['status'] = reviews.get(entry['id'], {}).get('status', STATUS_PROPOSED)
+            entry['time_saved_estimate'] = round(entry['time_saved_estimate'], 3)
+        return sorted(merged.values(), key=lambda s: s['time_saved_estimate'], reverse=True)
+
+    def review(self, suggestion_id: str, status: str) -> bool:
+        """Mark a suggestion accepted, dismissed or proposed again"""
+        if status not in (STATUS_PROPOSED, STATUS_ACCEPTED, STATUS_DISMISSED):
+            raise ValueError(f"Unknown status: {status}")
+        with self._lock:
+            state = self.load()
+            if not any(s['id'] == suggestion_id for r in state['results'] for s in r.get('suggestions', [])):
+                return False
+            state.setdefault('reviews', {})[suggestion_id] = {'status': status, 'time': time.time()}
+            write_json_atomic(self.state_path, state)
+        return True
+
+    # ------------------------------------------------------------------
+    # Schema
+    # ------------------------------------------------------------------
+
+    def prisma_tables(self) -> Dict[str, Dict]:
+        paths = sorted(self.schema_dir.glob('**/*.prisma')) if self.schema_dir.exists() else []
+        return parse_prisma_schema(paths) if paths else {}
+
+    def _table_info(self, table: str, cache: Dict) -> Optional[Dict]:
+        """Rows estimate, column types, indexes and unique index names of a table (None if it isn't in the database)"""
+        if table in cache:
+            return cache[table]
+        db = self.database.replace("'", "''")
+        name = table.replace("'", "''")
+        rows = self.client.query(
+            f"SELECT IFNULL(TABLE_ROWS, 0) FROM information_schema.TABLES "
+            f"WHERE TABLE_SCHEMA = '{db}' AND TABLE_NAME = '{name}'")
+        if not rows:
+            cache[table] = None
+            return None
+        columns = {row[0].lower(): (row[0], row[1].lower()) for row in self.client.query(
+            f"SELECT COLUMN_NAME, DATA_TYPE FROM information_schema.COLUMNS "
+            f"WHERE TABLE_SCHEMA = '{db}' AND TABLE_NAME = '{name}'")}
+        indexes: Dict[str, List[str]] = {}
+        unique = set()
+        for index, _, column, non_unique in self.client.query(
+                f"SELECT INDEX_NAME, SEQ_IN_INDEX, COLUMN_NAME, NON_UNIQUE FROM information_schema.STATISTICS "
+                f"WHERE TABLE_SCHEMA = '{db}' AND TABLE_NAME = '{name}' ORDER BY INDEX_NAME, SEQ_IN_INDEX"):
+            indexes.setdefault(index, []).append(column)
+            if non_unique == '0':
+                unique.add(index)
+        cache[table] = {'rows': int(rows[0][0]), 'columns': columns, 'indexes': indexes, 'unique': unique}
+        return cache[table]
+
+    # ------------------------------------------------------------------
+    # Statement analysis
+    # ------------------------------------------------------------------
+
+    def explain(self, sql: str) -> List[Dict]:
+        """EXPLAIN rows of a statement"""
+        rows = self.client.query(f"EXPLAIN {sql}", database=self.database, timeout=EXPLAIN_TIMEOUT)
+        return [dict(zip(EXPLAIN_COLUMNS, row)) for row in rows if len(row) >= len(EXPLAIN_COLUMNS)]
+
+    @staticmethod
+    def _aliases(sql: str) -> Dict[str, str]:
+        """Alias or table name (lower) -> table name, from FROM / JOIN clauses"""
+        aliases = {}
+        for reference, alias in _TABLE_REF.findall(sql):
+            table = _unquote(re.findall(_IDENT, reference)[-1])
+            aliases[table.lower()] = table
+            if alias and _unquote(alias).lower() not in _SQL_KEYWORDS:
+                aliases[_unquote(alias).lower()] = table
+        return aliases
+
+    @staticmethod
+    def _where_predicates(sql: str) -> Tuple[List[Tuple[str, str, str]], bool]:
+        """
+        Conjuncts of the WHERE and ON clauses as (column reference, kind, other side)
+
+        kind is 'eq' (=, <=>, IN, IS NULL) or 'range' (<, >, BETWEEN,
+        LIKE with a fixed prefix). The second value is True if the WHERE
+        clause has an OR (its predicates can't all share one index).
+        """
+        # Literals out of the way: prefix LIKE patterns stay recognisable
+        reduced = _STRING.sub(lambda m: "'%'" if m.group(0)[1:2] in ('%', '_') else "'s'", sql)
+        reduced = _IN_LIST.sub('IN (L)', reduced)
+        reduced = _BETWEEN.sub('BETWEEN R', reduced)
+        clauses = [m.group(1) for m in _WHERE.finditer(reduced)] + [m.group(1) for m in _ON.finditer(reduced)]
+        has_or = any(re.search(r'\bor\b', m.group(1), re.I) for m in _WHERE.finditer(reduced))
+
+        predicates = []
+        for clause in clauses:
+            clause = clause.replace('IN (L)', 'IN L').replace('(', ' ').replace(')', ' ')
+            for conjunct in re.split(r'\band\b', clause, flags=re.I):
+                conjunct = conjunct.strip()
+                match = re.match(rf'^{_COLUMN}\s*(<=>|=)\s*(.+)$', conjunct)
+                if match:
+                    predicates.append((match.group(1), 'eq', match.group(3)))
+                    # Join conditions make the other side an equality too
+                    if re.fullmatch(_COLUMN, match.group(3).strip()):
+                        predicates.append((match.group(3).strip(), 'eq', match.group(1)))
+                    continue
+                match = re.match(rf'^{_COLUMN}\s+(?:in\s+L|is\s+null)$', conjunct, re.I)
+                if match:
+                    predicates.append((match.group(1), 'eq', ''))
+                    continue
+                match = re.match(rf"^{_COLUMN}\s*(?:<=|>=|<|>|between\s+R|like\s+'s')", conjunct, re.I)
+                if match:
+                    predicates.append((match.group(1), 'range', ''))
+        return predicates, has_or
+
+    @staticmethod
+    def _order_by(sql: str) -> List[Tuple[str, str]]:
+        match = _ORDER_BY.search(_STRING.sub("'s'", sql))
+        if not match:
+            return []
+        order = []
+        for item in match.group(1).split(','):
+            parts = re.match(rf'^\s*{_COLUMN}\s*(asc|desc)?\s*$', item, re.I)
+            if not parts:
+                return []  # Expressions: no index delivers that order
+            order.append((parts.group(1), (parts.group(2) or 'asc').lower()))
+        return order
+
+    @staticmethod
+    def _limit(sql: str) -> Optional[int]:
+        match = _LIMIT.search(_STRING.sub("'s'", sql))
+        if not match:
+            return None
+        if match.group(2):  # LIMIT offset, count
+            return int(match.group(1)) + int(match.group(2))
+        return int(match.group(1)) + int(match.group(3) or 0)
+
+    def _candidate(self, sql: str, table: str, aliases: Dict[str, str], info: Dict) -> Optional[Dict]:
+        """Columns of the index proposed for one table of a statement"""
+        names = {alias for alias, name in aliases.items() if name.lower() == table.lower()}
+        single_table = len(set(name.lower() for name in aliases.values())) <= 1
+
+        def own_column(reference: str) -> Optional[str]:
+            qualifier, column = _split_column(reference)
+            if qualifier is None and not single_table and column.lower() not in info['columns']:
+                return None
+            if qualifier is not None and qualifier.lower() not in names:
+                return None
+            known = info['columns'].get(column.lower())
+            if known is None or known[1] in UNINDEXABLE_TYPES:
+                return None
+            return known[0]
+
+        predicates, has_or = self._where_predicates(sql)
+        if has_or:
+            return None
+        equality, ranges = [], []
+        for reference, kind, other in predicates:
+            column = own_column(reference)
+            if column is None:
+                continue
+            if kind == 'eq' and other and re.fullmatch(_COLUMN, other.strip()) and own_column(other.strip()):
+                continue  # Compares two columns of this table
+            target = equality if kind == 'eq' else ranges
+            if column not in equality and column not in target:
+                target.append(column)
+        ranges = [column for column in ranges if column not in equality]
+
+        order = [(own_column(reference), direction) for reference, direction in self._order_by(sql)]
+        sort = []
+        if order and all(column for column, _ in order) and len({d for _, d in order}) == 1:
+            sort = [column for column, _ in order if column not in equality]
+
+        columns = list(equality)
+        sorted_by_index = False
+        if sort and (not ranges or ranges[0] == sort[0]):
+            columns += sort
+            sorted_by_index = True
+        elif ranges:
+            columns.append(ranges[0])
+        columns = columns[:MAX_INDEX_COLUMNS]
+        if not columns:
+            return None
+        return {'columns': columns, 'equality': [c for c in equality if c in columns],
+                'sorted': sorted_by_index and len(columns) == len(equality) + len(sort)}
+
+    def _rows_after(self, table: str, candidate: Dict, info: Dict, limit: Optional[int],
+                    digest: Dict) -> Optional[int]:
+        """Estimated rows examined with the index"""
+        rows = None
+        if candidate['equality']:
+            quoted = ', '.join(f"`{c}`" for c in candidate['equality'])
+            result = self.client.query(
+                f"SELECT COUNT(*), COUNT(DISTINCT {quoted}) FROM "
+                f"(SELECT {quoted} FROM `{table}` LIMIT {SELECTIVITY_SAMPLE_ROWS}) sample",
+                database=self.database, timeout=EXPLAIN_TIMEOUT)
+            sampled, distinct = int(result[0][0]), int(result[0][1])
+            if distinct:
+                rows = math.ceil(sampled / distinct)
+        if candidate['sorted'] and limit is not None:
+            rows = min(rows, limit) if rows is not None else limit
+        if rows is None:
+            # A range: at least what the statement returned
+            rows = math.ceil(digest['rows_sent'] / digest['count']) if digest['count'] else None
+        return max(rows, 1) if rows is not None else None
+
+    def _analyze_fingerprint(self, digest: Dict, prisma: Dict, cache: Dict) -> Dict:
+        sql = digest['sample'].strip().rstrip(';')
+        result = {
+            'fingerprint_id': digest['id'],
+            'fingerprint': digest['fingerprint'],
+            'count': digest['count'],
+            'total': round(digest['total'], 3),
+            'rows_examined_avg': digest.get('rows_examined_avg'),
+            'problems': [],
+            'suggestions': [],
+            'notes': []
+        }
+        plan = self.explain(sql)
+        result['plan'] = plan
+        aliases = self._aliases(sql)
+        limit = self._limit(sql)
+
+        for row in plan:
+            table = aliases.get(row['table'].lower())
+            if table is None or row['table'].startswith('<'):
+                continue
+            info = self._table_info(table, cache)
+            if info is None or info['rows'] < LARGE_TABLE_ROWS:
+                continue
+            kinds = []
+            if row['type'] == 'ALL':
+                kinds.append('full_scan')
+            elif row['type'] == 'index':
+                kinds.append('full_index_scan')
+            if 'Using filesort' in row['Extra']:
+                kinds.append('filesort')
+            if not kinds:
+                continue
+            explained_rows = int(row['rows']) if row['rows'].isdigit() else None
+            result['problems'].append({'table': table, 'kinds': kinds, 'rows': explained_rows,
+                                       'table_rows': info['rows'], 'key': None if row['key'] == 'NULL' else row['key']})
+
+            candidate = self._candidate(sql, table, aliases, info)
+            if candidate is None:
+                result['notes'].append(f"{table}: no indexable predicate or order (OR, functions or no filter)")
+                continue
+            columns = candidate['columns']
+            lowered = [c.lower() for c in columns]
+            covering = next((name for name, existing in info['indexes'].items()
+                             if [c.lower() for c in existing[:len(columns)]] == lowered), None)
+            if covering:
+                result['notes'].append(f"{table}: index {covering} already covers ({', '.join(columns)})")
+                continue
+            model = prisma.get(table.lower())
+            if model and any([c.lower() for c in existing[:len(columns)]] == lowered for existing in model['indexes']):
+                result['notes'].append(f"{table}: schema.prisma declares an index on ({', '.join(columns)}) "
+                                       f"the database doesn't have yet (migration pending?)")
+                continue
+            # Only plain indexes: dropping a unique one (or PRIMARY) would drop its constraint
+            replaces = next((name for name, existing in info['indexes'].items()
+                             if name not in info['unique'] and [c.lower() for c in existing] == lowered[:len(existing)]),
+                            None)
+
+            before = digest.get('rows_examined_avg') or explained_rows
+            after = self._rows_after(table, candidate, info, limit, digest)
+            reduction = None
+            if before and after is not None:
+                reduction = round(max(0.0, min(1.0, 1 - after / before)), 4)
+
+            fields = [model['fields'].get(c.lower()) for c in columns] if model else None
+            name = index_name(table, columns)
+            prisma_index = None
+            if model and all(fields):
+                default = f"{table}_{'_'.join(columns)}_idx"
+                mapping = f', map: "{name}"' if name != default else ''
+                prisma_index = f"@@index([{', '.join(fields)}]{mapping})"
+            result['suggestions'].append({
+                'id': hashlib.sha1(f"{table.lower()}:{','.join(lowered)}".encode()).hexdigest()[:12],
+                'table': table,
+                'columns': columns,
+                'index_name': name,
+                'sql': f"CREATE INDEX `{name}` ON `{table}`({', '.join(f'`{c}`' for c in columns)});",
+                'replaces': replaces,
+                'prisma_model': model['model'] if model else None,
+                'prisma_index': prisma_index,
+                'rows_before': before,
+                'rows_after': after,
+                'reduction': reduction,
+                'reason': ', '.join(kinds)
+            })
+        return result
+
+    def analyze(self, limit: int = ANALYZE_FINGERPRINTS) -> Dict:
+        """
+        Explain the worst fingerprints and save the suggestions
+
+        Returns:
+            dict: {'analyzed_at', 'results': [...], 'reviews': {...}}
+
+        Raises:
+            RuntimeError: if an analysis is already running
+            MariaDBError: if the database can't be queried at all
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('An analysis is already running')
+        self.running = True
+        try:
+            with trace_span('index advisor', database=self.database) as span:
+                prisma = self.prisma_tables()
+                cache: Dict = {}
+                results = []
+                for digest in self.slow_log.top(limit, sort='total'):
+                    sample = digest.get('sample') or ''
+                    if digest.get('schema') not in (None, self.database) or not EXPLAINABLE.match(sample):
+                        continue
+                    if ';' in digest['fingerprint']:
+                        continue  # Several statements: EXPLAIN takes one
+                    try:
+                        results.append(self._analyze_fingerprint(digest, prisma, cache))
+                    except MariaDBError as e:
+                        results.append({'fingerprint_id': digest['id'], 'fingerprint': digest['fingerprint'],
+                                        'count': digest['count'], 'total': round(digest['total'], 3),
+                                        'problems': [], 'suggestions': [], 'notes': [], 'error': str(e)})
+                state = self.load()
+                state.update(analyzed_at=time.time(), results=results, prisma_models=len(prisma))
+                state.setdefault('reviews', {})
+                write_json_atomic(self.state_path, state)
+                count = len({s['id'] for r in results for s in r['suggestions']})
+                span.set_attributes(fingerprints=len(results), suggestions=count)
+                self.last_error = None
+            logger.info(f"🧭 Index advisor: {len(results)} statement(s) explained, {count} suggestion(s)")
+            return state
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        finally:
+            self.running = False
+            self._lock.release()
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+
+    def export_migration(self, include: str = STATUS_ACCEPTED) -> Optional[Dict]:
+        """
+        Prisma migration with the suggested indexes, for the backend team
+
+        Args:
+            include: 'accepted' (reviewed suggestions only) or 'all'
+                (everything not dismissed)
+
+        Returns:
+            dict: {'name' (migration directory), 'sql' (migration.sql),
+                   'schema_changes' ([{'model', 'change'}])}, or None if
+                   there is nothing to export
+        """
+        selected = [s for s in self.suggestions()
+                    if s['status'] == STATUS_ACCEPTED or (include == 'all' and s['status'] == STATUS_PROPOSED)]
+        if not selected:
+            return None
+        now = datetime.now()
+        name = f"{now:%Y%m%d%H%M%S}_add_suggested_indexes"
+        schema_changes = []
+        lines = [
+            f"-- Suggested by the 4Paws Agent index advisor on {now:%Y-%m-%d %H:%M}",
+            f"-- from the slow queries of {self.database}. Review before merging; nothing was applied.",
+            "--",
+            "-- Matching schema.prisma changes:"
+        ]
+        for suggestion in selected:
+            if suggestion['prisma_index']:
+                change = suggestion['prisma_index']
+                if suggestion['replaces']:
+                    change += f" (replaces the index {suggestion['replaces']})"
+                schema_changes.append({'model': suggestion['prisma_model'], 'change': change})
+                lines.append(f"--   model {suggestion['prisma_model']}: {change}")
+            else:
+                lines.append(f"--   table {suggestion['table']}: no Prisma model found, add the index by hand")
+        for suggestion in selected:
+            lines += [
+                "",
+                f"-- {suggestion['table']} ({suggestion['reason']}): rows examined "
+                f"~{suggestion['rows_before'] or '?'} -> ~{suggestion['rows_after'] or '?'}, "
+                f"{suggestion['time_saved_estimate']:.1f}s of logged slow time",
+            ]
+            lines += [f"--   {query['fingerprint'][:200]}" for query in suggestion['queries'][:3]]
+            lines.append(suggestion['sql'])
+            if suggestion['replaces']:
+                # Created first: a foreign key relying on the old index stays covered
+                lines.append(f"DROP INDEX `{suggestion['replaces']}` ON `{suggestion['table']}`;")
+        return {'name': name, 'sql': '\n'.join(lines) + '\n', 'schema_changes': schema_changes}
+
+    def status(self) -> Dict:
+        state = self.load()
+        return {
+            'running': self.running,
+            'analyzed_at': state.get('analyzed_at'),
+            'prisma_models': state.get('prisma_models'),
+            'last_error': self.last_error
+        }
+
+
+_advisor: Optional[IndexAdvisor] = None
+
+
+def get_index_advisor() -> IndexAdvisor:
+    """Get the global IndexAdvisor (advice in the writable dir, schema from the backend's prisma/)"""
+    global _advisor
+    if _advisor is None:
+        _advisor = IndexAdvisor(get_slow_query_log(), Config.WRITABLE_DIR / 'index_advice.json',
+                                Config.BACKEND_DIR / 'prisma')
+    return _advisor
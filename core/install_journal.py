@@ -0,0 +1,171 @@
+"""
+Install/update journal for 4Paws Agent
+Persists which steps of an install or update run have completed, with
+content fingerprints, so an interrupted run resumes instead of starting over
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Run states
+STATUS_RUNNING = 'running'
+STATUS_COMPLETED = 'completed'
+STATUS_FAILED = 'failed'
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_json_atomic(path: Path, data: Dict):
+    """
+    Write JSON so a crash or power cut leaves either the old or the new
+    file, never a truncated one (temp file + fsync + rename)
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class InstallJournal:
+    """
+    Journal of one install or update run
+
+    begin() either continues an unfinished run of the same kind and
+    components (failed or interrupted) or starts a new one. Each step that
+    completes is recorded with a fingerprint of what it produced (release
+    tag, archive hash, lockfile hash, ...); on resume the task graph asks
+    each step to check its fingerprint against the disk and only redoes the
+    steps that no longer match.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state: Dict = self._load()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        try:
+            write_json_atomic(self.path, self.state)
+        except OSError as e:
+            logger.warning(f"⚠️  Could not write install journal: {e}")
+
+    @property
+    def kind(self) -> Optional[str]:
+        return self.state.get('kind')
+
+    @property
+    def status(self) -> Optional[str]:
+        return self.state.get('status')
+
+    @property
+    def components(self) -> List[str]:
+        return list(self.state.get('components') or [])
+
+    def unfinished(self, kind: Optional[str] = None) -> bool:
+        """Whether a run (of this kind) was interrupted or failed"""
+        if self.status not in (STATUS_RUNNING, STATUS_FAILED):
+            return False
+        return kind is None or self.kind == kind
+
+    def begin(self, kind: str, components: List[str], fresh: bool = False) -> bool:
+        """
+        Start a run, continuing the previous one if it is unfinished and
+        covers the same components
+
+        Args:
+            fresh: Start over even if an earlier run could be continued
+
+        Returns:
+            bool: True if an earlier run is being resumed
+        """
+        with self.lock:
+            resumed = not fresh and self.unfinished(kind) and sorted(self.components) == sorted(components)
+            if resumed:
+                self.state['resumes'] = self.state.get('resumes', 0) + 1
+                logger.info(f"♻️  Resuming interrupted {kind} ({len(self.state.get('steps', {}))} step(s) journaled)")
+            else:
+                self.state = {
+                    'run_id': uuid.uuid4().hex,
+                    'kind': kind,
+                    'components': list(components),
+                    'started_at': time.time(),
+                    'resumes': 0,
+                    'steps': {}
+                }
+            self.state['status'] = STATUS_RUNNING
+            self.state['error'] = None
+            self._save()
+            return resumed
+
+    def checkpoint(self, step: str) -> Optional[Dict]:
+        """Fingerprint recorded when a step last completed in this run"""
+        entry = self.state.get('steps', {}).get(step)
+        return entry.get('data') if entry else None
+
+    def record(self, step: str, data: Optional[Dict], duration: Optional[float] = None):
+        """Record a completed step (durable before this returns)"""
+        with self.lock:
+            self.state.setdefault('steps', {})[step] = {
+                'completed_at': time.time(),
+                'duration': round(duration, 3) if duration is not None else None,
+                'data': data or {}
+            }
+            self._save()
+
+    def complete(self):
+        with self.lock:
+            self.state['status'] = STATUS_COMPLETED
+            self.state['finished_at'] = time.time()
+            self._save()
+
+    def fail(self, error: Optional[str] = None):
+        with self.lock:
+            self.state['status'] = STATUS_FAILED
+            self.state['error'] = error
+            self.state['finished_at'] = time.time()
+            self._save()
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return json.loads(json.dumps(self.state))
+
+
+_journal: Optional[InstallJournal] = None
+
+
+def get_install_journal() -> InstallJournal:
+    """Get the global InstallJournal (install_state.json in the writable dir)"""
+    global _journal
+    if _journal is None:
+        _journal = InstallJournal(Config.WRITABLE_DIR / 'install_state.json')
+    return _journal
@@ -0,0 +1,370 @@
+"""
+Log file reading utilities for 4Paws Agent
+Tail, incremental (offset-based) reads and line-range access for large logs
+"""
+
+import os
+import re
+import gzip
+import zlib
+from array import array
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+# Bytes read per backwards seek when tailing
+TAIL_BLOCK_SIZE = 64 * 1024
+
+# Maximum bytes returned by one incremental read
+MAX_INCREMENTAL_BYTES = 1024 * 1024
+
+# Bytes of the file head used to fingerprint a file (detects copy-truncate)
+FINGERPRINT_BYTES = 256
+
+# A line-offset checkpoint is kept for every Nth line
+LINE_INDEX_STRIDE = 1000
+
+
+def _decode(data: bytes) -> str:
+    return data.decode('utf-8', errors='replace')
+
+
+def tail_bytes(path: Path, lines: int = 100, block_size: int = TAIL_BLOCK_SIZE) -> Tuple[bytes, int]:
+    """
+    Read the last N lines of a file by seeking backwards from EOF
+
+    Only the blocks that contain the requested lines are read, so the cost
+    does not depend on the file size.
+
+    Args:
+        path: File to read
+        lines: Number of lines to return
+        block_size: Bytes read per backwards seek
+
+    Returns:
+        tuple: (raw bytes of the last lines, file size at time of read)
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if lines <= 0 or size == 0:
+            return b'', size
+
+        position = size
+        chunks = []
+        newlines = 0
+
+        # A trailing newline terminates the last line, it doesn't start a new one
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            newlines = -1
+
+        while position > 0 and newlines < lines:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            chunk = f.read(read_size)
+            newlines += chunk.count(b'\n')
+            chunks.append(chunk)
+
+        data = b''.join(reversed(chunks))
+
+    # Drop any extra leading lines from the first block we read
+    body_end = len(data) - 1 if data.endswith(b'\n') else len(data)
+    cut = body_end
+    for _ in range(lines):
+        cut = data.rfind(b'\n', 0, cut)
+        if cut < 0:
+            return data, size
+    return data[cut + 1:], size
+
+
+def tail_lines(path: Path, lines: int = 100) -> str:
+    """Return the last N lines of a file as text"""
+    data, _ = tail_bytes(path, lines)
+    return _decode(data)
+
+
+def rotated_segments(path: Path) -> List[Path]:
+    """
+    List rotated segments of a log file, newest first
+
+    Segments are named <stem>.<YYYYmmdd-HHMMSS>[-N].log, optionally
+    gzip-compressed (.log.gz), in the same directory as the live file.
+    """
+    path = Path(path)
+    if not path.parent.exists():
+        return []
+    pattern = re.compile(rf'^{re.escape(path.stem)}\.(\d{{8}}-\d{{6}})(?:-(\d+))?\.log(?:\.gz)?$')
+    found = []
+    for candidate in path.parent.iterdir():
+        match = pattern.match(candidate.name)
+        if match:
+            found.append((match.group(1), int(match.group(2) or 0), candidate))
+    found.sort(reverse=True)
+    return [segment for _, _, segment in found]
+
+
+def segment_timestamp(segment: Path) -> Optional[float]:
+    """Epoch time encoded in a segment name (when it was rotated)"""
+    match = re.search(r'\.(\d{8}-\d{6})(?:-\d+)?\.log(?:\.gz)?$', segment.name)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), '%Y%m%d-%H%M%S').timestamp()
+
+
+def open_segment(segment: Path):
+    """Open a live file or rotated segment for binary reading (handles .gz)"""
+    if segment.suffix == '.gz':
+        return gzip.open(segment, 'rb')
+    return open(segment, 'rb')
+
+
+def tail_segment_lines(segment: Path, lines: int) -> List[bytes]:
+    """Last N lines of a segment; compressed segments are streamed, not loaded"""
+    if segment.suffix != '.gz':
+        data, _ = tail_bytes(segment, lines)
+        return data.splitlines(keepends=True)
+    with open_segment(segment) as f:
+        return list(deque(f, maxlen=lines))
+
+
+def tail_lines_rotated(path: Path, lines: int = 100) -> str:
+    """
+    Last N lines of a log, continuing into rotated segments when the live
+    file holds fewer than N lines
+    """
+    collected: List[bytes] = []
+    sources = ([path] if Path(path).exists() else []) + rotated_segments(path)
+    for source in sources:
+        needed = lines - len(collected)
+        if needed <= 0:
+            break
+        try:
+            chunk = tail_segment_lines(source, needed)
+        except OSError:
+            continue
+        # Make sure the segment boundary doesn't glue two lines together
+        if chunk and not chunk[-1].endswith(b'\n'):
+            chunk[-1] += b'\n'
+        collected = chunk + collected
+    return _decode(b''.join(collected))
+
+
+def file_fingerprint(path: Path) -> str:
+    """
+    Identify a file so rotation and truncation can be detected
+
+    Combines the device/inode (a rename-rotation produces a new inode) with
+    a CRC of the first bytes (copy-truncate keeps the inode but rewrites the
+    head). The CRC length is encoded so a file that was shorter than
+    FINGERPRINT_BYTES when fingerprinted can still be verified later.
+
+    Returns:
+        str: Opaque file id, e.g. "803-1a2b3c-256-9f8e7d6c"
+    """
+    st = os.stat(path)
+    head_len = min(st.st_size, FINGERPRINT_BYTES)
+    with open(path, 'rb') as f:
+        head = f.read(head_len)
+    return f"{st.st_dev:x}-{st.st_ino:x}-{len(head)}-{zlib.crc32(head):08x}"
+
+
+def _same_file(path: Path, file_id: str) -> bool:
+    """Check whether path is still the file that produced file_id"""
+    try:
+        dev, ino, head_len, crc = file_id.split('-')
+        st = os.stat(path)
+        if f"{st.st_dev:x}" != dev or f"{st.st_ino:x}" != ino:
+            return False
+        head_len = int(head_len)
+        if st.st_size < head_len:
+            return False
+        with open(path, 'rb') as f:
+            head = f.read(head_len)
+        return f"{zlib.crc32(head):08x}" == crc
+    except (ValueError, OSError):
+        return False
+
+
+def read_incremental(path: Path, offset: Optional[int] = None, file_id: Optional[str] = None,
+                     tail: int = 100, max_bytes: int = MAX_INCREMENTAL_BYTES) -> Dict:
+    """
+    Return only the bytes appended since the caller's last read
+
+    The caller passes back the offset and file_id from the previous
+    response. If the file was rotated or truncated in between (different
+    file id, or size below offset) the read restarts with a tail of the
+    new file and 'reset' is set so the client can clear its view.
+
+    Only complete lines are returned; a partially written last line is left
+    for the next call.
+
+    Args:
+        path: Log file
+        offset: Byte offset returned by the previous call (None = start with a tail)
+        file_id: File id returned by the previous call
+        tail: Lines to return when (re)starting
+        max_bytes: Cap on bytes returned per call
+
+    Returns:
+        dict: {
+            'data': str,
+            'offset': int (pass back next time),
+            'file_id': str (pass back next time),
+            'size': int,
+            'reset': bool (view must be replaced instead of appended),
+            'has_more': bool (more data already available)
+        }
+    """
+    if not path.exists():
+        return {'data': '', 'offset': 0, 'file_id': None, 'size': 0, 'reset': offset is not None, 'has_more': False}
+
+    current_id = file_fingerprint(path)
+    reset = (
+        offset is None
+        or offset < 0
+        or (file_id is not None and file_id != current_id and not _same_file(path, file_id))
+    )
+
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if not reset and offset > size:
+            reset = True  # Truncated in place
+
+        if reset:
+            data, _ = tail_bytes(path, tail)
+            start = size - len(data)
+        else:
+            start = offset
+            f.seek(start)
+            data = f.read(min(size - start, max_bytes))
+
+    # Judged on what was read: the trim below may end the chunk well before it
+    has_more = start + len(data) < size
+
+    # Keep only whole lines so multi-byte characters and lines aren't split
+    end = data.rfind(b'\n') + 1
+    if end == 0 and len(data) >= max_bytes:
+        end = len(data)  # A single enormous line: return it in pieces
+    data = data[:end]
+    new_offset = start + len(data)
+
+    return {
+        'data': _decode(data),
+        'offset': new_offset,
+        'file_id': current_id,
+        'size': size,
+        'reset': reset and offset is not None,
+        'has_more': has_more
+    }
+
+
+class LineIndex:
+    """
+    Sparse line-offset index for one log file
+
+    Stores the byte offset of every LINE_INDEX_STRIDE-th line, so fetching
+    an arbitrary line range costs one seek plus reading at most
+    LINE_INDEX_STRIDE lines. The index is extended incrementally as the file
+    grows and rebuilt when the file is rotated or truncated.
+    """
+
+    def __init__(self, path: Path, stride: int = LINE_INDEX_STRIDE):
+        self.path = path
+        self.stride = stride
+        self.lock = Lock()
+        self.file_id: Optional[str] = None
+        self.checkpoints = array('Q', [0])  # checkpoints[k] = offset of line k*stride
+        self.indexed_bytes = 0               # Bytes scanned so far
+        self.indexed_lines = 0               # Complete lines seen so far
+
+    def _reset(self, file_id: Optional[str]):
+        self.file_id = file_id
+        self.checkpoints = array('Q', [0])
+        self.indexed_bytes = 0
+        self.indexed_lines = 0
+
+    def refresh(self) -> int:
+        """Extend the index to the current end of file; returns the line count"""
+        with self.lock:
+            if not self.path.exists():
+                self._reset(None)
+                return 0
+
+            if self.file_id is None or not _same_file(self.path, self.file_id):
+                self._reset(file_fingerprint(self.path))
+            size = os.path.getsize(self.path)
+            if size < self.indexed_bytes:
+                self._reset(file_fingerprint(self.path))
+
+            with open(self.path, 'rb') as f:
+                f.seek(self.indexed_bytes)
+                chunk_start = self.indexed_bytes
+                last_complete = self.indexed_bytes
+                while chunk_start < size:
+                    chunk = f.read(min(TAIL_BLOCK_SIZE, size - chunk_start))
+                    if not chunk:
+                        break
+                    nl = chunk.find(b'\n')
+                    while nl >= 0:
+                        last_complete = chunk_start + nl + 1
+                        self.indexed_lines += 1
+                        if self.indexed_lines % self.stride == 0:
+                            self.checkpoints.append(last_complete)
+                        nl = chunk.find(b'\n', nl + 1)
+                    chunk_start += len(chunk)
+                # A trailing partial line is rescanned once it is complete
+                self.indexed_bytes = last_complete
+            return self.indexed_lines
+
+    def read_lines(self, start_line: int, count: int) -> str:
+        """
+        Read lines [start_line, start_line + count) (0-based, complete lines only)
+
+        Args:
+            start_line: First line to return; negative counts from the end
+            count: Number of lines
+
+        Returns:
+            str: The requested lines
+        """
+        total = self.refresh()
+        with self.lock:
+            if start_line < 0:
+                start_line = max(0, total + start_line)
+            if count <= 0 or start_line >= total:
+                return ''
+            count = min(count, total - start_line)
+
+            checkpoint = start_line // self.stride
+            skip = start_line - checkpoint * self.stride
+            lines = []
+            with open(self.path, 'rb') as f:
+                f.seek(self.checkpoints[checkpoint])
+                for _ in range(skip):
+                    f.readline()
+                for _ in range(count):
+                    line = f.readline()
+                    if not line:
+                        break
+                    lines.append(line)
+            return _decode(b''.join(lines))
+
+
+_line_indexes: Dict[str, LineIndex] = {}
+_line_indexes_lock = Lock()
+
+
+def get_line_index(path: Path) -> LineIndex:
+    """Get the shared LineIndex for a file (created on first use)"""
+    key = str(Path(path).absolute())
+    with _line_indexes_lock:
+        index = _line_indexes.get(key)
+        if index is None:
+            index = LineIndex(Path(path))
+            _line_indexes[key] = index
+        return index
@@ -0,0 +1,289 @@
+"""
+Log rotation for 4Paws Agent
+Size/time based rotation, background compression and retention for
+service logs (mariadb/backend/frontend) and the agent's own logs
+"""
+
+import os
+import sys
+import gzip
+import time
+import queue
+import shutil
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .config import Config
+from .log_reader import rotated_segments, segment_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Rotation strategies
+ROTATE_RENAME = 'rename'              # Writer reopens the path (agent logs)
+ROTATE_COPY_TRUNCATE = 'copytruncate'  # A child process keeps its handle open
+
+
+def open_append_handle(path: Path):
+    """
+    Open a log file for a child process's stdout with kernel-level append
+
+    Every write lands at the current end of file even after another process
+    truncates it, which is what makes copy-truncate rotation safe while the
+    child keeps its handle. On POSIX this is O_APPEND. On Windows the CRT
+    only emulates append mode inside our own process, so the handle is
+    created with FILE_APPEND_DATA access (and full sharing) instead.
+
+    Returns:
+        Binary file object to pass as Popen stdout (close it after Popen)
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if sys.platform != 'win32':
+        return open(path, 'ab')
+
+    import ctypes
+    import msvcrt
+    from ctypes import wintypes
+
+    FILE_APPEND_DATA = 0x0004
+    SYNCHRONIZE = 0x00100000
+    FILE_SHARE_ALL = 0x1 | 0x2 | 0x4  # READ | WRITE | DELETE
+    OPEN_ALWAYS = 4
+    FILE_ATTRIBUTE_NORMAL = 0x80
+
+    create_file = ctypes.windll.kernel32.CreateFileW
+    create_file.argtypes = [wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD, wintypes.LPVOID,
+                            wintypes.DWORD, wintypes.DWORD, wintypes.HANDLE]
+    create_file.restype = wintypes.HANDLE
+
+    handle = create_file(str(path), FILE_APPEND_DATA | SYNCHRONIZE, FILE_SHARE_ALL, None,
+                         OPEN_ALWAYS, FILE_ATTRIBUTE_NORMAL, None)
+    if handle is None or handle == wintypes.HANDLE(-1).value:
+        raise ctypes.WinError()
+    fd = msvcrt.open_osfhandle(handle, os.O_WRONLY | os.O_APPEND)
+    return os.fdopen(fd, 'ab', buffering=0)
+
+
+def lower_io_priority():
+    """Drop the calling thread to background/idle I/O priority (best effort)"""
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN)
+        else:
+            import psutil
+            # On Linux the I/O priority is per thread, addressed by its native id
+            psutil.Process(threading.get_native_id()).ionice(psutil.IOPRIO_CLASS_IDLE)
+    except Exception as e:
+        logger.debug(f"Could not lower I/O priority: {e}")
+
+
+class LogRotator:
+    """
+    Rotate, compress and expire log files
+
+    Registered files are checked periodically. A file is rotated once it
+    exceeds the size limit, or once it is older than the age limit and not
+    empty. Rotated segments are named <stem>.<YYYYmmdd-HHMMSS>.log next to
+    the live file, gzip-compressed by a background worker at idle I/O
+    priority, and deleted when they fall outside the retention budget.
+    """
+
+    def __init__(self, check_interval: int = 60):
+        self.check_interval = check_interval
+        self.files: Dict[Path, str] = {}
+        self.last_rotation: Dict[Path, float] = {}
+        self.lock = threading.Lock()
+        self.compress_queue: "queue.Queue[Path]" = queue.Queue()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+        self.max_bytes = int(float(os.getenv('LOG_ROTATE_MAX_MB', Config.LOG_ROTATE_MAX_MB)) * 1024 * 1024)
+        self.max_age = float(os.getenv('LOG_ROTATE_MAX_HOURS', Config.LOG_ROTATE_MAX_HOURS)) * 3600
+        self.retention_bytes = int(float(os.getenv('LOG_RETENTION_MB', Config.LOG_RETENTION_MB)) * 1024 * 1024)
+        self.retention_age = float(os.getenv('LOG_RETENTION_DAYS', Config.LOG_RETENTION_DAYS)) * 86400
+
+    def register(self, path: Path, strategy: str = ROTATE_COPY_TRUNCATE):
+        """Watch a log file; strategy is ROTATE_RENAME or ROTATE_COPY_TRUNCATE"""
+        path = Path(path)
+        with self.lock:
+            self.files[path] = strategy
+            if path not in self.last_rotation:
+                segments = rotated_segments(path)
+                newest = segment_timestamp(segments[0]) if segments else None
+                self.last_rotation[path] = newest or time.time()
+
+    def start(self):
+        """Start the periodic check and compression threads (idempotent)"""
+        if self._threads:
+            return
+        self._stop.clear()
+        for target, name in ((self._check_loop, 'log-rotation'), (self._compress_loop, 'log-compress')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        # Segments left uncompressed by a previous run
+        for path in list(self.files):
+            for segment in rotated_segments(path):
+                if segment.suffix == '.log':
+                    self.compress_queue.put(segment)
+
+    def stop(self):
+        self._stop.set()
+        self.compress_queue.put(None)
+        self._threads = []
+
+    def _check_loop(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.check_all()
+            except Exception as e:
+                logger.warning(f"⚠️  Log rotation check failed: {e}")
+
+    def check_all(self):
+        """Rotate every registered file that is due"""
+        with self.lock:
+            files = list(self.files.items())
+        for path, strategy in files:
+            if self.should_rotate(path):
+                self.rotate(path, strategy)
+        self.enforce_retention()
+
+    def should_rotate(self, path: Path) -> bool:
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return False
+        if size == 0:
+            return False
+        if size >= self.max_bytes:
+            return True
+        return time.time() - self.last_rotation.get(path, time.time()) >= self.max_age
+
+    def rotate(self, path: Path, strategy: Optional[str] = None) -> Optional[Path]:
+        """
+        Rotate one file now
+
+        Returns:
+            Path of the new (uncompressed) segment, or None if nothing was rotated
+        """
+        strategy = strategy or self.files.get(path, ROTATE_COPY_TRUNCATE)
+        if not path.exists() or path.stat().st_size == 0:
+            return None
+
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        segment = path.with_name(f"{path.stem}.{stamp}.log")
+        suffix = 1
+        while segment.exists() or segment.with_suffix('.log.gz').exists():
+            segment = path.with_name(f"{path.stem}.{stamp}-{suffix}.log")
+            suffix += 1
+
+        try:
+            if strategy == ROTATE_RENAME:
+                os.replace(path, segment)
+            else:
+                self._copy_truncate(path, segment)
+        except OSError as e:
+            logger.warning(f"⚠️  Could not rotate {path.name}: {e}")
+            return None
+
+        self.last_rotation[path] = time.time()
+        self.compress_queue.put(segment)
+        logger.info(f"🔄 Rotated {path.name} → {segment.name}")
+        return segment
+
+    @staticmethod
+    def _copy_truncate(path: Path, segment: Path):
+        """Copy the live file into segment, then truncate it in place"""
+        with open(path, 'rb') as src, open(segment, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+            # Pick up anything written while copying, then truncate right away
+            # to keep the window in which new lines can be lost minimal
+            with open(path, 'r+b') as live:
+                dst.write(src.read())
+                live.truncate(0)
+
+    def _compress_loop(self):
+        lower_io_priority()
+        while True:
+            segment = self.compress_queue.get()
+            if segment is None or self._stop.is_set():
+                return
+            try:
+                self.compress_segment(segment)
+            except Exception as e:
+                logger.warning(f"⚠️  Could not compress {segment.name}: {e}")
+
+    @staticmethod
+    def compress_segment(segment: Path) -> Optional[Path]:
+        """gzip a rotated segment (streaming, via a temp file) and remove the original"""
+        if not segment.exists():
+            return None
+        target = segment.with_name(segment.name + '.gz')
+        temp = segment.with_name(segment.name + '.gz.tmp')
+        with open(segment, 'rb') as src, gzip.open(temp, 'wb', compresslevel=6) as dst:
+            while True:
+                chunk = src.read(256 * 1024)
+                if not chunk:
+                    break
+                dst.write(chunk)
+                time.sleep(0)  # Yield to request threads between chunks
+        # Keep the original mtime so retention ages the segment correctly
+        stat = segment.stat()
+        os.utime(temp, (stat.st_atime, stat.st_mtime))
+        os.replace(temp, target)
+        segment.unlink()
+        return target
+
+    def enforce_retention(self):
+        """Delete segments older than the age budget, then oldest-first over the size budget"""
+        with self.lock:
+            paths = list(self.files)
+        segments = []
+        for path in paths:
+            segments.extend(rotated_segments(path))
+
+        now = time.time()
+        entries = []
+        for segment in segments:
+            try:
+                stat = segment.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.retention_age:
+                self._delete(segment)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, segment))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, segment in sorted(entries):
+            if total <= self.retention_bytes:
+                break
+            self._delete(segment)
+            total -= size
+
+    @staticmethod
+    def _delete(segment: Path):
+        try:
+            segment.unlink()
+            logger.info(f"🗑️  Removed old log segment {segment.name}")
+        except OSError:
+            pass
+
+
+_rotator: Optional[LogRotator] = None
+
+
+def get_log_rotator() -> LogRotator:
+    """Get the global LogRotator, registering the standard service logs"""
+    global _rotator
+    if _rotator is None:
+        _rotator = LogRotator()
+        for service in ('mariadb', 'backend', 'frontend'):
+            _rotator.register(Config.LOGS_DIR / f'{service}.log', ROTATE_COPY_TRUNCATE)
+    return _rotator
@@ -0,0 +1,291 @@
+"""
+Merged log timeline for 4Paws Agent
+Parses timestamps/severity from log lines and merges several logs
+(including rotated segments) into one time-ordered stream
+"""
+
+import os
+import re
+import json
+import time
+import heapq
+import calendar
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .log_reader import rotated_segments, segment_timestamp, open_segment, TAIL_BLOCK_SIZE
+
+# Lines per chunk of a streamed timeline response
+TIMELINE_CHUNK_LINES = 500
+
+# Only the start of a line is searched for a timestamp
+TIMESTAMP_SEARCH_CHARS = 80
+
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;?]*[A-Za-z]')
+
+# "2025-10-19 14:03:11" / "2025-10-19T14:03:11.123Z" / "2025-10-19 14:03:11,123"
+# (MariaDB, agent.log, agent_web.log, Prisma, JSON loggers); local time unless
+# followed by Z or a UTC offset ("+07:00", "-0500")
+ISO_TIMESTAMP = re.compile(
+    r'(\d{4}-\d{2}-\d{2})[ T](\d{2}):(\d{2}):(\d{2})(?:[.,](\d{1,6}))?(Z|[+-]\d{2}:?\d{2})?')
+# "10/19/2025, 2:03:11 PM" (NestJS default logger)
+NEST_TIMESTAMP = re.compile(r'(\d{1,2}/\d{1,2}/\d{4}), (\d{1,2}:\d{2}:\d{2} [AP]M)')
+
+# Severity markers used by mysqld ([ERROR]/[Warning]/[Note]), NestJS
+# (ERROR/WARN/LOG/DEBUG/VERBOSE), Next.js (⨯ / ⚠), Python logging and
+# Node stack traces
+ERROR_PATTERN = re.compile(r'\[(?:ERROR|Error|FATAL)\]|\b(?:ERROR|FATAL|CRITICAL|ERR!)\b|^\s*(?:[A-Z]\w*)?Error:|⨯')
+WARNING_PATTERN = re.compile(r'\[(?:WARNING|Warning|WARN)\]|\b(?:WARN|WARNING)\b|⚠')
+DEBUG_PATTERN = re.compile(r'\[(?:DEBUG|Debug)\]|\b(?:DEBUG|VERBOSE)\b')
+INFO_PATTERN = re.compile(r'\[(?:Note|NOTE|INFO|Info)\]|\b(?:INFO|LOG|SUCCESS)\b')
+
+LEVELS = ('error', 'warning', 'info', 'debug')
+
+# Time of lines before a log's first timestamp when no earlier rotation tells
+# when the file started (e.g. Next.js output): merged ahead of timed lines and
+# not filtered by the time window
+UNTIMED = float('-inf')
+
+
+@lru_cache(maxsize=4096)
+def _hour_epoch(date: str, hour: int) -> float:
+    """Epoch of a local date + hour (cached: log lines share few hours)"""
+    return time.mktime(time.strptime(f"{date} {hour:02d}", '%Y-%m-%d %H'))
+
+
+@lru_cache(maxsize=4096)
+def _utc_hour_epoch(date: str, hour: int) -> float:
+    """Epoch of a UTC date + hour"""
+    return float(calendar.timegm(time.strptime(f"{date} {hour:02d}", '%Y-%m-%d %H')))
+
+
+def _utc_offset(zone: str) -> int:
+    """Seconds east of UTC of 'Z' / '+07:00' / '-0500'"""
+    if zone == 'Z':
+        return 0
+    digits = zone[1:].replace(':', '')
+    seconds = int(digits[:2]) * 3600 + int(digits[2:]) * 60
+    return -seconds if zone[0] == '-' else seconds
+
+
+def parse_timestamp(plain: str) -> Optional[float]:
+    """Epoch time of a log line's timestamp, or None if it has none"""
+    match = ISO_TIMESTAMP.search(plain, 0, TIMESTAMP_SEARCH_CHARS)
+    if match:
+        date, hour, minute, second, fraction, zone = match.groups()
+        try:
+            if zone:
+                ts = _utc_hour_epoch(date, int(hour)) - _utc_offset(zone)
+            else:
+                ts = _hour_epoch(date, int(hour))
+            ts += int(minute) * 60 + int(second)
+        except (ValueError, OverflowError):
+            return None
+        if fraction:
+            ts += int(fraction) / 10 ** len(fraction)
+        return ts
+
+    match = NEST_TIMESTAMP.search(plain, 0, TIMESTAMP_SEARCH_CHARS)
+    if match:
+        try:
+            return datetime.strptime(f"{match.group(1)} {match.group(2)}", '%m/%d/%Y %I:%M:%S %p').timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+def _contains_any(text: str, needles: Tuple[str, ...]) -> bool:
+    for needle in needles:
+        if needle in text:
+            return True
+    return False
+
+
+def parse_severity(plain: str) -> Optional[str]:
+    """Severity named in a log line ('error'/'warning'/'info'/'debug'), or None"""
+    # Substring checks first: most lines never reach the (much slower) regexes
+    if _contains_any(plain, ('ERR', 'Err', 'FATAL', 'CRITICAL', '⨯')) and ERROR_PATTERN.search(plain):
+        return 'error'
+    if _contains_any(plain, ('WARN', 'Warn', '⚠')) and WARNING_PATTERN.search(plain):
+        return 'warning'
+    if _contains_any(plain, ('DEBUG', 'Debug', 'VERBOSE')) and DEBUG_PATTERN.search(plain):
+        return 'debug'
+    if _contains_any(plain, ('Note', 'NOTE', 'INFO', 'Info', 'LOG', 'SUCCESS')) and INFO_PATTERN.search(plain):
+        return 'info'
+    return None
+
+
+def log_segments(path: Path, since: Optional[float] = None,
+                 until: Optional[float] = None) -> List[Tuple[Path, float, float]]:
+    """
+    Files holding a log's history (rotated segments and the live file),
+    oldest first, with the time range each one covers
+
+    A segment covers the time from the previous rotation up to its own
+    rotation (encoded in its name), so segments entirely outside
+    [since, until] are skipped without being opened. The oldest file has
+    no known start (file times don't tell it: copy-truncate keeps the
+    creation time on Windows and changes ctime on Linux).
+
+    Returns:
+        list: (file, start time or None, end time)
+    """
+    path = Path(path)
+    files: List[Tuple[Path, Optional[float], float]] = []
+    start: Optional[float] = None
+    for segment in reversed(rotated_segments(path)):
+        end = segment_timestamp(segment) or segment.stat().st_mtime
+        files.append((segment, start, end))
+        start = end
+    if path.exists():
+        files.append((path, start, path.stat().st_mtime))
+
+    return [
+        (segment, seg_start, seg_end) for segment, seg_start, seg_end in files
+        if (since is None or seg_end >= since) and (until is None or seg_start is None or seg_start <= until)
+    ]
+
+
+def _seek_to_time(f, size: int, since: float):
+    """
+    Position an uncompressed, time-ordered log near the first line at or
+    after since (binary search over byte offsets)
+    """
+    lo, hi = 0, size
+    while hi - lo > TAIL_BLOCK_SIZE:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        f.readline()  # Skip the partial line we landed in
+        ts = None
+        for _ in range(100):
+            line = f.readline()
+            if not line:
+                break
+            ts = parse_timestamp(ANSI_ESCAPE.sub('', line[:TIMESTAMP_SEARCH_CHARS * 2].decode('utf-8', errors='replace')))
+            if ts is not None:
+                break
+        if ts is None or ts >= since:
+            hi = mid
+        else:
+            lo = mid
+    f.seek(lo)
+    if lo:
+        f.readline()
+
+
+def read_log_lines(name: str, source_index: int, path: Path, since: Optional[float] = None,
+                   until: Optional[float] = None, levels: Optional[Iterable[str]] = None
+                   ) -> Iterator[Tuple[float, int, int, str, str, str]]:
+    """
+    Lazily read one log (oldest segment first) as parsed, filtered lines
+
+    Lines without a timestamp (stack traces, wrapped output) are treated as
+    continuations and inherit the timestamp, and unless they name one, the
+    severity of the line before them; at the start of a segment they get
+    the rotation time it started at, in the oldest file they stay UNTIMED
+    until its first timestamp. The time window and level filters
+    are applied here, so skipped segments are never opened and reading
+    stops at the first line after until.
+
+    Yields:
+        tuple: (epoch time, source index, line number, source name, level, text)
+    """
+    levels = set(levels) if levels else None
+    number = 0
+    for segment, seg_start, _ in log_segments(path, since, until):
+        last_ts = seg_start if seg_start is not None else UNTIMED
+        last_level = 'info'
+        try:
+            f = open_segment(segment)
+        except OSError:
+            continue
+        with f:
+            # Past a seek, leading untimed lines continue a line before since
+            skip_untimed = False
+            if since is not None and segment.suffix != '.gz':
+                _seek_to_time(f, os.fstat(f.fileno()).st_size, since)
+                skip_untimed = f.tell() > 0
+            for raw in f:
+                text = raw.rstrip(b'\r\n').decode('utf-8', errors='replace')
+                plain = ANSI_ESCAPE.sub('', text) if '\x1b' in text else text
+                ts = parse_timestamp(plain)
+                level = parse_severity(plain)
+                if ts is None:
+                    ts = last_ts
+                    level = level or last_level
+                else:
+                    last_ts = ts
+                    level = level or 'info'
+                last_level = level
+
+                if ts == UNTIMED:
+                    if skip_untimed:
+                        continue
+                elif since is not None and ts < since:
+                    continue
+                if until is not None and ts > until:
+                    return
+                if levels is not None and level not in levels:
+                    continue
+                number += 1
+                yield (ts, source_index, number, name, level, plain)
+
+
+def merge_timeline(sources: Dict[str, Path], since: Optional[float] = None, until: Optional[float] = None,
+                   levels: Optional[Iterable[str]] = None) -> Iterator[Tuple[float, int, int, str, str, str]]:
+    """
+    Merge several logs into one stream ordered by timestamp
+
+    A heap-based k-way merge over the lazy per-log readers: only one
+    pending line per log is held in memory, however large the window.
+
+    Args:
+        sources: Source name -> live log file (rotated segments are found next to it)
+        since, until: Time window (epoch seconds, inclusive)
+        levels: Only these severities
+
+    Yields:
+        tuple: (epoch time, source index, line number, source name, level, text)
+    """
+    readers = [
+        read_log_lines(name, index, path, since, until, levels)
+        for index, (name, path) in enumerate(sources.items())
+    ]
+    return heapq.merge(*readers)
+
+
+def format_timeline_line(entry: Tuple[float, int, int, str, str, str], fmt: str = 'text') -> str:
+    """Render one merged line as text or as an NDJSON record"""
+    ts, _, _, name, level, text = entry
+    if ts == UNTIMED:
+        ts, stamp = None, None
+    else:
+        stamp = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+    if fmt == 'ndjson':
+        return json.dumps({'time': ts, 'timestamp': stamp, 'source': name, 'level': level, 'message': text},
+                          ensure_ascii=False)
+    return f"{stamp or '-':<23} {name:<10} {level.upper():<7} {text}"
+
+
+def stream_timeline(sources: Dict[str, Path], since: Optional[float] = None, until: Optional[float] = None,
+                    levels: Optional[Iterable[str]] = None, fmt: str = 'text',
+                    limit: Optional[int] = None, chunk_lines: int = TIMELINE_CHUNK_LINES) -> Iterator[str]:
+    """
+    Merged timeline rendered in chunks of chunk_lines lines, for a streamed
+    HTTP response
+
+    Yields:
+        str: Newline-terminated block of rendered lines
+    """
+    chunk: List[str] = []
+    for count, entry in enumerate(merge_timeline(sources, since, until, levels), 1):
+        chunk.append(format_timeline_line(entry, fmt))
+        if len(chunk) >= chunk_lines:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+        if limit and count >= limit:
+            break
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
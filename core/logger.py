@@ -5,6 +5,7 @@ Custom handler for Web GUI integration
 
 import sys
 import logging
+import logging.handlers
 from pathlib import Path
 
 
@@ -92,12 +93,23 @@ def setup_logging(log_file: Path) -> tuple:
         logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     )
     
+    # File handler compatible with log rotation: on Linux the file is
+    # rotated by rename and WatchedFileHandler reopens it; on Windows an
+    # open file can't be renamed, so it is rotated by copy-truncate
+    from .log_rotation import get_log_rotator, ROTATE_RENAME, ROTATE_COPY_TRUNCATE
+    if sys.platform == 'win32':
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')
+        get_log_rotator().register(log_file, ROTATE_COPY_TRUNCATE)
+    else:
+        file_handler = logging.handlers.WatchedFileHandler(log_file, encoding='utf-8')
+        get_log_rotator().register(log_file, ROTATE_RENAME)
+    
     # Setup basic config
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s - %(levelname)s - %(message)s',
         handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
+            file_handler,
             logging.StreamHandler(),
             _log_manager_handler  # Add our custom handler
         ]
@@ -0,0 +1,426 @@
+"""
+Database maintenance for 4Paws Agent
+ANALYZE TABLE and selective OPTIMIZE TABLE in configured idle windows,
+skipped while the clinic is busy and resumed in the next window
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import Config
+from .install_journal import write_json_atomic
+from .mariadb import MariaDBClient, MariaDBError
+from .tracing import trace_span
+
+logger = logging.getLogger(__name__)
+
+DAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+WINDOW = re.compile(r'^(daily|\*|mon|tue|wed|thu|fri|sat|sun)\w*\s+(\d{1,2}):(\d{2})(?:\s*-\s*(\d{1,2}):(\d{2}))?$', re.I)
+
+CHECK_INTERVAL = 60
+# Tables whose statistics are refreshed at most this often
+ANALYZE_EVERY_DAYS = 7
+# OPTIMIZE only pays off above this much reclaimable space, and not again within a month
+OPTIMIZE_MIN_FREE_MB = 16
+OPTIMIZE_EVERY_DAYS = 30
+# Rebuild speed assumed before a table has been optimized once
+OPTIMIZE_BYTES_PER_SECOND = 20 * 1048576
+ANALYZE_SECONDS_GUESS = 5
+# A plan not finished after this long is rebuilt from fresh figures
+PLAN_MAX_AGE_DAYS = 28
+RUNS_KEPT = 30
+
+ANALYZE = 'analyze'
+OPTIMIZE = 'optimize'
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def maintenance_enabled() -> bool:
+    return os.getenv('MAINTENANCE', Config.MAINTENANCE).lower() != 'off'
+
+
+def parse_windows(spec: str, default_minutes: int) -> List[Tuple[Optional[int], int, int]]:
+    """
+    Maintenance windows from "Sun 02:00, daily 03:00-04:00"
+
+    Returns:
+        list: (weekday (0 = Monday) or None for every day, start minute of
+              the day, length in minutes)
+
+    Raises:
+        ValueError: on an entry that isn't "<day> HH:MM[-HH:MM]"
+    """
+    windows = []
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        match = WINDOW.match(entry)
+        if not match:
+            raise ValueError(f"Invalid maintenance window: {entry!r} (expected e.g. 'Sun 02:00-05:00')")
+        day, hour, minute, end_hour, end_minute = match.groups()
+        start = int(hour) * 60 + int(minute)
+        if end_hour is None:
+            length = default_minutes
+        else:
+            length = (int(end_hour) * 60 + int(end_minute) - start) % 1440 or 1440
+        weekday = None if day.lower() in ('daily', '*') else DAYS.index(day.lower()[:3])
+        windows.append((weekday, start, length))
+    return windows
+
+
+def configured_windows() -> List[Tuple[Optional[int], int, int]]:
+    return parse_windows(os.getenv('MAINTENANCE_WINDOWS', Config.MAINTENANCE_WINDOWS),
+                         int(os.getenv('MAINTENANCE_WINDOW_MINUTES', Config.MAINTENANCE_WINDOW_MINUTES)))
+
+
+def _occurrences(windows, around: datetime, days: range):
+    """(start, end) of each window on the days around a time"""
+    midnight = around.replace(hour=0, minute=0, second=0, microsecond=0)
+    for offset in days:
+        day = midnight + timedelta(days=offset)
+        for weekday, start, length in windows:
+            if weekday is None or day.weekday() == weekday:
+                begin = day + timedelta(minutes=start)
+                yield begin, begin + timedelta(minutes=length)
+
+
+def current_window(windows, now: datetime) -> Optional[Tuple[datetime, datetime]]:
+    """The window now falls in (a window may run past midnight)"""
+    for begin, end in _occurrences(windows, now, range(-1, 1)):
+        if begin <= now < end:
+            return begin, end
+    return None
+
+
+def next_window(windows, now: datetime) -> Optional[Tuple[datetime, datetime]]:
+    upcoming = [w for w in _occurrences(windows, now, range(0, 8)) if w[0] > now]
+    return min(upcoming) if upcoming else None
+
+
+class MaintenanceScheduler:
+    """
+    Table maintenance in idle windows
+
+    When a window (MAINTENANCE_WINDOWS, e.g. "Sun 02:00-05:00") opens, a
+    plan is built from information_schema:
+
+    - ANALYZE TABLE for every table not analyzed in ANALYZE_EVERY_DAYS,
+      biggest first: fresh statistics are what keeps plans from
+      degrading and cost seconds
+    - OPTIMIZE TABLE for fragmented tables (DATA_FREE at least
+      MAINTENANCE_OPTIMIZE_FREE_PCT of the table and OPTIMIZE_MIN_FREE_MB, not
+      rebuilt in OPTIMIZE_EVERY_DAYS), most reclaimable space first
+
+    Tasks run one at a time. Before each one the load guard is checked
+    (backend CPU under MAINTENANCE_MAX_BACKEND_CPU, database QPS under
+    MAINTENANCE_MAX_QPS) and the task's estimated duration must fit in
+    what is left of the window; the estimate is the table's last duration
+    or, for a first OPTIMIZE, its size at OPTIMIZE_BYTES_PER_SECOND.
+    Whatever doesn't run stays pending in the saved plan and is picked up
+    in the next window (or later in the same one once load drops). Each
+    run with its per-table durations is recorded and logged.
+    """
+
+    def __init__(self, state_path: Path, client: Optional[MariaDBClient] = None,
+                 database: Optional[str] = None):
+        self.state_path = Path(state_path)
+        self.client = client or MariaDBClient()
+        self.database = database or Config.MARIADB_DB
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.running: Optional[Dict] = None
+        self.last_error: Optional[str] = None
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+
+    def load(self) -> Dict:
+        try:
+            state = json.loads(self.state_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault('plan', None)
+        state.setdefault('runs', [])
+        state.setdefault('tables', {})
+        return state
+
+    def _save(self, state: Dict):
+        write_json_atomic(self.state_path, state)
+
+    # ------------------------------------------------------------------
+    # Planning
+    # ------------------------------------------------------------------
+
+    def _table_figures(self) -> List[Dict]:
+        db = self.database.replace("'", "''")
+        rows = self.client.query(
+            "SELECT TABLE_NAME, IFNULL(ENGINE, ''), IFNULL(TABLE_ROWS, 0), IFNULL(DATA_LENGTH, 0), "
+            "IFNULL(INDEX_LENGTH, 0), IFNULL(DATA_FREE, 0) FROM information_schema.TABLES "
+            f"WHERE TABLE_SCHEMA = '{db}' AND TABLE_TYPE = 'BASE TABLE'", timeout=60)
+        return [{'table': row[0], 'engine': row[1], 'rows': int(row[2]), 'data_bytes': int(row[3]),
+                 'index_bytes': int(row[4]), 'free_bytes': int(row[5])} for row in rows]
+
+    def plan(self, state: Optional[Dict] = None) -> Dict:
+        """
+        Maintenance tasks for the tables as they are now, in run order
+
+        Returns:
+            dict: {'created', 'tasks': [{'kind', 'table', 'benefit', 'estimate', 'status'}]}
+        """
+        state = state or self.load()
+        history = state['tables']
+        now = time.time()
+        min_free_pct = float(os.getenv('MAINTENANCE_OPTIMIZE_FREE_PCT', Config.MAINTENANCE_OPTIMIZE_FREE_PCT))
+        analyze, optimize = [], []
+        for figures in self._table_figures():
+            table = figures['table']
+            if table.startswith('_prisma'):
+                continue
+            known = history.get(table, {})
+            if now - known.get('analyzed', 0) >= ANALYZE_EVERY_DAYS * 86400:
+                analyze.append({
+                    'kind': ANALYZE, 'table': table,
+                    'benefit': f"statistics for ~{figures['rows']:,} rows",
+                    'score': figures['rows'],
+                    'estimate': round(known.get('analyze_seconds', ANALYZE_SECONDS_GUESS), 1)
+                })
+            size = figures['data_bytes'] + figures['index_bytes']
+            free = figures['free_bytes']
+            if (figures['engine'].lower() in ('innodb', 'aria', 'myisam') and free >= OPTIMIZE_MIN_FREE_MB * 1048576
+                    and free * 100 >= min_free_pct * (size + free)
+                    and now - known.get('optimized', 0) >= OPTIMIZE_EVERY_DAYS * 86400):
+                speed = known.get('optimize_bytes_per_second', OPTIMIZE_BYTES_PER_SECOND)
+                optimize.append({
+                    'kind': OPTIMIZE, 'table': table,
+                    'benefit': f"{free / 1048576:.0f} MB reclaimable ({free * 100 / (size + free):.0f}%)",
+                    'score': free,
+                    'size': size,
+                    'estimate': round(max(size / speed, 1), 1)
+                })
+        tasks = sorted(analyze, key=lambda t: -t['score']) + sorted(optimize, key=lambda t: -t['score'])
+        for task in tasks:
+            task['status'] = PENDING
+        return {'created': now, 'tasks': tasks}
+
+    # ------------------------------------------------------------------
+    # Running
+    # ------------------------------------------------------------------
+
+    def _load_guard(self, load: Optional[Callable[[], Dict]]) -> Optional[str]:
+        """Why the clinic is too busy for maintenance (None if it isn't)"""
+        if load is None:
+            return None
+        figures = load()
+        max_cpu = float(os.getenv('MAINTENANCE_MAX_BACKEND_CPU', Config.MAINTENANCE_MAX_BACKEND_CPU))
+        max_qps = float(os.getenv('MAINTENANCE_MAX_QPS', Config.MAINTENANCE_MAX_QPS))
+        cpu, qps = figures.get('backend_cpu'), figures.get('qps')
+        if cpu is not None and cpu > max_cpu:
+            return f"backend CPU {cpu:.0f}% > {max_cpu:.0f}%"
+        if qps is not None and qps > max_qps:
+            return f"{qps:.1f} queries/s > {max_qps:.0f}"
+        return None
+
+    def _execute(self, task: Dict, timeout: float) -> Tuple[bool, str]:
+        statement = 'ANALYZE TABLE' if task['kind'] == ANALYZE else 'OPTIMIZE TABLE'
+        table = task['table'].replace('`', '``')
+        rows = self.client.query(f"{statement} `{table}`", database=self.database, timeout=timeout)
+        # Table, Op, Msg_type, Msg_text (InnoDB's OPTIMIZE adds a note that it recreates the table)
+        errors = [row[3] for row in rows if len(row) >= 4 and row[2].lower() == 'error']
+        messages = [row[3] for row in rows if len(row) >= 4 and row[2].lower() == 'status']
+        return not errors, '; '.join(errors or messages)
+
+    def run(self, until: datetime, load: Optional[Callable[[], Dict]] = None,
+            window: Optional[str] = None) -> Dict:
+        """
+        Work through the plan until it is done, time runs out or load rises
+
+        A pending plan from an earlier window is continued; otherwise a new
+        one is built (if the last one finished, only when it is due again).
+
+        Args:
+            until: End of the window (no task starts that wouldn't finish)
+            load: Returns {'backend_cpu': % of the machine, 'qps': ...}
+            window: Label of the window, for the run record
+
+        Returns:
+            dict: The run record ({'started', 'finished', 'tasks', 'stopped', ...})
+
+        Raises:
+            RuntimeError: if maintenance is already running
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('Maintenance is already running')
+        try:
+            return self._run(until, load, window)
+        finally:
+            self.running = None
+            self._lock.release()
+
+    def _run(self, until: datetime, load, window) -> Dict:
+        state = self.load()
+        record = {'started': time.time(), 'window': window, 'tasks': [], 'skipped': [], 'stopped': None,
+                  'resumed': False}
+        self.running = record
+        with trace_span('database maintenance', database=self.database, window=window) as span:
+            reason = self._load_guard(load)
+            record['busy'] = reason is not None
+            plan = state['plan']
+            if reason is None:
+                if plan and any(t['status'] == PENDING for t in plan['tasks']) \
+                        and time.time() - plan['created'] < PLAN_MAX_AGE_DAYS * 86400:
+                    record['resumed'] = True
+                else:
+                    plan = state['plan'] = self.plan(state)
+                    self._save(state)
+            for task in (plan['tasks'] if reason is None else []):
+                if task['status'] != PENDING:
+                    continue
+                remaining = (until - datetime.now()).total_seconds()
+                if task['estimate'] > remaining:
+                    # Too long for what is left: smaller tasks after it may still fit
+                    record['skipped'].append({'kind': task['kind'], 'table': task['table'],
+                                              'estimate': task['estimate']})
+                    continue
+                reason = self._load_guard(load)
+                if reason:
+                    record['busy'] = True
+                    break
+                started = time.monotonic()
+                try:
+                    success, message = self._execute(task, timeout=max(remaining, 60))
+                except MariaDBError as e:
+                    success, message = False, str(e)
+                seconds = round(time.monotonic() - started, 2)
+                task.update(status=DONE if success else FAILED, seconds=seconds, message=message,
+                            finished=time.time())
+                record['tasks'].append({'kind': task['kind'], 'table': task['table'],
+                                        'seconds': seconds, 'success': success, 'message': message})
+                history = state['tables'].setdefault(task['table'], {})
+                if success and task['kind'] == ANALYZE:
+                    history.update(analyzed=time.time(), analyze_seconds=seconds)
+                elif success:
+                    # The rebuild refreshes the statistics too
+                    history.update(optimized=time.time(), optimize_seconds=seconds, analyzed=time.time())
+                    if task.get('size'):
+                        history['optimize_bytes_per_second'] = max(task['size'] / max(seconds, 0.1), 1048576)
+                icon = '✅' if success else '❌'
+                logger.info(f"{icon} {task['kind'].upper()} {task['table']}: {seconds:.1f}s {message}")
+                self._save(state)
+                if self._stop.is_set():
+                    reason = 'agent stopping'
+                    break
+
+            if reason is None and record['skipped']:
+                largest = max(record['skipped'], key=lambda t: t['estimate'])
+                reason = (f"{len(record['skipped'])} task(s) don't fit the window "
+                          f"(longest {largest['kind']} {largest['table']} ~{largest['estimate']:.0f}s)")
+            record['stopped'] = reason
+            record['finished'] = time.time()
+            record['pending'] = sum(t['status'] == PENDING for t in plan['tasks']) if plan else 0
+            state['runs'] = (state['runs'] + [record])[-RUNS_KEPT:]
+            self._save(state)
+            span.set_attributes(tasks=len(record['tasks']), pending=record['pending'], stopped=reason or '')
+        took = record['finished'] - record['started']
+        summary = ', '.join(f"{t['kind']} {t['table']} {t['seconds']:.1f}s" for t in record['tasks']) or 'nothing run'
+        logger.info(f"🧹 Database maintenance {'resumed' if record['resumed'] else 'run'} in {took:.0f}s: {summary}"
+                    + (f" (stopped: {reason}; {record['pending']} task(s) left for the next window)" if reason else ''))
+        return record
+
+    def _window_done(self, state: Dict, label: str) -> bool:
+        """True once a run in this window got as far as it could (not stopped by load)"""
+        return any(run.get('window') == label and not run.get('busy') for run in state['runs'])
+
+    def start(self, can_run: Callable[[], bool], load: Optional[Callable[[], Dict]] = None,
+              check_interval: int = CHECK_INTERVAL):
+        """
+        Run maintenance in the configured windows (idempotent)
+
+        Args:
+            can_run: False postpones maintenance (MariaDB not running, an
+                install/update or a backup in progress)
+            load: Figures for the load guard (see run)
+        """
+        if self._thread or not maintenance_enabled():
+            return
+        try:
+            windows = configured_windows()
+        except ValueError as e:
+            logger.warning(f"⚠️  Database maintenance disabled: {e}")
+            self.last_error = str(e)
+            return
+        self._stop.clear()
+
+        def loop():
+            postponed = None
+            while not self._stop.wait(check_interval):
+                try:
+                    current = current_window(windows, datetime.now())
+                    if current is None:
+                        continue
+                    label = current[0].strftime('%Y-%m-%d %H:%M')
+                    if self._window_done(self.load(), label) or not can_run():
+                        continue
+                    busy = self._load_guard(load)
+                    if busy:
+                        if postponed != label:
+                            logger.info(f"⏸️  Database maintenance postponed: {busy}")
+                            postponed = label
+                        continue
+                    record = self.run(current[1], load, label)
+                    if record['busy']:
+                        # Load rose: the rest waits until it drops again
+                        self._stop.wait(10 * check_interval)
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+                    logger.warning(f"⚠️  Database maintenance failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name='db-maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def status(self) -> Dict:
+        state = self.load()
+        now = datetime.now()
+        try:
+            windows = configured_windows()
+            error = self.last_error
+        except ValueError as e:
+            windows, error = [], str(e)
+        current = current_window(windows, now)
+        upcoming = next_window(windows, now)
+        plan = state['plan']
+        return {
+            'enabled': maintenance_enabled(),
+            'windows': os.getenv('MAINTENANCE_WINDOWS', Config.MAINTENANCE_WINDOWS),
+            'in_window': current is not None,
+            'next_window': upcoming[0].timestamp() if upcoming else None,
+            'running': dict(self.running) if self.running else None,
+            'plan': plan,
+            'pending': sum(t['status'] == PENDING for t in plan['tasks']) if plan else 0,
+            'runs': list(reversed(state['runs'][-10:])),
+            'last_error': error
+        }
+
+
+_scheduler: Optional[MaintenanceScheduler] = None
+
+
+def get_maintenance() -> MaintenanceScheduler:
+    """Get the global MaintenanceScheduler (plan and run history in the writable dir)"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = MaintenanceScheduler(Config.WRITABLE_DIR / 'maintenance.json')
+    return _scheduler
@@ -0,0 +1,223 @@
+"""
+MariaDB server helpers for 4Paws Agent
+Clean shutdown through the server itself, and startup / crash recovery
+figures read from the MariaDB log
+"""
+
+import re
+import subprocess
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from .config import Config
+from .log_timeline import parse_timestamp
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# Admin client names (MariaDB 10.5+ ships both, older releases only mysqladmin)
+ADMIN_CLIENTS = ('mariadb-admin.exe', 'mysqladmin.exe', 'mariadb-admin', 'mysqladmin')
+SQL_CLIENTS = ('mysql.exe', 'mariadb.exe', 'mysql', 'mariadb')
+DUMP_CLIENTS = ('mariadb-dump.exe', 'mysqldump.exe', 'mariadb-dump', 'mysqldump')
+
+# First line mysqld writes on start ("Starting MariaDB 11.4.2-MariaDB ... as process 1234",
+# older releases "mysqld.exe (mysqld 10.4.32) starting as process 1234")
+START_MARKERS = ('Starting MariaDB', ' as process ')
+READY_MARKER = 'ready for connections'
+
+# InnoDB redo log apply / Aria log replay after an unclean stop
+RECOVERY_START_MARKERS = ('Starting crash recovery', 'Aria engine: starting recovery')
+# First line written once recovery is over
+RECOVERY_END_MARKERS = ('rollback segments are active', 'Aria engine: recovery done',
+                        'Crash recovery finished', READY_MARKER)
+RECOVERY_PAGES = re.compile(r'(?:to recover|To recover:) (\d+) pages')
+
+# Lines of the log searched for the latest start
+STARTUP_LOG_LINES = 500
+
+
+def find_client(mariadb_dir: Path, names=ADMIN_CLIENTS) -> Optional[Path]:
+    """First existing client binary in the MariaDB bin directory"""
+    for name in names:
+        candidate = Path(mariadb_dir) / 'bin' / name
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def find_mariadb_dir() -> Path:
+    """MariaDB install directory (standard path or a versioned mariadb-* folder in tools/)"""
+    if (Config.MARIADB_DIR / 'bin').exists():
+        return Config.MARIADB_DIR
+    for candidate in sorted(Config.TOOLS_DIR.glob('mariadb*'), reverse=True):
+        if (candidate / 'bin').exists():
+            return candidate
+    return Config.MARIADB_DIR
+
+
+class MariaDBError(Exception):
+    """A client command against the agent's MariaDB failed"""
+
+
+class MariaDBClient:
+    """
+    Runs the MariaDB command-line clients against the agent's server
+
+    The agent has no Python database driver; queries go through mysql.exe
+    in batch mode (-N -B: tab-separated rows, no headers) and dumps through
+    mariadb-dump. The server runs with --skip-grant-tables, so root needs
+    no password.
+    """
+
+    def __init__(self, mariadb_dir: Optional[Path] = None, port: Optional[int] = None,
+                 user: Optional[str] = None):
+        self._mariadb_dir = Path(mariadb_dir) if mariadb_dir else None
+        self.port = port or Config.MARIADB_PORT
+        self.user = user or Config.MARIADB_USER
+
+    @property
+    def mariadb_dir(self) -> Path:
+        return self._mariadb_dir or find_mariadb_dir()
+
+    def command(self, names, *args: str) -> List[str]:
+        """Argument list for a client binary (first of names found) with connection options"""
+        client = find_client(self.mariadb_dir, names)
+        if client is None:
+            raise MariaDBError(f"{names[0]} not found in {self.mariadb_dir / 'bin'}")
+        return [str(client), '-u', self.user, '-P', str(self.port), '--protocol=TCP', *args]
+
+    def query(self, sql: str, database: Optional[str] = None, timeout: float = 60) -> List[List[str]]:
+        """
+        Run SQL and return the rows of its last result set
+
+        Raises:
+            MariaDBError: if the client is missing or the statement fails
+        """
+        args = self.command(SQL_CLIENTS, '-N', '-B', '--default-character-set=utf8mb4')
+        if database:
+            args.append(database)
+        try:
+            result = subprocess.run(args + ['-e', sql], capture_output=True, text=True, encoding='utf-8',
+                                    errors='replace', timeout=timeout,
+                                    creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise MariaDBError(str(e))
+        if result.returncode != 0:
+            raise MariaDBError(result.stderr.strip() or f"exit code {result.returncode}")
+        return [line.split('\t') for line in result.stdout.splitlines()]
+
+    def is_available(self) -> bool:
+        """True if the server answers"""
+        try:
+            self.query('SELECT 1', timeout=5)
+            return True
+        except MariaDBError:
+            return False
+
+
+def request_shutdown(mariadb_dir: Path, port: int, user: str, timeout: float = 10) -> bool:
+    """
+    Ask the server to shut down cleanly (mariadb-admin shutdown, else SQL SHUTDOWN)
+
+    The server flushes the buffer pool and writes a checkpoint before it
+    exits, so the next start needs no crash recovery. Only the request is
+    sent here; the caller waits for the process to exit.
+
+    Returns:
+        bool: True if the server accepted the request
+    """
+    creationflags = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+    attempts = []
+    admin = find_client(mariadb_dir, ADMIN_CLIENTS)
+    if admin:
+        attempts.append([str(admin), '-u', user, '-P', str(port), '--protocol=TCP', 'shutdown'])
+    client = find_client(mariadb_dir, SQL_CLIENTS)
+    if client:
+        attempts.append([str(client), '-u', user, '-P', str(port), '--protocol=TCP', '-e', 'SHUTDOWN;'])
+
+    for args in attempts:
+        try:
+            result = subprocess.run(args, capture_output=True, text=True, timeout=timeout,
+                                    creationflags=creationflags)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.debug(f"{Path(args[0]).name} shutdown failed: {e}")
+            continue
+        if result.returncode == 0:
+            return True
+        logger.debug(f"{Path(args[0]).name} shutdown returned {result.returncode}: {result.stderr.strip()}")
+    return False
+
+
+def latest_start(lines: Iterable[str]) -> List[str]:
+    """Log lines from the most recent mysqld start on"""
+    lines = list(lines)
+    for index in range(len(lines) - 1, -1, -1):
+        if any(marker in lines[index] for marker in START_MARKERS):
+            return lines[index:]
+    return lines
+
+
+def parse_startup(lines: Iterable[str]) -> Dict:
+    """
+    Startup and crash recovery figures of the latest start in a MariaDB log
+
+    Timestamps in the log have 1 s resolution, so short recoveries show
+    as 0 or 1 s.
+
+    Returns:
+        dict: {'crash_recovery': bool, 'recovery_seconds', 'recovered_pages',
+               'startup_seconds' (start line to "ready for connections"),
+               'ready': bool}
+    """
+    started = recovery_start = recovery_end = ready_at = None
+    pages = 0
+    ready = False
+    for line in latest_start(lines):
+        ts = parse_timestamp(line)
+        if started is None and ts is not None:
+            started = ts
+        if recovery_start is None and any(marker in line for marker in RECOVERY_START_MARKERS):
+            recovery_start = ts if ts is not None else started
+        elif recovery_start is not None and recovery_end is None and \
+                any(marker in line for marker in RECOVERY_END_MARKERS):
+            recovery_end = ts
+        match = RECOVERY_PAGES.search(line)
+        if match:
+            pages = max(pages, int(match.group(1)))
+        if READY_MARKER in line:
+            ready = True
+            ready_at = ts
+            break
+
+    recovery_seconds = None
+    if recovery_start is not None and recovery_end is not None:
+        recovery_seconds = max(recovery_end - recovery_start, 0.0)
+    return {
+        'crash_recovery': recovery_start is not None,
+        'recovery_seconds': recovery_seconds,
+        'recovered_pages': pages,
+        'startup_seconds': max(ready_at - started, 0.0) if started is not None and ready_at is not None else None,
+        'ready': ready
+    }
+
+
+def startup_history(limit: int = 20) -> List[Dict]:
+    """
+    Recent MariaDB starts and stops from the span history, newest first
+
+    Starts are 'start_mariadb' spans (with the recovery figures as
+    attributes), stops are 'mariadb shutdown' spans ('clean' attribute).
+    """
+    events = []
+    for span in get_tracer().iter_history():
+        if span.get('name') not in ('start_mariadb', 'mariadb shutdown'):
+            continue
+        events.append({
+            'event': 'start' if span['name'] == 'start_mariadb' else 'shutdown',
+            'time': span.get('start'),
+            'duration': span.get('duration'),
+            'status': span.get('status'),
+            **(span.get('attributes') or {})
+        })
+    return list(reversed(events[-limit:]))
@@ -0,0 +1,791 @@
+"""
+Front proxy for 4Paws Agent
+The agent owns the public frontend/backend ports and forwards HTTP to the
+app instance that is currently live. A new instance starts on an internal
+port, passes a health check and takes over with one switch while requests
+still running on the old one finish; with no live instance a maintenance
+page is served from memory. In lazy mode an idle app is stopped and
+started again by the first request that arrives for it
+"""
+
+import os
+import json
+import time
+import zlib
+import socket
+import asyncio
+import contextvars
+import logging
+import threading
+import http.client
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .config import Config
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# Largest request/response head accepted (request line + headers)
+HEAD_LIMIT = 64 * 1024
+
+READ_CHUNK = 64 * 1024
+
+# Request bodies up to this size are buffered, so a request whose pooled
+# upstream connection turns out to be closed can be resent on a new one
+RETRY_BODY_LIMIT = 1024 * 1024
+
+# Idle pooled connections older than this are not reused. Node closes idle
+# keep-alive sockets after 5 s, so reusing one near that age races the close
+POOL_IDLE_TIMEOUT = 4.0
+
+# While the public port is taken (installation / license page, a leftover
+# process) the proxy retries binding this often
+BIND_RETRY_INTERVAL = 1.0
+
+# Headers that describe one connection and are not forwarded
+HOP_BY_HOP = ('connection', 'keep-alive', 'proxy-connection')
+
+# Requests under this path stick to one upstream per client address
+STICKY_PATH = '/socket.io/'
+
+# Seconds between idle checks of a lazily started app
+IDLE_CHECK_INTERVAL = 15.0
+
+# Cold starts kept for status / the dashboard
+COLD_START_HISTORY = 20
+
+# Maintenance pages served while a service has no live instance
+MAINTENANCE_PAGES = {
+    'frontend': 'update_loading.html',
+    'backend': 'update_loading_backend.html'
+}
+
+Headers = List[Tuple[str, str]]
+
+
+class ProxyError(Exception):
+    """Malformed request; answered with the given status before closing"""
+
+    def __init__(self, status: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+def _header(headers: Headers, name: str) -> Optional[str]:
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _connection_tokens(headers: Headers) -> List[str]:
+    value = _header(headers, 'connection') or ''
+    return [token.strip().lower() for token in value.split(',') if token.strip()]
+
+
+def _keep_alive(version: str, headers: Headers) -> bool:
+    tokens = _connection_tokens(headers)
+    if version == 'HTTP/1.0':
+        return 'keep-alive' in tokens
+    return 'close' not in tokens
+
+
+def _content_length(headers: Headers) -> Optional[int]:
+    value = _header(headers, 'content-length')
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ProxyError(400, 'Bad Request')
+
+
+def _chunked(headers: Headers) -> bool:
+    return 'chunked' in (_header(headers, 'transfer-encoding') or '').lower()
+
+
+def _status(status_line: str) -> int:
+    parts = status_line.split(' ', 2)
+    return int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 502
+
+
+def _encode_head(start_line: str, headers: Headers) -> bytes:
+    lines = [start_line] + [f"{key}: {value}" for key, value in headers]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def read_head(reader: asyncio.StreamReader) -> Optional[Tuple[str, Headers]]:
+    """Read a request/response head; None if the peer closed before sending one"""
+    try:
+        data = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise ProxyError(400, 'Bad Request')
+        return None
+    except asyncio.LimitOverrunError:
+        raise ProxyError(431, 'Request Header Fields Too Large')
+
+    lines = data.decode('latin-1').split('\r\n')
+    headers: Headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        key, sep, value = line.partition(':')
+        if not sep:
+            raise ProxyError(400, 'Bad Request')
+        headers.append((key.strip(), value.strip()))
+    return lines[0], headers
+
+
+async def copy_body(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                    length: Optional[int], chunked: bool, until_eof: bool = False):
+    """Copy a message body unchanged (chunk framing included)"""
+    if chunked:
+        while True:
+            size_line = await reader.readuntil(b'\r\n')
+            writer.write(size_line)
+            size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                # Trailers, up to the empty line
+                while True:
+                    line = await reader.readuntil(b'\r\n')
+                    writer.write(line)
+                    if line == b'\r\n':
+                        break
+                break
+            remaining = size + 2  # Data + CRLF
+            while remaining:
+                chunk = await reader.read(min(remaining, READ_CHUNK))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                writer.write(chunk)
+                remaining -= len(chunk)
+                await writer.drain()
+    elif length:
+        remaining = length
+        while remaining:
+            chunk = await reader.read(min(remaining, READ_CHUNK))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b'', remaining)
+            writer.write(chunk)
+            remaining -= len(chunk)
+            await writer.drain()
+    elif until_eof:
+        while True:
+            chunk = await reader.read(READ_CHUNK)
+            if not chunk:
+                break
+            writer.write(chunk)
+            await writer.drain()
+    await writer.drain()
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            chunk = await reader.read(READ_CHUNK)
+            if not chunk:
+                break
+            writer.write(chunk)
+            await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+class _NullWriter:
+    """Sink for request bodies nobody will read (maintenance responses)"""
+
+    def write(self, data: bytes):
+        pass
+
+    async def drain(self):
+        pass
+
+
+class Upstream:
+    """
+    One app instance behind the proxy, with a pool of idle keep-alive
+    connections to it
+
+    Only touched from the proxy's event loop, except in_flight which other
+    threads read while draining.
+    """
+
+    def __init__(self, port: int, pool_size: int):
+        self.port = port
+        self.pool_size = pool_size
+        self.idle: Deque[Tuple[asyncio.StreamReader, asyncio.StreamWriter, float]] = deque()
+        self.in_flight = 0
+        self.requests = 0
+        self.connections_opened = 0
+        self.healthy = True
+        self.closed = False
+        self.since = time.time()
+
+    async def acquire(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        """A pooled connection if a fresh one is idle, else a new one; returns (reader, writer, reused)"""
+        now = time.monotonic()
+        while self.idle:
+            reader, writer, idle_since = self.idle.pop()  # Most recently used first
+            if now - idle_since < POOL_IDLE_TIMEOUT and not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port, limit=HEAD_LIMIT)
+        self.connections_opened += 1
+        return reader, writer, False
+
+    def release(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, reusable: bool):
+        if reusable and not self.closed and len(self.idle) < self.pool_size:
+            self.idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    def close(self):
+        self.closed = True
+        while self.idle:
+            self.idle.pop()[1].close()
+
+    def to_dict(self) -> Dict:
+        return {
+            'port': self.port,
+            'healthy': self.healthy,
+            'in_flight': self.in_flight,
+            'idle_connections': len(self.idle),
+            'connections_opened': self.connections_opened,
+            'requests': self.requests,
+            'since': self.since
+        }
+
+
+class ServiceProxy:
+    """
+    HTTP/1.1 reverse proxy owning one public port
+
+    The upstream is picked per request, so switch() / add() / remove()
+    take effect for the next request on every client connection while
+    requests already running finish on the old upstream (see drain()).
+    With several upstreams (backend cluster) the healthy one with the
+    fewest requests in flight wins; socket.io traffic sticks to one
+    upstream per client address since its polling transport keeps session
+    state in the process. WebSocket and other Upgrade requests are
+    tunnelled on their own connection.
+    """
+
+    def __init__(self, name: str, port: int, maintenance_page: Optional[Path] = None,
+                 pool_size: int = 32, host: str = ''):
+        self.name = name
+        self.port = port
+        self.host = host
+        self.pool_size = pool_size
+        self.upstreams: List[Upstream] = []
+        self.retired: List[Upstream] = []
+        self.maintenance_html = self._load_page(maintenance_page)
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.bound = threading.Event()
+        self.stats = {'requests': 0, 'maintenance': 0, 'upstream_errors': 0, 'switches': 0}
+        self._rotation = 0
+        # Lazy mode (see enable_activation)
+        self.activate: Optional[Callable[[], bool]] = None
+        self.deactivate: Optional[Callable[[], bool]] = None
+        self.idle_timeout = 0.0
+        self.hold_timeout = 0.0
+        self.parked = False
+        self.last_activity = time.time()
+        self.cold_starts: Deque[Dict] = deque(maxlen=COLD_START_HISTORY)
+        self._activation: Optional[asyncio.Future] = None
+        self._cold_start: Optional[Dict] = None
+
+    @staticmethod
+    def _load_page(path: Optional[Path]) -> bytes:
+        try:
+            if path:
+                return path.read_bytes()
+        except OSError as e:
+            logger.warning(f"⚠️  Maintenance page not found: {e}")
+        return (b"<!DOCTYPE html><html><head><meta http-equiv='refresh' content='5'></head>"
+                b"<body><h1>4Paws is updating</h1><p>This page reloads automatically.</p></body></html>")
+
+    # --- Control (any thread) -------------------------------------------------
+
+    def start(self):
+        """Start listening (in the background; retries while the port is taken)"""
+        if self.loop is not None:
+            return
+        self.loop = _get_loop()
+        asyncio.run_coroutine_threadsafe(self._serve(), self.loop)
+
+    def switch(self, port: Optional[int]) -> List[Upstream]:
+        """
+        Send new requests to the instance on port only (None: maintenance page)
+
+        Returns the previous upstreams, to be drained.
+        """
+        old, self.upstreams = self.upstreams, [Upstream(port, self.pool_size)] if port else []
+        self.stats['switches'] += 1
+        if port:
+            self.parked = False
+        self.retired.extend(old)
+        logger.info(f"🔀 {self.name} proxy :{self.port} → "
+                    f"{f'instance on :{port}' if port else 'maintenance page'}")
+        return old
+
+    def add(self, port: int) -> Upstream:
+        """Put another instance into rotation (cluster worker)"""
+        upstream = Upstream(port, self.pool_size)
+        self.upstreams = self.upstreams + [upstream]
+        self.parked = False
+        logger.info(f"➕ {self.name} proxy :{self.port} → also instance on :{port}")
+        return upstream
+
+    def remove(self, upstream: Upstream) -> Upstream:
+        """Take an instance out of rotation; returns it, to be drained"""
+        if upstream in self.upstreams:
+            self.upstreams = [u for u in self.upstreams if u is not upstream]
+            self.retired.append(upstream)
+        return upstream
+
+    def drain(self, upstreams: List[Upstream], timeout: float) -> bool:
+        """Wait until requests on switched-out upstreams have finished, then close their pools"""
+        deadline = time.time() + timeout
+        while any(u.in_flight > 0 for u in upstreams) and time.time() < deadline:
+            time.sleep(0.1)
+        drained = True
+        for upstream in upstreams:
+            if upstream.in_flight > 0:
+                drained = False
+                logger.warning(f"⚠️  {upstream.in_flight} request(s) still running on :{upstream.port} after {timeout}s")
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(upstream.close)
+            if upstream in self.retired:
+                self.retired.remove(upstream)
+        return drained
+
+    def enable_activation(self, activate: Callable[[], bool], deactivate: Callable[[], bool],
+                          idle_timeout: float, hold_timeout: float):
+        """
+        Lazy mode: once the app has had no request (and no open WebSocket)
+        for idle_timeout seconds, deactivate() stops it and the proxy parks.
+        The first request to a parked proxy calls activate() (in a worker
+        thread) and is held - with any requests arriving meanwhile - for up
+        to hold_timeout seconds until the app is up. An explicit stop or an
+        update leaves the proxy unparked, so those get the maintenance page.
+
+        activate() returns whether the app started; deactivate() returns
+        False to skip this round (e.g. during an update).
+        """
+        first = self.activate is None
+        self.activate, self.deactivate = activate, deactivate
+        self.idle_timeout, self.hold_timeout = idle_timeout, hold_timeout
+        if first:
+            self.start()
+            asyncio.run_coroutine_threadsafe(self._idle_watch(), self.loop)
+
+    def park(self):
+        """Mark the app as stopped for idleness (next request starts it)"""
+        self.parked = True
+        logger.info(f"💤 {self.name} idle, stopped until the next request on :{self.port}")
+
+    @property
+    def idle_seconds(self) -> float:
+        if any(u.in_flight for u in self.upstreams):
+            return 0.0
+        return time.time() - self.last_activity
+
+    def status(self) -> Dict:
+        status = {
+            'name': self.name,
+            'port': self.port,
+            'listening': self.bound.is_set(),
+            'upstreams': [upstream.to_dict() for upstream in self.upstreams],
+            'draining': [old.to_dict() for old in self.retired],
+            **self.stats
+        }
+        if self.activate is not None:
+            status['lazy'] = {
+                'parked': self.parked,
+                'idle_seconds': round(self.idle_seconds),
+                'idle_timeout': self.idle_timeout,
+                'cold_starts': list(self.cold_starts)
+            }
+        return status
+
+    def _pick(self, client_ip: str, target: str) -> Optional[Upstream]:
+        """Least-connections choice among healthy upstreams (ties rotate)"""
+        candidates = [u for u in self.upstreams if u.healthy]
+        if len(candidates) <= 1:
+            return candidates[0] if candidates else None
+        if STICKY_PATH in target:
+            return candidates[zlib.crc32(client_ip.encode()) % len(candidates)]
+        self._rotation += 1
+        count = len(candidates)
+        return min((candidates[(self._rotation + i) % count] for i in range(count)),
+                   key=lambda u: u.in_flight)
+
+    # --- Event loop -------------------------------------------------------------
+
+    async def _serve(self):
+        warned = False
+        while self.server is None:
+            try:
+                # asyncio's default reuse_address (POSIX only) keeps a bind on
+                # Windows from sharing a port another process listens on
+                self.server = await asyncio.start_server(self._handle, self.host or None, self.port,
+                                                         limit=HEAD_LIMIT)
+            except OSError as e:
+                if not warned:
+                    logger.info(f"ℹ️  Port {self.port} busy ({e}), {self.name} proxy will take it over when free")
+                    warned = True
+                await asyncio.sleep(BIND_RETRY_INTERVAL)
+        self.bound.set()
+        logger.info(f"🛡️  {self.name} proxy listening on :{self.port}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info('peername')
+        client_ip = peer[0] if peer else '127.0.0.1'
+        try:
+            while True:
+                try:
+                    head = await read_head(reader)
+                except ProxyError as e:
+                    await self._send_simple(writer, e.status, e.reason, keep_alive=False)
+                    break
+                if head is None:
+                    break
+                request_line, headers = head
+                parts = request_line.split(' ')
+                if len(parts) != 3:
+                    await self._send_simple(writer, 400, 'Bad Request', keep_alive=False)
+                    break
+                method, target, version = parts
+                keep_alive = _keep_alive(version, headers)
+                self.stats['requests'] += 1
+
+                self.last_activity = time.time()
+                upstream = self._pick(client_ip, target)
+                cold_start = None
+                if upstream is None and self.parked and self.activate is not None:
+                    upstream, cold_start = await self._wait_activation(client_ip, target)
+                if upstream is None:
+                    await self._discard_body(reader, headers)
+                    await self._send_maintenance(writer, headers, keep_alive)
+                elif 'upgrade' in _connection_tokens(headers):
+                    upstream.in_flight += 1
+                    try:
+                        await self._tunnel(reader, writer, upstream, request_line, headers, client_ip)
+                    finally:
+                        upstream.in_flight -= 1
+                    break
+                else:
+                    upstream.in_flight += 1
+                    upstream.requests += 1
+                    try:
+                        keep_alive = await self._forward(reader, writer, upstream, method, request_line,
+                                                         headers, client_ip, keep_alive, cold_start)
+                    finally:
+                        upstream.in_flight -= 1
+                if not keep_alive:
+                    break
+        except (ConnectionError, OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        except Exception as e:
+            logger.debug(f"{self.name} proxy connection error: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _forward_headers(headers: Headers, client_ip: str, connection: str) -> Headers:
+        hop = set(HOP_BY_HOP) | set(_connection_tokens(headers))
+        out = [(key, value) for key, value in headers if key.lower() not in hop]
+        forwarded_for = _header(headers, 'x-forwarded-for')
+        out = [(key, value) for key, value in out if key.lower() != 'x-forwarded-for']
+        out.append(('X-Forwarded-For', f"{forwarded_for}, {client_ip}" if forwarded_for else client_ip))
+        if _header(headers, 'x-forwarded-proto') is None:
+            out.append(('X-Forwarded-Proto', 'http'))
+        if _header(headers, 'host') and _header(headers, 'x-forwarded-host') is None:
+            out.append(('X-Forwarded-Host', _header(headers, 'host')))
+        out.append(('Connection', connection))
+        return out
+
+    async def _forward(self, reader, writer, upstream: Upstream, method: str, request_line: str,
+                       headers: Headers, client_ip: str, keep_alive: bool,
+                       cold_start: Optional[Dict] = None) -> bool:
+        """
+        Forward one request on a pooled connection; returns whether the client
+        connection stays open. For the request that triggered a cold start the
+        time to its first response byte is recorded.
+        """
+        length = _content_length(headers)
+        chunked = _chunked(headers)
+        head = _encode_head(request_line, self._forward_headers(headers, client_ip, 'keep-alive'))
+
+        # Small bodies are buffered so the request can be resent
+        body = b''
+        if not chunked and length:
+            body = await reader.readexactly(length) if length <= RETRY_BODY_LIMIT else None
+        retryable = body is not None and not chunked
+
+        response = None
+        for attempt in range(2):
+            try:
+                up_reader, up_writer, reused = await upstream.acquire()
+            except OSError:
+                break
+            try:
+                up_writer.write(head)
+                if body:
+                    up_writer.write(body)
+                elif body is None or chunked:
+                    await copy_body(reader, up_writer, length, chunked)
+                await up_writer.drain()
+                response = await read_head(up_reader)
+                # Interim responses (100 Continue) go straight to the client
+                while response and 100 <= _status(response[0]) < 200 and _status(response[0]) != 101:
+                    writer.write(_encode_head(*response))
+                    response = await read_head(up_reader)
+                if response is None:
+                    raise ConnectionResetError('upstream closed the connection')
+                break
+            except (OSError, asyncio.IncompleteReadError, ProxyError):
+                up_writer.close()
+                response = None
+                # A reused keep-alive connection may have been closed by the app
+                if not (reused and retryable and attempt == 0):
+                    break
+
+        if response is None:
+            self.stats['upstream_errors'] += 1
+            if not retryable:
+                keep_alive = False  # Part of the body may be unread
+            await self._send_simple(writer, 502, 'Bad Gateway', keep_alive)
+            return keep_alive
+
+        status_line, response_headers = response
+        status = _status(status_line)
+        response_length = _content_length(response_headers)
+        response_chunked = _chunked(response_headers)
+        no_body = method == 'HEAD' or status in (204, 304) or 100 <= status < 200
+        until_eof = not no_body and not response_chunked and response_length is None
+        if until_eof:
+            keep_alive = False  # Body ends when the connection does
+
+        out_headers = [(key, value) for key, value in response_headers
+                       if key.lower() not in set(HOP_BY_HOP) | set(_connection_tokens(response_headers))]
+        out_headers.append(('Connection', 'keep-alive' if keep_alive else 'close'))
+        writer.write(_encode_head(status_line, out_headers))
+        if cold_start is not None:
+            self._finish_cold_start(cold_start, True)
+        try:
+            if not no_body:
+                await copy_body(up_reader, writer, response_length, response_chunked, until_eof)
+            else:
+                await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            up_writer.close()
+            raise
+        reusable = not until_eof and _keep_alive(status_line.split(' ', 1)[0], response_headers)
+        upstream.release(up_reader, up_writer, reusable)
+        return keep_alive
+
+    async def _tunnel(self, reader, writer, upstream: Upstream, request_line: str,
+                      headers: Headers, client_ip: str):
+        """Upgrade request (WebSocket): dedicated upstream connection, bytes piped both ways"""
+        try:
+            up_reader, up_writer = await asyncio.open_connection('127.0.0.1', upstream.port, limit=HEAD_LIMIT)
+        except OSError:
+            self.stats['upstream_errors'] += 1
+            await self._send_simple(writer, 502, 'Bad Gateway', keep_alive=False)
+            return
+        out = self._forward_headers(headers, client_ip, _header(headers, 'connection') or 'Upgrade')
+        upgrade = _header(headers, 'upgrade')
+        if upgrade:
+            out.append(('Upgrade', upgrade))
+        up_writer.write(_encode_head(request_line, out))
+        await asyncio.gather(_pipe(reader, up_writer), _pipe(up_reader, writer))
+
+    # --- Lazy mode (event loop) ---------------------------------------------
+
+    async def _wait_activation(self, client_ip: str, target: str) -> Tuple[Optional[Upstream], Optional[Dict]]:
+        """
+        Hold a request until the parked app is up; returns its upstream and,
+        for the request that triggered the start, the cold start record
+        """
+        cold_start = None
+        if self._activation is None:
+            cold_start = {'time': time.time(), 'arrived': time.monotonic(), 'held': 0}
+            self._activation, self._cold_start = self.loop.create_future(), cold_start
+            # Own context: the span started in the worker thread stays out of the loop's
+            self.loop.run_in_executor(None, contextvars.copy_context().run,
+                                      self._run_activation, self._activation, cold_start)
+            logger.info(f"⚡ Request for {self.name} on :{self.port}, starting it")
+        else:
+            self._cold_start['held'] += 1
+        activation = self._activation
+        try:
+            await asyncio.wait_for(asyncio.shield(activation), self.hold_timeout)
+        except asyncio.TimeoutError:
+            pass
+        upstream = self._pick(client_ip, target)
+        if cold_start is not None and upstream is None:
+            self._finish_cold_start(cold_start, False)
+            cold_start = None
+        return upstream, cold_start
+
+    def _run_activation(self, activation: asyncio.Future, cold_start: Dict):
+        """Worker thread: start the app inside a 'cold start' span (ended at the first byte)"""
+        cold_start['span'] = get_tracer().start_span('cold start', {'service': self.name})
+        try:
+            started = bool(self.activate())
+        except Exception as e:
+            logger.error(f"❌ Starting {self.name} on demand failed: {e}")
+            started = False
+        cold_start['startup'] = round(time.monotonic() - cold_start['arrived'], 3)
+
+        def done():
+            self._activation = self._cold_start = None
+            if not started:
+                # Don't retry on every request: show the maintenance page until started manually
+                self.parked = False
+            if not activation.done():
+                activation.set_result(started)
+        self.loop.call_soon_threadsafe(done)
+
+    def _finish_cold_start(self, cold_start: Dict, success: bool):
+        """Record a cold start once its first request got its first byte (or failed)"""
+        span = cold_start.pop('span', None)
+        arrived = cold_start.pop('arrived')
+        cold_start['success'] = success
+        cold_start['ttfb'] = round(time.monotonic() - arrived, 3) if success else None
+        self.cold_starts.append(cold_start)
+        if success:
+            logger.info(f"⚡ {self.name.capitalize()} cold start: first byte after {cold_start['ttfb']:.2f}s "
+                        f"(startup {cold_start.get('startup', 0):.2f}s, {cold_start['held']} more request(s) held)")
+        if span is not None:
+            span.set_attributes(ttfb=cold_start['ttfb'], startup=cold_start.get('startup'), held=cold_start['held'])
+            get_tracer().end_span(span, success, None if success else f'{self.name} did not start')
+
+    async def _idle_watch(self):
+        """Stop the app after idle_timeout without requests"""
+        while True:
+            await asyncio.sleep(IDLE_CHECK_INTERVAL)
+            if self.parked or not self.upstreams or self._activation is not None:
+                continue
+            if self.idle_seconds < self.idle_timeout:
+                continue
+            logger.info(f"💤 No requests to {self.name} for {self.idle_seconds / 60:.0f} min, stopping it")
+            try:
+                stopped = await self.loop.run_in_executor(None, self.deactivate)
+            except Exception as e:
+                logger.warning(f"⚠️  Idle stop of {self.name} failed: {e}")
+                stopped = False
+            if stopped:
+                self.park()
+            else:
+                self.last_activity = time.time()  # Try again after another idle period
+
+    @staticmethod
+    async def _discard_body(reader: asyncio.StreamReader, headers: Headers):
+        length = _content_length(headers)
+        if _chunked(headers) or length:
+            await copy_body(reader, _NullWriter(), length, _chunked(headers))
+
+    async def _send_maintenance(self, writer: asyncio.StreamWriter, headers: Headers, keep_alive: bool):
+        self.stats['maintenance'] += 1
+        accept = (_header(headers, 'accept') or '').lower()
+        if 'application/json' in accept and 'text/html' not in accept:
+            body = json.dumps({'error': f'{self.name} is restarting or updating', 'retry_after': 5}).encode()
+            content_type = 'application/json'
+        else:
+            body = self.maintenance_html
+            content_type = 'text/html; charset=utf-8'
+        writer.write(_encode_head('HTTP/1.1 503 Service Unavailable', [
+            ('Content-Type', content_type),
+            ('Content-Length', str(len(body))),
+            ('Cache-Control', 'no-store'),
+            ('Retry-After', '5'),
+            ('Connection', 'keep-alive' if keep_alive else 'close')
+        ]) + body)
+        await writer.drain()
+
+    @staticmethod
+    async def _send_simple(writer: asyncio.StreamWriter, status: int, reason: str, keep_alive: bool):
+        body = f"{status} {reason}\n".encode()
+        writer.write(_encode_head(f'HTTP/1.1 {status} {reason}', [
+            ('Content-Type', 'text/plain'),
+            ('Content-Length', str(len(body))),
+            ('Connection', 'keep-alive' if keep_alive else 'close')
+        ]) + body)
+        await writer.drain()
+
+
+def free_port() -> int:
+    """An unused local port for an internal app instance"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def check_health(port: int, path: str = '/', timeout: float = 2.0) -> bool:
+    """An instance is healthy once it answers path with a non-5xx status"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request('GET', path, headers={'User-Agent': '4paws-agent-healthcheck'})
+        return conn.getresponse().status < 500
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        conn.close()
+
+
+def wait_healthy(port: int, path: str = '/', timeout: float = 90, process=None) -> bool:
+    """Poll an instance's health check; gives up early if its process exits"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        if check_health(port, path):
+            return True
+        time.sleep(0.5)
+    return False
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_proxies: Dict[str, ServiceProxy] = {}
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Event loop shared by all proxies, on its own thread"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='service-proxy', daemon=True).start()
+        return _loop
+
+
+def get_service_proxy(name: str) -> ServiceProxy:
+    """Get the proxy of 'frontend' or 'backend' (created on first use, not started)"""
+    with _loop_lock:
+        if name not in _proxies:
+            port = Config.FRONTEND_PORT if name == 'frontend' else Config.BACKEND_PORT
+            page = Path(__file__).parent.parent / MAINTENANCE_PAGES[name]
+            pool_size = int(os.getenv('PROXY_POOL_SIZE', Config.PROXY_POOL_SIZE))
+            _proxies[name] = ServiceProxy(name, port, page, pool_size)
+        return _proxies[name]
+
+
+def proxy_enabled() -> bool:
+    """Whether the agent fronts the app ports (SERVICE_PROXY=on)"""
+    return os.getenv('SERVICE_PROXY', Config.SERVICE_PROXY) == 'on'
+
+
+def lazy_start_enabled() -> bool:
+    """Whether idle apps are stopped and started on the next request (LAZY_START=on)"""
+    return proxy_enabled() and os.getenv('LAZY_START', Config.LAZY_START) == 'on'
@@ -0,0 +1,267 @@
+"""
+Migration rehearsal for 4Paws Agent
+Runs a release's pending Prisma migrations against a scratch copy of the
+database while the clinic keeps working, and predicts the update's downtime
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+import zipfile
+import threading
+from pathlib import Path
+from statistics import median
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+from .config import Config
+from .install_journal import write_json_atomic
+from .backup import DatabaseBackups, get_backups
+from .mariadb import MariaDBClient, MariaDBError
+from .tracing import trace_span, get_tracer
+
+logger = logging.getLogger(__name__)
+
+CLONE_SUFFIX = '_rehearsal'
+# Free disk space needed for the clone, relative to the backup's raw size
+CLONE_SPACE_FACTOR = 1.5
+# Recent update downtimes the restart overhead is taken from
+BASELINE_UPDATES = 5
+
+
+def scratch_database_url(database_url: str, database: str) -> str:
+    """The same connection URL, pointed at another database"""
+    parts = urlsplit(database_url)
+    return urlunsplit((parts.scheme, parts.netloc, f"/{database}", parts.query, parts.fragment))
+
+
+def extract_prisma_dir(zip_path: Path, target: Path) -> Path:
+    """
+    Extract only the prisma/ directory (schema and migrations) of a release archive
+
+    Returns:
+        Path: The extracted prisma directory
+
+    Raises:
+        ValueError: if the archive has no prisma/schema.prisma
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        names = archive.namelist()
+        schema = min((n for n in names if n.replace('\\', '/').endswith('prisma/schema.prisma')),
+                     key=len, default=None)
+        if schema is None:
+            raise ValueError(f"{zip_path.name} has no prisma/schema.prisma")
+        prefix = schema[:-len('schema.prisma')]
+        if target.exists():
+            shutil.rmtree(target)
+        for name in names:
+            if not name.startswith(prefix) or name.endswith('/'):
+                continue
+            relative = Path(name[len(prefix):])
+            if '..' in relative.parts:
+                continue
+            destination = target / relative
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            with archive.open(name) as source, open(destination, 'wb') as out:
+                shutil.copyfileobj(source, out)
+    return target
+
+
+class MigrationRehearsal:
+    """
+    Pending migrations run against a copy of the database
+
+    The copy is the newest backup if it is at most
+    MIGRATION_REHEARSAL_BACKUP_HOURS old, otherwise a new one, restored
+    into <database>_rehearsal with the backups' parallel per-table
+    loading. The release's migrations are then applied to it with
+    `prisma migrate deploy`. Prisma records when each migration started
+    and finished in _prisma_migrations, which gives per-migration
+    durations; a failing migration is reported with Prisma's log. The
+    copy is dropped afterwards.
+
+    The predicted downtime is the rehearsed migration time plus the
+    update overhead that isn't migrations (stop, swap, snapshot, restart):
+    the median of recent measured update downtimes minus their migration
+    spans.
+    """
+
+    def __init__(self, state_path: Path, work_dir: Path, backups: Optional[DatabaseBackups] = None,
+                 client: Optional[MariaDBClient] = None, database: Optional[str] = None):
+        self.state_path = Path(state_path)
+        self.work_dir = Path(work_dir)
+        self.backups = backups or get_backups()
+        self.client = client or MariaDBClient()
+        self.database = database or Config.MARIADB_DB
+        self._lock = threading.Lock()
+        self.running: Optional[Dict] = None
+
+    @property
+    def clone_database(self) -> str:
+        return f"{self.database}{CLONE_SUFFIX}"
+
+    def load(self) -> Optional[Dict]:
+        """The last rehearsal result"""
+        try:
+            return json.loads(self.state_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    # ------------------------------------------------------------------
+    # Steps
+    # ------------------------------------------------------------------
+
+    def _clone(self) -> Dict:
+        """Restore a recent (or new) backup into the scratch database"""
+        max_age = float(os.getenv('MIGRATION_REHEARSAL_BACKUP_HOURS', Config.MIGRATION_REHEARSAL_BACKUP_HOURS)) * 3600
+        latest = self.backups.latest()
+        if latest is None or time.time() - latest['created'] > max_age:
+            latest = self.backups.create('before rehearsal')
+        needed = latest['raw_bytes'] * CLONE_SPACE_FACTOR
+        free = shutil.disk_usage(Config.DATA_DIR if Config.DATA_DIR.exists() else Config.BASE_DIR).free
+        if free < needed:
+            raise RuntimeError(f"Not enough disk space for the copy: {needed / 1048576:.0f} MB needed, "
+                               f"{free / 1048576:.0f} MB free")
+        self.running['step'] = 'cloning'
+        restored = self.backups.restore(latest['id'], database=self.clone_database)
+        return {'backup': latest['id'], 'backup_created': latest['created'], 'raw_bytes': restored['raw_bytes'],
+                'seconds': restored['seconds']}
+
+    def drop_clone(self):
+        try:
+            self.client.query(f"DROP DATABASE IF EXISTS `{self.clone_database}`", timeout=300)
+        except MariaDBError as e:
+            logger.warning(f"⚠️  Could not drop {self.clone_database}: {e}")
+
+    def _timings(self, names: List[str]) -> List[Dict]:
+        """Per-migration duration and outcome from the copy's _prisma_migrations"""
+        rows = self.client.query(
+            "SELECT migration_name, IFNULL(TIMESTAMPDIFF(MICROSECOND, started_at, finished_at), -1), "
+            "IFNULL(REPLACE(REPLACE(logs, '\\n', ' '), '\\t', ' '), '') FROM _prisma_migrations",
+            database=self.clone_database)
+        recorded = {row[0]: row for row in rows}
+        timings = []
+        for name in names:
+            row = recorded.get(name)
+            if row is None:
+                timings.append({'name': name, 'seconds': None, 'success': False, 'error': 'not run'})
+                continue
+            micros = int(row[1])
+            timings.append({'name': name, 'seconds': round(micros / 1e6, 3) if micros >= 0 else None,
+                            'success': micros >= 0, 'error': row[2][:1000] or None if micros < 0 else None})
+        return timings
+
+    @staticmethod
+    def baseline_downtime() -> Optional[float]:
+        """
+        Update downtime that isn't migrations (stop, swap, snapshot, restart)
+
+        Returns:
+            float: Median over the last BASELINE_UPDATES successful backend
+                updates, or None before the first measured one
+        """
+        downtimes, migrations = [], {}
+        for span in get_tracer().iter_history():
+            if span.get('name') == 'downtime':
+                components = (span.get('attributes') or {}).get('components') or ''
+                if span.get('status') == 'ok' and 'backend' in components.split(','):
+                    downtimes.append(span)
+            elif span.get('name') == 'running database migrations':
+                migrations[span.get('trace_id')] = migrations.get(span.get('trace_id'), 0) + (span.get('duration') or 0)
+        samples = [max((span.get('duration') or 0) - migrations.get(span.get('trace_id'), 0), 0)
+                   for span in downtimes[-BASELINE_UPDATES:]]
+        return round(median(samples), 1) if samples else None
+
+    # ------------------------------------------------------------------
+    # Rehearsal
+    # ------------------------------------------------------------------
+
+    def run(self, release: str, prisma_dir: Path, pending: List[str],
+            migrate: Callable[[Path, str], Tuple[bool, str]]) -> Dict:
+        """
+        Rehearse a release's pending migrations and save the result
+
+        Args:
+            release: Release tag the migrations come from
+            prisma_dir: The release's prisma directory (schema.prisma, migrations/)
+            pending: Migrations of the release the live database hasn't applied
+            migrate: Runs `prisma migrate deploy` for a schema against a
+                database URL; returns (success, output)
+
+        Returns:
+            dict: {'release', 'success', 'migrations': [{'name', 'seconds', 'success', 'error'}],
+                   'migrate_seconds', 'clone', 'baseline_downtime', 'predicted_downtime', 'error'}
+
+        Raises:
+            RuntimeError: if a rehearsal is already running
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('A rehearsal is already running')
+        self.running = {'release': release, 'started': time.time(), 'step': 'preparing',
+                        'migrations': len(pending)}
+        try:
+            result = self._run(release, prisma_dir, pending, migrate)
+        finally:
+            self.running = None
+            self._lock.release()
+        write_json_atomic(self.state_path, result)
+        return result
+
+    def _run(self, release: str, prisma_dir: Path, pending: List[str], migrate) -> Dict:
+        baseline = self.baseline_downtime()
+        result = {'release': release, 'time': time.time(), 'pending': pending, 'migrations': [],
+                  'migrate_seconds': 0.0, 'clone': None, 'baseline_downtime': baseline,
+                  'success': True, 'error': None}
+        with trace_span('migration rehearsal', release=release, migrations=len(pending)) as span:
+            if pending:
+                try:
+                    result['clone'] = self._clone()
+                    self.running['step'] = 'migrating'
+                    logger.info(f"🧪 Rehearsing {len(pending)} migration(s) of {release} on {self.clone_database}...")
+                    started = time.perf_counter()
+                    success, output = migrate(prisma_dir / 'schema.prisma', self.clone_database)
+                    result['migrate_seconds'] = round(time.perf_counter() - started, 3)
+                    result['migrations'] = self._timings(pending)
+                    result['success'] = success and all(m['success'] for m in result['migrations'])
+                    if not result['success']:
+                        result['error'] = output.strip()[-2000:] or 'prisma migrate deploy failed'
+                except Exception as e:
+                    result.update(success=False, error=str(e))
+                finally:
+                    self.drop_clone()
+                if not result['success']:
+                    span.fail(result['error'])
+            result['predicted_downtime'] = (round(result['migrate_seconds'] + baseline, 1)
+                                            if baseline is not None else None)
+            span.set_attributes(migrate_seconds=result['migrate_seconds'], success=result['success'])
+
+        if not result['success']:
+            logger.error(f"❌ Migration rehearsal of {release} failed: {result['error']}")
+        else:
+            slowest = max(result['migrations'], key=lambda m: m['seconds'] or 0, default=None)
+            logger.info(f"✅ Migration rehearsal of {release}: {len(pending)} migration(s) in "
+                        f"{result['migrate_seconds']:.1f}s"
+                        + (f" (slowest {slowest['name']} {slowest['seconds']:.1f}s)" if slowest and slowest['seconds'] else '')
+                        + (f", predicted downtime ~{result['predicted_downtime']:.0f}s"
+                           if result['predicted_downtime'] is not None else ''))
+        return result
+
+    def status(self) -> Dict:
+        return {
+            'running': dict(self.running) if self.running else None,
+            'last': self.load(),
+            'baseline_downtime': self.baseline_downtime()
+        }
+
+
+_rehearsal: Optional[MigrationRehearsal] = None
+
+
+def get_migration_rehearsal() -> MigrationRehearsal:
+    """Get the global MigrationRehearsal (result in the writable dir, release files in staging)"""
+    global _rehearsal
+    if _rehearsal is None:
+        _rehearsal = MigrationRehearsal(Config.WRITABLE_DIR / 'rehearsal.json', Config.STAGING_DIR / 'rehearsal')
+    return _rehearsal
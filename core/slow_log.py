@@ -0,0 +1,439 @@
+"""
+Slow query digest for 4Paws Agent
+MariaDB writes statements slower than SLOW_QUERY_SECONDS to its slow query
+log; the log is tailed, each statement is reduced to a fingerprint (literals
+stripped) and timings are aggregated per fingerprint
+"""
+
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from .config import Config
+from .install_journal import write_json_atomic
+from .log_reader import read_incremental
+from .mariadb import MariaDBClient, MariaDBError
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+# Seconds between reads of the log / saves of the digest
+POLL_SECONDS = 5
+PERSIST_SECONDS = 60
+
+# Fingerprints kept; when full, the one with the least total time goes
+MAX_FINGERPRINTS = 500
+# Characters kept of a normalised statement / of the sample statement
+FINGERPRINT_CHARS = 2000
+SAMPLE_CHARS = 4000
+
+# Query times go into log-scale buckets (bucket i holds (GAMMA^(i-1), GAMMA^i]
+# seconds), so percentiles are within 5% and a fingerprint costs a few
+# dozen counters however often it runs
+HISTOGRAM_GAMMA = 1.1
+HISTOGRAM_MIN_SECONDS = 1e-6
+
+# Slow log syntax
+HEADER_FIELD = re.compile(r'([A-Za-z_]+): (\S+)')
+SET_TIMESTAMP = re.compile(r'^SET timestamp=(\d+);$')
+USE_SCHEMA = re.compile(r'^use `?([^`;\s]+)`?;$', re.IGNORECASE)
+# Written at the top of the file each time mysqld opens it
+LOG_PREAMBLE = re.compile(r'^(\S.*, Version: .* started with:|Tcp port: |Time\s+Id\s+Command\s+Argument)')
+
+# Normalisation
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"", re.S)
+_COMMENTS = re.compile(r'/\*.*?\*/|--\s[^\n]*|#[^\n]*', re.S)
+_HEX = re.compile(r'\b0x[0-9a-f]+\b|\bx\'[0-9a-f]*\'', re.I)
+_NUMBERS = re.compile(r'(?<![\w`.])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?\b', re.I)
+_SPACES = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\bin \((?:\?, ?)+\?\)')
+_VALUES_LIST = re.compile(r'(\bvalues ?\([^()]*\))(?:, ?\([^()]*\))+')
+
+
+def slow_log_enabled() -> bool:
+    return os.getenv('SLOW_QUERY_LOG', Config.SLOW_QUERY_LOG).lower() == 'on'
+
+
+def slow_query_seconds() -> float:
+    return float(os.getenv('SLOW_QUERY_SECONDS', Config.SLOW_QUERY_SECONDS))
+
+
+def normalize_query(sql: str) -> str:
+    """
+    Statement with its literals replaced by ?, comments dropped and
+    whitespace and case folded: statements that differ only in their
+    values normalise to the same text
+    """
+    text = _STRINGS.sub('?', sql)
+    text = _COMMENTS.sub(' ', text)
+    text = _HEX.sub('?', text)
+    text = _NUMBERS.sub('?', text)
+    text = _SPACES.sub(' ', text).strip().rstrip(';').strip().lower()
+    text = _IN_LIST.sub('in (?+)', text)
+    text = _VALUES_LIST.sub(r'\1+', text)
+    return text
+
+
+def fingerprint_id(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def _bucket(seconds: float) -> int:
+    return math.ceil(math.log(max(seconds, HISTOGRAM_MIN_SECONDS)) / math.log(HISTOGRAM_GAMMA))
+
+
+def _quantile(histogram: Dict[int, int], count: int, q: float) -> Optional[float]:
+    """Estimated q-quantile from a bucket histogram (bucket's geometric middle)"""
+    if count <= 0:
+        return None
+    rank = max(math.ceil(q * count), 1)  # Nearest rank
+    seen = 0
+    for index in sorted(histogram):
+        seen += histogram[index]
+        if seen >= rank:
+            return 2 * HISTOGRAM_GAMMA ** index / (HISTOGRAM_GAMMA + 1)
+    return None
+
+
+class SlowQueryLog:
+    """
+    Tails MariaDB's slow query log into per-fingerprint aggregates
+
+    mysqld is started with the slow log on (mysqld_args) and
+    log_slow_verbosity=query_plan, so each entry also says whether the
+    statement did a full scan, a filesort or an on-disk temporary table.
+    Every POLL_SECONDS the bytes appended since the last read are parsed;
+    each statement adds to its fingerprint's count, total/max time, rows
+    examined and sent, and a log-scale histogram that the percentiles come
+    from. The slowest occurrence is kept as the fingerprint's sample.
+
+    The aggregates and the read position are saved every PERSIST_SECONDS,
+    so an agent restart continues where it left off without counting an
+    entry twice. Once the log grows past SLOW_QUERY_LOG_MAX_MB and has been
+    read to the end, the server closes it (slow_query_log=OFF) while it is
+    emptied, which also works on Windows where an open file can't be
+    truncated from outside.
+    """
+
+    def __init__(self, log_path: Path, state_path: Path, client: Optional[MariaDBClient] = None):
+        self.log_path = Path(log_path)
+        self.state_path = Path(state_path)
+        self.client = client or MariaDBClient()
+        self.lock = threading.Lock()
+        self.digests: Dict[str, Dict] = {}
+        self.offset = 0
+        self.file_id: Optional[str] = None
+        self.entries = 0
+        self.since = time.time()
+        self.updated: Optional[float] = None
+        self._pending: Optional[Dict] = None
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.load()
+
+    def mysqld_args(self) -> List[str]:
+        """mysqld options that turn the slow query log on (empty with SLOW_QUERY_LOG=off)"""
+        if not slow_log_enabled():
+            return []
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        return [
+            '--slow-query-log=1',
+            f'--slow-query-log-file={self.log_path}',
+            f'--long-query-time={slow_query_seconds()}',
+            '--log-slow-verbosity=query_plan'
+        ]
+
+    # ------------------------------------------------------------------
+    # State
+    # ------------------------------------------------------------------
+
+    def load(self):
+        try:
+            state = json.loads(self.state_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return
+        if state.get('version') != STATE_VERSION:
+            return
+        with self.lock:
+            self.offset = state.get('offset', 0)
+            self.file_id = state.get('file_id')
+            self.entries = state.get('entries', 0)
+            self.since = state.get('since', self.since)
+            self.updated = state.get('updated')
+            self.digests = {}
+            for key, digest in state.get('digests', {}).items():
+                digest['histogram'] = {int(index): n for index, n in digest.get('histogram', {}).items()}
+                self.digests[key] = digest
+
+    def save(self):
+        with self.lock:
+            state = {
+                'version': STATE_VERSION,
+                'offset': self.offset,
+                'file_id': self.file_id,
+                'entries': self.entries,
+                'since': self.since,
+                'updated': self.updated,
+                'digests': self.digests
+            }
+            write_json_atomic(self.state_path, state)
+            self._dirty = False
+
+    def reset(self):
+        """Forget all aggregates (the log keeps being read from where it is)"""
+        with self.lock:
+            self.digests = {}
+            self.entries = 0
+            self.since = time.time()
+            self._dirty = True
+        self.save()
+
+    # ------------------------------------------------------------------
+    # Parsing
+    # ------------------------------------------------------------------
+
+    def _flush_pending(self):
+        pending, self._pending = self._pending, None
+        if not pending or not pending['sql'] or 'Query_time' not in pending['fields']:
+            return
+        fields = pending['fields']
+        sql = '\n'.join(pending['sql']).strip()
+        try:
+            entry = {
+                'time': pending.get('time') or time.time(),
+                'schema': fields.get('Schema') or pending.get('schema'),
+                'query_time': float(fields['Query_time']),
+                'lock_time': float(fields.get('Lock_time', 0)),
+                'rows_sent': int(fields.get('Rows_sent', 0)),
+                'rows_examined': int(fields.get('Rows_examined', 0)),
+                'full_scan': fields.get('Full_scan') == 'Yes',
+                'filesort': fields.get('Filesort') == 'Yes',
+                'tmp_disk': fields.get('Tmp_table_on_disk') == 'Yes',
+                'sql': sql
+            }
+        except ValueError:
+            return
+        self._add(entry)
+
+    def feed(self, lines: Iterable[str]):
+        """
+        Parse slow log lines; an entry is added once the next one starts
+        (or flush() is called)
+        """
+        for line in lines:
+            line = line.rstrip('\r\n')
+            if line.startswith('# '):
+                if self._pending is not None and self._pending['sql']:
+                    self._flush_pending()
+                if self._pending is None:
+                    self._pending = {'fields': {}, 'sql': []}
+                self._pending['fields'].update(HEADER_FIELD.findall(line))
+            elif LOG_PREAMBLE.match(line):
+                self._flush_pending()
+            elif self._pending is None or not line.strip():
+                continue  # Tail of an entry whose start wasn't read
+            elif not self._pending['sql'] and SET_TIMESTAMP.match(line):
+                self._pending['time'] = int(SET_TIMESTAMP.match(line).group(1))
+            elif not self._pending['sql'] and USE_SCHEMA.match(line):
+                self._pending['schema'] = USE_SCHEMA.match(line).group(1)
+            else:
+                self._pending['sql'].append(line)
+
+    def flush(self):
+        """Add the entry being parsed (mysqld writes an entry in one go)"""
+        if self._pending is not None and self._pending['sql']:
+            self._flush_pending()
+
+    def _add(self, entry: Dict):
+        normalized = normalize_query(entry['sql'])
+        if not normalized:
+            return
+        key = fingerprint_id(normalized)
+        seconds = entry['query_time']
+        with self.lock:
+            digest = self.digests.get(key)
+            if digest is None:
+                if len(self.digests) >= MAX_FINGERPRINTS:
+                    del self.digests[min(self.digests, key=lambda k: self.digests[k]['total'])]
+                digest = self.digests[key] = {
+                    'id': key,
+                    'fingerprint': normalized[:FINGERPRINT_CHARS],
+                    'schema': entry['schema'],
+                    'count': 0, 'total': 0.0, 'max': 0.0, 'lock': 0.0,
+                    'rows_examined': 0, 'rows_examined_max': 0, 'rows_sent': 0,
+                    'full_scan': 0, 'filesort': 0, 'tmp_disk': 0,
+                    'first_seen': entry['time'], 'last_seen': entry['time'],
+                    'sample': None, 'sample_seconds': 0.0,
+                    'histogram': {}
+                }
+            digest['count'] += 1
+            digest['total'] += seconds
+            digest['lock'] += entry['lock_time']
+            digest['rows_examined'] += entry['rows_examined']
+            digest['rows_examined_max'] = max(digest['rows_examined_max'], entry['rows_examined'])
+            digest['rows_sent'] += entry['rows_sent']
+            digest['full_scan'] += entry['full_scan']
+            digest['filesort'] += entry['filesort']
+            digest['tmp_disk'] += entry['tmp_disk']
+            digest['last_seen'] = max(digest['last_seen'], entry['time'])
+            if seconds >= digest['max']:
+                digest['max'] = seconds
+                digest['sample'] = entry['sql'][:SAMPLE_CHARS]
+                digest['sample_seconds'] = seconds
+                digest['schema'] = entry['schema'] or digest['schema']
+            bucket = _bucket(seconds)
+            digest['histogram'][bucket] = digest['histogram'].get(bucket, 0) + 1
+            self.entries += 1
+            self.updated = time.time()
+            self._dirty = True
+
+    # ------------------------------------------------------------------
+    # Tailing
+    # ------------------------------------------------------------------
+
+    def poll(self) -> int:
+        """Parse what was appended to the log since the last read; returns entries added"""
+        before = self.entries
+        while True:
+            result = read_incremental(self.log_path, self.offset, self.file_id, tail=0)
+            if result['reset']:
+                # Rotated or emptied: the new file is read from its start
+                self._pending = None
+                result = read_incremental(self.log_path, 0, result['file_id'])
+            self.offset, self.file_id = result['offset'], result['file_id']
+            if result['data']:
+                self.feed(result['data'].splitlines())
+            if not result['has_more']:
+                break
+        self.flush()
+        return self.entries - before
+
+    def rotate_if_large(self) -> bool:
+        """Empty the log once it is over SLOW_QUERY_LOG_MAX_MB and fully read (server must run)"""
+        max_bytes = float(os.getenv('SLOW_QUERY_LOG_MAX_MB', Config.SLOW_QUERY_LOG_MAX_MB)) * 1024 * 1024
+        try:
+            size = self.log_path.stat().st_size
+        except OSError:
+            return False
+        if size < max_bytes or self.offset < size:
+            return False
+        try:
+            self.client.query('SET GLOBAL slow_query_log=OFF', timeout=10)
+        except MariaDBError as e:
+            logger.debug(f"Slow log rotation skipped: {e}")
+            return False
+        try:
+            self.poll()  # Entries written right before the file was closed
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(0)
+            self.offset, self.file_id = 0, None
+        finally:
+            try:
+                self.client.query('SET GLOBAL slow_query_log=ON', timeout=10)
+            except MariaDBError as e:
+                logger.warning(f"⚠️  Could not turn the slow query log back on: {e}")
+        logger.info(f"🧹 Slow query log emptied ({size / 1048576:.1f} MB digested)")
+        return True
+
+    def start(self):
+        """Tail the log in the background (idempotent)"""
+        if self._thread or not slow_log_enabled():
+            return
+        self._stop.clear()
+
+        def loop():
+            last_save = time.time()
+            while not self._stop.wait(POLL_SECONDS):
+                try:
+                    self.poll()
+                    self.rotate_if_large()
+                    if self._dirty and time.time() - last_save >= PERSIST_SECONDS:
+                        self.save()
+                        last_save = time.time()
+                except Exception as e:
+                    logger.warning(f"⚠️  Slow query log read failed: {e}")
+
+        self._thread = threading.Thread(target=loop, name='slow-query-log', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+        if self._dirty:
+            self.save()
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def summarize(digest: Dict) -> Dict:
+        """A digest without its histogram, with averages and percentiles"""
+        count = digest['count']
+        summary = {key: value for key, value in digest.items() if key != 'histogram'}
+        summary.update(
+            avg=digest['total'] / count if count else None,
+            p50=_quantile(digest['histogram'], count, 0.50),
+            p95=_quantile(digest['histogram'], count, 0.95),
+            rows_examined_avg=digest['rows_examined'] / count if count else None
+        )
+        # Estimates never exceed what was measured
+        for key in ('p50', 'p95'):
+            if summary[key] is not None:
+                summary[key] = round(min(summary[key], digest['max']), 6)
+        return summary
+
+    def top(self, limit: int = 20, sort: str = 'total') -> List[Dict]:
+        """
+        Worst fingerprints first
+
+        Args:
+            sort: 'total' (time spent), 'count', 'avg', 'p95', 'max' or 'rows_examined'
+        """
+        with self.lock:
+            summaries = [self.summarize(digest) for digest in self.digests.values()]
+        return sorted(summaries, key=lambda s: s.get(sort) or 0, reverse=True)[:limit]
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self.lock:
+            digest = self.digests.get(key)
+            return self.summarize(digest) if digest else None
+
+    def status(self) -> Dict:
+        try:
+            log_bytes = self.log_path.stat().st_size
+        except OSError:
+            log_bytes = None
+        with self.lock:
+            return {
+                'enabled': slow_log_enabled(),
+                'threshold': slow_query_seconds(),
+                'log_file': str(self.log_path),
+                'log_bytes': log_bytes,
+                'fingerprints': len(self.digests),
+                'entries': self.entries,
+                'total_seconds': round(sum(d['total'] for d in self.digests.values()), 3),
+                'since': self.since,
+                'updated': self.updated
+            }
+
+
+_slow_log: Optional[SlowQueryLog] = None
+
+
+def get_slow_query_log() -> SlowQueryLog:
+    """Get the global SlowQueryLog (logs/mariadb-slow.log, digest in the writable dir)"""
+    global _slow_log
+    if _slow_log is None:
+        _slow_log = SlowQueryLog(Config.LOGS_DIR / 'mariadb-slow.log',
+                                 Config.WRITABLE_DIR / 'slow_queries.json')
+    return _slow_log
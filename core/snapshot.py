@@ -0,0 +1,463 @@
+"""
+Cold snapshots of the MariaDB data directory for 4Paws Agent
+File-level copies taken while mysqld is stopped (e.g. during an update),
+as reflinks where the filesystem supports them, otherwise as a parallel
+chunked copy with a SHA-256 per chunk
+"""
+
+import os
+import json
+import time
+import errno
+import shutil
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .config import Config
+from .install_journal import write_json_atomic
+from .mariadb import MariaDBClient
+from .tracing import trace_span
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+DATA_SUBDIR = 'data'
+
+METHOD_REFLINK = 'reflink'
+METHOD_COPY = 'copy'
+
+# Linux FICLONE ioctl: the target shares the source's extents (btrfs, XFS,
+# bcachefs...) until either is written, so a clone takes no time or space
+FICLONE = 0x40049409
+# Errors meaning the filesystem (or the pair of them) can't clone
+NO_REFLINK_ERRORS = {errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EBADF,
+                     getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP)}
+
+# Copies split files into chunks copied (and hashed) by parallel workers, so
+# one big InnoDB tablespace doesn't leave the other workers idle
+COPY_CHUNK = 64 * 1024 * 1024
+COPY_BUFFER = 1024 * 1024
+COPY_WORKERS = 4
+
+# Left behind by mysqld and meaningless in a copy
+SKIPPED_SUFFIXES = ('.pid',)
+
+
+def _reflink(source: Path, target: Path) -> bool:
+    """Clone source into target; False if the filesystem can't (target is removed)"""
+    if fcntl is None:
+        return False
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return True
+        except OSError as e:
+            if e.errno not in NO_REFLINK_ERRORS:
+                raise
+    target.unlink()
+    return False
+
+
+def _copy_chunk(source: Path, target: Path, offset: int, length: int) -> str:
+    """Copy one chunk of a file into the (pre-sized) target; returns the chunk's SHA-256"""
+    digest = hashlib.sha256()
+    with open(source, 'rb') as src, open(target, 'r+b') as dst:
+        src.seek(offset)
+        dst.seek(offset)
+        remaining = length
+        while remaining > 0:
+            data = src.read(min(COPY_BUFFER, remaining))
+            if not data:
+                raise OSError(f"{source} shrank while being copied")
+            digest.update(data)
+            dst.write(data)
+            remaining -= len(data)
+    return digest.hexdigest()
+
+
+def _rate(size: int, seconds: float) -> Optional[float]:
+    return round(size / seconds) if seconds > 0 else None
+
+
+class DataSnapshots:
+    """
+    Snapshots of a stopped MariaDB data directory, one directory per snapshot
+
+    A snapshot is the data directory's files exactly as mysqld left them
+    after a clean shutdown, so restoring one is a file copy back: no SQL
+    is replayed and the server starts without recovery. Every file is
+    first cloned with a reflink; if the filesystem can't (NTFS, ext4),
+    the rest are copied in COPY_CHUNK chunks by COPY_WORKERS threads, each
+    chunk hashed as it is copied. manifest.json (written last, atomically)
+    lists the files with their size and chunk hashes; a directory without
+    one is an unfinished snapshot and is removed.
+
+    Restores copy the snapshot next to the data directory (checking every
+    chunk against its hash on the way) and only then swap it in, so a
+    damaged snapshot leaves the current data untouched.
+    """
+
+    def __init__(self, directory: Path, source: Path, client: Optional[MariaDBClient] = None):
+        self.directory = Path(directory)
+        self.source = Path(source)
+        self.client = client or MariaDBClient()
+        self._lock = threading.Lock()
+        self.running: Optional[Dict] = None   # {'action', 'snapshot', 'started', 'bytes_done', 'bytes'}
+        self.last_error: Optional[str] = None
+
+    # ------------------------------------------------------------------
+    # Listing
+    # ------------------------------------------------------------------
+
+    def list(self) -> List[Dict]:
+        """Manifests of finished snapshots (without their file lists), newest first"""
+        snapshots = []
+        if not self.directory.exists():
+            return snapshots
+        for manifest_file in self.directory.glob(f'*/{MANIFEST_FILE}'):
+            try:
+                manifest = json.loads(manifest_file.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+            manifest.pop('files', None)
+            manifest.pop('dirs', None)
+            snapshots.append(manifest)
+        return sorted(snapshots, key=lambda m: m.get('created', 0), reverse=True)
+
+    def load(self, snapshot_id: str) -> Optional[Dict]:
+        manifest_file = self.directory / snapshot_id / MANIFEST_FILE
+        if '/' in snapshot_id or '\\' in snapshot_id or not manifest_file.exists():
+            return None
+        try:
+            return json.loads(manifest_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def latest(self) -> Optional[Dict]:
+        snapshots = self.list()
+        return snapshots[0] if snapshots else None
+
+    # ------------------------------------------------------------------
+    # Copying
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _scan(root: Path):
+        """Directories (relative, parents first) and files ({'path', 'size'}) under root"""
+        dirs, files = [], []
+        for path in sorted(root.rglob('*')):
+            relative = path.relative_to(root).as_posix()
+            if path.is_dir():
+                dirs.append(relative)
+            elif path.is_file() and not path.name.endswith(SKIPPED_SUFFIXES):
+                files.append({'path': relative, 'size': path.stat().st_size})
+        return dirs, files
+
+    @staticmethod
+    def _check_space(target: Path, size: int):
+        target.mkdir(parents=True, exist_ok=True)
+        free = shutil.disk_usage(target).free
+        if free < size:
+            raise OSError(f"{size / 1048576:.0f} MB needed in {target}, {free / 1048576:.0f} MB free")
+
+    def _copy_tree(self, source: Path, target: Path, dirs: List[str], files: List[Dict],
+                   expected: Optional[Dict[str, List[str]]] = None) -> Dict[str, Dict]:
+        """
+        Copy files from source to target, reflinked while the filesystem allows
+
+        Args:
+            expected: Chunk hashes per path; a copied chunk that differs
+                raises ValueError (reflinked files aren't read, so unchecked)
+
+        Returns:
+            dict: path -> {'method', 'chunks'} ('chunks' only for copies)
+        """
+        for relative in dirs:
+            (target / relative).mkdir(parents=True, exist_ok=True)
+
+        results: Dict[str, Dict] = {}
+        reflink = True
+        chunks = []
+        for entry in files:
+            src, dst = source / entry['path'], target / entry['path']
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if reflink:
+                if _reflink(src, dst):
+                    results[entry['path']] = {'method': METHOD_REFLINK}
+                    self.running['bytes_done'] += entry['size']
+                    continue
+                reflink = False
+                logger.info(f"📋 No reflink support under {target}, copying in chunks")
+                # The space check is only needed once real copies start
+                self._check_space(target, sum(e['size'] for e in files if e['path'] not in results))
+            with open(dst, 'wb') as f:
+                f.truncate(entry['size'])
+            results[entry['path']] = {'method': METHOD_COPY, 'chunks': []}
+            for offset in range(0, entry['size'], COPY_CHUNK) or [0]:
+                chunks.append((entry['path'], offset, min(COPY_CHUNK, entry['size'] - offset)))
+
+        if chunks:
+            def copy(chunk):
+                path, offset, length = chunk
+                digest = _copy_chunk(source / path, target / path, offset, length)
+                self.running['bytes_done'] += length
+                return digest
+
+            with ThreadPoolExecutor(max_workers=COPY_WORKERS, thread_name_prefix='snapshot') as pool:
+                for chunk, digest in zip(chunks, pool.map(copy, chunks)):
+                    results[chunk[0]]['chunks'].append(digest)
+
+        if expected:
+            for path, result in results.items():
+                if result['method'] == METHOD_COPY and expected.get(path) and result['chunks'] != expected[path]:
+                    raise ValueError(f"{path}: checksum mismatch")
+        return results
+
+    # ------------------------------------------------------------------
+    # Snapshot
+    # ------------------------------------------------------------------
+
+    def _ensure_stopped(self):
+        if self.client.is_available():
+            raise RuntimeError('MariaDB is running - data files are only consistent once it has stopped')
+
+    def create(self, reason: str = 'manual', meta: Optional[Dict] = None, prune: bool = True) -> Dict:
+        """
+        Snapshot the data directory now (MariaDB must be stopped)
+
+        Returns:
+            dict: The manifest
+
+        Raises:
+            RuntimeError: if MariaDB runs, or a snapshot or restore is running
+            OSError: if the copy fails (the partial snapshot is removed)
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('A snapshot or restore is already running')
+        try:
+            self._ensure_stopped()
+            manifest = self._create(reason, meta or {})
+        finally:
+            self.running = None
+            self._lock.release()
+        if prune:
+            self.prune()
+        return manifest
+
+    def _create(self, reason: str, meta: Dict) -> Dict:
+        if not self.source.exists():
+            raise FileNotFoundError(f"No data directory at {self.source}")
+        created = time.time()
+        snapshot_id = datetime.fromtimestamp(created).strftime('%Y%m%d-%H%M%S')
+        target = self.directory / snapshot_id
+        suffix = 1
+        while target.exists():
+            suffix += 1
+            target = self.directory / f"{snapshot_id}-{suffix}"
+        snapshot_id = target.name
+
+        with trace_span('data snapshot', reason=reason) as span:
+            dirs, files = self._scan(self.source)
+            size = sum(entry['size'] for entry in files)
+            self.running = {'action': 'snapshot', 'snapshot': snapshot_id, 'started': created,
+                            'bytes': size, 'bytes_done': 0}
+            logger.info(f"📸 Snapshot of {self.source.name} ({len(files)} files, {size / 1048576:.1f} MB)...")
+
+            started = time.perf_counter()
+            try:
+                results = self._copy_tree(self.source, target / DATA_SUBDIR, dirs, files)
+            except Exception as e:
+                shutil.rmtree(target, ignore_errors=True)
+                self.last_error = str(e)
+                span.fail(str(e))
+                raise
+            seconds = time.perf_counter() - started
+
+            methods = {result['method'] for result in results.values()}
+            manifest = {
+                'version': MANIFEST_VERSION,
+                'id': snapshot_id,
+                'reason': reason,
+                'created': created,
+                'source': str(self.source),
+                'method': methods.pop() if len(methods) == 1 else METHOD_COPY if methods else METHOD_REFLINK,
+                'chunk_size': COPY_CHUNK,
+                'dirs': dirs,
+                'files': [{**entry, **results[entry['path']]} for entry in files],
+                'file_count': len(files),
+                'bytes': size,
+                'seconds': round(seconds, 3),
+                'throughput': _rate(size, seconds),
+                **meta
+            }
+            write_json_atomic(target / MANIFEST_FILE, manifest)
+            span.set_attributes(units=size, unit='bytes', files=len(files), method=manifest['method'])
+            self.last_error = None
+
+        logger.info(f"✅ Snapshot {snapshot_id}: {size / 1048576:.1f} MB in {seconds:.1f}s "
+                    f"({manifest['method']})")
+        return manifest
+
+    def prune(self, keep: Optional[int] = None):
+        """Delete the oldest snapshots beyond SNAPSHOT_KEEP and leftovers of interrupted ones"""
+        keep = keep if keep is not None else int(os.getenv('SNAPSHOT_KEEP', Config.SNAPSHOT_KEEP))
+        for snapshot in self.list()[keep:]:
+            shutil.rmtree(self.directory / snapshot['id'], ignore_errors=True)
+            logger.info(f"🧹 Removed old snapshot {snapshot['id']}")
+        if self.directory.exists() and not self._lock.locked():
+            for leftover in self.directory.iterdir():
+                if leftover.is_dir() and not (leftover / MANIFEST_FILE).exists():
+                    shutil.rmtree(leftover, ignore_errors=True)
+
+    def delete(self, snapshot_id: str) -> bool:
+        if self.load(snapshot_id) is None:
+            return False
+        shutil.rmtree(self.directory / snapshot_id, ignore_errors=True)
+        return True
+
+    # ------------------------------------------------------------------
+    # Restore
+    # ------------------------------------------------------------------
+
+    def verify(self, snapshot_id: str) -> List[str]:
+        """
+        Problems with a snapshot's files (missing, size or checksum mismatch); empty if intact
+
+        Copied files are re-hashed chunk by chunk; reflinked files are
+        checked by size only (they were never read).
+        """
+        manifest = self.load(snapshot_id)
+        if manifest is None:
+            return [f"Snapshot {snapshot_id} not found"]
+        root = self.directory / snapshot_id / DATA_SUBDIR
+        chunk_size = manifest.get('chunk_size', COPY_CHUNK)
+
+        def check(entry: Dict) -> Optional[str]:
+            path = root / entry['path']
+            try:
+                if path.stat().st_size != entry['size']:
+                    return f"{entry['path']}: size mismatch"
+            except OSError:
+                return f"{entry['path']}: missing"
+            if entry['method'] != METHOD_COPY:
+                return None
+            with open(path, 'rb') as f:
+                for expected in entry['chunks']:
+                    digest = hashlib.sha256()
+                    remaining = chunk_size
+                    while remaining > 0:
+                        data = f.read(min(COPY_BUFFER, remaining))
+                        if not data:
+                            break
+                        digest.update(data)
+                        remaining -= len(data)
+                    if digest.hexdigest() != expected:
+                        return f"{entry['path']}: checksum mismatch"
+            return None
+
+        with ThreadPoolExecutor(max_workers=COPY_WORKERS, thread_name_prefix='snapshot') as pool:
+            return [problem for problem in pool.map(check, manifest['files']) if problem]
+
+    def restore(self, snapshot_id: str) -> Dict:
+        """
+        Replace the data directory with a snapshot (MariaDB must be stopped)
+
+        Returns:
+            dict: {'snapshot', 'bytes', 'seconds', 'throughput', 'method'}
+
+        Raises:
+            RuntimeError: if MariaDB runs, or a snapshot or restore is running
+            ValueError: if the snapshot is missing or damaged (data untouched)
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError('A snapshot or restore is already running')
+        try:
+            self._ensure_stopped()
+            return self._restore(snapshot_id)
+        finally:
+            self.running = None
+            self._lock.release()
+
+    def _restore(self, snapshot_id: str) -> Dict:
+        manifest = self.load(snapshot_id)
+        if manifest is None:
+            raise ValueError(f"Snapshot {snapshot_id} not found")
+        root = self.directory / snapshot_id / DATA_SUBDIR
+        incoming = self.source.with_name(f"{self.source.name}.restoring")
+        replaced = self.source.with_name(f"{self.source.name}.replaced")
+
+        with trace_span('data snapshot restore', snapshot=snapshot_id) as span:
+            self.running = {'action': 'restore', 'snapshot': snapshot_id, 'started': time.time(),
+                            'bytes': manifest['bytes'], 'bytes_done': 0}
+            logger.info(f"📸 Restoring snapshot {snapshot_id} ({manifest['bytes'] / 1048576:.1f} MB)...")
+            for leftover in (incoming, replaced):
+                if leftover.exists():
+                    shutil.rmtree(leftover)
+
+            started = time.perf_counter()
+            expected = {entry['path']: entry.get('chunks') for entry in manifest['files']}
+            try:
+                for entry in manifest['files']:
+                    if not (root / entry['path']).exists():
+                        raise ValueError(f"{entry['path']}: missing")
+                results = self._copy_tree(root, incoming, manifest.get('dirs', []), manifest['files'],
+                                          expected=expected)
+            except Exception as e:
+                shutil.rmtree(incoming, ignore_errors=True)
+                self.last_error = str(e)
+                span.fail(str(e))
+                raise
+
+            # Both renames stay on one volume: the swap itself is instant
+            if self.source.exists():
+                self.source.rename(replaced)
+            incoming.rename(self.source)
+            shutil.rmtree(replaced, ignore_errors=True)
+            seconds = time.perf_counter() - started
+            methods = {result['method'] for result in results.values()}
+            span.set_attributes(units=manifest['bytes'], unit='bytes', files=len(results))
+            self.last_error = None
+
+        logger.info(f"✅ Snapshot {snapshot_id} restored in {seconds:.1f}s")
+        return {
+            'snapshot': snapshot_id,
+            'bytes': manifest['bytes'],
+            'seconds': round(seconds, 3),
+            'throughput': _rate(manifest['bytes'], seconds),
+            'method': methods.pop() if len(methods) == 1 else METHOD_COPY if methods else METHOD_REFLINK
+        }
+
+    def status(self) -> Dict:
+        return {
+            'directory': str(self.directory),
+            'running': dict(self.running) if self.running else None,
+            'snapshots': self.list(),
+            'last_error': self.last_error
+        }
+
+
+def snapshot_before_update() -> bool:
+    return os.getenv('SNAPSHOT_BEFORE_UPDATE', Config.SNAPSHOT_BEFORE_UPDATE).lower() == 'on'
+
+
+_snapshots: Optional[DataSnapshots] = None
+
+
+def get_snapshots() -> DataSnapshots:
+    """Get the global DataSnapshots (SNAPSHOT_DIR, default snapshots/ in the writable dir)"""
+    global _snapshots
+    if _snapshots is None:
+        _snapshots = DataSnapshots(Path(os.getenv('SNAPSHOT_DIR', Config.SNAPSHOT_DIR)),
+                                   Config.DATA_DIR / 'mariadb')
+    return _snapshots
@@ -0,0 +1,386 @@
+"""
+Task graph scheduler for 4Paws Agent
+Runs install/update steps as a dependency graph: a step starts as soon as
+the steps it needs are done and its network/disk/CPU budget allows
+"""
+
+import os
+import time
+import logging
+import threading
+import contextvars
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .config import Config
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# Resource kinds a task can claim
+RESOURCE_NET = 'net'
+RESOURCE_DISK = 'disk'
+RESOURCE_CPU = 'cpu'
+
+# Task states
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+SKIPPED = 'skipped'  # A dependency failed
+
+# Listeners also get a tick (task=None) this often while tasks run, so
+# progress and ETAs keep moving during long silent steps
+TICK_INTERVAL = 2.0
+
+# Task running in the current thread (see report_progress)
+_current_task: contextvars.ContextVar[Optional['Task']] = contextvars.ContextVar('current_task', default=None)
+
+
+def default_budgets() -> Dict[str, int]:
+    """Concurrent slots per resource (INSTALL_*_SLOTS in .env)"""
+    return {
+        RESOURCE_NET: int(os.getenv('INSTALL_NET_SLOTS', Config.INSTALL_NET_SLOTS)),
+        RESOURCE_DISK: int(os.getenv('INSTALL_DISK_SLOTS', Config.INSTALL_DISK_SLOTS)),
+        RESOURCE_CPU: int(os.getenv('INSTALL_CPU_SLOTS', Config.INSTALL_CPU_SLOTS)),
+    }
+
+
+class Task:
+    """One step of a task graph"""
+
+    def __init__(self, name: str, func: Callable[['Task'], object], deps: Iterable[str] = (),
+                 resources: Optional[Dict[str, int]] = None, weight: float = 1.0,
+                 step: Optional[str] = None, title: Optional[str] = None,
+                 checkpoint: Optional[Callable[['Task'], Optional[Dict]]] = None,
+                 resume: Optional[Callable[[Optional[Dict]], bool]] = None):
+        """
+        Args:
+            name: Unique task name (also the span name)
+            func: Called with the task; returning False or raising fails it
+            deps: Names of tasks that must be done first
+            resources: Slots held while running, e.g. {'net': 1}
+            weight: Share of the overall progress (expected relative duration)
+            step: Progress page step this task belongs to ('download', 'install', ...)
+            title: Human readable description for progress events
+            checkpoint: Returns the fingerprint journaled when the task succeeds
+            resume: Given the journaled fingerprint (None if there is none),
+                checks it still matches the disk and restores what later
+                tasks need; True skips the task. Tasks without it always run.
+        """
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.resources = dict(resources or {})
+        self.weight = weight
+        self.step = step
+        self.title = title or name
+        self.checkpoint = checkpoint
+        self.resume = resume
+        self.resumed = False  # Skipped because its journaled result is still valid
+        self._resume_checked = False
+        self.state = PENDING
+        self.fraction = 0.0  # Progress within the task, 0..1
+        self.done: Optional[float] = None   # Units processed (bytes, packages, ...)
+        self.total: Optional[float] = None  # Units expected, if known
+        self.unit: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result = None
+        self.error: Optional[str] = None
+        self.priority = 0.0  # Weight of the longest path from here to the end
+        self._graph: Optional['TaskGraph'] = None
+
+    def report(self, fraction: Optional[float] = None, done: Optional[float] = None,
+               total: Optional[float] = None, unit: Optional[str] = None):
+        """
+        Report progress within the task: a fraction (0..1) and/or units
+        processed (e.g. done=bytes, total=size, unit='bytes'); with units
+        and a total the fraction is derived from them
+        """
+        if done is not None:
+            self.done = done
+        if total:
+            self.total = total
+        if unit:
+            self.unit = unit
+        if fraction is None and self.done is not None and self.total:
+            fraction = self.done / self.total
+        if fraction is not None:
+            self.fraction = max(self.fraction, min(max(fraction, 0.0), 1.0))
+        if self._graph:
+            self._graph._notify(self)
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+def report_progress(fraction: Optional[float] = None, done: Optional[float] = None,
+                    total: Optional[float] = None, unit: Optional[str] = None):
+    """Report progress of the task running in this thread (no-op outside a task graph)"""
+    task = _current_task.get()
+    if task:
+        task.report(fraction, done, total, unit)
+
+
+class TaskGraph:
+    """
+    Declarative DAG of tasks run by a budgeted scheduler
+
+    Ready tasks (all dependencies done) are started highest priority first
+    - priority being the remaining critical path - as long as their
+    resource claims fit the free budget. Each task runs on its own thread
+    inside a span that is a child of the span active when run() was called.
+    After a failure no new tasks start; running ones finish and the rest
+    are skipped. With a journal, finished tasks are checkpointed and a
+    rerun skips the ones whose results are still valid.
+
+    Progress is the weighted share of finished work, including the
+    fraction running tasks have reported.
+    """
+
+    def __init__(self, name: str, budgets: Optional[Dict[str, int]] = None):
+        self.name = name
+        self.budgets = budgets or default_budgets()
+        self.tasks: Dict[str, Task] = {}
+        self.lock = threading.Condition()
+        self.in_use: Dict[str, int] = {}
+        self.listeners: List[Callable[['TaskGraph', Task], None]] = []
+        self.failed: Optional[Task] = None
+
+    def add(self, name: str, func: Callable[[Task], object], deps: Iterable[str] = (), **options) -> Task:
+        """Add a task (see Task for options)"""
+        if name in self.tasks:
+            raise ValueError(f"Duplicate task: {name}")
+        task = Task(name, func, deps, **options)
+        task._graph = self
+        self.tasks[name] = task
+        return task
+
+    def add_listener(self, listener: Callable[['TaskGraph', Optional[Task]], None]):
+        """
+        Call listener(graph, task) whenever a task changes state or reports
+        progress, and listener(graph, None) every TICK_INTERVAL while running
+        """
+        self.listeners.append(listener)
+
+    def _notify(self, task: Optional[Task]):
+        """Call the listeners; never with the lock held, a slow listener would stall the scheduler"""
+        for listener in self.listeners:
+            try:
+                listener(self, task)
+            except Exception as e:
+                logger.debug(f"Task graph listener failed: {e}")
+
+    def _validate(self):
+        for task in self.tasks.values():
+            for dep in task.deps:
+                if dep not in self.tasks:
+                    raise ValueError(f"Task '{task.name}' depends on unknown task '{dep}'")
+            for kind, amount in task.resources.items():
+                if amount > self.budgets.get(kind, 0):
+                    raise ValueError(f"Task '{task.name}' needs {amount} {kind} slot(s), budget is {self.budgets.get(kind, 0)}")
+
+        # Priorities = longest weighted path to the end (also detects cycles)
+        dependents: Dict[str, List[str]] = {name: [] for name in self.tasks}
+        for task in self.tasks.values():
+            for dep in task.deps:
+                dependents[dep].append(task.name)
+        visiting, ranked = set(), set()
+
+        def rank(name: str) -> float:
+            if name in ranked:
+                return self.tasks[name].priority
+            if name in visiting:
+                raise ValueError(f"Task graph has a cycle through '{name}'")
+            visiting.add(name)
+            task = self.tasks[name]
+            task.priority = task.weight + max((rank(child) for child in dependents[name]), default=0.0)
+            visiting.discard(name)
+            ranked.add(name)
+            return task.priority
+
+        for name in self.tasks:
+            rank(name)
+
+    def progress(self) -> float:
+        """Overall progress in percent (skipped tasks weren't done, so they don't count)"""
+        with self.lock:
+            total = sum(task.weight for task in self.tasks.values()) or 1.0
+            done = sum(
+                task.weight * (1.0 if task.state == DONE else task.fraction)
+                for task in self.tasks.values()
+            )
+        return min(100.0, done / total * 100)
+
+    def step_status(self, step: str) -> str:
+        """'completed' when all tasks of a progress step are done, 'active' otherwise"""
+        tasks = [task for task in self.tasks.values() if task.step == step]
+        if tasks and all(task.state == DONE for task in tasks):
+            return 'completed'
+        return 'active'
+
+    def snapshot(self) -> List[Dict]:
+        """A copy of every task's state, consistent across tasks"""
+        with self.lock:
+            return self._snapshot()
+
+    def _snapshot(self) -> List[Dict]:
+        return [{
+            'name': task.name,
+            'state': task.state,
+            'step': task.step,
+            'title': task.title,
+            'progress': round(task.fraction * 100, 1),
+            'elapsed': round(task.elapsed, 1),
+            'done': task.done,
+            'unit': task.unit,
+            'resumed': task.resumed,
+            'error': task.error
+        } for task in self.tasks.values()]
+
+    def _fits(self, task: Task) -> bool:
+        return all(self.in_use.get(kind, 0) + amount <= self.budgets.get(kind, 0)
+                   for kind, amount in task.resources.items())
+
+    def _ready(self) -> List[Task]:
+        ready = [
+            task for task in self.tasks.values()
+            if task.state == PENDING and all(self.tasks[dep].state == DONE for dep in task.deps)
+        ]
+        return sorted(ready, key=lambda task: -task.priority)
+
+    def _try_resume(self, task: Task, journal) -> bool:
+        """
+        Skip a ready task whose journaled result is still valid
+
+        Only tasks whose journaled dependencies were skipped too qualify:
+        once something upstream has been redone, everything built on it is
+        redone as well.
+        """
+        if journal is None or task.resume is None or task._resume_checked:
+            return False
+        task._resume_checked = True  # Verify once, not on every scheduler wake-up
+        for dep in task.deps:
+            dep_task = self.tasks[dep]
+            if dep_task.resume is not None and not dep_task.resumed:
+                return False
+        try:
+            if not task.resume(journal.checkpoint(task.name)):
+                return False
+        except Exception as e:
+            logger.debug(f"Could not verify {task.name}: {e}")
+            return False
+        task.resumed = True
+        task.state = DONE
+        task.fraction = 1.0
+        logger.info(f"⏭️  {task.title}: already done, verified")
+        return True
+
+    def _execute(self, task: Task, journal=None):
+        ok = False
+        start = time.perf_counter()
+        task.started_at = time.time()
+        _current_task.set(task)
+        try:
+            with get_tracer().span(task.name, graph=self.name, step=task.step, resources=task.resources) as span:
+                task.result = task.func(task)
+                ok = task.result is not False
+                if task.done is not None:
+                    # Units processed, for throughput history (see core.eta)
+                    span.set_attributes(units=task.done, unit=task.unit)
+                if not ok:
+                    span.fail()
+                elif journal is not None and task.checkpoint is not None:
+                    journal.record(task.name, task.checkpoint(task), time.perf_counter() - start)
+        except Exception as e:
+            ok = False
+            task.error = f"{type(e).__name__}: {e}"
+            logger.error(f"❌ {task.title} failed: {e}")
+
+        with self.lock:
+            task.finished_at = time.time()
+            for kind, amount in task.resources.items():
+                self.in_use[kind] -= amount
+            if ok:
+                task.state = DONE
+                task.fraction = 1.0
+            else:
+                task.state = FAILED
+                task.error = task.error or 'failed'
+                self.failed = self.failed or task
+            self.lock.notify_all()
+        self._notify(task)
+
+    def run(self, journal=None) -> bool:
+        """
+        Run the graph to completion
+
+        Args:
+            journal: Optional InstallJournal; completed tasks are recorded
+                in it and tasks it shows as done (and still valid) are skipped
+
+        Returns:
+            bool: True if every task succeeded (see failed / snapshot() otherwise)
+        """
+        self._validate()
+        threads: List[threading.Thread] = []
+
+        while True:
+            started: List[Task] = []
+            ticked = False
+            with self.lock:
+                if self.failed is None:
+                    progressed = True
+                    while progressed:
+                        progressed = False
+                        for task in self._ready():
+                            if self._try_resume(task, journal):
+                                started.append(task)
+                                progressed = True  # Its dependents may be ready now
+                                continue
+                            if not self._fits(task):
+                                continue
+                            for kind, amount in task.resources.items():
+                                self.in_use[kind] = self.in_use.get(kind, 0) + amount
+                            task.state = RUNNING
+                            started.append(task)
+
+                running = any(task.state == RUNNING for task in self.tasks.values())
+                if not running:
+                    if self.failed:
+                        for task in self.tasks.values():
+                            if task.state == PENDING:
+                                task.state = SKIPPED
+                # Listeners get their turn first, the scheduler waits on the next pass
+                elif not started:
+                    ticked = not self.lock.wait(TICK_INTERVAL)
+
+            for task in started:
+                self._notify(task)
+                if task.state == RUNNING:
+                    # Started after its notice so listeners never see it finish first;
+                    # each task gets a copy of this context, so its span nests under ours
+                    context = contextvars.copy_context()
+                    thread = threading.Thread(
+                        target=context.run, args=(self._execute, task, journal),
+                        name=f'task-{task.name}', daemon=True
+                    )
+                    threads.append(thread)
+                    thread.start()
+            if ticked:
+                self._notify(None)
+            if not running:
+                break
+
+        for thread in threads:
+            thread.join()
+
+        stuck = [task.name for task in self.tasks.values() if task.state == PENDING]
+        if stuck:
+            # Can only happen if a task's claims never fit - _validate rules that out
+            logger.error(f"❌ Tasks never became runnable: {', '.join(stuck)}")
+            return False
+        return self.failed is None
@@ -0,0 +1,235 @@
+"""
+Trace recording for 4Paws Agent
+Records install/update runs (spans plus CPU/memory/disk/network counter
+tracks) and exports them as Chrome Trace Event JSON, which opens in
+Perfetto (ui.perfetto.dev) and chrome://tracing
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import psutil
+
+from .config import Config
+from .tracing import Span, Tracer, get_tracer
+
+logger = logging.getLogger(__name__)
+
+# Spans whose run is recorded as a trace file (first-time install and updates)
+RECORDED_SPANS = ('auto_install_and_setup', 'perform_update', 'update_apps')
+
+# Resource sampling interval while a run is recorded
+SAMPLE_INTERVAL = 0.5
+
+# Trace files kept in logs/traces
+TRACE_FILES_KEPT = 20
+
+TRACES_DIR_NAME = 'traces'
+
+
+class ResourceSampler:
+    """
+    Samples system CPU, RSS of the agent and its child processes (node,
+    pnpm, mysqld), and disk / network throughput on a background thread
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples: List[Dict] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='trace-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> List[Dict]:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.interval * 4)
+        return self.samples
+
+    @staticmethod
+    def _rss_mb(process: psutil.Process) -> float:
+        total = 0
+        for proc in [process] + process.children(recursive=True):
+            try:
+                total += proc.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return total / (1024 * 1024)
+
+    def _run(self):
+        process = psutil.Process(os.getpid())
+        psutil.cpu_percent(None)  # Prime: the first call has no interval to measure
+        last_time = time.time()
+        last_disk = psutil.disk_io_counters()
+        last_net = psutil.net_io_counters()
+
+        while not self._stop.wait(self.interval):
+            try:
+                now = time.time()
+                elapsed = max(now - last_time, 1e-6)
+                disk = psutil.disk_io_counters()
+                net = psutil.net_io_counters()
+                sample = {
+                    'time': now,
+                    'cpu': psutil.cpu_percent(None),
+                    'rss_mb': self._rss_mb(process)
+                }
+                if disk and last_disk:
+                    sample['disk_read_mbs'] = (disk.read_bytes - last_disk.read_bytes) / elapsed / 1e6
+                    sample['disk_write_mbs'] = (disk.write_bytes - last_disk.write_bytes) / elapsed / 1e6
+                if net and last_net:
+                    sample['net_recv_mbs'] = (net.bytes_recv - last_net.bytes_recv) / elapsed / 1e6
+                    sample['net_sent_mbs'] = (net.bytes_sent - last_net.bytes_sent) / elapsed / 1e6
+                self.samples.append(sample)
+                last_time, last_disk, last_net = now, disk, net
+            except Exception as e:
+                logger.debug(f"Resource sample failed: {e}")
+
+
+def to_chrome_trace(spans: List[Dict], samples: List[Dict], metadata: Optional[Dict] = None) -> Dict:
+    """
+    Build a Chrome Trace Event document
+
+    Spans become complete ('X') events on one track per thread; samples
+    become counter ('C') tracks. Timestamps are microseconds from the
+    start of the run.
+    """
+    starts = [span['start'] for span in spans] + [sample['time'] for sample in samples]
+    origin = min(starts) if starts else time.time()
+    pid = os.getpid()
+
+    def us(ts: float) -> int:
+        return int((ts - origin) * 1e6)
+
+    events: List[Dict] = [{'ph': 'M', 'name': 'process_name', 'pid': pid, 'args': {'name': '4Paws Agent'}}]
+    thread_ids: Dict[str, int] = {}
+    for span in sorted(spans, key=lambda s: s['start']):
+        thread = span.get('thread') or 'main'
+        if thread not in thread_ids:
+            thread_ids[thread] = len(thread_ids) + 1
+            events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': thread_ids[thread],
+                           'args': {'name': thread}})
+        args = dict(span.get('attributes') or {})
+        args.update(status=span['status'], span_id=span['span_id'], parent_id=span['parent_id'])
+        if span.get('error'):
+            args['error'] = span['error']
+        events.append({
+            'ph': 'X',
+            'name': span['name'],
+            'cat': span.get('root') or 'agent',
+            'pid': pid,
+            'tid': thread_ids[thread],
+            'ts': us(span['start']),
+            'dur': max(int((span.get('duration') or 0) * 1e6), 1),
+            'args': args
+        })
+
+    for sample in samples:
+        ts = us(sample['time'])
+        events.append({'ph': 'C', 'name': 'CPU %', 'pid': pid, 'ts': ts, 'args': {'system': round(sample['cpu'], 1)}})
+        events.append({'ph': 'C', 'name': 'RSS (MB)', 'pid': pid, 'ts': ts,
+                       'args': {'agent + children': round(sample['rss_mb'], 1)}})
+        if 'disk_read_mbs' in sample:
+            events.append({'ph': 'C', 'name': 'Disk (MB/s)', 'pid': pid, 'ts': ts,
+                           'args': {'read': round(sample['disk_read_mbs'], 2),
+                                    'write': round(sample['disk_write_mbs'], 2)}})
+        if 'net_recv_mbs' in sample:
+            events.append({'ph': 'C', 'name': 'Network (MB/s)', 'pid': pid, 'ts': ts,
+                           'args': {'recv': round(sample['net_recv_mbs'], 2),
+                                    'sent': round(sample['net_sent_mbs'], 2)}})
+
+    return {
+        'traceEvents': events,
+        'displayTimeUnit': 'ms',
+        'otherData': dict(metadata or {}, origin=datetime.fromtimestamp(origin).isoformat())
+    }
+
+
+class TraceRecorder:
+    """
+    Records install/update runs to trace files
+
+    Listens to the tracer: when a span named in RECORDED_SPANS starts, the
+    resource sampler starts and every span of the same trace is collected;
+    when it ends, the run is written to logs/traces/<time>-<name>.json.
+    """
+
+    def __init__(self, tracer: Tracer, traces_dir: Path, recorded=RECORDED_SPANS):
+        self.tracer = tracer
+        self.traces_dir = traces_dir
+        self.recorded = set(recorded)
+        self.lock = threading.Lock()
+        self.runs: Dict[str, Dict] = {}  # trace_id -> {'span', 'spans', 'sampler'}
+        tracer.add_listener(self._on_span)
+
+    def _on_span(self, event: str, span: Span):
+        with self.lock:
+            run = self.runs.get(span.trace_id)
+            if event == 'start':
+                if run is None and span.name in self.recorded:
+                    sampler = ResourceSampler()
+                    sampler.start()
+                    self.runs[span.trace_id] = {'span': span, 'spans': [], 'sampler': sampler}
+                return
+            if run is None:
+                return
+            run['spans'].append(span.to_dict())
+            if span is not run['span']:
+                return
+            del self.runs[span.trace_id]
+
+        self._write(span, run['spans'], run['sampler'].stop())
+
+    def _write(self, root: Span, spans: List[Dict], samples: List[Dict]) -> Optional[Path]:
+        try:
+            self.traces_dir.mkdir(parents=True, exist_ok=True)
+            stamp = datetime.fromtimestamp(root.start_time).strftime('%Y%m%d-%H%M%S')
+            path = self.traces_dir / f"{stamp}-{root.name}.json"
+            trace = to_chrome_trace(spans, samples, {
+                'run': root.name,
+                'trace_id': root.trace_id,
+                'status': root.status,
+                'duration': root.duration,
+                'release': root.release
+            })
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(trace, f, default=str)
+            logger.info(f"⏱️  Trace of {root.name} saved: {path.name}")
+            self._prune()
+            return path
+        except Exception as e:
+            logger.warning(f"⚠️  Could not write trace file: {e}")
+            return None
+
+    def _prune(self):
+        for old in self.list_traces()[TRACE_FILES_KEPT:]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+    def list_traces(self) -> List[Path]:
+        """Trace files, newest first"""
+        if not self.traces_dir.exists():
+            return []
+        return sorted(self.traces_dir.glob('*.json'), reverse=True)
+
+
+_recorder: Optional[TraceRecorder] = None
+
+
+def get_trace_recorder() -> TraceRecorder:
+    """Get the global TraceRecorder (attached to the global tracer)"""
+    global _recorder
+    if _recorder is None:
+        _recorder = TraceRecorder(get_tracer(), Config.LOGS_DIR / TRACES_DIR_NAME)
+    return _recorder
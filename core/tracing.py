@@ -0,0 +1,346 @@
+"""
+Span tracing for 4Paws Agent
+Nested timing of actions and steps (install, update, setup, service starts)
+that is safe across threads and asyncio tasks, with a persisted history
+for comparing step durations across releases
+"""
+
+import json
+import time
+import uuid
+import inspect
+import logging
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .config import Config
+from .log_reader import rotated_segments, open_segment
+
+logger = logging.getLogger(__name__)
+
+# Finished spans kept in memory for the API
+RECENT_SPANS = 500
+
+# Span active in the current thread / asyncio task. Each thread and each
+# task has its own context, so concurrent work never sees another's span.
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+
+class Span:
+    """One timed unit of work; a span without a parent starts a new trace"""
+
+    def __init__(self, name: str, parent: Optional['Span'] = None, attributes: Optional[Dict] = None):
+        self.span_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.parent = parent
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.root_name: str = parent.root_name if parent else name
+        self.release: Optional[str] = None  # Installed versions when the span ended
+        self.attributes: Dict = dict(attributes or {})
+        self.thread = threading.current_thread().name
+
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.end_time: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.status = 'running'
+        self.error: Optional[str] = None
+        self._failed = False
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error: Optional[str] = None):
+        """Mark the span as failed; it is recorded as 'error' when it ends"""
+        self._failed = True
+        if error:
+            self.error = error
+
+    @property
+    def elapsed(self) -> float:
+        if self.duration is not None:
+            return self.duration
+        return time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'root': self.root_name,
+            'release': self.release,
+            'thread': self.thread,
+            'start': self.start_time,
+            'end': self.end_time,
+            'duration': round(self.elapsed, 4),
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes
+        }
+
+
+class Tracer:
+    """
+    Creates spans, tracks the running ones and records finished ones
+
+    Finished spans are kept in memory (for the API) and appended to a
+    JSONL history file, one span per line, so durations of the same step
+    can be compared across releases (see history_stats).
+    """
+
+    def __init__(self, history_file: Optional[Path] = None):
+        self.history_file = history_file
+        self.lock = threading.Lock()
+        self.active: Dict[str, Span] = {}
+        self.recent: deque = deque(maxlen=RECENT_SPANS)
+        self.listeners: List[Callable[[str, Span], None]] = []
+        self.release_provider: Optional[Callable[[], str]] = None
+
+        if self.history_file:
+            self.history_file.parent.mkdir(parents=True, exist_ok=True)
+            from .log_rotation import get_log_rotator, ROTATE_RENAME
+            get_log_rotator().register(self.history_file, ROTATE_RENAME)  # Reopened per write
+
+    def add_listener(self, listener: Callable[[str, Span], None]):
+        """Call listener('start' | 'end', span) for every span"""
+        self.listeners.append(listener)
+
+    def _notify(self, event: str, span: Span):
+        for listener in self.listeners:
+            try:
+                listener(event, span)
+            except Exception as e:
+                logger.debug(f"Span listener failed: {e}")
+
+    def _release(self) -> Optional[str]:
+        if not self.release_provider:
+            return None
+        try:
+            return self.release_provider()
+        except Exception:
+            return None
+
+    def start_span(self, name: str, attributes: Optional[Dict] = None,
+                   parent: Optional[Span] = None, activate: bool = True) -> Span:
+        """
+        Start a span (child of the current span unless parent is given)
+
+        With activate=True it becomes the current span of this thread/task
+        until end_span. Work handed to another thread does not inherit it;
+        pass parent=span explicitly there.
+        """
+        if parent is None:
+            parent = _current_span.get()
+        span = Span(name, parent, attributes)
+        with self.lock:
+            self.active[span.span_id] = span
+        if activate:
+            _current_span.set(span)
+        self._notify('start', span)
+        return span
+
+    def end_span(self, span: Span, success: Optional[bool] = None, error: Optional[str] = None) -> Span:
+        """Finish a span (idempotent) and record it"""
+        if span.status != 'running':
+            return span
+        span.duration = time.perf_counter() - span._start
+        span.end_time = span.start_time + span.duration
+        if success is False:
+            span.fail(error)
+        elif error:
+            span.error = error
+        span.status = 'error' if span._failed else 'ok'
+        # Versions as of the end of the step, i.e. the release it installed or ran
+        span.release = self._release()
+
+        with self.lock:
+            self.active.pop(span.span_id, None)
+            self.recent.append(span.to_dict())
+        if _current_span.get() is span:
+            _current_span.set(span.parent)
+
+        self._persist(span)
+        self._notify('end', span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Run a block inside a span; an exception marks it failed and propagates"""
+        span = self.start_span(name, attributes, activate=False)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, False, f"{type(e).__name__}: {e}")
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            _current_span.reset(token)
+
+    def traced(self, name: Optional[str] = None, **attributes):
+        """
+        Decorator: run the function inside a span
+
+        A function returning False (the agent's usual failure signal) marks
+        the span failed. Coroutine functions are supported.
+        """
+        def decorator(func):
+            span_name = name or func.__name__
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(span_name, **attributes) as span:
+                        result = await func(*args, **kwargs)
+                        if result is False:
+                            span.fail()
+                        return result
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, **attributes) as span:
+                    result = func(*args, **kwargs)
+                    if result is False:
+                        span.fail()
+                    return result
+            return wrapper
+        return decorator
+
+    def _persist(self, span: Span):
+        if not self.history_file:
+            return
+        try:
+            line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+            with self.lock:
+                with open(self.history_file, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+        except Exception as e:
+            logger.debug(f"Could not persist span: {e}")
+
+    def active_spans(self) -> List[Dict]:
+        with self.lock:
+            return [span.to_dict() for span in self.active.values()]
+
+    def recent_spans(self, limit: int = 100, name: Optional[str] = None,
+                     trace_id: Optional[str] = None) -> List[Dict]:
+        """Most recently finished spans, newest first"""
+        with self.lock:
+            spans = list(self.recent)
+        result = []
+        for span in reversed(spans):
+            if name and span['name'] != name:
+                continue
+            if trace_id and span['trace_id'] != trace_id:
+                continue
+            result.append(span)
+            if len(result) >= limit:
+                break
+        return result
+
+    def iter_history(self) -> Iterator[Dict]:
+        """All persisted spans, oldest first (rotated segments included)"""
+        if not self.history_file:
+            return
+        sources = list(reversed(rotated_segments(self.history_file)))
+        if self.history_file.exists():
+            sources.append(self.history_file)
+        for source in sources:
+            try:
+                with open_segment(source) as f:
+                    for line in f:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+            except OSError:
+                continue
+
+    def history_stats(self, name: Optional[str] = None) -> List[Dict]:
+        """
+        Duration statistics per step and release
+
+        Returns:
+            list: {'name', 'release', 'count', 'failed', 'mean', 'p50', 'max', 'last'}
+            sorted by step name, releases in the order they were first seen
+        """
+        groups: Dict[tuple, List[float]] = {}
+        failed: Dict[tuple, int] = {}
+        for span in self.iter_history():
+            if name and span.get('name') != name:
+                continue
+            key = (span.get('name'), span.get('release'))
+            groups.setdefault(key, []).append(span.get('duration') or 0.0)
+            if span.get('status') == 'error':
+                failed[key] = failed.get(key, 0) + 1
+
+        stats = []
+        for (span_name, release), durations in groups.items():
+            ordered = sorted(durations)
+            stats.append({
+                'name': span_name,
+                'release': release,
+                'count': len(durations),
+                'failed': failed.get((span_name, release), 0),
+                'mean': round(sum(durations) / len(durations), 3),
+                'p50': round(ordered[len(ordered) // 2], 3),
+                'max': round(ordered[-1], 3),
+                'last': round(durations[-1], 3)
+            })
+        stats.sort(key=lambda s: s['name'] or '')
+        return stats
+
+
+def current_span() -> Optional[Span]:
+    """Span active in the calling thread / task, if any"""
+    return _current_span.get()
+
+
+def annotate(**attributes):
+    """Add attributes to the current span (no-op outside a span)"""
+    span = _current_span.get()
+    if span:
+        span.set_attributes(**attributes)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """Get the global Tracer (history in logs/spans.jsonl)"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(Config.LOGS_DIR / 'spans.jsonl')
+    return _tracer
+
+
+def traced(name: Optional[str] = None, **attributes):
+    """Decorator using the global tracer (see Tracer.traced)"""
+    def decorator(func):
+        # Resolve the tracer on first call, not at import time
+        @functools.wraps(func)
+        def lazy(*args, **kwargs):
+            return get_tracer().traced(name or func.__name__, **attributes)(func)(*args, **kwargs)
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def lazy_async(*args, **kwargs):
+                return await get_tracer().traced(name or func.__name__, **attributes)(func)(*args, **kwargs)
+            return lazy_async
+        return lazy
+    return decorator
+
+
+def trace_span(name: str, **attributes):
+    """Context manager using the global tracer (see Tracer.span)"""
+    return get_tracer().span(name, **attributes)
@@ -0,0 +1,352 @@
+"""
+Hardware-aware tuning for 4Paws Agent
+Probes RAM, cores and the data disk and derives MariaDB, Node.js heap and
+Prisma pool settings from them. Each generated profile is saved as a new
+version, so changes can be diffed and rolled back; a re-tune only needs
+the services restarted
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import threading
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import psutil
+
+from .config import Config
+from .install_journal import write_json_atomic
+from .cluster import configured_max_workers
+from .proxy import proxy_enabled
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Share of RAM for the InnoDB buffer pool. MariaDB shares the PC with the
+# Node apps, the agent and the front-desk software, so not the usual 70%
+BUFFER_POOL_SHARE = 0.25
+BUFFER_POOL_CHUNK = 128 * MB
+
+# Share of RAM for the V8 heaps of all backend workers / the frontend
+BACKEND_HEAP_SHARE = 0.25
+FRONTEND_HEAP_SHARE = 0.125
+MIN_HEAP_MB = 512
+MAX_HEAP_MB = 4096
+
+# Prisma pool per backend process (Prisma's own default is cores * 2 + 1)
+MIN_CONNECTION_LIMIT = 3
+MAX_CONNECTION_LIMIT = 10
+
+# Connections kept free for the agent, backups and admin tools
+CONNECTION_HEADROOM = 30
+
+# MariaDB settings written to my.ini, in file order
+MARIADB_KEYS = (
+    'innodb_buffer_pool_size', 'innodb_log_file_size', 'innodb_flush_method',
+    'innodb_flush_neighbors', 'innodb_io_capacity', 'max_connections',
+    'tmp_table_size', 'max_heap_table_size'
+)
+
+
+def _run(args: List[str], timeout: float = 10) -> str:
+    try:
+        kwargs = {'creationflags': subprocess.CREATE_NO_WINDOW} if sys.platform == 'win32' else {}
+        result = subprocess.run(args, capture_output=True, text=True, timeout=timeout, **kwargs)
+        return result.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+def probe_disk_type(path: Path) -> str:
+    """'ssd', 'hdd' or 'unknown' for the disk holding path"""
+    try:
+        path = path if path.exists() else Path(path.anchor or '/')
+        if sys.platform == 'win32':
+            drive = path.resolve().drive.rstrip(':')
+            media = _run(['powershell', '-NoProfile', '-Command',
+                          f"(Get-Partition -DriveLetter {drive} | Get-Disk | Get-PhysicalDisk).MediaType"])
+            return {'ssd': 'ssd', 'hdd': 'hdd'}.get(media.strip().lower(), 'unknown')
+        # Linux: the block device's rotational flag (partitions share their disk's queue)
+        dev = os.stat(path).st_dev
+        block = Path(f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}")
+        for queue in (block / 'queue', block.resolve().parent / 'queue'):
+            rotational = queue / 'rotational'
+            if rotational.exists():
+                return 'hdd' if rotational.read_text().strip() == '1' else 'ssd'
+    except (OSError, ValueError):
+        pass
+    return 'unknown'
+
+
+_hardware: Optional[Dict] = None
+
+
+def probe_hardware(refresh: bool = False) -> Dict:
+    """RAM, physical/logical cores and data disk type of this PC (probed once per run)"""
+    global _hardware
+    if _hardware is None or refresh:
+        _hardware = {
+            'memory_mb': psutil.virtual_memory().total // MB,
+            'cores': psutil.cpu_count(logical=False) or os.cpu_count() or 1,
+            'threads': psutil.cpu_count(logical=True) or os.cpu_count() or 1,
+            'disk': probe_disk_type(Config.DATA_DIR),
+            'platform': sys.platform
+        }
+    return dict(_hardware)
+
+
+def backend_process_count() -> int:
+    """Backend processes that may share MariaDB and RAM (cluster maximum)"""
+    return configured_max_workers() if proxy_enabled() else 1
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def generate_settings(hardware: Dict, backend_processes: int) -> Dict:
+    """Settings for the given hardware and number of backend processes"""
+    memory = hardware['memory_mb'] * MB
+    ssd = hardware['disk'] != 'hdd'
+
+    buffer_pool = max(BUFFER_POOL_CHUNK, int(memory * BUFFER_POOL_SHARE) // BUFFER_POOL_CHUNK * BUFFER_POOL_CHUNK)
+    # Redo log of a quarter of the buffer pool: enough for bursts of writes
+    # without long crash recovery
+    log_file = _clamp(buffer_pool // 4 // MB, 96, 1024) * MB
+    connection_limit = _clamp((hardware['cores'] * 2 + 1) // backend_processes,
+                              MIN_CONNECTION_LIMIT, MAX_CONNECTION_LIMIT)
+    tmp_table = (64 if memory >= 8192 * MB else 32) * MB
+
+    return {
+        'mariadb': {
+            'innodb_buffer_pool_size': f"{buffer_pool // MB}M",
+            'innodb_log_file_size': f"{log_file // MB}M",
+            # Bypass the OS cache (the buffer pool already caches pages)
+            'innodb_flush_method': 'unbuffered' if hardware.get('platform') == 'win32' else 'O_DIRECT',
+            'innodb_flush_neighbors': 0 if ssd else 1,
+            'innodb_io_capacity': 1000 if ssd else 200,
+            'max_connections': max(100, backend_processes * connection_limit + CONNECTION_HEADROOM),
+            'tmp_table_size': f"{tmp_table // MB}M",
+            'max_heap_table_size': f"{tmp_table // MB}M"
+        },
+        'node': {
+            'backend_heap_mb': _clamp(int(memory * BACKEND_HEAP_SHARE / MB) // backend_processes,
+                                      MIN_HEAP_MB, MAX_HEAP_MB),
+            'frontend_heap_mb': _clamp(int(memory * FRONTEND_HEAP_SHARE / MB), MIN_HEAP_MB, MAX_HEAP_MB)
+        },
+        'prisma': {
+            'connection_limit': connection_limit
+        }
+    }
+
+
+def _flatten(settings: Dict) -> Dict[str, object]:
+    return {f"{section}.{key}": value
+            for section, values in settings.items() for key, value in values.items()}
+
+
+def diff_settings(old: Optional[Dict], new: Dict) -> List[Dict]:
+    """Changed settings between two profiles' settings ({key, old, new})"""
+    before, after = _flatten(old or {}), _flatten(new)
+    return [
+        {'key': key, 'old': before.get(key), 'new': after.get(key)}
+        for key in sorted(set(before) | set(after))
+        if before.get(key) != after.get(key)
+    ]
+
+
+class TuningProfiles:
+    """
+    Versioned tuning profiles (tuning/profile-0001.json, ...)
+
+    A profile holds the hardware it was generated for, the generated
+    settings, manual overrides and the reason it was made. The newest
+    profile is the active one: applying (or rolling back to) other settings
+    always writes a new version, so the history reads top to bottom. The
+    active profile renders the managed my.ini that mysqld is started with
+    (--defaults-file) and the NODE_OPTIONS / connection_limit the apps get.
+    """
+
+    def __init__(self, directory: Path, ini_path: Path):
+        self.directory = directory
+        self.ini_path = ini_path
+        self.lock = threading.Lock()
+
+    def _path(self, version: int) -> Path:
+        return self.directory / f"profile-{version:04d}.json"
+
+    def versions(self) -> List[int]:
+        if not self.directory.exists():
+            return []
+        found = (re.match(r'profile-(\d+)\.json$', p.name) for p in self.directory.iterdir())
+        return sorted(int(m.group(1)) for m in found if m)
+
+    def load(self, version: int) -> Optional[Dict]:
+        try:
+            with open(self._path(version), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def current(self) -> Optional[Dict]:
+        versions = self.versions()
+        return self.load(versions[-1]) if versions else None
+
+    def history(self) -> List[Dict]:
+        """Summary of every version, newest first"""
+        entries = []
+        for version in reversed(self.versions()):
+            profile = self.load(version)
+            if profile:
+                entries.append({key: profile.get(key) for key in ('version', 'created_at', 'reason', 'hardware')})
+        return entries
+
+    @staticmethod
+    def effective(profile: Dict) -> Dict:
+        """Generated settings with the profile's overrides applied"""
+        settings = json.loads(json.dumps(profile['generated']))
+        for section, values in (profile.get('overrides') or {}).items():
+            settings.setdefault(section, {}).update(values)
+        return settings
+
+    def propose(self, overrides: Optional[Dict] = None, refresh: bool = False) -> Dict:
+        """Profile for the current hardware (not saved); keeps the active overrides unless given"""
+        current = self.current()
+        hardware = probe_hardware(refresh)
+        backend_processes = backend_process_count()
+        if overrides is None:
+            overrides = (current or {}).get('overrides') or {}
+        proposal = {
+            'hardware': hardware,
+            'backend_processes': backend_processes,
+            'generated': generate_settings(hardware, backend_processes),
+            'overrides': overrides
+        }
+        proposal['settings'] = self.effective(proposal)
+        proposal['changes'] = diff_settings(current['settings'] if current else None, proposal['settings'])
+        return proposal
+
+    def apply(self, reason: str, overrides: Optional[Dict] = None, settings: Optional[Dict] = None) -> Dict:
+        """
+        Save a new profile version (re-probing the hardware) and render my.ini
+
+        Returns the active profile and its changes; no new version is
+        written when nothing changed. settings= saves given settings as-is
+        (rollback).
+        """
+        with self.lock:
+            current = self.current()
+            proposal = self.propose(overrides, refresh=True)
+            if settings is not None:
+                proposal.update(generated=settings, overrides={}, settings=settings)
+                proposal['changes'] = diff_settings(current['settings'] if current else None, settings)
+            if current and not proposal['changes'] and proposal['hardware'] == current['hardware']:
+                self.write_ini(current)
+                return {'profile': current, 'changes': [], 'created': False}
+
+            version = (self.versions() or [0])[-1] + 1
+            profile = {
+                'version': version,
+                'created_at': time.time(),
+                'reason': reason,
+                **{key: proposal[key] for key in ('hardware', 'backend_processes', 'generated', 'overrides', 'settings')}
+            }
+            write_json_atomic(self._path(version), profile)
+            self.write_ini(profile)
+            for change in proposal['changes']:
+                logger.info(f"🎛️  {change['key']}: {change['old']} → {change['new']}")
+            logger.info(f"✅ Tuning profile v{version} active ({reason}); restart services to apply")
+            return {'profile': profile, 'changes': proposal['changes'], 'created': True}
+
+    def rollback(self, version: int) -> Dict:
+        """Make an older version's settings active again (as a new version)"""
+        old = self.load(version)
+        if old is None:
+            raise ValueError(f"Tuning profile v{version} not found")
+        return self.apply(f"rollback to v{version}", settings=old['settings'])
+
+    def ensure(self) -> Optional[Dict]:
+        """
+        Active profile, created on first use and regenerated when the
+        hardware (RAM upgrade, moved to another PC) or the number of
+        backend workers changed
+        """
+        if os.getenv('TUNING', Config.TUNING) != 'auto':
+            return None
+        try:
+            current = self.current()
+            if current is None:
+                return self.apply('initial')['profile']
+            if probe_hardware() != current['hardware']:
+                return self.apply('hardware changed')['profile']
+            if backend_process_count() != current.get('backend_processes'):
+                return self.apply('backend workers changed')['profile']
+            if not self.ini_path.exists():
+                self.write_ini(current)
+            return current
+        except Exception as e:
+            # Never keep services from starting: they run on defaults instead
+            logger.warning(f"⚠️  Tuning profile unavailable, using defaults: {e}")
+            return None
+
+    def write_ini(self, profile: Dict):
+        """Render the managed my.ini of a profile"""
+        mariadb = profile['settings']['mariadb']
+        lines = [
+            f"# Managed by 4Paws Agent - tuning profile v{profile['version']} ({profile['reason']})",
+            "# Regenerated on re-tune: change settings with overrides, not here",
+            f"# Hardware: {profile['hardware']['memory_mb']} MB RAM, {profile['hardware']['cores']} cores, "
+            f"{profile['hardware']['disk']} disk",
+            "",
+            "[mysqld]"
+        ]
+        lines += [f"{key}={mariadb[key]}" for key in MARIADB_KEYS if key in mariadb]
+        lines += [f"{key}={value}" for key, value in mariadb.items() if key not in MARIADB_KEYS]
+        self.ini_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.ini_path.with_name(f"{self.ini_path.name}.tmp")
+        tmp.write_text("\n".join(lines) + "\n", encoding='utf-8')
+        os.replace(tmp, self.ini_path)
+
+    # --- What the services are started with ------------------------------
+
+    def mariadb_args(self) -> List[str]:
+        """mysqld options file argument (must come first on the command line)"""
+        profile = self.ensure()
+        if profile is None or not self.ini_path.exists():
+            return []
+        return [f"--defaults-file={self.ini_path}"]
+
+    def node_options(self, component: str, existing: Optional[str] = None) -> Optional[str]:
+        """NODE_OPTIONS with the profile's heap limit (replacing any earlier one)"""
+        profile = self.ensure()
+        if profile is None:
+            return existing
+        heap = profile['settings']['node'].get(f"{component}_heap_mb")
+        options = re.sub(r'--max-old-space-size=\d+\s*', '', existing or '').strip()
+        return f"{options} --max-old-space-size={heap}".strip() if heap else options or None
+
+    def database_url(self, url: str) -> str:
+        """DATABASE_URL with the profile's Prisma connection_limit (kept if the URL sets one)"""
+        profile = self.ensure()
+        if profile is None or not url or 'connection_limit=' in url:
+            return url
+        limit = profile['settings']['prisma']['connection_limit']
+        separator = '&' if '?' in url else '?'
+        return f"{url}{separator}connection_limit={limit}"
+
+
+_profiles: Optional[TuningProfiles] = None
+
+
+def get_tuning() -> TuningProfiles:
+    """Get the global TuningProfiles (tuning/ in the writable dir, my.ini in the data dir)"""
+    global _profiles
+    if _profiles is None:
+        _profiles = TuningProfiles(Config.WRITABLE_DIR / 'tuning', Config.DATA_DIR / 'my.ini')
+    return _profiles
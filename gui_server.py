@@ -11,10 +11,10 @@ import socket
 import psutil
 import subprocess
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
 from functools import wraps
 from flask import Flask, render_template, jsonify, request, send_file, Response
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
 from dotenv import load_dotenv
 
@@ -22,6 +22,28 @@ from dotenv import load_dotenv
 sys.path.insert(0, str(Path(__file__).parent))
 from agent import Agent, ProcessManager, Config, VersionManager, set_agent_log_manager
 from log_manager import init_log_manager, get_log_manager
+from core.log_reader import (
+    read_incremental, get_line_index, tail_lines_rotated, rotated_segments, tail_segment_lines
+)
+from core.log_rotation import get_log_rotator, ROTATE_RENAME
+from core.log_timeline import stream_timeline, LEVELS as TIMELINE_LEVELS
+from core.tracing import get_tracer, traced, current_span
+from core.trace_export import get_trace_recorder
+from core.install_journal import get_install_journal, STATUS_RUNNING
+from core.eta import RunHistory
+from core.task_graph import DONE
+from core.proxy import get_service_proxy, proxy_enabled, lazy_start_enabled
+from core.tuning import get_tuning, diff_settings
+from core.mariadb import startup_history
+from core.backup import get_backups
+from core.binlog import get_binlog_archiver
+from core.snapshot import get_snapshots
+from core.slow_log import get_slow_query_log
+from core.index_advisor import get_index_advisor
+from core.db_metrics import get_db_metrics
+from core.maintenance import get_maintenance
+from core.rehearsal import get_migration_rehearsal
+from service_output import get_output_ingestor, get_output_mode
 from installation_server import start_installation_server, stop_installation_server, get_installation_server
 import threading
 import time
@@ -46,10 +68,24 @@ agent = Agent()
 # Initialize log manager
 log_file = Path(__file__).parent / 'logs' / 'agent_web.log'
 log_manager = init_log_manager(log_file, socketio)
+get_log_rotator().register(log_file, ROTATE_RENAME)  # LogManager reopens per write
 
 # Connect agent logging to web GUI
 set_agent_log_manager(log_manager)
 
+# Services whose output can be streamed (pipe mode)
+SERVICE_NAMES = ('mariadb', 'backend', 'frontend')
+
+def emit_service_output(service, entries, stats):
+    """Push newly ingested service lines to clients subscribed to that service"""
+    socketio.emit('service_log_lines', {
+        'service': service,
+        'lines': entries,
+        'stats': stats
+    }, to=f'service-logs:{service}')
+
+get_output_ingestor().set_emitter(emit_service_output)
+
 # Reduce Flask logging verbosity (disable HTTP access logs in Web GUI)
 import logging as flask_logging
 flask_logging.getLogger('werkzeug').setLevel(flask_logging.WARNING)
@@ -85,6 +121,10 @@ def requires_auth(f):
         return f(*args, **kwargs)
     return decorated
 
+# /api/logs page size
+LOGS_API_DEFAULT_LIMIT = 1000
+LOGS_API_MAX_LIMIT = 5000
+
 # Update check cache (1 hour)
 UPDATE_CHECK_CACHE = {
     'last_check': None,
@@ -92,6 +132,10 @@ UPDATE_CHECK_CACHE = {
     'cache_duration': 3600  # 1 hour in seconds
 }
 
+# How long a loading page server retries binding while a stopped service
+# releases its port
+LOADING_SERVER_BIND_TIMEOUT = 5
+
 def find_available_port(start_port=5000):
     """Find available port starting from start_port"""
     port = start_port
@@ -172,6 +216,12 @@ def api_status():
             'mariadb': str(Config.MARIADB_DIR.absolute()) if Config.MARIADB_DIR.exists() else 'Not installed',
             'data': str(Config.DATA_DIR.absolute())
         },
+        'output': get_output_ingestor().get_stats(),
+        'mariadb_startup': ProcessManager.mariadb_startup,
+        'mariadb_metrics': get_db_metrics().summary(),
+        'cluster': ProcessManager.cluster.status() if ProcessManager._cluster_active() else None,
+        'lazy': {name: get_service_proxy(name).status().get('lazy') for name in ['backend', 'frontend']}
+                if lazy_start_enabled() else None,
         'system': {
             'cpu': psutil.cpu_percent(),
             'memory': psutil.virtual_memory().percent,
@@ -183,15 +233,15 @@ def api_status():
 @requires_auth
 def api_start(service):
     """Start a service"""
+    action = log_manager.start_action(f'start-{service}')
     try:
-        log_manager.start_action(f'start-{service}')
         log_manager.info(f"🚀 Starting {service}...")
         
         # Check license before starting ANY service
         from core import LicenseManager
         if not LicenseManager.check_and_block():
             log_manager.error("❌ License invalid - cannot start services")
-            log_manager.end_action(f'start-{service}', False)
+            log_manager.end_action(action, False)
             return jsonify({
                 'success': False,
                 'error': 'License expired or invalid. Please renew license to continue.'
@@ -208,6 +258,7 @@ def api_start(service):
             success = ProcessManager.start_frontend()
         else:
             log_manager.error(f"Unknown service: {service}")
+            log_manager.end_action(action, False)
             return jsonify({'success': False, 'error': f'Unknown service: {service}'}), 400
         
         if success:
@@ -215,19 +266,19 @@ def api_start(service):
         else:
             log_manager.error(f"❌ Failed to start {service}")
         
-        log_manager.end_action(f'start-{service}', success)
+        log_manager.end_action(action, success)
         return jsonify({'success': success})
     except Exception as e:
         log_manager.error(f"❌ Error starting {service}: {str(e)}")
-        log_manager.end_action(f'start-{service}', False)
+        log_manager.end_action(action, False)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/stop/<service>', methods=['POST'])
 @requires_auth
 def api_stop(service):
     """Stop a service"""
+    action = log_manager.start_action(f'stop-{service}')
     try:
-        log_manager.start_action(f'stop-{service}')
         
         if service == 'all':
             # Check which services are actually running
@@ -240,20 +291,20 @@ def api_stop(service):
             
             if not running_services:
                 log_manager.info("ℹ️  All services already stopped")
-                log_manager.end_action(f'stop-{service}', True)
+                log_manager.end_action(action, True)
                 return jsonify({'success': True, 'message': 'All services already stopped'})
             
             log_manager.info(f"⏹️ Stopping {len(running_services)} running service(s): {', '.join(running_services)}")
             agent.stop_all()
             log_manager.success(f"✅ All services stopped")
-            log_manager.end_action(f'stop-{service}', True)
+            log_manager.end_action(action, True)
             return jsonify({'success': True, 'stopped': running_services})
             
         elif service in ['mariadb', 'backend', 'frontend']:
             # Check if service is in process manager
             if service not in ProcessManager.processes:
                 log_manager.info(f"ℹ️  {service} is not running")
-                log_manager.end_action(f'stop-{service}', True)
+                log_manager.end_action(action, True)
                 return jsonify({'success': True, 'message': f'{service} is not running'})
             
             process = ProcessManager.processes[service]
@@ -262,12 +313,28 @@ def api_stop(service):
             if process.poll() is not None:
                 log_manager.info(f"ℹ️  {service} already stopped")
                 del ProcessManager.processes[service]
-                log_manager.end_action(f'stop-{service}', True)
+                log_manager.end_action(action, True)
                 return jsonify({'success': True, 'message': f'{service} already stopped'})
             
             # Process is running, stop it
             log_manager.info(f"⏹️ Stopping {service}...")
             
+            if service == 'mariadb':
+                # Clean shutdown (no crash recovery on the next start); killed only past the deadline
+                if ProcessManager.stop_mariadb():
+                    log_manager.success("✅ mariadb shut down cleanly")
+                else:
+                    log_manager.warning("⚠️  mariadb did not shut down in time and was killed")
+                log_manager.end_action(action, True)
+                return jsonify({'success': True, 'message': f'{service} stopped successfully'})
+            
+            if service in ['backend', 'frontend'] and proxy_enabled():
+                # Proxy switches to the maintenance page and drains first
+                ProcessManager.stop_service(service)
+                log_manager.success(f"✅ {service} stopped")
+                log_manager.end_action(action, True)
+                return jsonify({'success': True, 'message': f'{service} stopped successfully'})
+            
             try:
                 # Try graceful termination
                 process.terminate()
@@ -281,18 +348,369 @@ def api_stop(service):
                 log_manager.success(f"✅ {service} force stopped")
             
             del ProcessManager.processes[service]
-            log_manager.end_action(f'stop-{service}', True)
+            log_manager.end_action(action, True)
             return jsonify({'success': True, 'message': f'{service} stopped successfully'})
             
         else:
             log_manager.error(f"Unknown service: {service}")
-            log_manager.end_action(f'stop-{service}', False)
+            log_manager.end_action(action, False)
             return jsonify({'success': False, 'error': f'Unknown service: {service}'}), 400
             
     except Exception as e:
         log_manager.error(f"❌ Error stopping {service}: {str(e)}")
-        log_manager.end_action(f'stop-{service}', False)
+        log_manager.end_action(action, False)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/restart/<service>', methods=['POST'])
+@requires_auth
+def api_restart(service):
+    """Restart backend or frontend (blue/green behind the proxy)"""
+    if service not in ['backend', 'frontend']:
+        return jsonify({'success': False, 'error': f'Unknown service: {service}'}), 400
+    action = log_manager.start_action(f'restart-{service}')
+    try:
+        log_manager.info(f"🔄 Restarting {service}...")
+        success = ProcessManager.restart_service(service)
+        if success:
+            log_manager.success(f"✅ {service} restarted")
+        else:
+            log_manager.error(f"❌ Failed to restart {service}")
+        log_manager.end_action(action, success)
+        return jsonify({'success': success})
+    except Exception as e:
+        log_manager.error(f"❌ Error restarting {service}: {str(e)}")
+        log_manager.end_action(action, False)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/cluster')
+@requires_auth
+def api_cluster():
+    """Backend workers: per-worker CPU, memory, requests; size limits and last scaling"""
+    if not ProcessManager._cluster_active():
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **ProcessManager.cluster.status()})
+
+@app.route('/api/cluster/scale', methods=['POST'])
+@requires_auth
+def api_cluster_scale():
+    """Set the number of backend workers (autoscaling may change it again)"""
+    if not ProcessManager._cluster_active():
+        return jsonify({'success': False, 'error': 'Backend cluster is not running'}), 400
+    data = request.get_json(silent=True) or {}
+    try:
+        workers = int(data.get('workers'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'workers must be a number'}), 400
+    cluster = ProcessManager.cluster
+    workers = max(cluster.min_workers, min(workers, cluster.max_workers))
+    log_manager.info(f"📈 Scaling backend to {workers} worker(s)...")
+    size = cluster.scale_to(workers, 'manual')
+    return jsonify({'success': size == workers, 'workers': size})
+
+@app.route('/api/tuning')
+@requires_auth
+def api_tuning():
+    """Active tuning profile, what a re-tune would change, and the version history"""
+    tuning = get_tuning()
+    return jsonify({
+        'enabled': os.getenv('TUNING', Config.TUNING) == 'auto',
+        'active': tuning.current(),
+        'proposal': tuning.propose(refresh=True),
+        'history': tuning.history(),
+        'ini_path': str(tuning.ini_path)
+    })
+
+@app.route('/api/tuning/apply', methods=['POST'])
+@requires_auth
+def api_tuning_apply():
+    """Re-tune: probe the hardware and save a new profile version (optional overrides)"""
+    data = request.get_json(silent=True) or {}
+    overrides = data.get('overrides')
+    if overrides is not None and not isinstance(overrides, dict):
+        return jsonify({'success': False, 'error': 'overrides must be an object'}), 400
+    try:
+        result = get_tuning().apply(data.get('reason') or 'manual re-tune', overrides)
+    except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'restart_required': result['created'], **result})
+
+@app.route('/api/tuning/rollback/<int:version>', methods=['POST'])
+@requires_auth
+def api_tuning_rollback(version):
+    """Make an older profile's settings active again (saved as a new version)"""
+    try:
+        result = get_tuning().rollback(version)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    return jsonify({'success': True, 'restart_required': result['created'], **result})
+
+@app.route('/api/tuning/diff')
+@requires_auth
+def api_tuning_diff():
+    """Settings changed between two profile versions (?from=1&to=3)"""
+    tuning = get_tuning()
+    old = tuning.load(request.args.get('from', type=int) or 0)
+    new = tuning.load(request.args.get('to', type=int) or 0)
+    if not old or not new:
+        return jsonify({'success': False, 'error': 'Profile version not found'}), 404
+    return jsonify({'success': True, 'changes': diff_settings(old['settings'], new['settings'])})
+
+@app.route('/api/mariadb/startup')
+@requires_auth
+def api_mariadb_startup():
+    """Last MariaDB start (crash recovery time) and recent starts/shutdowns (?limit=20)"""
+    return jsonify({
+        'last': ProcessManager.mariadb_startup,
+        'history': startup_history(request.args.get('limit', 20, type=int))
+    })
+
+@app.route('/api/backups')
+@requires_auth
+def api_backups():
+    """Database backups (newest first), the running backup/restore and whether one is due"""
+    backups = get_backups()
+    return jsonify({**backups.status(), 'backups': backups.list(), 'binlog': get_binlog_archiver().status()})
+
+@app.route('/api/backups', methods=['POST'])
+@requires_auth
+def api_backup_create():
+    """Start a database backup in the background (progress in GET /api/backups)"""
+    if get_backups().running:
+        return jsonify({'success': False, 'error': 'A backup or restore is already running'}), 409
+    
+    def run():
+        action = log_manager.start_action('backup')
+        manifest = agent.backup_database('manual')
+        if manifest:
+            log_manager.success(f"✅ Backup {manifest['id']} saved "
+                                f"({manifest['bytes'] / 1048576:.1f} MB, {manifest['seconds']:.1f}s)")
+        else:
+            log_manager.error("❌ Backup failed")
+        log_manager.end_action(action, manifest is not None)
+    
+    threading.Thread(target=run, daemon=True).start()
+    return jsonify({'success': True, 'started': True}), 202
+
+@app.route('/api/backups/<backup_id>/restore', methods=['POST'])
+@requires_auth
+def api_backup_restore(backup_id):
+    """Replace the database with a backup (backend must be stopped; current data is backed up first)"""
+    backups = get_backups()
+    if backups.load(backup_id) is None:
+        return jsonify({'success': False, 'error': f'Backup {backup_id} not found'}), 404
+    if backups.running:
+        return jsonify({'success': False, 'error': 'A backup or restore is already running'}), 409
+    if ProcessManager._cluster_active() or get_process_status('backend')['running']:
+        return jsonify({'success': False, 'error': 'Stop the backend before restoring a backup'}), 409
+    
+    def run():
+        action = log_manager.start_action('restore')
+        log_manager.info(f"♻️  Restoring backup {backup_id}...")
+        result = agent.restore_database(backup_id)
+        if result:
+            log_manager.success(f"✅ Restored {backup_id} in {result['seconds']:.1f}s")
+        else:
+            log_manager.error(f"❌ Restore of {backup_id} failed")
+        log_manager.end_action(action, result is not None)
+    
+    threading.Thread(target=run, daemon=True).start()
+    return jsonify({'success': True, 'started': True}), 202
+
+@app.route('/api/backups/pitr', methods=['POST'])
+@requires_auth
+def api_backup_pitr():
+    """Restore the database as it was at a time ({"time": epoch seconds}; backend must be stopped)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        target = float(data.get('time'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'time must be epoch seconds'}), 400
+    if get_binlog_archiver().base_backup(target) is None:
+        return jsonify({'success': False, 'error': 'No backup with a binary log position before that time'}), 404
+    if get_backups().running:
+        return jsonify({'success': False, 'error': 'A backup or restore is already running'}), 409
+    if ProcessManager._cluster_active() or get_process_status('backend')['running']:
+        return jsonify({'success': False, 'error': 'Stop the backend before restoring a backup'}), 409
+    
+    def run():
+        action = log_manager.start_action('restore')
+        log_manager.info(f"♻️  Restoring database to {datetime.fromtimestamp(target):%Y-%m-%d %H:%M:%S}...")
+        result = agent.restore_database_to(target)
+        if result:
+            log_manager.success(f"✅ Restored backup {result['backup']} + {len(result['binlogs'])} binary log(s)")
+        else:
+            log_manager.error("❌ Point-in-time restore failed")
+        log_manager.end_action(action, result is not None)
+    
+    threading.Thread(target=run, daemon=True).start()
+    return jsonify({'success': True, 'started': True}), 202
+
+@app.route('/api/backups/<backup_id>/verify')
+@requires_auth
+def api_backup_verify(backup_id):
+    """Check a backup's files against the checksums in its manifest"""
+    problems = get_backups().verify(backup_id)
+    return jsonify({'success': not problems, 'problems': problems})
+
+@app.route('/api/snapshots')
+@requires_auth
+def api_snapshots():
+    """MariaDB data directory snapshots (newest first) and the running snapshot/restore"""
+    return jsonify(get_snapshots().status())
+
+@app.route('/api/snapshots/<snapshot_id>/verify')
+@requires_auth
+def api_snapshot_verify(snapshot_id):
+    """Check a snapshot's files against the sizes and chunk checksums in its manifest"""
+    problems = get_snapshots().verify(snapshot_id)
+    return jsonify({'success': not problems, 'problems': problems})
+
+@app.route('/api/slow-queries')
+@requires_auth
+def api_slow_queries():
+    """Slowest statement fingerprints (?limit=20&sort=total|count|avg|p95|max|rows_examined)"""
+    slow_log = get_slow_query_log()
+    sort = request.args.get('sort', 'total')
+    if sort not in ('total', 'count', 'avg', 'p95', 'max', 'rows_examined'):
+        return jsonify({'success': False, 'error': f'Unknown sort: {sort}'}), 400
+    return jsonify({
+        'success': True,
+        **slow_log.status(),
+        'queries': slow_log.top(request.args.get('limit', 20, type=int), sort)
+    })
+
+@app.route('/api/slow-queries/<fingerprint>')
+@requires_auth
+def api_slow_query(fingerprint):
+    """One fingerprint's aggregates with its slowest sample statement"""
+    digest = get_slow_query_log().get(fingerprint)
+    if digest is None:
+        return jsonify({'success': False, 'error': 'Fingerprint not found'}), 404
+    return jsonify({'success': True, 'query': digest})
+
+@app.route('/api/slow-queries/reset', methods=['POST'])
+@requires_auth
+def api_slow_queries_reset():
+    """Start the slow query digest over"""
+    get_slow_query_log().reset()
+    return jsonify({'success': True})
+
+@app.route('/api/db-metrics')
+@requires_auth
+def api_db_metrics():
+    """MariaDB performance time series: last hour per sample, the day in 5 minute averages, table sizes"""
+    return jsonify({'success': True, **get_db_metrics().status()})
+
+@app.route('/api/maintenance')
+@requires_auth
+def api_maintenance():
+    """Maintenance windows, the pending plan and recent runs with per-table durations"""
+    return jsonify({'success': True, **get_maintenance().status()})
+
+@app.route('/api/maintenance/run', methods=['POST'])
+@requires_auth
+def api_maintenance_run():
+    """Run maintenance now for up to MAINTENANCE_WINDOW_MINUTES (load guards still apply)"""
+    maintenance = get_maintenance()
+    if maintenance.running:
+        return jsonify({'success': False, 'error': 'Maintenance is already running'}), 409
+    if not get_process_status('mariadb')['running']:
+        return jsonify({'success': False, 'error': 'MariaDB is not running'}), 409
+    minutes = int(os.getenv('MAINTENANCE_WINDOW_MINUTES', Config.MAINTENANCE_WINDOW_MINUTES))
+    
+    def run():
+        action = log_manager.start_action('maintenance')
+        try:
+            record = maintenance.run(datetime.now() + timedelta(minutes=minutes), agent.maintenance_load, 'manual')
+        except Exception as e:
+            log_manager.error(f"❌ Database maintenance failed: {e}")
+            log_manager.end_action(action, False)
+            return
+        message = f"🧹 Database maintenance: {len(record['tasks'])} task(s) run, {record['pending']} pending"
+        if record['stopped']:
+            message += f" (stopped: {record['stopped']})"
+        log_manager.success(message)
+        log_manager.end_action(action, True)
+    
+    threading.Thread(target=run, daemon=True).start()
+    return jsonify({'success': True, 'started': True}), 202
+
+@app.route('/api/index-advisor')
+@requires_auth
+def api_index_advisor():
+    """Index suggestions from the last analysis with their review status"""
+    advisor = get_index_advisor()
+    state = advisor.load()
+    return jsonify({
+        'success': True,
+        **advisor.status(),
+        'suggestions': advisor.suggestions(),
+        'results': [{key: value for key, value in result.items() if key != 'plan'}
+                    for result in state.get('results', [])]
+    })
+
+@app.route('/api/index-advisor/analyze', methods=['POST'])
+@requires_auth
+def api_index_advisor_analyze():
+    """EXPLAIN the slowest fingerprints in the background"""
+    advisor = get_index_advisor()
+    if advisor.running:
+        return jsonify({'success': False, 'error': 'An analysis is already running'}), 409
+    if not get_process_status('mariadb')['running']:
+        return jsonify({'success': False, 'error': 'MariaDB is not running'}), 409
+    
+    def run():
+        action = log_manager.start_action('index-advisor')
+        try:
+            state = advisor.analyze()
+        except Exception as e:
+            log_manager.error(f"❌ Index analysis failed: {e}")
+            log_manager.end_action(action, False)
+            return
+        count = len({s['id'] for r in state['results'] for s in r['suggestions']})
+        log_manager.success(f"🧭 {len(state['results'])} slow statement(s) explained, {count} index suggestion(s)")
+        log_manager.end_action(action, True)
+    
+    threading.Thread(target=run, daemon=True).start()
+    return jsonify({'success': True, 'message': 'Analysis started'}), 202
+
+@app.route('/api/index-advisor/export')
+@requires_auth
+def api_index_advisor_export():
+    """Accepted suggestions as a Prisma migration.sql download (?include=accepted|all)"""
+    include = request.args.get('include', 'accepted')
+    if include not in ('accepted', 'all'):
+        return jsonify({'success': False, 'error': f'Unknown include: {include}'}), 400
+    migration = get_index_advisor().export_migration(include)
+    if migration is None:
+        return jsonify({'success': False, 'error': 'No suggestions to export'}), 404
+    return Response(migration['sql'], mimetype='application/sql', headers={
+        'Content-Disposition': f"attachment; filename={migration['name']}.sql"
+    })
+
+@app.route('/api/index-advisor/<suggestion_id>', methods=['POST'])
+@requires_auth
+def api_index_advisor_review(suggestion_id):
+    """Accept or dismiss a suggestion ({"status": "accepted"|"dismissed"|"proposed"})"""
+    status = (request.get_json(silent=True) or {}).get('status')
+    try:
+        found = get_index_advisor().review(suggestion_id, status)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not found:
+        return jsonify({'success': False, 'error': 'Suggestion not found'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/proxy')
+@requires_auth
+def api_proxy():
+    """Front proxy state: current upstream, pooled connections, requests served"""
+    if not proxy_enabled():
+        return jsonify({'enabled': False})
+    return jsonify({
+        'enabled': True,
+        'proxies': {name: get_service_proxy(name).status() for name in ['frontend', 'backend']}
+    })
 
 @app.route('/api/updates')
 @requires_auth
@@ -307,16 +725,124 @@ def api_updates():
 @app.route('/api/logs/<service>')
 @requires_auth
 def api_logs(service):
-    """Get service logs"""
+    """
+    Get service logs
+    
+    Query params:
+        lines: Lines to return for a tail (default 100)
+        offset, file_id: Values from the previous response; only bytes
+            appended since then are returned ('reset' is true if the file
+            was rotated or truncated and the view must be replaced)
+        start_line, count: Fetch an arbitrary line range via the line index
+        rotated=1: Continue the tail into rotated segments
+        segment: Name of a rotated segment to read (see /segments)
+    """
     try:
         log_file = Config.LOGS_DIR / f'{service}.log'
+        lines = request.args.get('lines', default=100, type=int)
+        
+        segment_name = request.args.get('segment')
+        if segment_name:
+            segment = next((s for s in rotated_segments(log_file) if s.name == segment_name), None)
+            if segment is None:
+                return jsonify({'error': f'Unknown segment: {segment_name}'}), 404
+            text = b''.join(tail_segment_lines(segment, lines)).decode('utf-8', errors='replace')
+            return jsonify({'logs': text, 'segment': segment.name})
+        
+        if request.args.get('rotated') == '1':
+            return jsonify({'logs': tail_lines_rotated(log_file, lines)})
+        
         if not log_file.exists():
-            return jsonify({'logs': ''})
+            return jsonify({'logs': '', 'offset': 0, 'file_id': None, 'reset': False})
         
-        # Read last 100 lines
-        with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
-            lines = f.readlines()
-            return jsonify({'logs': ''.join(lines[-100:])})
+        start_line = request.args.get('start_line', type=int)
+        if start_line is not None:
+            count = request.args.get('count', default=lines, type=int)
+            index = get_line_index(log_file)
+            return jsonify({
+                'logs': index.read_lines(start_line, min(count, 10000)),
+                'total_lines': index.indexed_lines
+            })
+        
+        # Tail (no offset) or incremental read from the client's last offset
+        result = read_incremental(
+            log_file,
+            offset=request.args.get('offset', type=int),
+            file_id=request.args.get('file_id'),
+            tail=lines
+        )
+        return jsonify({
+            'logs': result['data'],
+            'offset': result['offset'],
+            'file_id': result['file_id'],
+            'size': result['size'],
+            'reset': result['reset'],
+            'has_more': result['has_more']
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/logs/<service>/live')
+@requires_auth
+def api_logs_live(service):
+    """
+    Get a service's output from the in-memory tail (pipe mode)
+    
+    Query params:
+        lines: Lines to return (default 200)
+        after_seq: Only lines after this seq (resume after a reconnect)
+        level: Filter by severity (error/warning/info/debug)
+    """
+    try:
+        if service not in SERVICE_NAMES:
+            return jsonify({'error': f'Unknown service: {service}'}), 404
+        
+        mode = get_output_mode()
+        ingestor = get_output_ingestor()
+        if mode != 'pipe' and not ingestor.is_attached(service):
+            return jsonify({'mode': mode, 'available': False, 'lines': []})
+        
+        lines = min(request.args.get('lines', default=200, type=int), LOGS_API_MAX_LIMIT)
+        entries = ingestor.get_lines(
+            service,
+            after_seq=request.args.get('after_seq', type=int),
+            limit=lines,
+            level=request.args.get('level')
+        )
+        return jsonify({
+            'mode': mode,
+            'available': True,
+            'lines': entries,
+            'stats': ingestor.get_stats(service)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/services/output')
+@requires_auth
+def api_services_output():
+    """Per-service output counters (lines, errors, warnings) in pipe mode"""
+    return jsonify({
+        'mode': get_output_mode(),
+        'services': get_output_ingestor().get_stats()
+    })
+
+@app.route('/api/logs/<service>/segments')
+@requires_auth
+def api_log_segments(service):
+    """List rotated segments of a service log (newest first)"""
+    try:
+        log_file = Config.LOGS_DIR / f'{service}.log'
+        segments = []
+        for segment in rotated_segments(log_file):
+            stat = segment.stat()
+            segments.append({
+                'name': segment.name,
+                'size': stat.st_size,
+                'compressed': segment.suffix == '.gz',
+                'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
+            })
+        return jsonify({'segments': segments})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -324,8 +850,8 @@ def api_logs(service):
 @requires_auth
 def api_install(component):
     """Install frontend/backend/all"""
+    action = log_manager.start_action(f'install-{component}')
     try:
-        log_manager.start_action(f'install-{component}')
         log_manager.info(f"📦 Installing {component}...")
         
         success = agent.install_apps(component)
@@ -335,23 +861,23 @@ def api_install(component):
         else:
             log_manager.error(f"❌ Failed to install {component}")
         
-        log_manager.end_action(f'install-{component}', success)
+        log_manager.end_action(action, success)
         return jsonify({'success': success})
     except Exception as e:
         log_manager.error(f"❌ Error installing {component}: {str(e)}")
-        log_manager.end_action(f'install-{component}', False)
+        log_manager.end_action(action, False)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/update/<component>', methods=['POST'])
 @requires_auth
 def api_update(component):
     """Update frontend/backend/all"""
+    action = log_manager.start_action(f'update-{component}')
     try:
         # Get force flag from request
         data = request.get_json() or {}
         force = data.get('force', False)
         
-        log_manager.start_action(f'update-{component}')
         log_manager.info(f"🔄 Updating {component}...")
         
         if component == 'all':
@@ -364,19 +890,19 @@ def api_update(component):
         else:
             log_manager.error(f"❌ Failed to update {component}")
         
-        log_manager.end_action(f'update-{component}', success)
+        log_manager.end_action(action, success)
         return jsonify({'success': success})
     except Exception as e:
         log_manager.error(f"❌ Error updating {component}: {str(e)}")
-        log_manager.end_action(f'update-{component}', False)
+        log_manager.end_action(action, False)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/setup/<component>', methods=['POST'])
 @requires_auth
 def api_setup(component):
     """Setup apps (install dependencies, migrate, etc)"""
+    action = log_manager.start_action(f'setup-{component}')
     try:
-        log_manager.start_action(f'setup-{component}')
         log_manager.info(f"⚙️ Setting up {component}...")
         
         success = agent.setup_apps(component)
@@ -386,11 +912,11 @@ def api_setup(component):
         else:
             log_manager.error(f"❌ Failed to setup {component}")
         
-        log_manager.end_action(f'setup-{component}', success)
+        log_manager.end_action(action, success)
         return jsonify({'success': success})
     except Exception as e:
         log_manager.error(f"❌ Error setting up {component}: {str(e)}")
-        log_manager.end_action(f'setup-{component}', False)
+        log_manager.end_action(action, False)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/seed', methods=['POST'])
@@ -401,7 +927,7 @@ def api_seed():
         data = request.get_json() or {}
         seed_type = data.get('type', 'all')
         
-        log_manager.start_action(f'seed-{seed_type}')
+        action = log_manager.start_action(f'seed-{seed_type}')
         log_manager.info(f"🌱 Seeding database ({seed_type})...")
         
         success = agent.seed_database(seed_type)
@@ -411,11 +937,11 @@ def api_seed():
         else:
             log_manager.error(f"❌ Failed to seed database ({seed_type})")
         
-        log_manager.end_action(f'seed-{seed_type}', success)
+        log_manager.end_action(action, success)
         return jsonify({'success': success})
     except Exception as e:
         log_manager.error(f"❌ Error seeding database: {str(e)}")
-        log_manager.end_action(f'seed-{seed_type}', False)
+        log_manager.end_action(action, False)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/check-tools')
@@ -533,7 +1059,11 @@ def api_update_start():
     """Start update process (non-blocking with WebSocket notifications)"""
     try:
         data = request.get_json() or {}
-        component = data.get('component', 'all')
+        component = data.get('component')
+        if component is None:
+            # Finish an interrupted or failed update first (resumes from its journal)
+            journal = get_install_journal()
+            component = components_to_target(journal.components) if journal.unfinished('update') else 'all'
         
         # Clear update cache since we're updating
         UPDATE_CHECK_CACHE['last_check'] = None
@@ -551,11 +1081,90 @@ def api_update_start():
         return jsonify({
             'success': True,
             'message': 'Update started',
+            'component': component,
             'websocket_channel': 'update_progress'
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/update/state')
+@requires_auth
+def api_update_state():
+    """
+    Journal of the last install/update run (steps completed, status,
+    resumable or not) and the per-step durations/throughput that ETAs
+    are estimated from
+    """
+    journal = get_install_journal()
+    return jsonify({
+        'success': True,
+        'resumable': journal.unfinished(),
+        'journal': journal.to_dict(),
+        'history': {kind: RunHistory(kind).to_dict() for kind in ('install', 'update')}
+    })
+
+def update_downtimes(limit=20):
+    """Measured service downtime of recent updates, newest first (from the span history)"""
+    entries = []
+    for span in get_tracer().iter_history():
+        if span.get('name') != 'downtime':
+            continue
+        attributes = span.get('attributes') or {}
+        entries.append({
+            'trace_id': span.get('trace_id'),
+            'time': datetime.fromtimestamp(span['start']).isoformat(),
+            'seconds': round(span.get('duration') or 0, 1),
+            'components': attributes.get('components'),
+            'mode': attributes.get('mode'),
+            'release': span.get('release'),
+            'success': span.get('status') == 'ok',
+            'error': span.get('error')
+        })
+    return list(reversed(entries))[:limit]
+
+@app.route('/api/update/downtime')
+@requires_auth
+def api_update_downtime():
+    """Measured downtime of recent updates (stop → services answering again)"""
+    limit = request.args.get('limit', default=20, type=int)
+    return jsonify({'success': True, 'updates': update_downtimes(limit)})
+
+@app.route('/api/update/rehearsal')
+@requires_auth
+def api_update_rehearsal():
+    """Last migration rehearsal: per-migration durations and the predicted downtime"""
+    return jsonify({'success': True, **get_migration_rehearsal().status()})
+
+@app.route('/api/update/rehearsal', methods=['POST'])
+@requires_auth
+def api_update_rehearsal_start():
+    """Rehearse the latest backend release's migrations on a copy of the database"""
+    if get_migration_rehearsal().running:
+        return jsonify({'success': False, 'error': 'A rehearsal is already running'}), 409
+    if get_backups().running:
+        return jsonify({'success': False, 'error': 'A backup or restore is running'}), 409
+
+    def run():
+        action = log_manager.start_action('rehearsal')
+        result = agent.rehearse_migrations()
+        if result is None or not result['success']:
+            error = result['error'] if result else 'see the agent log'
+            log_manager.error(f"❌ Migration rehearsal failed: {error}")
+            log_manager.end_action(action, False)
+            return
+        message = f"🧪 {result['release']}: {len(result['pending'])} migration(s) rehearsed in {result['migrate_seconds']:.1f}s"
+        if result['predicted_downtime'] is not None:
+            message += f", predicted downtime ~{result['predicted_downtime']:.0f}s"
+        log_manager.success(message)
+        log_manager.end_action(action, True)
+
+    threading.Thread(target=run, daemon=True).start()
+    return jsonify({'success': True, 'started': True}), 202
+
+def components_to_target(components):
+    """Journal component list -> 'all' / 'backend' / 'frontend'"""
+    return components[0] if len(components) == 1 else 'all'
+
 def start_loading_server(port=3100, page='update_loading.html'):
     """Start simple HTTP server for update loading page"""
     import http.server
@@ -583,126 +1192,126 @@ def start_loading_server(port=3100, page='update_loading.html'):
         def log_message(self, format, *args):
             pass  # Suppress logs
     
-    try:
-        # Create handler factory with loading_page parameter
-        handler = lambda *args, **kwargs: LoadingHandler(*args, loading_page=page, **kwargs)
-        server = socketserver.TCPServer(("", port), handler)
-        thread = threading.Thread(target=server.serve_forever, daemon=True)
-        thread.start()
-        return server
-    except Exception as e:
-        print(f"Failed to start loading server on port {port}: {e}")
-        return None
+    class LoadingServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+        allow_reuse_address = True
+        daemon_threads = True
+    
+    # Create handler factory with loading_page parameter
+    handler = lambda *args, **kwargs: LoadingHandler(*args, loading_page=page, **kwargs)
+    
+    # The service that owned the port may still be releasing it: retry
+    # briefly instead of sleeping a fixed time before binding
+    deadline = time.time() + LOADING_SERVER_BIND_TIMEOUT
+    while True:
+        try:
+            server = LoadingServer(("", port), handler)
+            break
+        except OSError as e:
+            if time.time() >= deadline:
+                print(f"Failed to start loading server on port {port}: {e}")
+                return None
+            time.sleep(0.1)
+    
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
 
+def shutdown_loading_servers(servers):
+    """Stop update loading page servers (safe to call more than once)"""
+    while servers:
+        server = servers.pop()
+        if server:
+            try:
+                server.shutdown()
+                server.server_close()
+            except Exception:
+                pass
+
+@traced('perform_update')
 def perform_update_with_notifications(component):
     """Background update with WebSocket notifications"""
+    current_span().set_attribute('component', component)
+    loading_servers = []
     try:
-        import time
-        
-        # Step 1: Stopping services and starting loading pages
-        socketio.emit('update_status', {
-            'status': 'stopping_services',
-            'message': 'Stopping services...',
-            'progress': 10
-        })
+        components = ['backend', 'frontend'] if component == 'all' else [component]
         
-        # Stop all services
-        ProcessManager.stop_all()
-        time.sleep(2)
+        def on_stopped():
+            # Behind the proxy the maintenance pages are already being served
+            if proxy_enabled():
+                return
+            # Services are down: serve the loading pages on both ports
+            # (binding retries until the stopped services release them)
+            loading_servers.append(start_loading_server(port=3100, page='update_loading.html'))
+            loading_servers.append(start_loading_server(port=3200, page='update_loading_backend.html'))
         
-        # Start loading servers on both ports
-        frontend_loading_server = start_loading_server(port=3100, page='update_loading.html')
-        backend_loading_server = start_loading_server(port=3200, page='update_loading_backend.html')
-        time.sleep(1)
+        def before_start():
+            # shutdown() returns once the servers stop listening
+            shutdown_loading_servers(loading_servers)
         
-        # Step 2: Downloading
-        socketio.emit('update_status', {
-            'status': 'downloading',
-            'message': 'Downloading updates from GitHub...',
-            'progress': 30
-        })
-        time.sleep(1)
-        
-        # Step 3: Install updates
-        socketio.emit('update_status', {
-            'status': 'extracting',
-            'message': 'Extracting and installing updates...',
-            'progress': 50
-        })
-        
-        success = agent.update_apps(component, force=True)
-        
-        if not success:
+        def on_progress(progress, step, status, title=None, description=None, eta=None):
             socketio.emit('update_status', {
-                'status': 'failed',
-                'message': 'Update failed! Please check logs.',
-                'progress': 0
+                'status': step,
+                'message': description or title or step,
+                'progress': progress,
+                'eta': eta
             })
-            return
         
-        # Step 4: Setup apps (install dependencies & migrations)
-        socketio.emit('update_status', {
-            'status': 'setup',
-            'message': 'Installing dependencies and running migrations...',
-            'progress': 70
-        })
+        # Download, stop, extract, install dependencies, migrate and restart
+        # as one task graph; progress comes from the graph
+        graph = agent.build_update_graph(components, setup=True, restart=True,
+                                          on_stopped=on_stopped, before_start=before_start)
+        graph.add_listener(agent.graph_progress_listener(on_progress, {}))
         
-        # Run setup for updated components
-        if not agent.setup_apps(component):
+        if not agent.run_journaled(graph, 'update', components):
+            failed = graph.failed.title if graph.failed else 'Update'
+            current_span().fail(f'{failed} failed')
+            
+            # Services were stopped: put the previous release (and the data
+            # snapshot, if migrations ran) back and start them again
+            if graph.tasks['stop services'].state == DONE and any(name.startswith('swap ') for name in graph.tasks):
+                socketio.emit('update_status', {
+                    'status': 'rolling_back',
+                    'message': f'{failed} failed, restoring the previous version',
+                    'progress': 0
+                })
+            rolled_back = agent.rollback_update(graph, components, before_start=before_start)
+            if rolled_back:
+                socketio.emit('update_status', {
+                    'status': 'rolled_back',
+                    'message': f'{failed} failed - the previous version was restored. Please check logs.',
+                    'progress': 100
+                })
+                return
+            
+            # Loading pages stay up and show the failure
+            message = f'{failed} failed! Please check logs.'
+            if rolled_back is False:
+                message = f'{failed} failed and could not be fully rolled back! Please check logs.'
             socketio.emit('update_status', {
                 'status': 'failed',
-                'message': 'Setup failed! Please check logs.',
+                'message': message,
                 'progress': 0
             })
             return
         
-        # Step 5: Shutdown loading servers and restart services
-        socketio.emit('update_status', {
-            'status': 'restarting',
-            'message': 'Starting services...',
-            'progress': 90
-        })
-        
-        # Shutdown loading servers
-        if frontend_loading_server:
-            frontend_loading_server.shutdown()
-            frontend_loading_server.server_close()
-        
-        if backend_loading_server:
-            backend_loading_server.shutdown()
-            backend_loading_server.server_close()
-        
-        time.sleep(2)
-        
-        # Start services (skip setup since we just did it)
-        agent.start_all(skip_setup=True)
-        
-        # Wait for services to start
-        time.sleep(5)
-        
-        # Step 6: Completed
+        # 'start services' returns once both ports answer again
+        downtime = next((entry for entry in update_downtimes(limit=1)
+                         if entry['trace_id'] == current_span().trace_id), None)
+        message = 'Update completed successfully!'
+        if downtime:
+            message = f"Update completed successfully! Services were down for {downtime['seconds']:.1f}s"
         socketio.emit('update_status', {
             'status': 'completed',
-            'message': 'Update completed successfully!',
-            'progress': 100
+            'message': message,
+            'progress': 100,
+            'downtime': downtime['seconds'] if downtime else None
         })
         
     except Exception as e:
         # Cleanup loading servers on error
-        try:
-            if 'frontend_loading_server' in locals() and frontend_loading_server:
-                frontend_loading_server.shutdown()
-                frontend_loading_server.server_close()
-        except:
-            pass
+        shutdown_loading_servers(loading_servers)
         
-        try:
-            if 'backend_loading_server' in locals() and backend_loading_server:
-                backend_loading_server.shutdown()
-                backend_loading_server.server_close()
-        except:
-            pass
-            
+        current_span().fail(f'Update failed: {e}')
         socketio.emit('update_status', {
             'status': 'failed',
             'message': f'Update failed: {str(e)}',
@@ -716,16 +1325,49 @@ def perform_update_with_notifications(component):
 @app.route('/api/logs')
 @requires_auth
 def api_get_logs():
-    """Get log entries from buffer"""
+    """
+    Get log entries from buffer (cursor-paginated by sequence number)
+    
+    Query params: after_seq, before_seq, limit, action, level.
+    Pass the last seq you received as after_seq to resume a stream
+    without gaps or duplicates.
+    """
     action = request.args.get('action')
-    limit = request.args.get('limit', type=int)
+    level = request.args.get('level')
+    after_seq = request.args.get('after_seq', type=int)
+    before_seq = request.args.get('before_seq', type=int)
+    limit = request.args.get('limit', default=LOGS_API_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, LOGS_API_MAX_LIMIT))
+    
+    logs = log_manager.get_logs(
+        action=action,
+        level=level,
+        after_seq=after_seq,
+        before_seq=before_seq,
+        limit=limit
+    )
+    bounds = log_manager.get_seq_bounds()
     
-    logs = log_manager.get_logs(action=action, limit=limit)
+    # Cursor for the next page: forward pages continue after the newest
+    # entry returned, backward pages continue before the oldest one
+    if after_seq is not None:
+        next_after_seq = logs[-1]['seq'] if logs else max(after_seq, bounds['first_seq'] - 1)
+        has_more = len(logs) >= limit
+    else:
+        next_after_seq = logs[-1]['seq'] if logs else bounds['last_seq']
+        has_more = False
     
     return jsonify({
         'success': True,
         'logs': logs,
         'count': len(logs),
+        'first_seq': bounds['first_seq'],
+        'last_seq': bounds['last_seq'],
+        'next_after_seq': next_after_seq,
+        'prev_before_seq': logs[0]['seq'] if logs else None,
+        'has_more': has_more,
+        # Entries between after_seq and first_seq were evicted from memory
+        'truncated': after_seq is not None and after_seq + 1 < bounds['first_seq'],
         'current_action': log_manager.get_current_action()
     })
 
@@ -748,6 +1390,69 @@ def api_download_logs():
         download_name='4paws-agent.log'
     )
 
+def parse_time_param(value):
+    """Parse a time query param: epoch seconds or ISO datetime (local time)"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/api/logs/timeline')
+@requires_auth
+def api_logs_timeline():
+    """
+    Stream a merged, time-ordered view of the service logs and agent logs
+    
+    Query params:
+        since, until: Time window (epoch seconds or ISO datetime)
+        hours: Window ending now, if since is not given (default 1)
+        services: Comma-separated sources (mariadb,backend,frontend,agent,agent-gui)
+        level: Comma-separated levels (error,warning,info,debug)
+        format: 'text' (default) or 'ndjson'
+        limit: Stop after this many lines
+        download=1: Send as an attachment
+    """
+    try:
+        sources = {
+            'mariadb': Config.LOGS_DIR / 'mariadb.log',
+            'backend': Config.LOGS_DIR / 'backend.log',
+            'frontend': Config.LOGS_DIR / 'frontend.log',
+            'agent': Config.WRITABLE_DIR / 'agent.log',
+            'agent-gui': log_file
+        }
+        selected = request.args.get('services')
+        if selected:
+            names = [name.strip() for name in selected.split(',') if name.strip()]
+            unknown = [name for name in names if name not in sources]
+            if unknown:
+                return jsonify({'error': f"Unknown source(s): {', '.join(unknown)}"}), 400
+            sources = {name: sources[name] for name in names}
+        
+        levels = request.args.get('level')
+        levels = [level.strip().lower() for level in levels.split(',')] if levels else None
+        if levels and any(level not in TIMELINE_LEVELS for level in levels):
+            return jsonify({'error': f"level must be one of: {', '.join(TIMELINE_LEVELS)}"}), 400
+        
+        until = parse_time_param(request.args.get('until'))
+        since = parse_time_param(request.args.get('since'))
+        if since is None:
+            since = (until or time.time()) - request.args.get('hours', default=1, type=float) * 3600
+        
+        fmt = 'ndjson' if request.args.get('format') == 'ndjson' else 'text'
+        chunks = stream_timeline(sources, since, until, levels, fmt, request.args.get('limit', type=int))
+        
+        headers = {}
+        if request.args.get('download') == '1':
+            headers['Content-Disposition'] = f"attachment; filename=4paws-timeline.{'ndjson' if fmt == 'ndjson' else 'log'}"
+        mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/plain'
+        return Response(chunks, mimetype=mimetype, headers=headers)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/logs/clear', methods=['POST'])
 @requires_auth
 def api_clear_logs():
@@ -765,9 +1470,84 @@ def api_current_action():
     action = log_manager.get_current_action()
     return jsonify({
         'success': True,
-        'action': action
+        'action': action,
+        'actions': log_manager.get_active_actions()
     })
 
+@app.route('/api/spans')
+@requires_auth
+def api_spans():
+    """
+    Running and recently finished spans (actions and their nested steps)
+    
+    Query params:
+        trace_id: Only spans of one trace (one action / install / update run)
+        name: Only spans with this name
+        limit: Finished spans to return (default 200)
+    """
+    tracer = get_tracer()
+    trace_id = request.args.get('trace_id')
+    active = tracer.active_spans()
+    if trace_id:
+        active = [span for span in active if span['trace_id'] == trace_id]
+    return jsonify({
+        'success': True,
+        'active': active,
+        'recent': tracer.recent_spans(
+            limit=request.args.get('limit', default=200, type=int),
+            name=request.args.get('name'),
+            trace_id=trace_id
+        )
+    })
+
+@app.route('/api/spans/history')
+@requires_auth
+def api_span_history():
+    """Persisted step durations per release (count, mean, p50, max, last), optionally for one step name"""
+    try:
+        return jsonify({
+            'success': True,
+            'steps': get_tracer().history_stats(request.args.get('name'))
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/traces')
+@requires_auth
+def api_traces():
+    """Recorded install/update runs (Chrome trace files), newest first"""
+    traces = []
+    for path in get_trace_recorder().list_traces():
+        stat = path.stat()
+        traces.append({
+            'name': path.name,
+            'size': stat.st_size,
+            'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
+        })
+    return jsonify({'success': True, 'traces': traces})
+
+@app.route('/api/traces/<name>')
+@requires_auth
+def api_trace_download(name):
+    """
+    Download a recorded run as Chrome Trace Event JSON ('latest' for the
+    newest); open it in ui.perfetto.dev or chrome://tracing
+    """
+    traces = get_trace_recorder().list_traces()
+    if name == 'latest':
+        path = traces[0] if traces else None
+    else:
+        path = next((trace for trace in traces if trace.name == name), None)
+    if path is None:
+        return jsonify({'success': False, 'error': 'Trace not found'}), 404
+    
+    return send_file(
+        path,
+        mimetype='application/json',
+        as_attachment=True,
+        download_name=f'4paws-trace-{path.name}'
+    )
+
 # ============================================================================
 # WebSocket Events
 # ============================================================================
@@ -778,6 +1558,20 @@ def handle_connect():
     emit('connected', {'data': 'Connected to 4Paws Agent'})
     log_manager.info("🔌 New client connected to Web GUI")
 
+@socketio.on('subscribe_service_logs')
+def handle_subscribe_service_logs(data):
+    """Start receiving 'service_log_lines' for one service"""
+    service = (data or {}).get('service')
+    if service in SERVICE_NAMES:
+        join_room(f'service-logs:{service}')
+
+@socketio.on('unsubscribe_service_logs')
+def handle_unsubscribe_service_logs(data):
+    """Stop receiving 'service_log_lines' for one service"""
+    service = (data or {}).get('service')
+    if service in SERVICE_NAMES:
+        leave_room(f'service-logs:{service}')
+
 @socketio.on('request_status')
 def handle_status_request():
     """Send status update via WebSocket"""
@@ -791,9 +1585,9 @@ def run_auto_install():
     """
     install_server = get_installation_server(port=3100)
     
-    def progress_callback(progress, step=None, status=None, title=None, description=None):
+    def progress_callback(progress, step=None, status=None, title=None, description=None, eta=None):
         """Send progress updates to installation page"""
-        install_server.send_progress(progress, step, status, title, description)
+        install_server.send_progress(progress, step, status, title, description, eta)
     
     def log_callback(message, level='info'):
         """Send log messages to installation page"""
@@ -870,8 +1664,16 @@ Opening browser in 2 seconds...
 🎨 Dark/Light mode available
 """)
         
+        journal = get_install_journal()
+        if journal.unfinished('update') and journal.status == STATUS_RUNNING:
+            # The agent stopped in the middle of an update (crash, power cut):
+            # finish it from the journal instead of starting a half-updated app
+            component = components_to_target(journal.components)
+            print(f"♻️  Resuming interrupted update ({component})...")
+            log_manager.info(f"♻️  Resuming interrupted update ({component})...")
+            threading.Thread(target=perform_update_with_notifications, args=(component,), daemon=True).start()
         # Auto-start services if not already running
-        if not any(key in ProcessManager.processes for key in ['mariadb', 'backend', 'frontend']):
+        elif not any(key in ProcessManager.processes for key in ['mariadb', 'backend', 'frontend']):
             print("🚀 Starting services automatically...")
             log_manager.info("🚀 Auto-starting services...")
             
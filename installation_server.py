@@ -385,6 +385,13 @@ class InstallationServer:
         
         let currentProgress = 0;
         
+        // Remaining time from the agent's estimate (seconds)
+        function formatEta(seconds) {
+            if (seconds === undefined || seconds === null) return '';
+            if (seconds < 60) return ' • ~' + Math.max(seconds, 1) + 's left';
+            return ' • ~' + Math.round(seconds / 60) + ' min left';
+        }
+        
         // Listen for installation logs
         socket.on('installation_log', function(data) {
             const logEntry = document.createElement('div');
@@ -400,7 +407,7 @@ class InstallationServer:
         socket.on('installation_progress', function(data) {
             currentProgress = data.progress;
             progressBar.style.width = currentProgress + '%';
-            progressText.textContent = currentProgress + '%';
+            progressText.textContent = currentProgress + '%' + formatEta(data.eta);
             
             if (data.step) {
                 updateStep(data.step, data.status || 'active');
@@ -536,10 +543,12 @@ class InstallationServer:
                 'level': level
             })
     
-    def send_progress(self, progress, step=None, status=None, title=None, description=None):
-        """Send progress update to connected clients"""
+    def send_progress(self, progress, step=None, status=None, title=None, description=None, eta=None):
+        """Send progress update to connected clients (eta: estimated seconds remaining)"""
         if self.socketio and self.is_running:
             data = {'progress': progress}
+            if eta is not None:
+                data['eta'] = eta
             if step:
                 data['step'] = step
             if status:
@@ -4,13 +4,286 @@ Provides real-time log streaming, action tracking, and persistent storage
 """
 
 import os
+import sys
+import time
+import zlib
 import logging
+from array import array
+from bisect import bisect_left
 from datetime import datetime
-from collections import deque
+from functools import lru_cache
 from threading import Lock
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Tuple, Union
 from pathlib import Path
 
+from core.log_reader import tail_lines
+from core.tracing import get_tracer, current_span, Span
+
+# Default in-memory window (override with LOG_BUFFER_SIZE in .env)
+DEFAULT_BUFFER_SIZE = 1000
+
+class LogRingBuffer:
+    """
+    Compact in-memory log window addressed by sequence number
+    
+    Entries are stored column-wise in parallel arrays instead of one dict
+    per entry: epoch timestamps (array 'd') and interned level/action codes
+    (bytearray / array 'I'). Messages are UTF-8 encoded and packed into
+    blocks of MESSAGE_BLOCK_SIZE entries; full blocks are zlib-compressed.
+    Display fields such as the HH:MM:SS timestamp and full_text are
+    rendered on read.
+    
+    Seq N lives in slot N % capacity. Sequence numbers are never reused
+    (not even after clear()) so clients can resume a stream from the last
+    seq they have seen.
+    """
+    
+    MESSAGE_BLOCK_SIZE = 256
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.lock = Lock()
+        self.first_seq = 1   # Oldest seq still held in the buffer
+        self.next_seq = 1    # Seq that will be assigned to the next entry
+        
+        # Column storage
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.level_codes = bytearray(capacity)
+        self.action_codes = array('I', bytes(4 * capacity))  # 0 = no action
+        
+        # Message blocks: block id (seq // MESSAGE_BLOCK_SIZE) -> (offsets, zlib data).
+        # The block currently being filled stays uncompressed.
+        self.sealed_blocks: Dict[int, Tuple[array, bytes]] = {}
+        self.open_block_id = self.next_seq // self.MESSAGE_BLOCK_SIZE
+        self.open_block: List[Optional[bytes]] = [None] * self.MESSAGE_BLOCK_SIZE
+        self._cached_block_id = -1
+        self._cached_block = b''
+        
+        # Intern tables (code -> string); action code 0 is reserved for None
+        self.levels: List[str] = []
+        self.level_ids: Dict[str, int] = {}
+        self.actions: List[Optional[str]] = [None]
+        self.action_ids: Dict[str, int] = {}
+        
+        # Secondary indexes: action/level -> ascending array of seqs.
+        # Expired seqs are trimmed lazily (see _trim_index).
+        self.action_index: Dict[str, array] = {}
+        self.level_index: Dict[str, array] = {}
+    
+    def __len__(self) -> int:
+        return self.next_seq - self.first_seq
+    
+    def append(self, timestamp: float, level: str, action: Optional[str], message: str) -> int:
+        """Store an entry and return its sequence number"""
+        encoded = message.encode('utf-8', 'replace')
+        with self.lock:
+            level_code = self.level_ids.get(level)
+            if level_code is None:
+                if len(self.levels) >= 255:
+                    level = 'info'
+                    level_code = self.level_ids.get(level)
+                if level_code is None:
+                    level_code = len(self.levels)
+                    self.level_ids[level] = level_code
+                    self.levels.append(sys.intern(level))
+            
+            action_code = 0
+            if action:
+                action_code = self.action_ids.get(action, 0)
+                if not action_code:
+                    action_code = len(self.actions)
+                    self.action_ids[action] = action_code
+                    self.actions.append(sys.intern(action))
+            
+            seq = self.next_seq
+            slot = seq % self.capacity
+            self.timestamps[slot] = timestamp
+            self.level_codes[slot] = level_code
+            self.action_codes[slot] = action_code
+            self.open_block[seq % self.MESSAGE_BLOCK_SIZE] = encoded
+            
+            self.next_seq = seq + 1
+            if self.next_seq - self.first_seq > self.capacity:
+                self.first_seq = self.next_seq - self.capacity
+            if self.next_seq % self.MESSAGE_BLOCK_SIZE == 0:
+                self._seal_open_block()
+            
+            if action_code:
+                self.action_index.setdefault(self.actions[action_code], array('Q')).append(seq)
+            self.level_index.setdefault(self.levels[level_code], array('Q')).append(seq)
+            
+            # Once per full ring, sweep expired seqs out of every index so
+            # arrays for keys nobody queries don't grow without bound
+            if seq % self.capacity == 0:
+                for index in (self.action_index, self.level_index):
+                    for key in list(index):
+                        seqs = index[key]
+                        expired = bisect_left(seqs, self.first_seq)
+                        if expired:
+                            del seqs[:expired]
+                        if not seqs:
+                            del index[key]
+            return seq
+    
+    def _seal_open_block(self):
+        """Compress the full open block and start the next one (caller holds lock)"""
+        offsets = array('I', [0])
+        for message in self.open_block:
+            offsets.append(offsets[-1] + len(message or b''))
+        data = zlib.compress(b''.join(m or b'' for m in self.open_block), 1)
+        self.sealed_blocks[self.open_block_id] = (offsets, data)
+        self.open_block_id += 1
+        self.open_block = [None] * self.MESSAGE_BLOCK_SIZE
+        
+        # Drop blocks that no longer hold any seq inside the ring
+        oldest_block = self.first_seq // self.MESSAGE_BLOCK_SIZE
+        for block_id in [b for b in self.sealed_blocks if b < oldest_block]:
+            del self.sealed_blocks[block_id]
+    
+    def _message(self, seq: int) -> str:
+        """Decode the message stored under seq (caller holds lock)"""
+        block_id, index = divmod(seq, self.MESSAGE_BLOCK_SIZE)
+        if block_id == self.open_block_id:
+            raw = self.open_block[index] or b''
+        else:
+            offsets, data = self.sealed_blocks[block_id]
+            # Queries read consecutive seqs, so keep the last inflated block
+            if self._cached_block_id != block_id:
+                self._cached_block = zlib.decompress(data)
+                self._cached_block_id = block_id
+            raw = self._cached_block[offsets[index]:offsets[index + 1]]
+        return raw.decode('utf-8', 'replace')
+    
+    def _entry(self, seq: int) -> Dict:
+        """Render the entry stored under seq (caller holds lock)"""
+        slot = seq % self.capacity
+        ts = self.timestamps[slot]
+        action = self.actions[self.action_codes[slot]]
+        return render_entry(seq, ts, self.levels[self.level_codes[slot]], action,
+                            self._message(seq))
+    
+    def _trim_index(self, index: Dict[str, array], key: str) -> array:
+        """Drop seqs that fell out of the ring from an index array"""
+        seqs = index.get(key)
+        if not seqs:
+            return array('Q')
+        
+        # Amortised: only rewrite the array once a sizeable prefix has expired
+        expired = bisect_left(seqs, self.first_seq)
+        if expired and (expired >= 1024 or expired * 2 >= len(seqs)):
+            del seqs[:expired]
+            if not seqs:
+                del index[key]
+                return array('Q')
+        return seqs
+    
+    def query(self, action: Optional[str] = None, level: Optional[str] = None,
+              after_seq: Optional[int] = None, before_seq: Optional[int] = None,
+              limit: Optional[int] = None) -> List[Dict]:
+        """Select entries; see LogManager.get_logs for the cursor semantics"""
+        with self.lock:
+            lo = self.first_seq
+            hi = self.next_seq  # exclusive
+            if after_seq is not None:
+                lo = max(lo, after_seq + 1)
+            if before_seq is not None:
+                hi = min(hi, before_seq)
+            if lo >= hi:
+                return []
+            
+            forward = after_seq is not None
+            if action or level:
+                seqs = self._select_indexed(action, level, lo, hi, limit, forward)
+            else:
+                # Unfiltered: the seq range maps straight onto ring slots
+                if limit:
+                    if forward:
+                        hi = min(hi, lo + limit)
+                    else:
+                        lo = max(lo, hi - limit)
+                seqs = range(lo, hi)
+            return [self._entry(seq) for seq in seqs]
+    
+    def _select_indexed(self, action: Optional[str], level: Optional[str],
+                        lo: int, hi: int, limit: Optional[int], forward: bool):
+        """Pick matching seqs in [lo, hi) using the smallest applicable index"""
+        candidates: List[Tuple[array, int, int]] = []
+        action_code = self.action_ids.get(action, 0) if action else 0
+        level_code = self.level_ids.get(level, -1) if level else -1
+        if action:
+            candidates.append((self._trim_index(self.action_index, action), 0, level_code))
+        if level:
+            candidates.append((self._trim_index(self.level_index, level), action_code, -1))
+        seqs, need_action, need_level = min(candidates, key=lambda c: len(c[0]))
+        
+        start = bisect_left(seqs, lo)
+        end = bisect_left(seqs, hi, start)
+        if start >= end:
+            return []
+        
+        if not need_action and need_level < 0:
+            if limit:
+                if forward:
+                    end = min(end, start + limit)
+                else:
+                    start = max(start, end - limit)
+            return seqs[start:end]
+        
+        # Both filters given: walk the smaller index and check the other column
+        capacity = self.capacity
+        order = range(start, end) if forward else range(end - 1, start - 1, -1)
+        selected = []
+        for i in order:
+            slot = seqs[i] % capacity
+            if need_action and self.action_codes[slot] != need_action:
+                continue
+            if need_level >= 0 and self.level_codes[slot] != need_level:
+                continue
+            selected.append(seqs[i])
+            if limit and len(selected) >= limit:
+                break
+        if not forward:
+            selected.reverse()
+        return selected
+    
+    def bounds(self) -> Tuple[int, int]:
+        """Return (first_seq, last_seq); last_seq is 0 if nothing was logged yet"""
+        with self.lock:
+            return self.first_seq, self.next_seq - 1
+    
+    def clear(self):
+        """Drop all entries while keeping the seq counter"""
+        with self.lock:
+            self.sealed_blocks.clear()
+            self.open_block = [None] * self.MESSAGE_BLOCK_SIZE
+            self._cached_block_id = -1
+            self._cached_block = b''
+            self.first_seq = self.next_seq
+            self.action_index.clear()
+            self.level_index.clear()
+
+
+@lru_cache(maxsize=4096)
+def _format_clock(second: int) -> str:
+    """HH:MM:SS for an epoch second (cached: neighbouring entries share seconds)"""
+    return time.strftime('%H:%M:%S', time.localtime(second))
+
+
+def render_entry(seq: int, ts: float, level: str, action: Optional[str], message: str) -> Dict:
+    """Build the log entry dict sent to clients"""
+    timestamp = _format_clock(int(ts))
+    action_tag = f"[{action}]" if action else ""
+    return {
+        'seq': seq,
+        'timestamp': timestamp,
+        'time': ts,
+        'level': level,
+        'action': action,
+        'message': message,
+        'full_text': f"[{timestamp}] {action_tag} {message}"
+    }
+
+
 class LogManager:
     """Central log manager with WebSocket broadcasting"""
     
@@ -22,12 +295,15 @@ class LogManager:
             max_buffer_size: Maximum number of log lines to keep in memory
             log_file: Path to persistent log file
         """
-        self.buffer = deque(maxlen=max_buffer_size)
-        self.buffer_lock = Lock()
+        self.max_buffer_size = max_buffer_size
+        self.buffer = LogRingBuffer(max_buffer_size)
         self.log_file = log_file
         self.socketio = None
-        self.current_action: Optional[str] = None
-        self.action_start_time: Optional[datetime] = None
+        
+        # Actions are root spans of the tracer; several can run at once
+        self.tracer = get_tracer()
+        self.action_spans: Dict[str, List[Span]] = {}
+        self.actions_lock = Lock()
         
         # Setup file logging
         if self.log_file:
@@ -37,30 +313,87 @@ class LogManager:
         """Set SocketIO instance for real-time broadcasting"""
         self.socketio = socketio
     
-    def start_action(self, action: str):
-        """Mark the start of an action"""
-        self.current_action = action
-        self.action_start_time = datetime.now()
+    @property
+    def current_action(self) -> Optional[str]:
+        """Most recently started action that is still running"""
+        with self.actions_lock:
+            latest = None
+            for spans in self.action_spans.values():
+                for span in spans:
+                    if latest is None or span.start_time > latest.start_time:
+                        latest = span
+            return latest.name if latest else None
+    
+    def _context_action(self) -> Optional[str]:
+        """
+        Action to tag a log line with: the action the calling thread is
+        working for, else the most recently started one
+        """
+        span = current_span()
+        if span is not None:
+            return span.root_name
+        return self.current_action
+    
+    def start_action(self, action: str, activate: bool = True, **attributes) -> Span:
+        """
+        Mark the start of an action (opens a span, nested under the current one if any)
+
+        Returns the span to hand to end_action. With activate=True it is the
+        calling thread's current span until then, so the thread's logs and
+        nested spans belong to it; pass activate=False if another thread
+        ends the action.
+        """
+        span = self.tracer.start_span(action, attributes, activate=activate)
+        with self.actions_lock:
+            self.action_spans.setdefault(action, []).append(span)
         self.log(f"▶️ Starting action: {action}", level='action', action=action)
+        return span
     
-    def end_action(self, action: str, success: bool = True):
-        """Mark the end of an action"""
-        if self.action_start_time:
-            duration = (datetime.now() - self.action_start_time).total_seconds()
+    def end_action(self, action: Union[str, Span], success: bool = True):
+        """
+        Mark the end of an action
+        
+        Args:
+            action: The span start_action returned. A bare name ends that
+                action's span current in this thread, else its latest one
+            success: Whether the action succeeded
+        """
+        with self.actions_lock:
+            if isinstance(action, Span):
+                span, action = action, action.name
+                spans = self.action_spans.get(action, [])
+                if span in spans:
+                    spans.remove(span)
+                else:
+                    span = None  # Already ended
+            else:
+                spans = self.action_spans.get(action, [])
+                span = current_span()
+                while span is not None and span not in spans:
+                    span = span.parent
+                span = span or (spans[-1] if spans else None)
+                if span is not None:
+                    spans.remove(span)
+            if action in self.action_spans and not self.action_spans[action]:
+                del self.action_spans[action]
+        
+        duration = 0.0
+        if span is not None:
+            self.tracer.end_span(span, success)
+            duration = span.duration
             status = "✅ Completed" if success else "❌ Failed"
             self.log(f"{status}: {action} (took {duration:.1f}s)", 
                     level='success' if success else 'error', 
                     action=action)
         
-        self.current_action = None
-        self.action_start_time = None
-        
         # Broadcast action status
         if self.socketio:
             self.socketio.emit('action_status', {
                 'action': action,
                 'status': 'completed' if success else 'failed',
-                'duration': duration if self.action_start_time else 0
+                'duration': duration,
+                'span_id': span.span_id if span else None,
+                'trace_id': span.trace_id if span else None
             })
     
     def log(self, message: str, level: str = 'info', action: Optional[str] = None):
@@ -72,36 +405,20 @@ class LogManager:
             level: Log level (info, success, warning, error, action)
             action: Associated action name (optional)
         """
-        timestamp = datetime.now().strftime('%H:%M:%S')
-        action_tag = f"[{action}]" if action else ""
-        
-        # Emoji mapping
-        emoji_map = {
-            'info': 'ℹ️',
-            'success': '✅',
-            'warning': '⚠️',
-            'error': '❌',
-            'action': '▶️'
-        }
+        now = time.time()
+        action = action or self._context_action()
         
-        # Create log entry
-        log_entry = {
-            'timestamp': timestamp,
-            'level': level,
-            'action': action or self.current_action,
-            'message': message,
-            'full_text': f"[{timestamp}] {action_tag} {message}"
-        }
-        
-        # Add to buffer
-        with self.buffer_lock:
-            self.buffer.append(log_entry)
+        # Add to buffer, then render the entry for file/console/WebSocket
+        seq = self.buffer.append(now, level, action, message)
+        log_entry = render_entry(seq, now, level, action, message)
         
-        # Write to file
+        # Write to file (with date and level, so the timeline view can place it)
         if self.log_file:
             try:
+                action_tag = f"[{action}] " if action else ""
+                day = time.strftime('%Y-%m-%d', time.localtime(now))
                 with open(self.log_file, 'a', encoding='utf-8') as f:
-                    f.write(log_entry['full_text'] + '\n')
+                    f.write(f"[{day} {log_entry['timestamp']}] {level.upper():<7} {action_tag}{message}\n")
             except Exception as e:
                 print(f"Failed to write to log file: {e}")
         
@@ -128,49 +445,69 @@ class LogManager:
         """Log error message"""
         self.log(message, level='error', action=action)
     
-    def get_logs(self, action: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+    def get_logs(self, action: Optional[str] = None, limit: Optional[int] = None,
+                 level: Optional[str] = None, after_seq: Optional[int] = None,
+                 before_seq: Optional[int] = None) -> List[Dict]:
         """
         Get log entries from buffer
         
+        With after_seq the oldest matching entries newer than after_seq are
+        returned (use this to resume a stream). Otherwise the newest matching
+        entries older than before_seq are returned. Results are always in
+        ascending seq order.
+        
         Args:
             action: Filter by action name (optional)
             limit: Maximum number of entries to return (optional)
+            level: Filter by log level (optional)
+            after_seq: Only entries with seq > after_seq (optional)
+            before_seq: Only entries with seq < before_seq (optional)
         
         Returns:
             List of log entries
         """
-        with self.buffer_lock:
-            logs = list(self.buffer)
-        
-        # Filter by action if specified
-        if action:
-            logs = [log for log in logs if log.get('action') == action]
-        
-        # Apply limit
-        if limit:
-            logs = logs[-limit:]
-        
-        return logs
+        return self.buffer.query(
+            action=action,
+            level=level,
+            after_seq=after_seq,
+            before_seq=before_seq,
+            limit=limit
+        )
     
-    def get_current_action(self) -> Optional[Dict]:
-        """Get information about currently running action"""
-        if not self.current_action:
-            return None
-        
-        duration = 0
-        if self.action_start_time:
-            duration = (datetime.now() - self.action_start_time).total_seconds()
+    def get_seq_bounds(self) -> Dict[str, int]:
+        """
+        Get the seq range currently held in memory
         
+        Returns:
+            dict with first_seq (oldest available) and last_seq (newest, 0 if none)
+        """
+        first_seq, last_seq = self.buffer.bounds()
         return {
-            'action': self.current_action,
-            'start_time': self.action_start_time.isoformat() if self.action_start_time else None,
-            'duration': duration
+            'first_seq': first_seq,
+            'last_seq': last_seq
         }
     
+    def get_current_action(self) -> Optional[Dict]:
+        """Get information about the most recently started running action"""
+        actions = self.get_active_actions()
+        return actions[-1] if actions else None
+    
+    def get_active_actions(self) -> List[Dict]:
+        """All running actions, oldest first"""
+        with self.actions_lock:
+            spans = [span for spans in self.action_spans.values() for span in spans]
+        spans.sort(key=lambda span: span.start_time)
+        return [{
+            'action': span.name,
+            'start_time': datetime.fromtimestamp(span.start_time).isoformat(),
+            'duration': span.elapsed,
+            'span_id': span.span_id,
+            'trace_id': span.trace_id
+        } for span in spans]
+    
     def clear_logs(self):
         """Clear log buffer"""
-        with self.buffer_lock:
-            self.buffer.clear()
+        self.buffer.clear()
         self.log("🗑️ Log buffer cleared", level='info')
     
     def get_log_file_content(self, lines: int = 1000) -> str:
@@ -187,9 +524,7 @@ class LogManager:
             return ""
         
         try:
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                all_lines = f.readlines()
-                return ''.join(all_lines[-lines:])
+            return tail_lines(self.log_file, lines)
         except Exception as e:
             return f"Error reading log file: {e}"
 
@@ -199,10 +534,15 @@ class LogManager:
 log_manager: Optional[LogManager] = None
 
 
-def init_log_manager(log_file: Path, socketio=None) -> LogManager:
+def init_log_manager(log_file: Path, socketio=None, max_buffer_size: Optional[int] = None) -> LogManager:
     """Initialize global log manager"""
     global log_manager
-    log_manager = LogManager(max_buffer_size=1000, log_file=log_file)
+    if max_buffer_size is None:
+        try:
+            max_buffer_size = int(os.getenv('LOG_BUFFER_SIZE', DEFAULT_BUFFER_SIZE))
+        except ValueError:
+            max_buffer_size = DEFAULT_BUFFER_SIZE
+    log_manager = LogManager(max_buffer_size=max(1, max_buffer_size), log_file=log_file)
     if socketio:
         log_manager.set_socketio(socketio)
     return log_manager
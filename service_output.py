@@ -0,0 +1,288 @@
+"""
+Service output ingestion for 4Paws Agent
+Optional pipe mode: the agent owns the services' stdout/stderr instead of
+redirecting them straight into log files
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from core import Config
+from core.log_rotation import get_log_rotator, ROTATE_RENAME
+from core.log_timeline import ANSI_ESCAPE, parse_timestamp, parse_severity
+from log_manager import LogRingBuffer
+
+logger = logging.getLogger(__name__)
+
+# Output modes (SERVICE_OUTPUT_MODE in .env)
+OUTPUT_MODE_FILE = 'file'  # Child writes its log file directly (default)
+OUTPUT_MODE_PIPE = 'pipe'  # Agent reads the pipe, buffers, writes and broadcasts
+
+# Bytes taken from a pipe per read (whatever is available, up to this much)
+READ_CHUNK_SIZE = 64 * 1024
+
+# A line longer than this is cut so one runaway line can't grow the buffer
+MAX_LINE_BYTES = 16 * 1024
+
+# Writer flushes pending output at least this often...
+FLUSH_INTERVAL = 0.25
+# ...or as soon as a service has this many lines pending
+FLUSH_LINES = 500
+
+
+def get_output_mode() -> str:
+    """Configured service output mode ('file' or 'pipe')"""
+    mode = os.getenv('SERVICE_OUTPUT_MODE', Config.SERVICE_OUTPUT_MODE).strip().lower()
+    return OUTPUT_MODE_PIPE if mode == OUTPUT_MODE_PIPE else OUTPUT_MODE_FILE
+
+
+def parse_line(text: str, received: float):
+    """
+    Pick the timestamp and severity out of one line of service output
+
+    Returns:
+        tuple: (epoch time, level, text without ANSI colors) - falls back
+        to the receive time and 'info'
+    """
+    plain = ANSI_ESCAPE.sub('', text)
+    ts = parse_timestamp(plain)
+    return (received if ts is None else ts), parse_severity(plain) or 'info', plain
+
+
+class ServiceChannel:
+    """Live output of one service: ring buffer, pending writes and counters"""
+
+    def __init__(self, name: str, log_file: Path, capacity: int):
+        self.name = name
+        self.log_file = log_file
+        self.buffer = LogRingBuffer(capacity)
+        self.lock = threading.Lock()
+        self.reader: Optional[threading.Thread] = None
+        self.pid: Optional[int] = None
+
+        # Filled by the reader, drained by the writer
+        self.pending_bytes: List[bytes] = []
+        self.pending_seqs: List[int] = []
+
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.started_at = time.time()
+        self.lines = 0
+        self.bytes = 0
+        self.errors = 0
+        self.warnings = 0
+        self.last_error: Optional[Dict] = None
+        self.recent_errors: deque = deque(maxlen=1000)  # Timestamps for the per-minute rate
+
+    def stats(self) -> Dict:
+        now = time.time()
+        with self.lock:
+            return {
+                'service': self.name,
+                'pid': self.pid,
+                'attached': self.reader is not None and self.reader.is_alive(),
+                'since': self.started_at,
+                'lines': self.lines,
+                'bytes': self.bytes,
+                'errors': self.errors,
+                'warnings': self.warnings,
+                'errors_last_minute': sum(1 for t in self.recent_errors if now - t <= 60),
+                'last_error': self.last_error,
+                'last_seq': self.buffer.next_seq - 1
+            }
+
+
+class OutputIngestor:
+    """
+    Reads service pipes and fans the output out
+
+    Each attached process gets a reader thread that takes whatever bytes
+    are available from its pipe (os.read returns as soon as any output
+    arrives, it never waits for a full buffer or line). Windows anonymous
+    pipes can't be polled with select or O_NONBLOCK, so one thread per pipe
+    is what keeps the readers from blocking each other or the agent.
+
+    Complete lines are parsed and appended to the service's ring buffer
+    (instant tail without touching the disk), then a single writer thread
+    flushes them to the log files in batches and hands the new entries to
+    the emitter, which only reaches clients subscribed to that service.
+    """
+
+    def __init__(self, capacity: Optional[int] = None):
+        self.capacity = capacity or int(os.getenv('SERVICE_OUTPUT_BUFFER_LINES', Config.SERVICE_OUTPUT_BUFFER_LINES))
+        self.channels: Dict[str, ServiceChannel] = {}
+        self.lock = threading.Lock()
+        self.emitter: Optional[Callable[[str, List[Dict], Dict], None]] = None
+        self._wake = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+    def set_emitter(self, emitter: Callable[[str, List[Dict], Dict], None]):
+        """Set the callback receiving (service, new entries, stats) after each flush"""
+        self.emitter = emitter
+
+    def channel(self, service: str, log_file: Optional[Path] = None) -> ServiceChannel:
+        with self.lock:
+            channel = self.channels.get(service)
+            if channel is None:
+                channel = ServiceChannel(service, log_file or Config.LOGS_DIR / f'{service}.log', self.capacity)
+                self.channels[service] = channel
+            elif log_file is not None:
+                channel.log_file = log_file
+            return channel
+
+    def attach(self, service: str, process, log_file: Path):
+        """
+        Start ingesting a process started with stdout=PIPE
+
+        The ring buffer is kept across restarts so the tail stays
+        continuous; the error counters start over for the new process.
+        """
+        channel = self.channel(service, log_file)
+        with channel.lock:
+            channel.pid = process.pid
+            channel.reset_counters()
+
+        # The agent reopens the file for every batch, so a plain rename rotates it
+        get_log_rotator().register(log_file, ROTATE_RENAME)
+
+        channel.reader = threading.Thread(
+            target=self._read_loop, args=(channel, process.stdout),
+            name=f'output-{service}', daemon=True
+        )
+        channel.reader.start()
+        self._ensure_writer()
+
+    def is_attached(self, service: str) -> bool:
+        channel = self.channels.get(service)
+        return channel is not None and channel.reader is not None
+
+    def wait_for_eof(self, service: str, timeout: float = 2.0):
+        """Wait until the reader has drained the pipe of an exited process"""
+        channel = self.channels.get(service)
+        if channel and channel.reader:
+            channel.reader.join(timeout)
+        self.flush()
+
+    def _read_loop(self, channel: ServiceChannel, stream):
+        fd = stream.fileno()
+        partial = b''
+        try:
+            while True:
+                try:
+                    chunk = os.read(fd, READ_CHUNK_SIZE)
+                except OSError:
+                    break
+                if not chunk:
+                    break  # EOF: the process exited
+                lines = (partial + chunk).split(b'\n')
+                partial = lines.pop()
+                if len(partial) > MAX_LINE_BYTES:
+                    lines.append(partial)
+                    partial = b''
+                self._ingest(channel, lines)
+            if partial:
+                self._ingest(channel, [partial])
+        finally:
+            try:
+                stream.close()
+            except OSError:
+                pass
+            self._wake.set()
+
+    def _ingest(self, channel: ServiceChannel, lines: List[bytes]):
+        received = time.time()
+        with channel.lock:
+            for raw in lines:
+                text = raw.rstrip(b'\r').decode('utf-8', errors='replace')
+                ts, level, plain = parse_line(text, received)
+                seq = channel.buffer.append(ts, level, None, plain)
+
+                channel.pending_bytes.append(raw + b'\n')
+                channel.pending_seqs.append(seq)
+                channel.lines += 1
+                channel.bytes += len(raw) + 1
+                if level == 'error':
+                    channel.errors += 1
+                    channel.recent_errors.append(received)
+                    channel.last_error = {'seq': seq, 'time': ts, 'message': plain[:500]}
+                elif level == 'warning':
+                    channel.warnings += 1
+            backlog = len(channel.pending_seqs)
+        if backlog >= FLUSH_LINES:
+            self._wake.set()
+
+    def _ensure_writer(self):
+        with self.lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name='output-writer', daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"⚠️  Service output flush failed: {e}")
+
+    def flush(self):
+        """Write pending output to the log files and notify subscribers"""
+        for channel in list(self.channels.values()):
+            with channel.lock:
+                if not channel.pending_seqs:
+                    continue
+                data = b''.join(channel.pending_bytes)
+                seqs = channel.pending_seqs
+                channel.pending_bytes = []
+                channel.pending_seqs = []
+
+            try:
+                channel.log_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(channel.log_file, 'ab') as f:
+                    f.write(data)
+            except OSError as e:
+                logger.warning(f"⚠️  Could not write {channel.log_file.name}: {e}")
+
+            if self.emitter:
+                entries = channel.buffer.query(after_seq=seqs[0] - 1, before_seq=seqs[-1] + 1)
+                try:
+                    self.emitter(channel.name, entries, channel.stats())
+                except Exception as e:
+                    logger.debug(f"Service output emit failed: {e}")
+
+    def get_lines(self, service: str, after_seq: Optional[int] = None,
+                  limit: Optional[int] = None, level: Optional[str] = None) -> List[Dict]:
+        """Entries from the service's ring buffer (same cursor semantics as LogManager.get_logs)"""
+        channel = self.channels.get(service)
+        if channel is None:
+            return []
+        return channel.buffer.query(level=level, after_seq=after_seq, limit=limit)
+
+    def tail(self, service: str, lines: int = 20) -> List[str]:
+        """Last N lines of a service's output, straight from memory"""
+        return [entry['message'] for entry in self.get_lines(service, limit=lines)]
+
+    def get_stats(self, service: Optional[str] = None) -> Dict:
+        """Per-service line/error counters"""
+        if service is not None:
+            channel = self.channels.get(service)
+            return channel.stats() if channel else {}
+        return {name: channel.stats() for name, channel in list(self.channels.items())}
+
+
+_ingestor: Optional[OutputIngestor] = None
+
+
+def get_output_ingestor() -> OutputIngestor:
+    """Get the global OutputIngestor"""
+    global _ingestor
+    if _ingestor is None:
+        _ingestor = OutputIngestor()
+    return _ingestor
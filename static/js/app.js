@@ -5,16 +5,42 @@ var socket = io();
 let currentLogService = 'agent';
 let autoRefresh = true;
 
+// Incremental service log cursor: {offset, file_id} from the last response
+let logCursor = null;
+
+// Pipe mode: lines are pushed over the socket; lastLiveSeq guards against duplicates
+let liveLogService = null;
+let lastLiveSeq = 0;
+
+// Latest backend release offered and its migration rehearsal (for the update prompt)
+let latestBackendRelease = null;
+let lastRehearsal = null;
+
 // Initialize on page load
 document.addEventListener('DOMContentLoaded', () => {
     initializeTheme();
     refreshStatus();
+    loadUpdateDowntime();
+    loadDbMetrics();
+    loadSlowQueries().then(loadIndexAdvisor);  // Shown along with the slow queries
+    loadMaintenance();
     startAutoRefresh();
 });
 
 // WebSocket events
 socket.on('connect', () => {
     console.log('Connected to server');
+    // Rooms don't survive a reconnect: subscribe again and fetch what we missed
+    if (liveLogService) {
+        socket.emit('subscribe_service_logs', { service: liveLogService });
+        fetchLiveLogs(liveLogService, lastLiveSeq).catch(() => {});
+    }
+});
+
+socket.on('service_log_lines', (data) => {
+    if (data.service !== liveLogService) return;
+    appendLiveLines(data.lines);
+    updateLogErrorCount(data.stats);
 });
 
 socket.on('status_update', (data) => {
@@ -64,6 +90,30 @@ function updateStatus(data) {
     updateServiceStatusCompact('backend', data.backend, data.ports.backend, data.versions.backend);
     updateServiceStatusCompact('frontend', data.frontend, data.ports.frontend, data.versions.frontend);
     
+    // Error counts parsed from service output (pipe mode only)
+    if (data.output) {
+        ['mariadb', 'backend', 'frontend'].forEach(service => {
+            const stats = data.output[service];
+            const wrap = document.getElementById(`${service}-errors-wrap`);
+            const count = document.getElementById(`${service}-errors-compact`);
+            if (!stats || !wrap || !count) return;
+            wrap.style.display = '';
+            count.textContent = stats.errors;
+            wrap.title = stats.last_error ? stats.last_error.message : '';
+        });
+    }
+    
+    // MariaDB: time of the last start, flagged when it needed crash recovery
+    updateMariadbStartup(data.mariadb_startup);
+    
+    // Backend cluster workers
+    updateClusterWorkers(data.cluster);
+    
+    // Lazy start: apps stopped for idleness start on the next request
+    if (data.lazy) {
+        ['backend', 'frontend'].forEach(service => updateLazyBadge(service, data.lazy[service]));
+    }
+    
     // Update paths (compact view)
     if (data.paths) {
         const frontendPathEl = document.getElementById('frontend-path-compact');
@@ -145,6 +195,58 @@ function updateServiceStatus(service, status, port, version = null) {
     }
 }
 
+function updateClusterWorkers(cluster) {
+    const el = document.getElementById('backend-workers-compact');
+    if (!el) return;
+    if (!cluster || !cluster.workers.length) {
+        el.style.display = 'none';
+        return;
+    }
+    el.style.display = '';
+    const rows = cluster.workers.map(w => `
+        <div class="worker-row${w.healthy ? '' : ' worker-unhealthy'}" title="Port ${w.port}, ${w.restarts} restart(s)">
+            <span>#${w.id}</span>
+            <span>PID ${w.pid}</span>
+            <span>CPU ${w.cpu.toFixed(1)}%</span>
+            <span>MEM ${w.memory.toFixed(0)} MB</span>
+            <span>${w.requests} req${w.in_flight ? ` (${w.in_flight} active)` : ''}</span>
+        </div>`).join('');
+    let scale = '';
+    if (cluster.last_scale) {
+        const when = new Date(cluster.last_scale.time * 1000).toLocaleTimeString();
+        scale = ` • last scaled ${cluster.last_scale.from} → ${cluster.last_scale.to} at ${when} (${cluster.last_scale.reason})`;
+    }
+    el.innerHTML = `
+        <div class="worker-summary">${cluster.size} worker(s) (${cluster.min}–${cluster.max}${cluster.autoscale ? ', autoscale' : ''})${scale}</div>
+        ${rows}`;
+}
+
+function updateMariadbStartup(startup) {
+    const statusBadge = document.getElementById('mariadb-status-mini');
+    if (!statusBadge || !startup) return;
+    const ready = startup.startup_seconds !== null ? startup.startup_seconds : startup.ready_wait;
+    let text = `Last start: ready after ${ready.toFixed(0)}s`;
+    if (startup.crash_recovery) {
+        const recovery = startup.recovery_seconds !== null ? ` in ${startup.recovery_seconds.toFixed(0)}s` : '';
+        text += ` • crash recovery of ${startup.recovered_pages} page(s)${recovery} (previous stop was not clean)`;
+    }
+    statusBadge.title = text;
+}
+
+function updateLazyBadge(service, lazy) {
+    const statusBadge = document.getElementById(`${service}-status-mini`);
+    if (!statusBadge || !lazy) return;
+    const last = lazy.cold_starts.length ? lazy.cold_starts[lazy.cold_starts.length - 1] : null;
+    const lastText = last && last.success ? `Last cold start: first byte after ${last.ttfb.toFixed(1)}s` : '';
+    if (lazy.parked) {
+        statusBadge.textContent = 'Sleeping';
+        statusBadge.className = 'status-badge-mini stopped';
+        statusBadge.title = `Starts on the next request. ${lastText}`.trim();
+    } else {
+        statusBadge.title = lastText;
+    }
+}
+
 // Service Control
 async function startService(service) {
     showLoading(`Starting ${service}...`);
@@ -184,6 +286,25 @@ async function stopService(service) {
     }
 }
 
+async function restartService(service) {
+    showLoading(`Restarting ${service}...`);
+    try {
+        const response = await fetch(`/api/restart/${service}`, { method: 'POST' });
+        const data = await response.json();
+        
+        if (data.success) {
+            showNotification(`${service} restarted successfully`, 'success');
+            setTimeout(refreshStatus, 1000);
+        } else {
+            showNotification(`Failed to restart ${service}: ${data.error || 'Unknown error'}`, 'error');
+        }
+    } catch (error) {
+        showNotification(`Error restarting ${service}: ${error.message}`, 'error');
+    } finally {
+        hideLoading();
+    }
+}
+
 async function startAll() {
     await startService('all');
 }
@@ -294,18 +415,21 @@ function displayUpdates(updates) {
             <div class="update-card">
                 <h3>🎨 Frontend Update Available</h3>
                 <p>Current: ${updates.frontend.current || 'Not installed'}</p>
-                <p>Latest: ${updates.frontend.latest}</p>
+                <p>Latest: ${updates.frontend.latest || updates.frontend}</p>
                 <button class="btn btn-primary" onclick="updateComponent('frontend')">Update Frontend</button>
             </div>
         `;
     }
     
     if (updates.backend) {
+        latestBackendRelease = updates.backend.latest || updates.backend;
         html += `
             <div class="update-card">
                 <h3>🔧 Backend Update Available</h3>
                 <p>Current: ${updates.backend.current || 'Not installed'}</p>
-                <p>Latest: ${updates.backend.latest}</p>
+                <p>Latest: ${latestBackendRelease}</p>
+                <div id="rehearsal-content"></div>
+                <button class="btn btn-secondary" id="rehearsal-run" onclick="rehearseMigrations()">Rehearse migrations</button>
                 <button class="btn btn-primary" onclick="updateComponent('backend')">Update Backend</button>
             </div>
         `;
@@ -320,10 +444,402 @@ function displayUpdates(updates) {
     
     content.innerHTML = html;
     section.style.display = 'block';
+    if (updates.backend) loadRehearsal();
+}
+
+// How long services were down during recent updates
+async function loadUpdateDowntime() {
+    try {
+        const response = await fetch('/api/update/downtime?limit=5');
+        const data = await response.json();
+        if (!data.updates || data.updates.length === 0) return;
+        
+        let html = '<div class="updates-list">';
+        data.updates.forEach(update => {
+            html += `
+                <div class="update-card">
+                    <h3>${update.success ? '✅' : '❌'} ${update.seconds}s down • ${update.components || ''}</h3>
+                    <p>${new Date(update.time).toLocaleString()} • ${update.mode === 'staged' ? 'Staged' : 'In place'}</p>
+                    ${update.release ? `<p>${update.release}</p>` : ''}
+                    ${update.error ? `<p>${update.error}</p>` : ''}
+                </div>
+            `;
+        });
+        html += '</div>';
+        
+        document.getElementById('downtime-content').innerHTML = html;
+        document.getElementById('downtime-section').style.display = 'block';
+    } catch (error) {
+        console.error('Error loading update downtime:', error);
+    }
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text === null || text === undefined ? '' : String(text);
+    return div.innerHTML;
+}
+
+function formatSeconds(seconds) {
+    if (seconds === null || seconds === undefined) return '--';
+    return seconds < 1 ? `${(seconds * 1000).toFixed(0)} ms` : `${seconds.toFixed(2)} s`;
+}
+
+function formatBytes(bytes) {
+    if (bytes >= 1073741824) return `${(bytes / 1073741824).toFixed(1)} GB`;
+    if (bytes >= 1048576) return `${(bytes / 1048576).toFixed(1)} MB`;
+    return `${(bytes / 1024).toFixed(0)} KB`;
+}
+
+function sparkline(values, width = 160, height = 32) {
+    const points = values.filter(v => v !== null);
+    if (points.length < 2) return '';
+    const max = Math.max(...points), min = Math.min(...points, 0);
+    const range = max - min || 1;
+    const step = width / (values.length - 1);
+    const path = values
+        .map((v, i) => v === null ? null : `${(i * step).toFixed(1)},${(height - (v - min) / range * height).toFixed(1)}`)
+        .filter(Boolean).join(' ');
+    return `<svg class="db-sparkline" width="${width}" height="${height}"><polyline points="${path}"/></svg>`;
+}
+
+// Database performance: rates from MariaDB's global status (last hour)
+async function loadDbMetrics() {
+    try {
+        const response = await fetch('/api/db-metrics');
+        const data = await response.json();
+        const section = document.getElementById('db-metrics-section');
+        if (!data.success || !data.enabled || (!data.recent.length && !data.history.length)) {
+            section.style.display = 'none';
+            return;
+        }
+        section.style.display = 'block';
+        
+        const series = data.recent.length ? data.recent : data.history;
+        const column = name => series.map(point => point[data.fields.indexOf(name)]);
+        const latest = series[series.length - 1];
+        const value = name => latest[data.fields.indexOf(name)];
+        document.getElementById('db-metrics-summary').textContent = data.connected
+            ? `Sampled every ${data.interval}s; ${data.recent.length ? 'last hour' : 'last day (5 min averages)'}`
+            : `Not sampling${data.last_error ? `: ${data.last_error}` : ' (MariaDB stopped)'}; showing the last values`;
+        
+        document.getElementById('db-metrics-signals').innerHTML = data.signals
+            .map(signal => `<div class="db-flags">⚠️ ${escapeHtml(signal.message)}</div>`).join('');
+        
+        const tiles = [
+            ['Queries/s', 'qps', v => v.toFixed(1)],
+            ['Writes/s', 'writes', v => v.toFixed(1)],
+            ['Buffer pool hits', 'hit_ratio', v => `${v.toFixed(2)}%`],
+            ['Dirty pages', 'dirty_pct', v => `${v.toFixed(1)}%`],
+            ['Row lock waits/s', 'lock_waits', v => v.toFixed(2)],
+            ['Temp tables on disk/s', 'tmp_disk', v => v.toFixed(2)],
+            ['Threads connected', 'threads_connected', v => v.toFixed(0)],
+            ['Threads running', 'threads_running', v => v.toFixed(0)]
+        ];
+        document.getElementById('db-metrics-content').innerHTML = tiles.map(([label, name, format]) => `
+            <div class="db-metric">
+                <div class="db-metric-label">${label}</div>
+                <div class="db-metric-value">${value(name) === null ? '--' : format(value(name))}</div>
+                ${sparkline(column(name))}
+            </div>`).join('');
+        
+        if (!data.tables.length) {
+            document.getElementById('db-tables-content').innerHTML = '';
+            return;
+        }
+        const rows = data.tables.slice(0, 10).map(t => `
+            <tr>
+                <td>${escapeHtml(t.table)}</td>
+                <td>${t.rows.toLocaleString()}</td>
+                <td>${formatBytes(t.data_bytes)}</td>
+                <td>${formatBytes(t.index_bytes)}</td>
+                <td>${formatBytes(t.free_bytes)}</td>
+            </tr>`).join('');
+        document.getElementById('db-tables-content').innerHTML = `
+            <table class="db-table">
+                <thead><tr><th>Table</th><th>Rows (est.)</th><th>Data</th><th>Indexes</th><th>Free</th></tr></thead>
+                <tbody>${rows}</tbody>
+            </table>`;
+    } catch (error) {
+        console.error('Error loading database metrics:', error);
+    }
+}
+
+// Slow queries: worst fingerprints by total time spent
+async function loadSlowQueries() {
+    try {
+        const response = await fetch('/api/slow-queries?limit=10');
+        const data = await response.json();
+        const section = document.getElementById('slow-queries-section');
+        if (!data.success || !data.enabled) {
+            section.style.display = 'none';
+            return;
+        }
+        section.style.display = 'block';
+        
+        const since = new Date(data.since * 1000).toLocaleString();
+        document.getElementById('slow-queries-summary').textContent =
+            `${data.entries} statement(s) over ${data.threshold}s in ${data.fingerprints} fingerprint(s) since ${since}`;
+        
+        if (!data.queries.length) {
+            document.getElementById('slow-queries-content').innerHTML = '';
+            return;
+        }
+        const rows = data.queries.map(q => {
+            const flags = [
+                q.full_scan ? `full scan ×${q.full_scan}` : '',
+                q.filesort ? `filesort ×${q.filesort}` : '',
+                q.tmp_disk ? `tmp on disk ×${q.tmp_disk}` : ''
+            ].filter(Boolean).join(', ');
+            return `
+                <tr title="${escapeHtml(q.sample)}">
+                    <td class="db-sql">${escapeHtml(q.fingerprint)}${flags ? `<div class="db-flags">${flags}</div>` : ''}</td>
+                    <td>${q.count}</td>
+                    <td>${formatSeconds(q.total)}</td>
+                    <td>${formatSeconds(q.p50)}</td>
+                    <td>${formatSeconds(q.p95)}</td>
+                    <td>${formatSeconds(q.max)}</td>
+                    <td>${Math.round(q.rows_examined_avg).toLocaleString()}</td>
+                </tr>`;
+        }).join('');
+        document.getElementById('slow-queries-content').innerHTML = `
+            <table class="db-table">
+                <thead><tr><th>Statement</th><th>Count</th><th>Total</th><th>p50</th><th>p95</th><th>Max</th><th>Rows examined</th></tr></thead>
+                <tbody>${rows}</tbody>
+            </table>`;
+    } catch (error) {
+        console.error('Error loading slow queries:', error);
+    }
+}
+
+// Index suggestions: reviewed here, never applied by the agent
+async function loadIndexAdvisor() {
+    try {
+        const response = await fetch('/api/index-advisor');
+        const data = await response.json();
+        const section = document.getElementById('index-advisor-section');
+        const slowQueries = document.getElementById('slow-queries-section');
+        if (!data.success || (slowQueries.style.display === 'none' && !data.analyzed_at)) {
+            section.style.display = 'none';
+            return;
+        }
+        section.style.display = 'block';
+        
+        const button = document.getElementById('index-advisor-analyze');
+        button.disabled = data.running;
+        button.textContent = data.running ? 'Analyzing...' : 'Analyze';
+        let summary = data.analyzed_at
+            ? `Last analysis ${new Date(data.analyzed_at * 1000).toLocaleString()}: ${data.results.length} statement(s) explained`
+            : 'Not analyzed yet';
+        if (data.last_error) summary += ` (failed: ${data.last_error})`;
+        document.getElementById('index-advisor-summary').textContent = summary;
+        
+        if (!data.suggestions.length) {
+            document.getElementById('index-advisor-content').innerHTML = '';
+            return;
+        }
+        const rows = data.suggestions.map(s => {
+            const reduction = s.reduction === null ? '--' : `${Math.round(s.reduction * 100)}%`;
+            const details = [
+                s.prisma_index ? `${s.prisma_model}: ${s.prisma_index}` : 'no Prisma model',
+                s.replaces ? `replaces ${s.replaces}` : ''
+            ].filter(Boolean).join(', ');
+            const queries = s.queries.map(q => q.fingerprint).join('\n\n');
+            const actions = s.status === 'proposed'
+                ? `<button class="btn-mini btn-success" onclick="reviewIndex('${s.id}', 'accepted')">Accept</button>
+                   <button class="btn-mini btn-danger" onclick="reviewIndex('${s.id}', 'dismissed')">Dismiss</button>`
+                : `${s.status} <button class="btn-mini btn-secondary" onclick="reviewIndex('${s.id}', 'proposed')">Undo</button>`;
+            return `
+                <tr title="${escapeHtml(queries)}">
+                    <td class="db-sql">${escapeHtml(s.sql)}<div class="db-flags">${escapeHtml(s.reason)} · ${escapeHtml(details)}</div></td>
+                    <td>${s.rows_before === null ? '--' : Math.round(s.rows_before).toLocaleString()}</td>
+                    <td>${s.rows_after === null ? '--' : s.rows_after.toLocaleString()}</td>
+                    <td>${reduction}</td>
+                    <td>${formatSeconds(s.time_saved_estimate)}</td>
+                    <td>${actions}</td>
+                </tr>`;
+        }).join('');
+        document.getElementById('index-advisor-content').innerHTML = `
+            <table class="db-table">
+                <thead><tr><th>Index</th><th>Rows now</th><th>With index</th><th>Fewer rows</th><th>Slow time</th><th></th></tr></thead>
+                <tbody>${rows}</tbody>
+            </table>`;
+    } catch (error) {
+        console.error('Error loading index suggestions:', error);
+    }
+}
+
+async function analyzeIndexes() {
+    try {
+        const response = await fetch('/api/index-advisor/analyze', { method: 'POST' });
+        const data = await response.json();
+        if (!data.success) {
+            showNotification(`Analysis not started: ${data.error}`, 'error');
+            return;
+        }
+        showNotification('Explaining slow queries...', 'info');
+        document.getElementById('index-advisor-analyze').disabled = true;
+        setTimeout(loadIndexAdvisor, 5000);
+    } catch (error) {
+        showNotification(`Error starting analysis: ${error.message}`, 'error');
+    }
+}
+
+async function reviewIndex(id, status) {
+    try {
+        const response = await fetch(`/api/index-advisor/${id}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ status })
+        });
+        const data = await response.json();
+        if (!data.success) {
+            showNotification(`Failed: ${data.error}`, 'error');
+        }
+        loadIndexAdvisor();
+    } catch (error) {
+        showNotification(`Error: ${error.message}`, 'error');
+    }
+}
+
+function exportIndexMigration() {
+    // Accepted suggestions only; the agent never runs the migration itself
+    window.location.href = '/api/index-advisor/export';
+}
+
+// Maintenance: idle-window ANALYZE / OPTIMIZE runs and what is left for the next window
+async function loadMaintenance() {
+    try {
+        const response = await fetch('/api/maintenance');
+        const data = await response.json();
+        const section = document.getElementById('maintenance-section');
+        if (!data.success || !data.enabled) {
+            section.style.display = 'none';
+            return;
+        }
+        section.style.display = 'block';
+        
+        const button = document.getElementById('maintenance-run');
+        button.disabled = !!data.running;
+        button.textContent = data.running ? 'Running...' : 'Run now';
+        const next = data.next_window ? new Date(data.next_window * 1000).toLocaleString() : '--';
+        let summary = data.in_window ? `In window (${data.windows})` : `Windows: ${data.windows}; next ${next}`;
+        summary += `; ${data.pending} task(s) pending`;
+        if (data.last_error) summary += ` (${data.last_error})`;
+        document.getElementById('maintenance-summary').textContent = summary;
+        
+        if (!data.runs.length) {
+            document.getElementById('maintenance-content').innerHTML = '';
+            return;
+        }
+        const rows = data.runs.map(run => {
+            const tasks = run.tasks.map(t => `${t.success ? '' : '❌ '}${t.kind} ${t.table} ${formatSeconds(t.seconds)}`).join(', ');
+            return `
+                <tr>
+                    <td>${new Date(run.started * 1000).toLocaleString()}${run.resumed ? ' (resumed)' : ''}</td>
+                    <td>${run.tasks.length}</td>
+                    <td>${formatSeconds(run.finished - run.started)}</td>
+                    <td class="db-sql" title="${escapeHtml(tasks)}">${escapeHtml(tasks || '--')}
+                        ${run.stopped ? `<div class="db-flags">stopped: ${escapeHtml(run.stopped)}</div>` : ''}</td>
+                </tr>`;
+        }).join('');
+        document.getElementById('maintenance-content').innerHTML = `
+            <table class="db-table">
+                <thead><tr><th>Run</th><th>Tasks</th><th>Took</th><th>Tables</th></tr></thead>
+                <tbody>${rows}</tbody>
+            </table>`;
+    } catch (error) {
+        console.error('Error loading maintenance:', error);
+    }
+}
+
+async function runMaintenance() {
+    try {
+        const response = await fetch('/api/maintenance/run', { method: 'POST' });
+        const data = await response.json();
+        if (!data.success) {
+            showNotification(`Maintenance not started: ${data.error}`, 'error');
+            return;
+        }
+        showNotification('Database maintenance started', 'info');
+        setTimeout(loadMaintenance, 3000);
+    } catch (error) {
+        showNotification(`Error starting maintenance: ${error.message}`, 'error');
+    }
+}
+
+// Migration rehearsal of the latest backend release (predicted downtime)
+async function loadRehearsal() {
+    try {
+        const response = await fetch('/api/update/rehearsal');
+        const data = await response.json();
+        const content = document.getElementById('rehearsal-content');
+        if (!data.success || !content) return;
+        
+        const button = document.getElementById('rehearsal-run');
+        button.disabled = !!data.running;
+        button.textContent = data.running ? `Rehearsing (${data.running.step})...` : 'Rehearse migrations';
+        const last = data.last;
+        lastRehearsal = last && last.release === latestBackendRelease ? last : null;
+        
+        if (data.running) {
+            content.innerHTML = `<p>🧪 Rehearsing ${data.running.migrations} migration(s) on a copy of the database...</p>`;
+            setTimeout(loadRehearsal, 3000);
+        } else if (!lastRehearsal) {
+            content.innerHTML = data.baseline_downtime != null
+                ? `<p class="db-flags">Not rehearsed; updates without migrations take ~${formatSeconds(data.baseline_downtime)}</p>`
+                : '<p class="db-flags">Not rehearsed</p>';
+        } else {
+            const migrations = lastRehearsal.migrations.map(m => `
+                <tr>
+                    <td class="db-sql" title="${escapeHtml(m.name)}">${m.success ? '' : '❌ '}${escapeHtml(m.name)}</td>
+                    <td>${m.seconds != null ? formatSeconds(m.seconds) : '--'}</td>
+                </tr>`).join('');
+            let summary;
+            if (!lastRehearsal.success) {
+                summary = `⚠️ Migrations failed on the copy: ${escapeHtml(lastRehearsal.error || 'unknown error')}`;
+            } else if (lastRehearsal.predicted_downtime != null) {
+                summary = `⏱️ Predicted downtime ~${formatSeconds(lastRehearsal.predicted_downtime)} `
+                    + `(${lastRehearsal.pending.length} migration(s) in ${formatSeconds(lastRehearsal.migrate_seconds)})`;
+            } else {
+                summary = `⏱️ Migrations take ${formatSeconds(lastRehearsal.migrate_seconds)} (no measured update yet)`;
+            }
+            content.innerHTML = `
+                <p>${summary}</p>
+                <p class="db-flags">Rehearsed ${new Date(lastRehearsal.time * 1000).toLocaleString()}</p>
+                ${migrations ? `<table class="db-table"><thead><tr><th>Migration</th><th>Took</th></tr></thead>
+                    <tbody>${migrations}</tbody></table>` : ''}`;
+        }
+    } catch (error) {
+        console.error('Error loading migration rehearsal:', error);
+    }
+}
+
+async function rehearseMigrations() {
+    try {
+        const response = await fetch('/api/update/rehearsal', { method: 'POST' });
+        const data = await response.json();
+        if (!data.success) {
+            showNotification(`Rehearsal not started: ${data.error}`, 'error');
+            return;
+        }
+        showNotification('Migration rehearsal started', 'info');
+        setTimeout(loadRehearsal, 1000);
+    } catch (error) {
+        showNotification(`Error starting rehearsal: ${error.message}`, 'error');
+    }
 }
 
 async function updateComponent(component) {
-    if (!confirm(`Are you sure you want to update ${component}? Services will be restarted.`)) {
+    let question = `Are you sure you want to update ${component}? Services will be restarted.`;
+    if (component !== 'frontend' && lastRehearsal) {
+        if (!lastRehearsal.success) {
+            question += `\n\n⚠️ The migrations of ${lastRehearsal.release} failed on a copy of the database: ${lastRehearsal.error}`;
+        } else if (lastRehearsal.predicted_downtime != null) {
+            question += `\n\nPredicted downtime: ~${formatSeconds(lastRehearsal.predicted_downtime)}`;
+        }
+    }
+    if (!confirm(question)) {
         return;
     }
     
@@ -361,11 +877,23 @@ async function showLogs(service) {
     });
     event.target.classList.add('active');
     
-    // Fetch logs
+    // Fetch logs (tail; later polls only fetch appended bytes)
+    logCursor = null;
+    if (liveLogService) {
+        socket.emit('unsubscribe_service_logs', { service: liveLogService });
+        liveLogService = null;
+    }
     try {
+        // Pipe mode: in-memory tail, then pushed lines instead of polling
+        if (service !== 'agent' && await fetchLiveLogs(service, null)) {
+            socket.emit('subscribe_service_logs', { service: service });
+            return;
+        }
+        
         const response = await fetch(`/api/logs/${service}`);
         const data = await response.json();
         document.getElementById('logs-output').textContent = data.logs || 'No logs available';
+        logCursor = { offset: data.offset, file_id: data.file_id };
         
         // Auto-scroll to bottom
         const logsOutput = document.getElementById('logs-output');
@@ -375,6 +903,82 @@ async function showLogs(service) {
     }
 }
 
+// Load a service's in-memory tail (pipe mode); returns false in file mode
+async function fetchLiveLogs(service, afterSeq) {
+    let url = `/api/logs/${service}/live?lines=500`;
+    if (afterSeq) url += `&after_seq=${afterSeq}`;
+    const response = await fetch(url);
+    const data = await response.json();
+    if (!data.available || service !== currentLogService) return false;
+    
+    const output = document.getElementById('logs-output');
+    if (!afterSeq) {
+        output.textContent = '';
+        lastLiveSeq = 0;
+    }
+    liveLogService = service;
+    appendLiveLines(data.lines);
+    updateLogErrorCount(data.stats);
+    if (!output.textContent) output.textContent = 'No logs available';
+    return true;
+}
+
+function appendLiveLines(lines) {
+    const output = document.getElementById('logs-output');
+    if (!output || !lines || !lines.length) return;
+    
+    const fresh = lines.filter(line => line.seq > lastLiveSeq);
+    if (!fresh.length) return;
+    lastLiveSeq = fresh[fresh.length - 1].seq;
+    
+    const wasAtBottom = output.scrollHeight - output.scrollTop <= output.clientHeight + 5;
+    if (output.textContent === 'No logs available') output.textContent = '';
+    output.textContent += fresh.map(line => line.message).join('\n') + '\n';
+    if (output.textContent.length > 500000) {
+        output.textContent = output.textContent.slice(-400000);
+    }
+    if (wasAtBottom) {
+        output.scrollTop = output.scrollHeight;
+    }
+}
+
+function updateLogErrorCount(stats) {
+    const badge = document.getElementById('log-error-count');
+    if (!badge || !stats) return;
+    badge.textContent = stats.errors ? `${stats.errors} errors (${stats.errors_last_minute}/min)` : '';
+}
+
+// Append bytes written since the last poll (or replace the view after rotation)
+async function pollServiceLogs() {
+    const output = document.getElementById('logs-output');
+    if (!output || !currentLogService) return;
+    
+    let url = `/api/logs/${currentLogService}`;
+    if (logCursor && logCursor.file_id) {
+        url += `?offset=${logCursor.offset}&file_id=${encodeURIComponent(logCursor.file_id)}`;
+    }
+    const service = currentLogService;
+    const response = await fetch(url);
+    const data = await response.json();
+    if (service !== currentLogService || data.error) return;
+    
+    const wasAtBottom = output.scrollHeight - output.scrollTop === output.clientHeight;
+    if (!logCursor || data.reset) {
+        output.textContent = data.logs || 'No logs available';
+    } else if (data.logs) {
+        if (output.textContent === 'No logs available') output.textContent = '';
+        output.textContent += data.logs;
+        // Keep the view bounded
+        if (output.textContent.length > 500000) {
+            output.textContent = output.textContent.slice(-400000);
+        }
+    }
+    logCursor = { offset: data.offset, file_id: data.file_id };
+    if (wasAtBottom) {
+        output.scrollTop = output.scrollHeight;
+    }
+}
+
 // Modal Management
 function showInstallModal() {
     document.getElementById('installModal').style.display = 'flex';
@@ -457,22 +1061,21 @@ function startAutoRefresh() {
     setInterval(() => {
         if (autoRefresh) {
             refreshStatus();
-            if (currentLogService) {
-                // Refresh logs silently
-                fetch(`/api/logs/${currentLogService}`)
-                    .then(r => r.json())
-                    .then(data => {
-                        const output = document.getElementById('logs-output');
-                        const wasAtBottom = output.scrollHeight - output.scrollTop === output.clientHeight;
-                        output.textContent = data.logs || 'No logs available';
-                        if (wasAtBottom) {
-                            output.scrollTop = output.scrollHeight;
-                        }
-                    })
-                    .catch(() => {});
+            if (currentLogService && !liveLogService) {
+                // Refresh logs silently (pipe mode pushes lines instead)
+                pollServiceLogs().catch(() => {});
             }
         }
     }, 3000); // Refresh every 3 seconds
+    
+    // Database panels change slowly
+    setInterval(() => {
+        if (autoRefresh) {
+            loadDbMetrics();
+            loadSlowQueries().then(loadIndexAdvisor);
+            loadMaintenance();
+        }
+    }, 30000);
 }
 
 // External Links
@@ -9,6 +9,13 @@ let logs = [];
 let currentFilter = '';
 const actions = new Set();
 
+// Stream cursor: seq of the newest server entry we hold (0 = none yet)
+let lastSeq = 0;
+let syncing = false;
+let pendingEntries = [];
+const LOGS_PAGE_SIZE = 1000;
+const MAX_CLIENT_LOGS = 5000;
+
 // Initialize when DOM is ready
 document.addEventListener('DOMContentLoaded', () => {
     initializeRealtimeLogs();
@@ -26,7 +33,11 @@ function initializeRealtimeLogs() {
     socket.on('connect', () => {
         console.log('✅ Connected to agent (realtime-logs)');
         addSystemLog('✅ Connected to agent');
-        loadExistingLogs();
+        if (lastSeq > 0) {
+            syncLogs();  // Resume from where we left off
+        } else {
+            loadExistingLogs();
+        }
     });
     
     socket.on('disconnect', () => {
@@ -35,7 +46,7 @@ function initializeRealtimeLogs() {
     });
     
     socket.on('log_entry', (data) => {
-        addLogEntry(data);
+        receiveServerEntry(data);
     });
     
     // Apply theme
@@ -56,12 +67,14 @@ function addSystemLog(message) {
 
 // Load existing logs from server
 async function loadExistingLogs() {
+    syncing = true;
     try {
-        const response = await fetch('/api/logs');
+        const response = await fetch(`/api/logs?limit=${LOGS_PAGE_SIZE}`);
         const data = await response.json();
         
         if (data.success) {
             logs = data.logs;
+            lastSeq = data.next_after_seq || 0;
             renderLogs();
             
             // Update action filter
@@ -72,12 +85,74 @@ async function loadExistingLogs() {
         }
     } catch (error) {
         console.error('Failed to load logs:', error);
+    } finally {
+        finishSync();
+    }
+}
+
+// Fetch every entry after lastSeq (after a reconnect or a detected gap)
+async function syncLogs() {
+    if (syncing) return;
+    syncing = true;
+    try {
+        while (true) {
+            const response = await fetch(`/api/logs?after_seq=${lastSeq}&limit=${LOGS_PAGE_SIZE}`);
+            const data = await response.json();
+            if (!data.success) break;
+            
+            if (data.truncated) {
+                addSystemLog('⚠️ Some log entries were dropped from the server buffer while disconnected');
+            }
+            data.logs.forEach(entry => acceptServerEntry(entry));
+            lastSeq = Math.max(lastSeq, data.next_after_seq || 0);
+            if (!data.has_more) break;
+        }
+    } catch (error) {
+        console.error('Failed to sync logs:', error);
+    } finally {
+        finishSync();
     }
 }
 
+// Replay live entries that arrived while a fetch was in flight
+function finishSync() {
+    syncing = false;
+    const pending = pendingEntries;
+    pendingEntries = [];
+    pending.sort((a, b) => a.seq - b.seq).forEach(entry => receiveServerEntry(entry));
+}
+
+// Handle a live entry from the WebSocket, filling gaps and dropping duplicates
+function receiveServerEntry(entry) {
+    if (syncing) {
+        pendingEntries.push(entry);
+        return;
+    }
+    if (!entry.seq) {
+        addLogEntry(entry);
+        return;
+    }
+    if (entry.seq <= lastSeq) return;  // Already have it
+    if (lastSeq > 0 && entry.seq > lastSeq + 1) {
+        // Missed something - the sync fetch will include this entry too
+        syncLogs();
+        return;
+    }
+    acceptServerEntry(entry);
+}
+
+function acceptServerEntry(entry) {
+    if (entry.seq <= lastSeq) return;
+    lastSeq = entry.seq;
+    addLogEntry(entry);
+}
+
 // Add log entry
 function addLogEntry(entry) {
     logs.push(entry);
+    if (logs.length > MAX_CLIENT_LOGS) {
+        logs.splice(0, logs.length - MAX_CLIENT_LOGS);
+    }
     
     // Add action to filter
     if (entry.action && !actions.has(entry.action)) {